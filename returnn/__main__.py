@@ -32,7 +32,7 @@ from returnn.datasets.hdf import HDFDataset
 from returnn.util.debug import init_ipython_kernel, init_better_exchook, init_faulthandler, \
   init_cuda_not_in_main_proc_check
 from returnn.util.basic import init_thread_join_hack, describe_returnn_version, describe_theano_version, \
-  describe_tensorflow_version, BackendEngine, get_tensorflow_version_tuple
+  describe_tensorflow_version, BackendEngine, get_tensorflow_version_tuple, NativeCodeCompiler
 
 if typing.TYPE_CHECKING:
   import returnn.tf.engine
@@ -322,6 +322,8 @@ def init_backend_engine():
   Initializes ``engine``, which is either :class:`TFEngine.Engine` or Theano :class:`Engine.Engine`.
   """
   BackendEngine.select_engine(config=config)
+  if config.value("native_code_cache_dir", None):
+    NativeCodeCompiler.CacheBaseDir = config.value("native_code_cache_dir", None)
   if BackendEngine.is_theano_selected():
     print("Theano:", describe_theano_version(), file=log.v3)
     import returnn.theano.util
@@ -358,6 +360,10 @@ def init_backend_engine():
     # Print available devices. Also make sure that get_tf_list_local_devices uses the correct TF session opts.
     print_available_devices(tf_session_opts=tf_session_opts, file=log.v2)
     debug_register_better_repr()
+    native_ops_precompile = config.bool_or_other("native_ops_precompile", False)
+    if native_ops_precompile:
+      from returnn.tf.native_op import precompile_native_ops
+      precompile_native_ops(op_names=None if native_ops_precompile is True else config.list("native_ops_precompile"))
     if config.is_true("distributed_tf"):
       import returnn.tf.distributed
       returnn.tf.distributed.init_distributed_tf(config)
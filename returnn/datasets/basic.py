@@ -87,7 +87,7 @@ class Dataset(object):
                seq_ordering='default', random_seed_offset=None,
                partition_epoch=None, repeat_epoch=None,
                seq_list_filter_file=None, unique_seq_tags=False,
-               seq_order_seq_lens_file=None,
+               seq_order_seq_lens_file=None, seq_order_version=1, seq_meta_cache=False,
                shuffle_frames_of_nseqs=0, min_chunk_size=0, chunking_variance=0,
                estimated_num_seqs=None):
     """
@@ -106,6 +106,10 @@ class Dataset(object):
     :param str|None seq_list_filter_file: defines a subset of sequences (by tag) to use
     :param bool unique_seq_tags: uniquify seqs with same seq tags in seq order
     :param str|None seq_order_seq_lens_file: for seq order, use the seq length given by this file
+    :param int seq_order_version: 1 uses Python Random for shuffling (as always),
+      2 uses Numpy (faster for large datasets, but different order). See :func:`get_seq_order_for_epoch`
+    :param bool|str seq_meta_cache: whether to use a persistent cache of seq meta data (seq lengths, tags, ...),
+      if supported by the dataset. If str, the cache directory. See :class:`SeqMetaCache`
     :param int shuffle_frames_of_nseqs: shuffles the frames. not always supported
     :param None|int estimated_num_seqs: for progress reporting in case the real num_seqs is unknown
     """
@@ -124,7 +128,11 @@ class Dataset(object):
     self.seq_tags_filter = set(self._load_seq_list_file(seq_list_filter_file)) if seq_list_filter_file else None
     self.unique_seq_tags = unique_seq_tags
     self._seq_order_seq_lens_file = seq_order_seq_lens_file
-    self._seq_order_seq_lens_by_idx = None
+    self._seq_order_seq_lens_by_idx = None  # type: typing.Optional[numpy.ndarray]
+    self.seq_order_version = seq_order_version
+    self._seq_order_tag_ids = None  # type: typing.Optional[numpy.ndarray]
+    self._seq_order_tags_filter_mask = None  # type: typing.Optional[numpy.ndarray]
+    self.seq_meta_cache = seq_meta_cache
     # There is probably no use case for combining the two, so avoid potential misconfiguration.
     assert self.partition_epoch == 1 or self.repeat_epoch == 1, (
       "Combining partition_epoch and repeat_epoch is prohibited.")
@@ -190,6 +198,20 @@ class Dataset(object):
         return returnn.tf.horovod.get_ctx().rank() * 16127
     return 0
 
+  def _get_seq_meta_cache(self, source_files, opts=None):
+    """
+    :param list[str]|str source_files:
+    :param dict[str]|None opts: further options which influence the meta data
+    :return: cache, or None if disabled via the seq_meta_cache option
+    :rtype: returnn.datasets.seq_meta_cache.SeqMetaCache|None
+    """
+    if not self.seq_meta_cache:
+      return None
+    from .seq_meta_cache import SeqMetaCache
+    return SeqMetaCache(
+      source_files=source_files, kind=self.__class__.__name__, opts=opts,
+      cache_dir=self.seq_meta_cache if isinstance(self.seq_meta_cache, str) else None)
+
   @staticmethod
   def _parse_chunking(chunking):
     """
@@ -362,7 +384,14 @@ class Dataset(object):
     :param int seq_idx:
     :rtype: int
     """
-    if not self._seq_order_seq_lens_by_idx:
+    return int(self._get_seq_order_seq_lens()[seq_idx])
+
+  def _get_seq_order_seq_lens(self):
+    """
+    :return: seq lens from seq_order_seq_lens_file, for all (original) seq idx
+    :rtype: numpy.ndarray
+    """
+    if self._seq_order_seq_lens_by_idx is None:
       assert self._seq_order_seq_lens_file
       if self._seq_order_seq_lens_file.endswith(".gz"):
         import gzip
@@ -372,18 +401,51 @@ class Dataset(object):
       seq_lens = eval(raw)
       assert isinstance(seq_lens, dict)
       all_tags = self.get_all_tags()
-      self._seq_order_seq_lens_by_idx = [seq_lens[tag] for tag in all_tags]
-    return self._seq_order_seq_lens_by_idx[seq_idx]
+      self._seq_order_seq_lens_by_idx = numpy.array([seq_lens[tag] for tag in all_tags], dtype="int64")
+    return self._seq_order_seq_lens_by_idx
 
-  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None):
+  def _get_seq_order_tag_ids(self):
+    """
+    :return: for all (original) seq idx, an id of the seq tag, such that equal tags have equal ids
+    :rtype: numpy.ndarray
+    """
+    if self._seq_order_tag_ids is None:
+      # Note: This is as generic as possible, but requires that get_all_tags is implemented.
+      tag_ids = {}  # type: typing.Dict[str,int]
+      self._seq_order_tag_ids = numpy.array(
+        [tag_ids.setdefault(tag, len(tag_ids)) for tag in self.get_all_tags()], dtype="int64")
+    return self._seq_order_tag_ids
+
+  def _get_seq_order_tags_filter_mask(self, num_seqs):
+    """
+    :param int num_seqs:
+    :return: for all (original) seq idx, whether the seq tag is in seq_tags_filter
+    :rtype: numpy.ndarray
+    """
+    if self._seq_order_tags_filter_mask is None:
+      # Note: This is as generic as possible, but requires that get_all_tags is implemented.
+      all_seq_tags = self.get_all_tags()
+      assert len(all_seq_tags) == num_seqs == self.get_total_num_seqs(), "%r vs %r vs %r" % (
+        len(all_seq_tags), num_seqs, self.get_total_num_seqs())
+      self._seq_order_tags_filter_mask = numpy.array([tag in self.seq_tags_filter for tag in all_seq_tags], dtype=bool)
+    return self._seq_order_tags_filter_mask
+
+  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None, seq_lens=None):
     """
     Returns the order of the given epoch.
     This is mostly a static method, except that is depends on the configured type of ordering,
     such as 'default' (= as-is), 'sorted' or 'random'. 'sorted' also uses the sequence length.
 
+    This is implemented via Numpy, i.e. everything is vectorized,
+    except of the shuffling with ``seq_order_version = 1`` (the default),
+    which uses Python :class:`Random` to stay reproducible with earlier RETURNN versions.
+    ``seq_order_version = 2`` uses :class:`numpy.random.RandomState` instead,
+    which is much faster for large datasets, but gives a different (but again reproducible) order.
+
     :param int epoch: for 'random', this determines the random seed
     :param int num_seqs:
     :param ((int) -> int)|None get_seq_len: function (originalSeqIdx: int) -> int
+    :param numpy.ndarray|None seq_lens: alternative to get_seq_len: seq lens for all original seq idx, shape (num_seqs,)
     :return: the order for the given epoch. such that seq_idx -> underlying idx
     :rtype: list[int]
     """
@@ -395,9 +457,73 @@ class Dataset(object):
     if partition_epoch > 1:
       full_epoch = (epoch - 1) // partition_epoch + 1
     assert num_seqs > 0
-    seq_index = list(range(num_seqs))  # type: typing.List[int]  # the real seq idx after sorting
+    seq_index = numpy.arange(num_seqs, dtype="int64")  # the real seq idx after sorting
     if self._seq_order_seq_lens_file:
-      get_seq_len = self._get_seq_order_seq_lens_by_idx
+      seq_lens = self._get_seq_order_seq_lens()
+
+    all_seq_lens = []  # type: typing.List[numpy.ndarray]  # cache
+
+    def get_seq_lens():
+      """
+      :return: seq lens for all original seq idx
+      :rtype: numpy.ndarray
+      """
+      if not all_seq_lens:
+        if seq_lens is not None:
+          assert len(seq_lens) == num_seqs
+          all_seq_lens.append(numpy.asarray(seq_lens))
+        else:
+          assert get_seq_len
+          all_seq_lens.append(numpy.array([get_seq_len(i) for i in range(num_seqs)]))
+        if all_seq_lens[0].dtype.kind == "u":  # we negate it below
+          all_seq_lens[0] = all_seq_lens[0].astype("int64")
+      return all_seq_lens[0]
+
+    def get_random(seed):
+      """
+      :param int|float seed:
+      :rtype: Random|numpy.random.RandomState
+      """
+      if self.seq_order_version == 1:
+        return Random(seed)
+      return numpy.random.RandomState(int(seed) % (2 ** 32))
+
+    def shuffle(rnd, indices):
+      """
+      :param Random|numpy.random.RandomState rnd:
+      :param numpy.ndarray indices:
+      :return: shuffled indices
+      :rtype: numpy.ndarray
+      """
+      if isinstance(rnd, Random):
+        indices_list = indices.tolist()
+        rnd.shuffle(indices_list)
+        return numpy.array(indices_list, dtype=indices.dtype)
+      return rnd.permutation(indices)
+
+    def sort_by_len(indices, reverse=False):
+      """
+      Stable sort, i.e. like Python sort with key=get_seq_len.
+
+      :param numpy.ndarray indices:
+      :param bool reverse:
+      :rtype: numpy.ndarray
+      """
+      lens = get_seq_lens()[indices]
+      if reverse:
+        lens = -lens
+      return indices[numpy.argsort(lens, kind="stable")]
+
+    def split_bins(indices, bins):
+      """
+      :param numpy.ndarray indices:
+      :param int bins:
+      :rtype: list[numpy.ndarray]
+      """
+      n = len(indices)
+      return [indices[i * n // bins:(i + 1) * n // bins] for i in range(bins)]
+
+    assert self.seq_order_version in (1, 2), "%s: invalid seq_order_version %r" % (self, self.seq_order_version)
     if self.seq_ordering == 'default':
       pass  # Keep order as-is.
     elif self.seq_ordering.startswith("default_every_n:"):
@@ -408,18 +534,14 @@ class Dataset(object):
       seq_index = numpy.arange(num_seqs // num, dtype="int64").repeat(num)
       for i in range(1, num):
         seq_index[i::num] += i * (num_seqs // num)
-      seq_index = list(seq_index)
     elif self.seq_ordering == 'reverse':
-      seq_index = list(reversed(seq_index))
+      seq_index = seq_index[::-1]
     elif self.seq_ordering == 'sorted':
-      assert get_seq_len
-      seq_index.sort(key=get_seq_len)  # sort by length, starting with shortest
+      seq_index = sort_by_len(seq_index)  # sort by length, starting with shortest
     elif self.seq_ordering == "sorted_reverse":
-      assert get_seq_len
-      seq_index.sort(key=get_seq_len, reverse=True)  # sort by length, in reverse, starting with longest
+      seq_index = sort_by_len(seq_index, reverse=True)  # sort by length, in reverse, starting with longest
     elif self.seq_ordering.startswith('sort_bin_shuffle'):
       # Shuffle seqs, sort by length, and shuffle bins (then shuffle seqs within each bin if sort_bin_shuffle_x2).
-      assert get_seq_len
       tmp = self.seq_ordering.split(':')[1:]
       # Keep this deterministic! Use fixed seed.
       if len(tmp) <= 1:
@@ -427,9 +549,9 @@ class Dataset(object):
       else:
         nth = int(tmp[1])
       rnd_seed = ((full_epoch - 1) // nth + 1) if full_epoch else 1
-      rnd = Random(rnd_seed + self.random_seed_offset)
-      rnd.shuffle(seq_index)  # Shuffle sequences.
-      seq_index.sort(key=get_seq_len)  # Sort by length, starting with shortest.
+      rnd = get_random(rnd_seed + self.random_seed_offset)
+      seq_index = shuffle(rnd, seq_index)  # Shuffle sequences.
+      seq_index = sort_by_len(seq_index)  # Sort by length, starting with shortest.
       if len(tmp) == 0:
         bins = 2
       else:
@@ -437,20 +559,16 @@ class Dataset(object):
           bins = max(num_seqs // int(tmp[0][1:]), 2)
         else:  # the number of bins
           bins = int(tmp[0])
-      bin_ids = list(range(bins))
-      rnd.shuffle(bin_ids)  # Shuffle bins.
+      bin_ids = shuffle(rnd, numpy.arange(bins))  # Shuffle bins.
+      parts = split_bins(seq_index, bins)
       out_index = []
       for i in bin_ids:
-        if i == bins - 1:
-          part = seq_index[i * len(seq_index) // bins:][:]
-        else:
-          part = seq_index[i * len(seq_index) // bins:(i + 1) * len(seq_index) // bins][:]
+        part = parts[i]
         if self.seq_ordering.startswith('sort_bin_shuffle_x2'):
-          rnd.shuffle(part)  # Shuffle within the bin.
-        out_index += part
-      seq_index = out_index
+          part = shuffle(rnd, part)  # Shuffle within the bin.
+        out_index.append(part)
+      seq_index = numpy.concatenate(out_index)
     elif self.seq_ordering.startswith('laplace'):
-      assert get_seq_len
       tmp = self.seq_ordering.split(':')[1:]
       if len(tmp) == 0:
         bins = 2
@@ -464,57 +582,47 @@ class Dataset(object):
       else:
         nth = int(tmp[1])
       rnd_seed = ((full_epoch - 1) // nth + 1) if full_epoch else 1
-      rnd = Random(rnd_seed + self.random_seed_offset)
-      rnd.shuffle(seq_index)
-      out_index = []
-      for i in range(bins):
-        if i == bins - 1:
-          part = seq_index[i * len(seq_index) // bins:][:]
-        else:
-          part = seq_index[i * len(seq_index) // bins:(i + 1) * len(seq_index) // bins][:]
-        part.sort(key=get_seq_len, reverse=(i % 2 == 1))
-        out_index += part
-      seq_index = out_index
+      rnd = get_random(rnd_seed + self.random_seed_offset)
+      seq_index = shuffle(rnd, seq_index)
+      seq_index = numpy.concatenate([
+        sort_by_len(part, reverse=(i % 2 == 1)) for i, part in enumerate(split_bins(seq_index, bins))])
     elif self.seq_ordering.startswith('random'):
       tmp = self.seq_ordering.split(':')
       nth = int(tmp[1]) if len(tmp) > 1 else 1
       # Keep this deterministic! Use fixed seed.
-      rnd_seed = (full_epoch - 1) / nth + 1
-      rnd = Random(rnd_seed + self.random_seed_offset)
-      rnd.shuffle(seq_index)
+      if self.seq_order_version == 1:
+        rnd_seed = (full_epoch - 1) / nth + 1  # note: float seed, kept for reproducibility
+      else:
+        rnd_seed = (full_epoch - 1) // nth + 1
+      rnd = get_random(rnd_seed + self.random_seed_offset)
+      seq_index = shuffle(rnd, seq_index)
     else:
       assert False, "invalid batching specified: " + self.seq_ordering
     if self.unique_seq_tags:
-      # Note: This is as generic as possible, but requires that get_all_tags is implemented.
-      all_seq_tags = self.get_all_tags()
-      used_seq_tags = set()
-      seq_index = [
-        i for i in seq_index
-        if (all_seq_tags[i] not in used_seq_tags, used_seq_tags.add(all_seq_tags[i]))[0]]
+      # Keep the first occurrence of each seq tag.
+      _, first_idx = numpy.unique(self._get_seq_order_tag_ids()[seq_index], return_index=True)
+      seq_index = seq_index[numpy.sort(first_idx)]
     if partition_epoch > 1:
       seq_index = self._apply_partition_epoch(seq_index, partition_epoch, epoch)
     if repeat_epoch > 1:
-      seq_index = seq_index * repeat_epoch
+      seq_index = numpy.tile(seq_index, repeat_epoch)
     if self.seq_tags_filter is not None:
-      # Note: This is as generic as possible, but requires that get_all_tags is implemented.
-      assert seq_index
-      all_seq_tags = self.get_all_tags()
-      assert len(all_seq_tags) == num_seqs == self.get_total_num_seqs(), "%r vs %r vs %r" % (
-        len(all_seq_tags), num_seqs, self.get_total_num_seqs())
+      assert len(seq_index) > 0
       old_seq_index = seq_index
-      seq_index = [i for i in seq_index if all_seq_tags[i] in self.seq_tags_filter]
-      assert seq_index, "%s: empty after applying seq_list_filter_file. Example filter tags: %r, used tags: %r" % (
-        self, sorted(self.seq_tags_filter)[:3], [all_seq_tags[i] for i in old_seq_index[:3]])
-    return seq_index
+      seq_index = seq_index[self._get_seq_order_tags_filter_mask(num_seqs=num_seqs)[seq_index]]
+      assert len(seq_index) > 0, (
+        "%s: empty after applying seq_list_filter_file. Example filter tags: %r, used tags: %r" % (
+          self, sorted(self.seq_tags_filter)[:3], [self.get_all_tags()[i] for i in old_seq_index[:3]]))
+    return seq_index.tolist()
 
   @classmethod
   def _apply_partition_epoch(cls, seq_index, partition_epoch, epoch):
     """
-    :param list[int] seq_index: full list of ordered sequence indices
+    :param list[int]|numpy.ndarray seq_index: full list of ordered sequence indices
     :param int partition_epoch: number of partitions seq_index should be split into
     :param int|None epoch: current epoch
     :return: partition of seq_index for current epoch
-    :rtype: list[int]
+    :rtype: list[int]|numpy.ndarray
     """
     num_seqs = len(seq_index)
     current_partition = ((epoch or 1) - 1) % partition_epoch
@@ -1062,7 +1170,8 @@ class Dataset(object):
                         max_pad_size=None,
                         min_seq_length=0, pruning=0.0,
                         seq_drop=0.0, max_total_num_seqs=-1,
-                        used_data_keys=None):
+                        used_data_keys=None,
+                        bucket_boundaries=None, bucket_batch_sizes=None):
     """
     :param bool recurrent_net: If True, the batch might have a batch seq dimension > 1.
       Otherwise, the batch seq dimension is always 1 and multiple seqs will be concatenated.
@@ -1072,6 +1181,15 @@ class Dataset(object):
     :param int max_total_num_seqs:
     :param int|dict[str,int]|NumbersDict max_seq_length:
     :param set(str)|None used_data_keys:
+    :param list[int|dict[str,int]]|None bucket_boundaries: if given, for recurrent_net,
+      seqs (or chunks) are grouped into buckets by length, where bucket i contains the seqs
+      with length <= bucket_boundaries[i] (and the last bucket all longer seqs),
+      and the batches are built per bucket, which minimizes the padding.
+      All batches of the epoch are collected first and then shuffled.
+      Like shuffle_batches, this requires that the dataset supports loading the seqs in non-monotonic order,
+      see :func:`can_load_seqs_in_any_order`.
+    :param list[int|dict[str,int]]|None bucket_batch_sizes: batch_size per bucket,
+      i.e. len(bucket_boundaries) + 1 entries. By default, batch_size for all buckets.
     """
     if not batch_size:
       batch_size = sys.maxsize
@@ -1096,6 +1214,18 @@ class Dataset(object):
       if chunk_size != 0:
         print("Non-recurrent network, chunk size %s:%s ignored" % (chunk_size, chunk_step), file=log.v4)
         chunk_size = 0
+    bucket_batches = None  # type: typing.Optional[typing.List[Batch]]
+    finished_bucket_batches = []  # type: typing.List[Batch]
+    bucket_idx = None
+    if bucket_boundaries is not None:
+      assert recurrent_net, "%s: bucket_boundaries only for recurrent_net" % self
+      bucket_boundaries = [NumbersDict(boundary) for boundary in bucket_boundaries]
+      if bucket_batch_sizes is None:
+        bucket_batch_sizes = [batch_size] * (len(bucket_boundaries) + 1)
+      assert len(bucket_batch_sizes) == len(bucket_boundaries) + 1
+      bucket_batch_sizes = [NumbersDict(size) for size in bucket_batch_sizes]
+      bucket_batches = [Batch() for _ in bucket_batch_sizes]
+    cur_batch_size = batch_size
     batch = Batch()
     total_num_seqs = 0
     last_seq_idx = -1
@@ -1117,19 +1247,23 @@ class Dataset(object):
           continue
         if length.any_compare(min_seq_length, (lambda a, b: a < b)):
           continue
-        if length.any_compare(batch_size, (lambda a, b: a > b)):
-          print("warning: sequence length (%r) larger than limit (%r)" % (length, batch_size), file=log.v4)
+        if bucket_batches is not None:
+          bucket_idx = self._get_bucket_idx(length, bucket_boundaries)
+          batch = bucket_batches[bucket_idx]
+          cur_batch_size = bucket_batch_sizes[bucket_idx]
+        if length.any_compare(cur_batch_size, (lambda a, b: a > b)):
+          print("warning: sequence length (%r) larger than limit (%r)" % (length, cur_batch_size), file=log.v4)
         if self.rnd_seq_drop.random() < seq_drop:
           continue
         dt, ds = batch.try_sequence_as_slice(length)
-        if batch.num_slices >= 1:
-          if (dt * ds).any_compare(batch_size, (lambda a, b: a > b)):
-            yield batch
-            batch = Batch()
-          elif ds > max_seqs:
-            yield batch
-            batch = Batch()
-          elif (dt * ds - batch.get_total_num_frames() - length).any_compare(max_pad_size, (lambda a, b: a > b)):
+        if batch.num_slices >= 1 and (
+              (dt * ds).any_compare(cur_batch_size, (lambda a, b: a > b))
+              or ds > max_seqs
+              or (dt * ds - batch.get_total_num_frames() - length).any_compare(max_pad_size, (lambda a, b: a > b))):
+          if bucket_batches is not None:
+            finished_bucket_batches.append(batch)
+            batch = bucket_batches[bucket_idx] = Batch()
+          else:
             yield batch
             batch = Batch()
         batch.add_sequence_as_slice(seq_idx=seq_idx, seq_start_frame=t_start, length=length)
@@ -1149,9 +1283,45 @@ class Dataset(object):
         last_seq_idx = seq_idx
         total_num_seqs += 1
 
-    if batch.get_all_slices_num_frames().max_value() > 0:
+    if bucket_batches is not None:
+      finished_bucket_batches += [b for b in bucket_batches if b.get_all_slices_num_frames().max_value() > 0]
+      Random(self.random_seed_offset + (self.epoch or 1)).shuffle(finished_bucket_batches)
+      print("%s: %i bucketed batches, padding ratio %s" % (
+        self, len(finished_bucket_batches), self.get_batches_padding_ratio(finished_bucket_batches)), file=log.v4)
+      for batch in finished_bucket_batches:
+        yield batch
+    elif batch.get_all_slices_num_frames().max_value() > 0:
       yield batch
 
+  @staticmethod
+  def _get_bucket_idx(length, bucket_boundaries):
+    """
+    :param NumbersDict length:
+    :param list[NumbersDict] bucket_boundaries:
+    :return: index of the first bucket where the length fits, or len(bucket_boundaries) if it does not fit anywhere
+    :rtype: int
+    """
+    for i, boundary in enumerate(bucket_boundaries):
+      if not length.any_compare(boundary, (lambda a, b: a > b)):
+        return i
+    return len(bucket_boundaries)
+
+  @staticmethod
+  def get_batches_padding_ratio(batches):
+    """
+    :param list[Batch] batches: recurrent batches, i.e. with one slice per seq
+    :return: key -> fraction of zero-padded frames, over all the batches
+    :rtype: dict[str,float]
+    """
+    num_padded_frames = NumbersDict(0)
+    num_frames = NumbersDict(0)
+    for batch in batches:
+      num_padded_frames += batch.get_all_slices_num_frames()
+      num_frames += batch.get_total_num_frames()
+    return {
+      key: 1. - float(num_frames[key]) / num_padded_frames[key]
+      for key in num_padded_frames.keys() if num_padded_frames[key] > 0}
+
   def batch_set_generator_cache_whole_epoch(self):
     """
     The BatchSetGenerator can cache the list of batches which we generated across epochs.
@@ -1167,15 +1337,31 @@ class Dataset(object):
     """
     return False
 
-  def generate_batches(self, shuffle_batches=False, **kwargs):
+  def can_load_seqs_in_any_order(self):
+    """
+    Most datasets (e.g. :class:`CachedDataset2`) only support :func:`load_seqs` with monotonic increasing seq idx.
+    Options like ``bucket_boundaries`` for :func:`generate_batches` need to load the seqs in any order.
+
+    :return: whether :func:`load_seqs` can be called with non-monotonic seq idx
+    :rtype: bool
+    """
+    return False
+
+  def generate_batches(self, shuffle_batches=False, batch_slice=None, **kwargs):
     """
     :param bool shuffle_batches:
+    :param slice|None batch_slice: select a subset of the batches, e.g. ``slice(shard_index, None, num_shards)``
+      to split the dataset across multiple processes. All processes must have the same seq order.
     :param kwargs: will be passed to :func:`_generate_batches`
     :rtype: BatchSetGenerator
     """
+    generator = self._generate_batches(**kwargs)
+    if batch_slice is not None:
+      import itertools
+      generator = itertools.islice(generator, batch_slice.start, batch_slice.stop, batch_slice.step)
     return BatchSetGenerator(
       dataset=self,
-      generator=self._generate_batches(**kwargs),
+      generator=generator,
       shuffle_batches=shuffle_batches,
       cache_whole_epoch=self.batch_set_generator_cache_whole_epoch())
 
@@ -77,7 +77,9 @@ class CachedDataset(Dataset):
       self._update_tag_idx()
       seq_index = [self._tag_idx[tag] for tag in seq_list]
     else:
-      seq_index = self.get_seq_order_for_epoch(epoch, self._num_seqs, lambda s: self._get_seq_length_by_real_idx(s)[0])
+      seq_index = self.get_seq_order_for_epoch(
+        epoch, self._num_seqs, lambda s: self._get_seq_length_by_real_idx(s)[0],
+        seq_lens=self._get_all_seq_lengths_by_real_idx())
 
     old_index_map = self._index_map[:]
     self._index_map = range(len(seq_index))  # sorted seq idx -> seq_index idx
@@ -122,6 +124,9 @@ class CachedDataset(Dataset):
   def batch_set_generator_cache_whole_epoch(self):
     return True
 
+  def can_load_seqs_in_any_order(self):
+    return True
+
   def _init_alloc_intervals(self):
     if self.cache_byte_size_limit_at_start == 0:
       return
@@ -466,6 +471,14 @@ class CachedDataset(Dataset):
     """
     raise NotImplementedError
 
+  def _get_all_seq_lengths_by_real_idx(self):
+    """
+    :return: length of "data" for all real seq idx, shape (num_seqs,), or None if not available.
+      used for the seq order (see :func:`get_seq_order_for_epoch`)
+    :rtype: numpy.ndarray|None
+    """
+    return None
+
   def get_seq_length_nd(self, sorted_seq_idx):
     """
     :type sorted_seq_idx: int
@@ -5,6 +5,7 @@ Provides :class:`CachedDataset2`.
 
 from .basic import Dataset, DatasetSeq
 from threading import Condition
+from multiprocessing.pool import ThreadPool, ApplyResult
 import typing
 try:
   # noinspection PyCompatibility
@@ -26,9 +27,18 @@ class CachedDataset2(Dataset):
   - handle seq ordering by overriding `init_seq_order`
   - you can set `_estimated_num_seqs`
   - you can set `_num_seqs` or `_num_timesteps` if you know them in advance
+
+  With the `readahead` option, the next seqs (in the current seq order) are collected in background threads.
+  This is only allowed if `_collect_single_seq` of the derived class is thread-safe.
   """
 
-  def __init__(self, **kwargs):
+  def __init__(self, readahead=0, readahead_num_threads=4, **kwargs):
+    """
+    :param int readahead: number of seqs to collect in advance in background threads, after the last loaded seq.
+      This requires that the derived class has a thread-safe `_collect_single_seq`,
+      and that the num seqs is known in advance.
+    :param int readahead_num_threads:
+    """
     super(CachedDataset2, self).__init__(**kwargs)
     self._num_timesteps = None
     self.epoch = None
@@ -36,6 +46,17 @@ class CachedDataset2(Dataset):
     self.added_data = []  # type: typing.List[DatasetSeq]
     self.expected_load_seq_start = 0
     self._num_timesteps_accumulated = 0
+    self.readahead = readahead
+    self.readahead_num_threads = readahead_num_threads
+    self._readahead_pool = None  # type: typing.Optional[ThreadPool]
+    self._readahead_results = {}  # type: typing.Dict[int,ApplyResult]  # seq_idx -> result
+
+  def __del__(self):
+    # noinspection PyBroadException
+    try:
+      self._readahead_close_pool()
+    except Exception:  # e.g. at shutdown. but does not matter
+      pass
 
   def init_seq_order(self, epoch=None, seq_list=None, seq_order=None):
     """
@@ -49,6 +70,8 @@ class CachedDataset2(Dataset):
     This is called when we start a new epoch, or at initialization.
     Call this when you reset the seq list.
     """
+    # Derived classes change their seq order after this call, so the readahead threads must be finished.
+    self._readahead_wait_all()
     super(CachedDataset2, self).init_seq_order(epoch=epoch, seq_list=seq_list, seq_order=seq_order)
     if not epoch:
       epoch = 1
@@ -60,6 +83,13 @@ class CachedDataset2(Dataset):
     self.epoch = epoch
     return True
 
+  def finish_epoch(self):
+    """
+    Called at the end of the epoch. Stops the readahead threads (recreated on demand in the next epoch).
+    """
+    self._readahead_close_pool()
+    super(CachedDataset2, self).finish_epoch()
+
   def _cleanup_old_seqs(self, seq_idx_end):
     """
     :param int seq_idx_end:
@@ -116,11 +146,63 @@ class CachedDataset2(Dataset):
       self.expected_load_seq_start = start
     if self.added_data:
       start = max(self.added_data[-1].seq_idx + 1, start)
-    seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
+    if self.readahead > 0:
+      seqs = self._readahead_collect_seqs(start, end)
+    else:
+      seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
     seqs = list(filter(None, seqs))  # We might not know the num seqs in advance.
     self._num_timesteps_accumulated += sum([seq.num_frames for seq in seqs])
     self.added_data += seqs
 
+  def _readahead_collect_seqs(self, start, end):
+    """
+    Collects the seqs in [start,end), using the results of the readahead threads if available,
+    and schedules the readahead of the seqs [end,end+readahead).
+
+    :param int start:
+    :param int end:
+    :rtype: list[DatasetSeq|None]
+    """
+    for seq_idx in [seq_idx for seq_idx in self._readahead_results if seq_idx < start]:
+      del self._readahead_results[seq_idx]  # skipped seqs. will finish in the background
+    readahead_end = end + self.readahead
+    # noinspection PyBroadException
+    try:
+      readahead_end = min(readahead_end, self.num_seqs)
+    except Exception:  # num seqs unknown. we might collect past the end, so no readahead
+      readahead_end = end
+    if self._readahead_pool is None and readahead_end > end:
+      self._readahead_pool = ThreadPool(self.readahead_num_threads)
+    for seq_idx in range(end, readahead_end):
+      if seq_idx not in self._readahead_results:
+        self._readahead_results[seq_idx] = self._readahead_pool.apply_async(
+          self._collect_single_seq, kwds={"seq_idx": seq_idx})
+    seqs = []
+    for seq_idx in range(start, end):
+      if seq_idx in self._readahead_results:
+        seqs.append(self._readahead_results.pop(seq_idx).get())
+      else:
+        seqs.append(self._collect_single_seq(seq_idx=seq_idx))
+    return seqs
+
+  def _readahead_wait_all(self):
+    """
+    Waits until all pending readahead threads are finished, and discards their results.
+    """
+    for result in self._readahead_results.values():
+      result.wait()
+    self._readahead_results.clear()
+
+  def _readahead_close_pool(self):
+    """
+    Waits for the pending readahead threads, and closes the thread pool.
+    """
+    self._readahead_wait_all()
+    if self._readahead_pool is not None:
+      self._readahead_pool.close()
+      self._readahead_pool.join()
+      self._readahead_pool = None
+
   def is_less_than_num_seqs(self, n):
     """
     :param int n:
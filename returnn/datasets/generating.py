@@ -7,7 +7,7 @@ from __future__ import print_function
 
 from .basic import Dataset, DatasetSeq, convert_data_dims
 from .cached2 import CachedDataset2
-from returnn.util.basic import class_idx_seq_to_1_of_k, CollectionReadCheckCovered, PY3
+from returnn.util.basic import class_idx_seq_to_1_of_k, CollectionReadCheckCovered, LRUCache, PY3
 from returnn.log import log
 import numpy
 import re
@@ -1251,6 +1251,33 @@ class ExtractAudioFeatures:
     """
     return (self.with_delta + 1) * self.num_feature_filters * (self.join_frames or 1)
 
+  def get_cache_key(self):
+    """
+    The features only depend on the audio and on the options if there is no randomness involved.
+    Custom functions (``pre_process``, ``post_process``, callable ``features``) might be random,
+    and we also cannot reliably hash them, so we don't allow caching in that case.
+
+    :return: hash of all options which influence the features, or None if the features should not be cached
+    :rtype: str|None
+    """
+    import hashlib
+    if self.random_permute_opts and self.random_permute_opts.truth_value:
+      return None
+    if self.pre_process or self.post_process or callable(self.features):
+      return None
+    h = hashlib.md5()
+    for value in [
+          self.window_len, self.step_len, self.num_feature_filters, self.with_delta, self.features,
+          sorted((self.feature_options or {}).items()), sorted((self.raw_ogg_opts or {}).items()),
+          self.sample_rate, self.num_channels, self.peak_normalization, self.preemphasis, self.join_frames,
+          self.norm_mean, self.norm_std_dev]:
+      if isinstance(value, numpy.ndarray):
+        h.update(value.tobytes())
+      else:
+        h.update(repr(value).encode("utf8"))
+      h.update(b";")
+    return h.hexdigest()
+
 
 def _get_audio_linear_spectrogram(audio, sample_rate, window_len=0.025, step_len=0.010, num_feature_filters=512):
   """
@@ -2032,12 +2059,13 @@ class BytePairEncoding(Vocabulary):
   Proceedings of the 54th Annual Meeting of the Association for Computational Linguistics (ACL 2016). Berlin, Germany.
   """
 
-  def __init__(self, vocab_file, bpe_file, seq_postfix=None, unknown_label="UNK"):
+  def __init__(self, vocab_file, bpe_file, seq_postfix=None, unknown_label="UNK", encode_cache_size=100000):
     """
     :param str vocab_file:
     :param str bpe_file:
     :param list[int]|None seq_postfix: labels will be added to the seq in self.get_seq
     :param str|None unknown_label:
+    :param int|None encode_cache_size: max number of encoded words to keep in the LRU cache. None means unbounded
     """
     super(BytePairEncoding, self).__init__(vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label)
     # check version information
@@ -2051,7 +2079,7 @@ class BytePairEncoding(Vocabulary):
     # some hacking to deal with duplicates (only consider first instance)
     self._bpe_codes = dict([(code, i) for (i, code) in reversed(list(enumerate(self._bpe_codes)))])
     self._bpe_codes_reverse = dict([(pair[0] + pair[1], pair) for pair, i in self._bpe_codes.items()])
-    self._bpe_encode_cache = {}
+    self._bpe_encode_cache = LRUCache(max_size=encode_cache_size)
     self._bpe_separator = '@@'
 
   @staticmethod
@@ -2075,8 +2103,9 @@ class BytePairEncoding(Vocabulary):
     :rtype: tuple[str]
     """
 
-    if orig in self._bpe_encode_cache:
-      return self._bpe_encode_cache[orig]
+    word = self._bpe_encode_cache.get(orig)
+    if word is not None:
+      return word
 
     if self._bpe_file_version == (0, 1):
       word = tuple(orig) + ('</w>',)
@@ -2085,38 +2114,10 @@ class BytePairEncoding(Vocabulary):
     else:
       raise NotImplementedError
 
-    pairs = self._get_pairs(word)
-    if not pairs:
+    if len(word) < 2:  # no pairs
       return orig
 
-    while True:
-      bigram = min(pairs, key=lambda pair: self._bpe_codes.get(pair, float('inf')))
-      if bigram not in self._bpe_codes:
-        break
-      first, second = bigram
-      new_word = []
-      i = 0
-      while i < len(word):
-        try:
-          j = word.index(first, i)
-          new_word.extend(word[i:j])
-          i = j
-        except ValueError:
-          new_word.extend(word[i:])
-          break
-
-        if word[i] == first and i < len(word) - 1 and word[i + 1] == second:
-          new_word.append(first + second)
-          i += 2
-        else:
-          new_word.append(word[i])
-          i += 1
-      new_word = tuple(new_word)
-      word = new_word
-      if len(word) == 1:
-        break
-      else:
-        pairs = self._get_pairs(word)
+    word = self._merge_symbols(word)
 
     # don't print end-of-word symbols
     if word[-1] == '</w>':
@@ -2130,6 +2131,61 @@ class BytePairEncoding(Vocabulary):
     self._bpe_encode_cache[orig] = word
     return word
 
+  def _merge_symbols(self, word):
+    """
+    Applies the BPE merge operations.
+    In every step, the pair with the lowest rank (i.e. first in the BPE file) is merged,
+    at all its (non-overlapping) occurrences from left to right, like in subword-nmt.
+    Instead of searching over all pairs in every step, we keep a priority queue of the pairs (rank, pos),
+    and a linked list over the symbols.
+
+    :param tuple[str] word: represented as tuple of symbols (symbols being variable-length strings)
+    :return: merged symbols
+    :rtype: tuple[str]
+    """
+    import heapq
+    codes = self._bpe_codes
+    symbols = list(word)  # type: typing.List[typing.Optional[str]]  # None if merged into the left neighbor
+    next_pos = list(range(1, len(symbols))) + [-1]
+    prev_pos = list(range(-1, len(symbols) - 1))
+    queue = []  # type: typing.List[typing.Tuple[int,int,str,str]]  # rank, pos, pair
+    for pos in range(len(symbols) - 1):
+      pair = (symbols[pos], symbols[pos + 1])
+      if pair in codes:
+        queue.append((codes[pair], pos) + pair)
+    heapq.heapify(queue)
+
+    def add_pair(left_pos):
+      """
+      :param int left_pos:
+      """
+      pair_ = (symbols[left_pos], symbols[next_pos[left_pos]])
+      if pair_ in codes:
+        heapq.heappush(queue, (codes[pair_], left_pos) + pair_)
+
+    while queue:
+      # Get all occurrences of the best pair. They come sorted by position.
+      # New pairs can never be the same pair again, as they contain the merged symbol.
+      rank, pos, first, second = heapq.heappop(queue)
+      positions = [pos]
+      while queue and queue[0][0] == rank:
+        positions.append(heapq.heappop(queue)[1])
+      for pos in positions:
+        # Check that the pair is still valid, i.e. not changed by a previous merge.
+        if symbols[pos] != first or next_pos[pos] < 0 or symbols[next_pos[pos]] != second:
+          continue
+        right_pos = next_pos[pos]
+        symbols[pos] = first + second
+        symbols[right_pos] = None
+        next_pos[pos] = next_pos[right_pos]
+        if next_pos[pos] >= 0:
+          prev_pos[next_pos[pos]] = pos
+          add_pair(pos)
+        if prev_pos[pos] >= 0:
+          add_pair(prev_pos[pos])
+
+    return tuple([symbol for symbol in symbols if symbol is not None])
+
   def check_vocab_and_split(self, orig, bpe_codes, vocab, separator):
     """Check for each segment in word if it is in-vocabulary,
     and segment OOV segments into smaller units by reversing the BPE merge operations"""
@@ -2182,10 +2238,11 @@ class BytePairEncoding(Vocabulary):
       for item in self.recursive_split(right, bpe_codes, vocab, separator, final):
         yield item
 
-  def _segment_sentence(self, sentence):
+  def _segment_sentence(self, sentence, encoded_words=None):
     """
     Segment single sentence (whitespace-tokenized string) with BPE encoding.
     :param str sentence:
+    :param dict[str,tuple[str]]|None encoded_words: if given, used instead of :func:`_encode_word`
     :rtype: list[str]
     """
 
@@ -2206,7 +2263,7 @@ class BytePairEncoding(Vocabulary):
       else:
         found_category = False
         skip_category = False
-        new_word = self._encode_word(word)
+        new_word = encoded_words[word] if encoded_words is not None else self._encode_word(word)
 
         for item in new_word[:-1]:
           output.append(item + self._bpe_separator)
@@ -2223,6 +2280,22 @@ class BytePairEncoding(Vocabulary):
     seq = self.get_seq_indices(segments)
     return seq + self.seq_postfix
 
+  def get_seqs(self, sentences):
+    """
+    Batched variant of :func:`get_seq`.
+    Every distinct word is encoded only once over all the sentences, independent of the cache.
+
+    :param list[str] sentences:
+    :rtype: list[list[int]]
+    """
+    words = set()
+    for sentence in sentences:
+      words.update(sentence.split())
+    encoded_words = {word: self._encode_word(word) for word in words}
+    return [
+      self.get_seq_indices(self._segment_sentence(sentence, encoded_words=encoded_words)) + self.seq_postfix
+      for sentence in sentences]
+
 
 class CharacterTargets(Vocabulary):
   """
@@ -2780,6 +2853,7 @@ class OggZipDataset(CachedDataset2):
                zip_audio_files_have_name_as_prefix=True,
                fixed_random_seed=None, fixed_random_subset=None,
                epoch_wise_filter=None,
+               feature_cache=None, feature_cache_dtype="float32",
                **kwargs):
     """
     :param str|list[str] path: filename to zip
@@ -2795,6 +2869,11 @@ class OggZipDataset(CachedDataset2):
       If given, will use this random subset. This will be applied initially at loading time,
       i.e. not dependent on the epoch. It will use an internally hardcoded fixed random seed, i.e. it's deterministic.
     :param dict|None epoch_wise_filter: see init_seq_order
+    :param str|bool|None feature_cache: if set, stores the extracted audio features on disk,
+      such that the audio decoding and feature extraction is only done once per audio file.
+      If str, this is the cache directory. If True, we use a directory in the temp dir.
+      Not used if the features are not deterministic, see :func:`ExtractAudioFeatures.get_cache_key`.
+    :param str feature_cache_dtype: "float32" or "float16" (half the disk space, but lossy)
     """
     import os
     import zipfile
@@ -2851,6 +2930,18 @@ class OggZipDataset(CachedDataset2):
     self.feature_extractor = (
       ExtractAudioFeatures(random_state=self._audio_random, **audio) if audio is not None else None)
     self.num_inputs = self.feature_extractor.get_feature_dimension() if self.feature_extractor else 0
+    self._feature_cache_dir = None  # type: typing.Optional[str]
+    self._feature_cache_dtype = feature_cache_dtype
+    if feature_cache and self.feature_extractor:
+      assert feature_cache_dtype in ("float32", "float16")
+      cache_key = self.feature_extractor.get_cache_key()
+      if cache_key:
+        if feature_cache is True:
+          feature_cache = "%s/returnn_feature_cache" % returnn.util.basic.get_temp_dir()
+        self._feature_cache_dir = "%s/%s-%s" % (feature_cache, cache_key[:16], feature_cache_dtype)
+        print("%s: using feature cache %r" % (self, self._feature_cache_dir), file=log.v4)
+      else:
+        print("%s: audio features are not deterministic, not using the feature cache" % self, file=log.v3)
     self.num_outputs = {
       "raw": {"dtype": "string", "shape": ()},
       "orth": [256, 1]}
@@ -2888,6 +2979,40 @@ class OggZipDataset(CachedDataset2):
       return self._zip_files[zip_index].read(filename)
     return open("%s/%s" % (self.paths[0], filename), "rb").read()
 
+  _TxtIndexKeys = ("text", "duration", "file", "seq_name")
+
+  def _read_txt_index(self, zip_index):
+    """
+    :param int zip_index: index of the zip file to load, unused when loading without zip
+    :return: data entries of the txt file, potentially via the seq_meta_cache
+    :rtype: list[dict[str]]
+    """
+    name = self._names[zip_index]
+    if name in self._separate_txt_files:
+      source_file = self._separate_txt_files[name]
+    elif self._zip_files is not None:
+      source_file = self.paths[zip_index]
+    else:
+      source_file = "%s/%s.txt" % (self.paths[0], name)
+    seq_meta_cache = self._get_seq_meta_cache(source_file, opts={"name": name})
+    seq_meta = seq_meta_cache.load() if seq_meta_cache else None
+    if seq_meta is not None:
+      keys = [key for key in self._TxtIndexKeys if key in seq_meta]
+      columns = [seq_meta[key].tolist() if key == "duration" else seq_meta[key] for key in keys]
+      return [dict(zip(keys, values)) for values in zip(*columns)]
+    data = eval(self._read("%s.txt" % name, zip_index))  # type: typing.List[typing.Dict[str]]
+    if seq_meta_cache and data and isinstance(data, list):
+      keys = set(data[0].keys())
+      if keys.issubset(self._TxtIndexKeys) and all(set(entry.keys()) == keys for entry in data):
+        seq_meta_cache.save({
+          key: numpy.array([entry[key] for entry in data], dtype="float64") if key == "duration" else
+          [entry[key] for entry in data]
+          for key in keys})
+      else:
+        print("%s: entries in %s.txt have other keys than %r, cannot use seq_meta_cache" % (
+          self, name, self._TxtIndexKeys), file=log.v3)
+    return data
+
   def _collect_data_part(self, zip_index):
     """
     collect all the entries of a single zip-file or txt file
@@ -2895,7 +3020,7 @@ class OggZipDataset(CachedDataset2):
     :return: data entries
     :rtype: list[dict[str]]
     """
-    data = eval(self._read("%s.txt" % self._names[zip_index], zip_index))  # type: typing.List[typing.Dict[str]]
+    data = self._read_txt_index(zip_index)
     assert data and isinstance(data, list)
     first_entry = data[0]
     assert isinstance(first_entry, dict)
@@ -3085,20 +3210,78 @@ class OggZipDataset(CachedDataset2):
       targets_seq = []
     return targets_seq, raw_targets_txt
 
-  def _open_audio_file(self, seq_idx):
+  def _get_audio_filename(self, seq_idx):
     """
     :param int seq_idx:
-    :return: io.FileIO
+    :return: filename in the zip-file (or relative to the dir), zip index
+    :rtype: (str, int)
     """
-    import io
     seq = self._data[self._get_ref_seq_idx(seq_idx)]
     if self.zip_audio_files_have_name_as_prefix:
       audio_fn = "%s/%s" % (self._names[seq['_zip_file_index']], seq["file"])
     else:
       audio_fn = seq["file"]
-    raw_bytes = self._read(audio_fn, seq['_zip_file_index'])
+    return audio_fn, seq['_zip_file_index']
+
+  def _open_audio_file(self, seq_idx):
+    """
+    :param int seq_idx:
+    :return: io.FileIO
+    """
+    import io
+    audio_fn, zip_index = self._get_audio_filename(seq_idx)
+    raw_bytes = self._read(audio_fn, zip_index)
     return io.BytesIO(raw_bytes)
 
+  def _get_feature_cache_filename(self, seq_idx):
+    """
+    The cache entry is identified by the audio file name and its size and CRC (zip) or mtime (dir),
+    so a modified audio file gets a new entry.
+
+    :param int seq_idx:
+    :return: filename of the .npy file in the feature cache
+    :rtype: str
+    """
+    import os
+    import hashlib
+    audio_fn, zip_index = self._get_audio_filename(seq_idx)
+    if self._zip_files is not None:
+      info = self._zip_files[zip_index].getinfo(audio_fn)
+      key = [os.path.basename(self.paths[zip_index]), audio_fn, info.file_size, info.CRC]
+    else:
+      filename = os.path.abspath("%s/%s" % (self.paths[0], audio_fn))
+      key = [filename, os.path.getsize(filename), os.path.getmtime(filename)]
+    key_hash = hashlib.md5(repr(key).encode("utf8")).hexdigest()
+    return "%s/%s/%s.npy" % (self._feature_cache_dir, key_hash[:2], key_hash)
+
+  def _get_audio_features(self, seq_idx, seq_tag):
+    """
+    :param int seq_idx:
+    :param str seq_tag:
+    :return: features, via the feature cache if enabled
+    :rtype: numpy.ndarray
+    """
+    import os
+    cache_fn = self._get_feature_cache_filename(seq_idx) if self._feature_cache_dir else None
+    if cache_fn and os.path.exists(cache_fn):
+      try:
+        return numpy.load(cache_fn, mmap_mode="r").astype("float32")
+      except (IOError, OSError, ValueError) as exc:
+        print("%s: cannot load feature cache file %r: %s" % (self, cache_fn, exc), file=log.v3)
+    with self._open_audio_file(seq_idx) as audio_file:
+      features = self.feature_extractor.get_audio_features_from_raw_bytes(audio_file, seq_name=seq_tag)
+    if cache_fn:
+      # Write to a tmp file and rename it, such that concurrent readers never see a partially written file.
+      tmp_fn = "%s.tmp.%i.npy" % (cache_fn[:-len(".npy")], os.getpid())
+      try:
+        if not os.path.exists(os.path.dirname(cache_fn)):
+          os.makedirs(os.path.dirname(cache_fn))
+        numpy.save(tmp_fn, features.astype(self._feature_cache_dtype))
+        os.rename(tmp_fn, cache_fn)
+      except (IOError, OSError) as exc:
+        print("%s: cannot write feature cache file %r: %s" % (self, cache_fn, exc), file=log.v3)
+    return features
+
   def _collect_single_seq(self, seq_idx):
     """
     :param int seq_idx:
@@ -3106,8 +3289,7 @@ class OggZipDataset(CachedDataset2):
     """
     seq_tag = self.get_tag(seq_idx)
     if self.feature_extractor:
-      with self._open_audio_file(seq_idx) as audio_file:
-        features = self.feature_extractor.get_audio_features_from_raw_bytes(audio_file, seq_name=seq_tag)
+      features = self._get_audio_features(seq_idx, seq_tag)
     else:
       features = numpy.zeros(())  # currently the API requires some dummy values...
     targets, txt = self._get_transcription(seq_idx)
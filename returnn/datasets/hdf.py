@@ -12,6 +12,7 @@ import numpy
 from .cached import CachedDataset
 from .cached2 import CachedDataset2
 from .basic import Dataset, DatasetSeq
+from .seq_meta_cache import StringList
 from returnn.log import log
 
 
@@ -29,19 +30,30 @@ class HDFDataset(CachedDataset):
   This was the main original dataset format of RETURNN.
   """
 
-  def __init__(self, files=None, use_cache_manager=False, **kwargs):
+  def __init__(self, files=None, use_cache_manager=False, use_memmap=False, **kwargs):
     """
     :param None|list[str] files:
     :param bool use_cache_manager: uses :func:`Util.cf` for files
-    """
+    :param bool use_memmap: for all contiguous uncompressed HDF datasets (e.g. as written by :class:`HDFDatasetWriter`),
+      get_data returns read-only :class:`numpy.memmap` views into the file, without any copy.
+      The OS page cache does the caching then (shared between processes), thus this implies cache_byte_size=0.
+      Chunked (e.g. compressed or resizable) HDF datasets fall back to reading via h5py.
+    """
+    if use_memmap:
+      if kwargs.get("cache_byte_size", 0) != 0:
+        print("HDFDataset: use_memmap, ignoring cache_byte_size %r" % kwargs["cache_byte_size"], file=log.v3)
+      kwargs["cache_byte_size"] = 0
     super(HDFDataset, self).__init__(**kwargs)
     assert self.partition_epoch == 1 or self.cache_byte_size_total_limit == 0, (
       "To use partition_epoch in HDFDatasets, disable caching by setting cache_byte_size=0")
     self._use_cache_manager = use_cache_manager
+    self.use_memmap = use_memmap
+    self._file_memmaps = []  # type: typing.List[typing.Dict[str,numpy.ndarray]]  # via use_memmap
     self.files = []  # type: typing.List[str]  # file names
     self.h5_files = []  # type: typing.List[h5py.File]
     self.file_start = [0]
     self.file_seq_start = []  # type: typing.List[numpy.ndarray]
+    self._file_seq_tags = []  # type: typing.List[typing.Optional[StringList]]  # via seq_meta_cache
     self.data_dtype = {}  # type: typing.Dict[str,str]
     self.data_sparse = {}  # type: typing.Dict[str,bool]
     if files:
@@ -57,6 +69,8 @@ class HDFDataset(CachedDataset):
         pass
     del self.h5_files[:]
     del self.file_seq_start[:]
+    del self._file_seq_tags[:]
+    del self._file_memmaps[:]
 
   @staticmethod
   def _decode(s):
@@ -113,7 +127,16 @@ class HDFDataset(CachedDataset):
     else:
       self.target_keys = ['classes']
 
-    seq_lengths = fin[attr_seqLengths][...]  # shape (num_seqs,num_target_keys + 1)
+    seq_meta_cache = self._get_seq_meta_cache(filename)
+    seq_meta = seq_meta_cache.load() if seq_meta_cache else None
+    if seq_meta is None:
+      seq_meta = {"seq_lengths": fin[attr_seqLengths][...]}
+      if seq_meta_cache:
+        if "seqTags" in fin:
+          seq_meta["seq_tags"] = StringList.from_strings(map(self._decode, fin["seqTags"][...].tolist()))
+        seq_meta_cache.save(seq_meta)
+    self._file_seq_tags.append(seq_meta.get("seq_tags"))
+    seq_lengths = seq_meta["seq_lengths"]  # shape (num_seqs,num_target_keys + 1)
     if len(seq_lengths.shape) == 1:
       seq_lengths = numpy.array(zip(*[seq_lengths.tolist() for _ in range(len(self.target_keys)+1)]))
     assert seq_lengths.ndim == 2 and seq_lengths.shape[1] == len(self.target_keys) + 1
@@ -196,6 +219,26 @@ class HDFDataset(CachedDataset):
           self.num_outputs[str(name)] = (dim, ndim)
     self.data_dtype["data"] = str(fin['inputs'].dtype)
     assert len(self.target_keys) == len(self.file_seq_start[0][0]) - 1
+    self._file_memmaps.append(self._get_file_memmaps(filename, fin) if self.use_memmap else {})
+
+  def _get_file_memmaps(self, filename, fin):
+    """
+    :param str filename:
+    :param h5py.File fin:
+    :return: data key -> memmap of the whole HDF dataset, for all which are stored contiguously
+    :rtype: dict[str,numpy.ndarray]
+    """
+    h5_datasets = {"data": fin["inputs"]}
+    if "targets" in fin:
+      h5_datasets.update({k: fin["targets/data/" + k] for k in fin["targets/data"]})
+    res = {}
+    for key, h5_dataset in sorted(h5_datasets.items()):
+      offset = h5_dataset.id.get_offset()  # None if chunked or not allocated
+      if offset is None or h5_dataset.dtype.hasobject or h5_dataset.size == 0:
+        print("HDFDataset, %s: %r not stored contiguously, cannot use memmap" % (filename, key), file=log.v4)
+        continue
+      res[key] = numpy.memmap(filename, dtype=h5_dataset.dtype, mode="r", offset=offset, shape=h5_dataset.shape)
+    return res
 
   def _load_seqs(self, start, end):
     """
@@ -268,15 +311,16 @@ class HDFDataset(CachedDataset):
     real_file_seq_idx = real_seq_idx - self.file_start[file_idx]
     start_pos = self.file_seq_start[file_idx][real_file_seq_idx]
     end_pos = self.file_seq_start[file_idx][real_file_seq_idx + 1]
+    memmaps = self._file_memmaps[file_idx]
 
     if key == "data":
-      inputs = fin['inputs']
+      inputs = memmaps["data"] if "data" in memmaps else fin['inputs']
       data = inputs[start_pos[0]:end_pos[0]]
       if self.window > 1:
         data = self._sliding_window(data)
     else:
       assert 'targets' in fin
-      targets = fin['targets/data/' + key]
+      targets = memmaps[key] if key in memmaps else fin['targets/data/' + key]
       ldx = self.target_keys.index(key) + 1
       data = targets[start_pos[ldx]:end_pos[ldx]]
     return data
@@ -323,10 +367,19 @@ class HDFDataset(CachedDataset):
 
     return end_pos - start_pos
 
+  def _get_all_seq_lengths_by_real_idx(self):
+    """
+    :return: length of "data" for all real seq idx, shape (num_seqs,)
+    :rtype: numpy.ndarray
+    """
+    return numpy.concatenate([numpy.diff(seq_start[:, 0]) for seq_start in self.file_seq_start])
+
   def _get_tag_by_real_idx(self, real_seq_idx):
     file_idx = self._get_file_index(real_seq_idx)
     real_file_seq_idx = real_seq_idx - self.file_start[file_idx]
 
+    if self._file_seq_tags[file_idx] is not None:
+      return self._file_seq_tags[file_idx][real_file_seq_idx]
     s = self.h5_files[file_idx]["seqTags"][real_file_seq_idx]
     s = self._decode(s)
     return s
@@ -344,9 +397,12 @@ class HDFDataset(CachedDataset):
     :rtype: list[str]
     """
     tags = []
-    for h5_file in self.h5_files:
-      tags += h5_file["seqTags"][...].tolist()
-    return list(map(self._decode, tags))
+    for h5_file, file_seq_tags in zip(self.h5_files, self._file_seq_tags):
+      if file_seq_tags is not None:
+        tags += list(file_seq_tags)
+      else:
+        tags += map(self._decode, h5_file["seqTags"][...].tolist())
+    return tags
 
   def get_total_num_seqs(self):
     """
@@ -953,9 +1009,14 @@ class SimpleHDFWriter:
   which can be read later by :class:`HDFDataset`.
 
   Note that we dump to a temp file first, and only at :func:`close` we move it over to the real destination.
+
+  The inserted seqs are buffered in memory, and written in :func:`flush`,
+  with a single resize and a single write per HDF dataset.
+  Writing (and resizing) the HDF datasets seq by seq is very slow for large corpora.
   """
 
-  def __init__(self, filename, dim, labels=None, ndim=None, extra_type=None, swmr=False, extend_existing_file=False):
+  def __init__(self, filename, dim, labels=None, ndim=None, extra_type=None, swmr=False, extend_existing_file=False,
+               buffer_max_bytes=0, background_write=False):
     """
     :param str filename: Create file, truncate if exists
     :param int|None dim:
@@ -964,6 +1025,10 @@ class SimpleHDFWriter:
     :param dict[str,(int,int,str)]|None extra_type: key -> (dim,ndim,dtype)
     :param bool swmr: see http://docs.h5py.org/en/stable/swmr.html
     :param bool extend_existing_file: True also means we expect that it exists
+    :param int buffer_max_bytes: flush once the buffered data is bigger than this.
+      With 0, we flush at the end of every :func:`insert_batch`.
+    :param bool background_write: write to the HDF in a background thread, such that :func:`insert_batch`
+      does not need to wait for it. The next flush waits for the previous write.
     """
     from returnn.util.basic import hdf5_strings, unicode
     import tempfile
@@ -1028,6 +1093,17 @@ class SimpleHDFWriter:
     if extra_type:
       self._prepare_extra(extra_type)
 
+    self.buffer_max_bytes = buffer_max_bytes
+    self._buffer_seq_tags = []  # type: typing.List[str]
+    self._buffer_seq_lens = []  # type: typing.List[typing.Dict[str,int]]  # per seq: data key -> len
+    self._buffer_data = {}  # type: typing.Dict[str,typing.List[numpy.ndarray]]  # data key -> list of seq data
+    self._buffer_num_bytes = 0
+    self._write_pool = None
+    self._write_result = None
+    if background_write:
+      from multiprocessing.pool import ThreadPool
+      self._write_pool = ThreadPool(1)
+
     if swmr:
       assert not self._file.swmr_mode  # this also checks whether the attribute exists (right version)
       self._file.swmr_mode = True
@@ -1081,12 +1157,13 @@ class SimpleHDFWriter:
       self._seq_lengths.resize(1 + len(self._prepared_extra), axis=1)
     return bool(added_count)
 
-  def _insert_h5_inputs(self, raw_data):
+  def _insert_h5_inputs(self, raw_data, num_seqs=1):
     """
-    Inserts a record into the hdf5-file.
+    Inserts records into the hdf5-file.
     Resizes if necessary.
 
-    :param numpy.ndarray raw_data: shape=(time,data) or shape=(time,)
+    :param numpy.ndarray raw_data: shape=(time,data) or shape=(time,), concatenated over num_seqs
+    :param int num_seqs:
     """
     assert raw_data.ndim >= 1
     name = "inputs"
@@ -1102,15 +1179,16 @@ class SimpleHDFWriter:
     # append raw data to dataset
     self._datasets[name][self._file.attrs['numTimesteps']:] = raw_data
     self._file.attrs['numTimesteps'] += raw_data.shape[0]
-    self._file.attrs['numSeqs'] += 1
+    self._file.attrs['numSeqs'] += num_seqs
 
-  def _insert_h5_other(self, data_key, raw_data, dtype=None, add_time_dim=False, dim=None):
+  @staticmethod
+  def _get_h5_other_raw_data(raw_data, dtype=None, add_time_dim=False):
     """
-    :param str data_key:
     :param numpy.ndarray|int|float|list[int] raw_data: shape=(time,data) or shape=(time,) or shape=()...
     :param str|None dtype:
     :param bool add_time_dim:
-    :param int|None dim:
+    :return: raw_data, with time dim
+    :rtype: numpy.ndarray
     """
     if isinstance(raw_data, (int, float, list, numpy.float32)):
       raw_data = numpy.array(raw_data)
@@ -1120,39 +1198,91 @@ class SimpleHDFWriter:
     assert raw_data.ndim > 0 and raw_data.shape[0] > 0
     if dtype:
       raw_data = raw_data.astype(dtype)
-    if dim is None:
-      if raw_data.ndim > 1:
-        dim = raw_data.shape[-1]
-      else:
-        dim = 1  # dummy
-
-    # We assume that _insert_h5_inputs was called before.
-    assert self._file.attrs['numSeqs'] > 0 and self._seq_lengths.shape[0] > 0
-    seq_idx = self._file.attrs['numSeqs'] - 1
-
-    if raw_data.dtype == numpy.object:
-      # Is this a string?
-      assert isinstance(raw_data.flat[0], (str, bytes))
-      dtype = "string"
-    else:
-      dtype = raw_data.dtype.name
-    if self._prepare_extra({data_key: (dim, raw_data.ndim, dtype)}):
-      # We added it now. Maybe other extra data keys were added before. The data_key_idx is different now.
-      # Thus, seq_lengths might have become invalid. Reinit them.
-      assert seq_idx == 0 or self.extend_existing_file  # We can only do that in the beginning.
-      for data_key_idx_0, data_key_ in enumerate(sorted(self._prepared_extra)):
-        self._seq_lengths[seq_idx, data_key_idx_0 + 1] = self._extra_num_time_steps[data_key_]
+    return raw_data
 
+  def _insert_h5_other(self, data_key, raw_data):
+    """
+    :param str data_key:
+    :param numpy.ndarray raw_data: from :func:`_get_h5_other_raw_data`, concatenated over multiple seqs
+    """
     self._extra_num_time_steps[data_key] += raw_data.shape[0]
     self._datasets[data_key].resize(self._extra_num_time_steps[data_key], axis=0)
-
-    data_key_idx = sorted(self._prepared_extra).index(data_key) + 1
-    self._seq_lengths[seq_idx, data_key_idx] = raw_data.shape[0]
-
     offset = self._extra_num_time_steps[data_key] - raw_data.shape[0]
     hdf_data = self._datasets[data_key]
     hdf_data[offset:] = raw_data
 
+  def _buffer_add(self, data_key, raw_data):
+    """
+    :param str data_key:
+    :param numpy.ndarray raw_data: for the current (last) seq
+    """
+    self._buffer_data.setdefault(data_key, []).append(raw_data)
+    self._buffer_seq_lens[-1][data_key] = raw_data.shape[0]
+    self._buffer_num_bytes += raw_data.nbytes
+
+  def flush(self):
+    """
+    Writes all buffered seqs to the HDF file.
+    With background_write, this returns before the write is finished.
+    """
+    if not self._buffer_seq_tags:
+      return
+    seq_tags, seq_lens = self._buffer_seq_tags, self._buffer_seq_lens
+    data = {key: numpy.concatenate(values, axis=0) for (key, values) in self._buffer_data.items()}
+    self._buffer_seq_tags, self._buffer_seq_lens, self._buffer_data = [], [], {}
+    self._buffer_num_bytes = 0
+    self._wait_for_write()
+    if self._write_pool:
+      self._write_result = self._write_pool.apply_async(self._write, (seq_tags, seq_lens, data))
+    else:
+      self._write(seq_tags=seq_tags, seq_lens=seq_lens, data=data)
+
+  def _wait_for_write(self):
+    """
+    Waits for the background write, and reraises its exception, if there was any.
+    """
+    if self._write_result:
+      write_result, self._write_result = self._write_result, None
+      write_result.get()
+
+  def _write(self, seq_tags, seq_lens, data):
+    """
+    :param list[str] seq_tags:
+    :param list[dict[str,int]] seq_lens: per seq: data key -> len
+    :param dict[str,numpy.ndarray] data: data key -> concatenated seq data
+    """
+    n_seqs = len(seq_tags)
+    seq_offset = self._seq_lengths.shape[0]
+    for data_key, raw_data in sorted(data.items()):
+      if data_key == "inputs":
+        continue
+      if raw_data.dtype == object:
+        # Is this a string?
+        assert isinstance(raw_data.flat[0], (str, bytes))
+        dtype = "string"
+      else:
+        dtype = raw_data.dtype.name
+      dim = raw_data.shape[-1] if raw_data.ndim > 1 else 1  # 1 is dummy
+      if self._prepare_extra({data_key: (dim, raw_data.ndim, dtype)}):
+        # We added it now. Maybe other extra data keys were added before. The data_key_idx is different now.
+        # Thus, seq_lengths of existing seqs would become invalid.
+        assert seq_offset == 0 or self.extend_existing_file  # We can only do that in the beginning.
+
+    extra_keys = sorted(self._prepared_extra)
+    seq_lengths = numpy.zeros((n_seqs, self._seq_lengths.shape[1]), dtype=self._seq_lengths.dtype)
+    for i, seq_lens_ in enumerate(seq_lens):
+      for data_key, seq_len in seq_lens_.items():
+        seq_lengths[i, 0 if data_key == "inputs" else (extra_keys.index(data_key) + 1)] = seq_len
+    self._seq_lengths.resize(seq_offset + n_seqs, axis=0)
+    self._seq_lengths[seq_offset:] = seq_lengths
+    self._seq_tags.resize(seq_offset + n_seqs, axis=0)
+    self._seq_tags[seq_offset:] = numpy.array(seq_tags, dtype=self._seq_tags.dtype)
+
+    self._insert_h5_inputs(data["inputs"], num_seqs=n_seqs)
+    for data_key in extra_keys:
+      if data_key in data:
+        self._insert_h5_other(data_key, data[data_key])
+
   def insert_batch(self, inputs, seq_len, seq_tag, extra=None):
     """
     :param numpy.ndarray inputs: shape=(n_batch,time,data) (or (n_batch,time), or (n_batch,time1,time2), ...)
@@ -1186,12 +1316,12 @@ class SimpleHDFWriter:
       assert all([n_batch == value.shape[0] for value in extra.values()]), (
         "n_batch %i, extra shapes: %r" % (n_batch, {key: value.shape for (key, value) in extra.items()}))
 
-    seqlen_offset = self._seq_lengths.shape[0]
-    self._seq_lengths.resize(seqlen_offset + n_batch, axis=0)
-    self._seq_tags.resize(seqlen_offset + n_batch, axis=0)
-
     for i in range(n_batch):
-      self._seq_tags[seqlen_offset + i] = numpy.array(seq_tag[i], dtype=self._seq_tags.dtype)
+      tag = seq_tag[i]
+      if isinstance(tag, bytes):
+        tag = tag.decode("utf8")
+      self._buffer_seq_tags.append(tag)
+      self._buffer_seq_lens.append({})
       # Note: Currently, our HDFDataset does not support to have multiple axes with dynamic length.
       # Thus, we flatten all together, and calculate the flattened seq len.
       # (Ignore this if there is only a single time dimension.)
@@ -1200,29 +1330,31 @@ class SimpleHDFWriter:
       flat_shape = [flat_seq_len]
       if self.dim and not sparse:
         flat_shape.append(self.dim)
-      self._seq_lengths[seqlen_offset + i, 0] = flat_seq_len
       data = inputs[i]
       data = data[tuple([slice(None, seq_len[axis][i]) for axis in range(ndim_with_seq_len)])]
       data = numpy.reshape(data, flat_shape)
-      self._insert_h5_inputs(data)
+      self._buffer_add("inputs", data)
       if len(seq_len) > 1:
         # Note: Because we have flattened multiple axes with dynamic len into a single one,
         # we want to store the individual axes lengths. We store those in a separate data entry "sizes".
         # Note: We could add a dummy time-dim for this "sizes", and then have a feature-dim = number of axes.
         # However, we keep it consistent to how we handled it in our 2D MDLSTM experiments.
-        self._insert_h5_other(
-          "sizes", [seq_len[axis][i] for axis in range(ndim_with_seq_len)], add_time_dim=False, dtype="int32")
+        self._buffer_add(
+          "sizes",
+          self._get_h5_other_raw_data([seq_len[axis][i] for axis in range(ndim_with_seq_len)], dtype="int32"))
       if extra:
         try:
           for key, value in extra.items():
             assert value.shape[0] == n_batch
-            self._insert_h5_other(key, value[i])
+            self._buffer_add(key, self._get_h5_other_raw_data(value[i]))
         except Exception:
           print("%s: insert extra exception. input shape %r, seq len %r, extra shapes: %r" % (
             self, inputs.shape, seq_len,
             {key: value.shape if isinstance(value, numpy.ndarray) else repr(value) for (key, value) in extra.items()}),
             file=log.v3)
           raise
+    if self._buffer_num_bytes >= self.buffer_max_bytes:
+      self.flush()
 
   def close(self):
     """
@@ -1231,6 +1363,11 @@ class SimpleHDFWriter:
     import os
     import shutil
     if self._file:
+      self.flush()
+      self._wait_for_write()
+      if self._write_pool:
+        self._write_pool.close()
+        self._write_pool = None
       self._file.close()
       self._file = None
     if self.tmp_filename:
@@ -1244,6 +1381,58 @@ class SimpleHDFWriter:
       self.tmp_filename = None
 
 
+def merge_hdf_files(filenames, output_filename, max_copy_len=1000000):
+  """
+  Concatenates the seqs of multiple HDF files, e.g. written by :class:`SimpleHDFWriter`,
+  into a single file, which can be read by :class:`HDFDataset`.
+  All files must have the same data keys, shapes and dtypes.
+
+  :param list[str] filenames:
+  :param str output_filename: will be created, must not exist
+  :param int max_copy_len: copy in slices of this len, to limit the memory consumption
+  """
+  import os
+  assert filenames
+  assert not os.path.exists(output_filename)
+  in_files = [h5py.File(fn, "r") for fn in filenames]
+  try:
+    first = in_files[0]
+    data_paths = ["inputs", "seqTags", attr_seqLengths]
+    if "targets" in first:
+      data_paths += ["targets/data/%s" % key for key in sorted(first["targets/data"].keys())]
+    out_file = h5py.File(output_filename, "w")
+    for key, value in first.attrs.items():
+      out_file.attrs[key] = value
+    for key in ["numSeqs", "numTimesteps"]:  # as in SimpleHDFWriter
+      if key in first.attrs:
+        out_file.attrs[key] = sum([int(f.attrs[key]) for f in in_files])
+    first.copy("labels", out_file)
+    if "targets" in first:
+      out_file.create_group("targets")
+      first.copy("targets/size", out_file["targets"])
+      first.copy("targets/labels", out_file["targets"])
+    for path in data_paths:
+      in_datasets = [f[path] for f in in_files]
+      shape_rest = in_datasets[0].shape[1:]
+      for fn, in_dataset in zip(filenames, in_datasets):
+        assert in_dataset.shape[1:] == shape_rest and in_dataset.dtype == in_datasets[0].dtype, (
+          "%s: %s has shape %r dtype %r, but %s has shape %r dtype %r" % (
+            path, fn, in_dataset.shape, in_dataset.dtype, filenames[0], in_datasets[0].shape, in_datasets[0].dtype))
+      total_len = sum([in_dataset.shape[0] for in_dataset in in_datasets])
+      out_dataset = out_file.create_dataset(path, shape=(total_len,) + shape_rest, dtype=in_datasets[0].dtype)
+      offset = 0
+      for in_dataset in in_datasets:
+        for start in range(0, in_dataset.shape[0], max_copy_len):
+          end = min(start + max_copy_len, in_dataset.shape[0])
+          out_dataset[offset + start:offset + end] = in_dataset[start:end]
+        offset += in_dataset.shape[0]
+      assert offset == total_len
+    out_file.close()
+  finally:
+    for f in in_files:
+      f.close()
+
+
 class HDFDatasetWriter:
   """
   Similar as :class:`SimpleHDFWriter`, but is mostly intended to copy an existing dataset,
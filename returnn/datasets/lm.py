@@ -11,6 +11,7 @@ import os
 import sys
 from .basic import DatasetSeq
 from .cached2 import CachedDataset2
+from .seq_meta_cache import StringList
 import gzip
 import xml.etree.ElementTree as ElementTree
 from returnn.util.basic import parse_orthography, parse_orthography_into_symbols, load_json, BackendEngine, unicode
@@ -201,12 +202,19 @@ class LmDataset(CachedDataset2):
       self.num_outputs["delayed"] = self.num_outputs["data"]
       self.labels["delayed"] = self.labels["data"]
 
-    if isinstance(corpus_file, list):  # If a list of files is provided, concatenate all.
+    corpus_files = corpus_file if isinstance(corpus_file, list) else [corpus_file]
+    orths_and_lens = [self._read_corpus(file_name) for file_name in corpus_files]
+    if len(corpus_files) == 1:
+      self.orths = orths_and_lens[0][0]
+    elif all(isinstance(orths, StringList) for orths, _ in orths_and_lens):
+      self.orths = StringList.concat([orths for orths, _ in orths_and_lens])
+    else:  # If a list of files is provided, concatenate all.
       self.orths = []
-      for file_name in corpus_file:
-        self.orths += read_corpus(file_name)
-    else:
-      self.orths = read_corpus(corpus_file)
+      for orths, _ in orths_and_lens:
+        self.orths += orths
+    self._orth_lens = None  # type: typing.Optional[numpy.ndarray]  # via seq_meta_cache
+    if all(orth_lens is not None for _, orth_lens in orths_and_lens):
+      self._orth_lens = numpy.concatenate([orth_lens for _, orth_lens in orths_and_lens])
     # It's only estimated because we might filter some out or so.
     self._estimated_num_seqs = len(self.orths) // self.partition_epoch
     print("  done, loaded %i sequences" % len(self.orths), file=log.v4)
@@ -216,6 +224,22 @@ class LmDataset(CachedDataset2):
     self.num_skipped = 0
     self.num_unknown = 0
 
+  def _read_corpus(self, filename):
+    """
+    :param str filename:
+    :return: orths, and the len of each orth if we have them via seq_meta_cache
+    :rtype: (list[str]|StringList, numpy.ndarray|None)
+    """
+    seq_meta_cache = self._get_seq_meta_cache(filename)
+    if not seq_meta_cache:
+      return read_corpus(filename), None
+    seq_meta = seq_meta_cache.load()
+    if seq_meta is None:
+      orths = read_corpus(filename)
+      seq_meta = {"orths": StringList.from_strings(orths), "orth_lens": numpy.array([len(orth) for orth in orths])}
+      seq_meta_cache.save(seq_meta)
+    return seq_meta["orths"], seq_meta["orth_lens"]
+
   def get_data_keys(self):
     """
     :rtype: list[str]
@@ -265,7 +289,7 @@ class LmDataset(CachedDataset2):
       self.seq_order = [int(s[len(self._tag_prefix):]) for s in seq_list]
     else:
       self.seq_order = self.get_seq_order_for_epoch(
-        epoch=epoch, num_seqs=len(self.orths), get_seq_len=lambda i: len(self.orths[i]))
+        epoch=epoch, num_seqs=len(self.orths), get_seq_len=lambda i: len(self.orths[i]), seq_lens=self._orth_lens)
     self.next_orth_idx = 0
     self.next_seq_idx = 0
     self.num_skipped = 0
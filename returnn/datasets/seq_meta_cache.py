@@ -0,0 +1,219 @@
+"""
+Provides :class:`SeqMetaCache`, a persistent on-disk cache of per-sequence meta data
+(e.g. sequence lengths, sequence tags, orthographies) of some dataset files.
+
+Collecting this meta data can be expensive for big corpora
+(e.g. reading all seq tags of a HDF file, ``eval`` of the OggZip txt index, parsing a Bliss XML corpus).
+The cache is written on the first load and validated by the size and mtime of the source files.
+On later runs, the arrays are memory-mapped, so loading them is almost instant,
+and they are shared in the page cache between multiple processes.
+
+The layout of a cache entry is a directory with one ``.npy`` file per array,
+and an ``info.json`` file with the validation info.
+Strings are stored as one concatenated utf8 byte array plus an offsets array, see :class:`StringList`.
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import typing
+import numpy
+from returnn.log import log
+
+
+class StringList(object):
+  """
+  Immutable list of strings, which is backed by (potentially memory-mapped) Numpy arrays.
+  The strings are only decoded when accessed.
+  """
+
+  def __init__(self, data, offsets):
+    """
+    :param numpy.ndarray data: uint8, concatenated utf8 encoded strings
+    :param numpy.ndarray offsets: int64, shape (num_strings + 1,)
+    """
+    self.data = data
+    self.offsets = offsets
+
+  @classmethod
+  def from_strings(cls, strings):
+    """
+    :param list[str]|typing.Iterable[str] strings:
+    :rtype: StringList
+    """
+    encoded = [s.encode("utf8") for s in strings]
+    offsets = numpy.zeros((len(encoded) + 1,), dtype="int64")
+    numpy.cumsum([len(s) for s in encoded], out=offsets[1:])
+    data = numpy.frombuffer(b"".join(encoded), dtype="uint8")
+    return StringList(data=data, offsets=offsets)
+
+  @classmethod
+  def concat(cls, string_lists):
+    """
+    :param list[StringList] string_lists:
+    :return: new list in memory (not memory-mapped anymore)
+    :rtype: StringList
+    """
+    data = numpy.concatenate([ls.data for ls in string_lists])
+    offsets = [numpy.zeros((1,), dtype="int64")]
+    for ls in string_lists:
+      offsets.append(ls.offsets[1:] - ls.offsets[0] + offsets[-1][-1])
+    return StringList(data=data, offsets=numpy.concatenate(offsets))
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, item):
+    """
+    :param int|slice item:
+    :rtype: str|list[str]
+    """
+    if isinstance(item, slice):
+      return [self[i] for i in range(*item.indices(len(self)))]
+    if item < 0:
+      item += len(self)
+    if not 0 <= item < len(self):
+      raise IndexError("%s: index %i out of range" % (self, item))
+    start, end = self.offsets[item:item + 2]
+    return self.data[start:end].tobytes().decode("utf8")
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def __repr__(self):
+    return "<%s len=%i>" % (self.__class__.__name__, len(self))
+
+
+class SeqMetaCache(object):
+  """
+  Cache entry of some seq meta data, for a given list of source files and some kind (+ opts).
+  Use :func:`load` to get the cached arrays (or None), and :func:`save` after you collected them.
+  """
+
+  Version = 1
+  CacheDirPostfix = ".returnn-seq-meta"
+  FallbackCacheDirName = "returnn_seq_meta_cache"
+
+  def __init__(self, source_files, kind, opts=None, cache_dir=None):
+    """
+    :param list[str]|str source_files: data is valid as long as these files are unchanged
+    :param str kind: e.g. the dataset class name. the same source files can have multiple kinds of meta data
+    :param dict[str]|None opts: any further options (must be JSON serializable) which influence the meta data
+    :param str|None cache_dir: if given, will store the cache in there. otherwise next to the (first) source file,
+      or in the temp dir if that is not writeable
+    """
+    if isinstance(source_files, str):
+      source_files = [source_files]
+    assert source_files
+    self.source_files = [os.path.abspath(fn) for fn in source_files]
+    self.kind = kind
+    self.opts = opts or {}
+    self.cache_dir = cache_dir
+    opts_hash = hashlib.md5(json.dumps(
+      [self.source_files, self.kind, self.opts], sort_keys=True).encode("utf8")).hexdigest()[:10]
+    self._entry_name = "%s-%s" % (self.kind, opts_hash)
+
+  def __repr__(self):
+    return "<%s %r kind %r>" % (self.__class__.__name__, self.source_files[0], self.kind)
+
+  def _get_source_info(self):
+    """
+    :return: (filename, size, mtime) per source file
+    :rtype: list[list[str|int|float]]
+    """
+    return [[fn, os.path.getsize(fn), os.path.getmtime(fn)] for fn in self.source_files]
+
+  def _get_info(self):
+    """
+    :rtype: dict[str]
+    """
+    return {
+      "version": self.Version, "kind": self.kind, "opts": self.opts, "sources": self._get_source_info()}
+
+  def _get_candidate_dirs(self):
+    """
+    :return: possible locations of the cache entry, in order of preference
+    :rtype: list[str]
+    """
+    if self.cache_dir:
+      return ["%s/%s" % (self.cache_dir, self._entry_name)]
+    from returnn.util.basic import get_temp_dir
+    return [
+      "%s%s/%s" % (self.source_files[0], self.CacheDirPostfix, self._entry_name),
+      "%s/%s/%s" % (get_temp_dir(), self.FallbackCacheDirName, self._entry_name)]
+
+  def load(self):
+    """
+    :return: the cached arrays, memory-mapped, or None if there is no valid cache
+    :rtype: dict[str,numpy.ndarray|StringList]|None
+    """
+    for dirname in self._get_candidate_dirs():
+      if not os.path.exists("%s/info.json" % dirname):
+        continue
+      try:
+        with open("%s/info.json" % dirname) as f:
+          info = json.load(f)
+        if info["info"] != json.loads(json.dumps(self._get_info())):
+          print("%s: cache in %r outdated, ignoring it" % (self, dirname), file=log.v4)
+          continue
+        res = {}
+        for key in info["arrays"]:
+          res[key] = numpy.load("%s/%s.npy" % (dirname, key), mmap_mode="r")
+        for key in info["strings"]:
+          res[key] = StringList(
+            data=numpy.load("%s/%s.data.npy" % (dirname, key), mmap_mode="r"),
+            offsets=numpy.load("%s/%s.offsets.npy" % (dirname, key), mmap_mode="r"))
+      except (IOError, OSError, ValueError, KeyError) as exc:
+        print("%s: cannot load cache from %r: %s" % (self, dirname, exc), file=log.v3)
+        continue
+      print("%s: loaded cache from %r" % (self, dirname), file=log.v5)
+      return res
+    return None
+
+  def save(self, values):
+    """
+    Writes the cache entry. Errors (e.g. not writeable directory) are not fatal, we just print them.
+    Writing is atomic, i.e. concurrent readers will never see a partially written entry.
+
+    :param dict[str,numpy.ndarray|list[str]|StringList] values:
+    :return: whether we have successfully written the cache
+    :rtype: bool
+    """
+    import shutil
+    info = {"info": self._get_info(), "arrays": [], "strings": []}
+    arrays = {}  # type: typing.Dict[str,numpy.ndarray]
+    for key, value in sorted(values.items()):
+      if isinstance(value, numpy.ndarray):
+        info["arrays"].append(key)
+        arrays[key] = value
+      else:
+        if not isinstance(value, StringList):
+          value = StringList.from_strings(value)
+        info["strings"].append(key)
+        arrays["%s.data" % key] = value.data
+        arrays["%s.offsets" % key] = value.offsets
+    for dirname in self._get_candidate_dirs():
+      tmp_dirname = "%s.tmp.%i" % (dirname, os.getpid())
+      try:
+        if not os.path.exists(os.path.dirname(dirname)):
+          os.makedirs(os.path.dirname(dirname))
+        if os.path.exists(tmp_dirname):
+          shutil.rmtree(tmp_dirname)
+        os.mkdir(tmp_dirname)
+        for key, value in arrays.items():
+          numpy.save("%s/%s.npy" % (tmp_dirname, key), value)
+        with open("%s/info.json" % tmp_dirname, "w") as f:
+          json.dump(info, f)
+        if os.path.exists(dirname):  # outdated
+          shutil.rmtree(dirname)
+        os.rename(tmp_dirname, dirname)
+      except (IOError, OSError) as exc:
+        print("%s: cannot write cache to %r: %s" % (self, dirname, exc), file=log.v4)
+        shutil.rmtree(tmp_dirname, ignore_errors=True)
+        continue
+      print("%s: wrote cache to %r" % (self, dirname), file=log.v4)
+      return True
+    return False
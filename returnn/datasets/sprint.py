@@ -607,14 +607,22 @@ class ExternSprintDataset(SprintDatasetBase):
 
   # Do not change the argument names here, to not break existing configs.
   # noinspection PyPep8Naming
-  def __init__(self, sprintTrainerExecPath, sprintConfigStr, partitionEpoch=None, **kwargs):
+  def __init__(self, sprintTrainerExecPath, sprintConfigStr, partitionEpoch=None,
+               shared_mem_ring_buffer_size=None, **kwargs):
     """
     :param str|list[str] sprintTrainerExecPath:
     :param str | list[str] | ()->str | list[()->str] | ()->list[str] | ()->list[()->str] sprintConfigStr:
       via eval_shell_str
     :param int|None partitionEpoch: deprecated. use partition_epoch instead
+    :param int|None shared_mem_ring_buffer_size: in bytes. if set, the Sprint child writes the features and targets
+      into a shared memory ring buffer (:class:`SharedMemRingBuffer`), and only sends small headers over the pipe.
+      This avoids the pickling and the copying through the pipe, e.g. for high-dimensional features.
+      Seqs which are too big for the buffer are still sent over the pipe.
     """
     super(ExternSprintDataset, self).__init__(**kwargs)
+    self.shared_mem_ring_buffer_size = shared_mem_ring_buffer_size
+    self.shared_mem_ring_buffer = None  # type: typing.Optional[task_system.SharedMemRingBuffer]
+    self.shared_mem_ring_buffer_num_seqs = 0  # seqs received via the ring buffer (otherwise via the pipe)
     self.add_data_thread_id = None
     self.sprint_trainer_exec_path = sprintTrainerExecPath
     self.sprint_config = sprintConfigStr
@@ -777,6 +785,12 @@ class ExternSprintDataset(SprintDatasetBase):
     """
     config_str = "action:ExternSprintDataset,c2p_fd:%i,p2c_fd:%i" % (
       self.pipe_c2p[1].fileno(), self.pipe_p2c[0].fileno())
+    if self.shared_mem_ring_buffer_size:
+      if not self.shared_mem_ring_buffer:
+        # Reused for all child procs. A new child starts writing at the current read position.
+        self.shared_mem_ring_buffer = task_system.SharedMemRingBuffer(size=self.shared_mem_ring_buffer_size)
+      config_str += ",shm_ring_buffer_id:%i,shm_ring_buffer_size:%i" % (
+        self.shared_mem_ring_buffer.get_shmid(), self.shared_mem_ring_buffer.capacity)
     if task_system.SharedMemNumpyConfig["enabled"]:
       config_str += ",EnableAutoNumpySharedMemPickling:True"
     epoch = self.returnn_epoch or 1
@@ -917,6 +931,19 @@ class ExternSprintDataset(SprintDatasetBase):
               numpy_copy_and_set_unused(features),
               numpy_copy_and_set_unused(targets),
               segment_name=segment_name)
+          elif data_type == b"data-shm":
+            seq_count += 1
+            segment_name, array_target_keys, refs, end_pos, targets = args
+            if segment_name is not None:
+              segment_name = segment_name.decode("utf8")
+            refs = [
+              (offset, tuple(shape), dtype_str.decode("utf8") if isinstance(dtype_str, bytes) else dtype_str)
+              for (offset, shape, dtype_str) in refs]
+            arrays = self.shared_mem_ring_buffer.read_arrays(refs, end_pos=end_pos)
+            self.shared_mem_ring_buffer_num_seqs += 1
+            targets = {key.decode("utf8"): value for (key, value) in targets.items()}
+            targets.update({key.decode("utf8"): value for (key, value) in zip(array_target_keys, arrays[1:])})
+            self.add_new_data(arrays[0], targets, segment_name=segment_name)
           elif data_type == b"exit":
             have_seen_the_whole = True
             break
@@ -999,16 +1026,20 @@ class SprintCacheDataset(CachedDataset2):
     """
     Helper class to read a Sprint cache directly.
     """
-    def __init__(self, data_key, filename, data_type=None, allophone_labeling=None):
+    def __init__(self, data_key, filename, data_type=None, allophone_labeling=None, bundle_index_cache=False):
       """
       :param str data_key: e.g. "data" or "classes"
       :param str filename: to Sprint cache archive
       :param str|None data_type: "feat" or "align"
       :param dict[str] allophone_labeling: kwargs for :class:`AllophoneLabeling`
+      :param bool|str bundle_index_cache: for a bundle file, see :class:`FileArchiveBundle`
       """
       self.data_key = data_key
       from returnn.sprint.cache import open_file_archive
-      self.sprint_cache = open_file_archive(filename)
+      if filename.endswith(".bundle"):
+        self.sprint_cache = open_file_archive(filename, index_cache=bundle_index_cache)
+      else:
+        self.sprint_cache = open_file_archive(filename)
       if not data_type:
         if data_key == "data":
           data_type = "feat"
@@ -1055,12 +1086,11 @@ class SprintCacheDataset(CachedDataset2):
       """
       assert self.type == "feat"
       assert self.content_keys
-      times, feats = self.sprint_cache.read(self.content_keys[0], "feat")
+      times, feats = self.sprint_cache.read_numpy(self.content_keys[0], "feat")
       assert len(times) == len(feats) > 0
-      feat = feats[0]
-      assert isinstance(feat, numpy.ndarray)
-      assert feat.ndim == 1
-      return feat.shape[0]
+      assert isinstance(feats, numpy.ndarray)
+      assert feats.ndim == 2
+      return feats.shape[1]
 
     def read(self, name):
       """
@@ -1068,20 +1098,26 @@ class SprintCacheDataset(CachedDataset2):
       :return: numpy array of shape (time, [num_labels])
       :rtype: numpy.ndarray
       """
-      res = self.sprint_cache.read(name, typ=self.type)
+      res = self.sprint_cache.read_numpy(name, typ=self.type)
       if self.type == "align":
-        label_seq = numpy.array([self.allophone_labeling.get_label_idx(a, s) for (t, a, s) in res], dtype=self.dtype)
+        # Only map each unique (allophone, state) once.
+        allo_states, inverse = numpy.unique(res[:, 1:], axis=0, return_inverse=True)
+        labels = numpy.array(
+          [self.allophone_labeling.get_label_idx(a, s) for (a, s) in allo_states.tolist()], dtype=self.dtype)
+        label_seq = labels[inverse.reshape(-1)]
         assert label_seq.shape == (len(res),)
         return label_seq
       elif self.type == "align_raw":
-        label_seq = numpy.array(
-          [self.allophone_labeling.state_tying_by_allo_state_idx[a] for (t, a, s) in res], dtype=self.dtype)
+        allos, inverse = numpy.unique(res[:, 1], return_inverse=True)
+        labels = numpy.array(
+          [self.allophone_labeling.state_tying_by_allo_state_idx[a] for a in allos.tolist()], dtype=self.dtype)
+        label_seq = labels[inverse.reshape(-1)]
         assert label_seq.shape == (len(res),)
         return label_seq
       elif self.type == "feat":
         times, feats = res
         assert len(times) == len(feats) > 0
-        feat_mat = numpy.array(feats, dtype=self.dtype)
+        feat_mat = feats.astype(self.dtype, copy=False)
         assert feat_mat.shape == (len(times), self.num_labels)
         return feat_mat
       else:
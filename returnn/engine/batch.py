@@ -20,6 +20,8 @@ class BatchSeqCopyPart:
    be stored in the batch.
   """
 
+  __slots__ = ("seq_idx", "seq_start_frame", "seq_end_frame", "batch_slice", "batch_frame_offset")
+
   def __init__(self, seq_idx, seq_start_frame, seq_end_frame,
                batch_slice, batch_frame_offset):
     """
@@ -63,6 +65,10 @@ class Batch:
     # original data_shape = [0, 0], format (time,batch/slice)
     #          data_shape = [max_num_frames_per_slice, num_slices]
     self.seqs = []  # type: typing.List[BatchSeqCopyPart]
+    # Accumulated over self.seqs when they are added, such that we don't need to iterate through them.
+    self._total_num_frames = 0  # type: typing.Union[int,NumbersDict]  # like sum([s.frame_length for s in seqs])
+    self._min_seq_idx = None  # type: typing.Optional[int]
+    self._max_seq_idx = None  # type: typing.Optional[int]
 
   def __repr__(self):
     return "<Batch start_seq:%r, len(seqs):%i>" % (self.start_seq, len(self.seqs))
@@ -84,11 +90,11 @@ class Batch:
     :param NumbersDict length: number of (time) frames
     """
     self.max_num_frames_per_slice, self.num_slices = self.try_sequence_as_slice(length)
-    self.seqs += [BatchSeqCopyPart(seq_idx=seq_idx,
-                                   seq_start_frame=seq_start_frame,
-                                   seq_end_frame=seq_start_frame + length,
-                                   batch_slice=self.num_slices - 1,
-                                   batch_frame_offset=0)]
+    self._add_seq_copy_part(BatchSeqCopyPart(seq_idx=seq_idx,
+                                             seq_start_frame=seq_start_frame,
+                                             seq_end_frame=seq_start_frame + length,
+                                             batch_slice=self.num_slices - 1,
+                                             batch_frame_offset=0))
 
   def add_frames(self, seq_idx, seq_start_frame, length, frame_dim_corresponds=True):
     """
@@ -106,11 +112,23 @@ class Batch:
       self.max_num_frames_per_slice = NumbersDict(self.max_num_frames_per_slice.max_value())
     self.max_num_frames_per_slice += length
     self.num_slices = max(self.num_slices, 1)
-    self.seqs += [BatchSeqCopyPart(seq_idx=seq_idx,
-                                   seq_start_frame=seq_start_frame,
-                                   seq_end_frame=seq_start_frame + length,
-                                   batch_slice=0,
-                                   batch_frame_offset=batch_frame_offset)]
+    self._add_seq_copy_part(BatchSeqCopyPart(seq_idx=seq_idx,
+                                             seq_start_frame=seq_start_frame,
+                                             seq_end_frame=seq_start_frame + length,
+                                             batch_slice=0,
+                                             batch_frame_offset=batch_frame_offset))
+
+  def _add_seq_copy_part(self, part):
+    """
+    :param BatchSeqCopyPart part:
+    """
+    self.seqs.append(part)
+    self._total_num_frames += part.frame_length
+    if self._min_seq_idx is None:
+      self._min_seq_idx = self._max_seq_idx = part.seq_idx
+    else:
+      self._min_seq_idx = min(self._min_seq_idx, part.seq_idx)
+      self._max_seq_idx = max(self._max_seq_idx, part.seq_idx)
 
   def init_with_one_full_sequence(self, seq_idx, dataset):
     """
@@ -135,33 +153,33 @@ class Batch:
     """
     :rtype: NumbersDict
     """
-    return sum([s.frame_length for s in self.seqs])
+    if isinstance(self._total_num_frames, NumbersDict):
+      return self._total_num_frames.copy()
+    return self._total_num_frames
 
   @property
   def start_seq(self):
     """
     :rtype: int|None
     """
-    if not self.seqs:
-      return None
-    return min([s.seq_idx for s in self.seqs])
+    return self._min_seq_idx
 
   @property
   def end_seq(self):
     """
     :rtype: int|None
     """
-    if not self.seqs:
+    if self._max_seq_idx is None:
       return None
-    return max([s.seq_idx for s in self.seqs]) + 1
+    return self._max_seq_idx + 1
 
   def get_num_seqs(self):
     """
     :rtype: int
     """
-    if not self.seqs:
+    if self._min_seq_idx is None:
       return 0
-    return self.end_seq - self.start_seq
+    return self._max_seq_idx + 1 - self._min_seq_idx
 
 
 class BatchSetGenerator:
@@ -12,7 +12,7 @@ import sys
 import os
 import typing
 import array
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
 import numpy
 import zlib
 import mmap
@@ -176,10 +176,20 @@ class FileArchive:
   start_recovery_tag = 0xaa55aa55
   end_recovery_tag = 0x55aa55aa
 
-  def __init__(self, filename, must_exists=True):
+  def __init__(self, filename, must_exists=True, file_infos=None):
+    """
+    :param str filename:
+    :param bool must_exists:
+    :param list[FileInfo]|None file_infos: if given, we don't read the file info table (e.g. via an index cache)
+    """
 
     self.ft = {}  # type: typing.Dict[str,FileInfo]
-    if os.path.exists(filename):
+    if file_infos is not None:
+      self.allophones = []
+      self.f = open(filename, 'rb')
+      self.ft = {fi.name: fi for fi in file_infos}
+
+    elif os.path.exists(filename):
       self.allophones = []
       self.f = open(filename, 'rb')
       header = self.read_str(len(self.SprintCacheHeader))
@@ -224,15 +234,19 @@ class FileArchive:
     self.f.seek(-8, 2)
     pos_count = self.read_u64()
     self.f.seek(pos_count)
-    count = self.read_u32()
+    # Read the whole table at once. This avoids many small reads, which are slow e.g. on network file systems.
+    buf = self.f.read()
+    count, = unpack_from("=i", buf, 0)
     if not count > 0:
       return
+    offset = 4
     for i in range(count):
-      str_len = self.read_u32()
-      name = self.read_str(str_len)
-      pos = self.read_u64()
-      size = self.read_u32()
-      comp = self.read_u32()
+      str_len, = unpack_from("=i", buf, offset)
+      offset += 4
+      name = buf[offset:offset + str_len].decode('ascii')
+      offset += str_len
+      pos, size, comp = unpack_from("=qii", buf, offset)
+      offset += 16
       self.ft[name] = FileInfo(name, pos, size, comp, i)
       # TODO: read empty files
 
@@ -281,82 +295,113 @@ class FileArchive:
       # raise NotImplementedError("Need to scan archive if no "
       #                           "file info table found.")
 
-  def _raw_read(self, size, typ):
-    """
-    :param int|None size: needed for typ == "str"
-    :param str typ: "str", "feat" or "align"
-    :return: depending on typ, "str" -> string, "feat" -> (time, data), "align" -> align,
-      where string is a str,
-      time is list of time-stamp tuples (start-time,end-time) in millisecs,
-        data is a list of features, each a numpy vector,
-      align is a list of (time, allophone, state), time is an int from 0 to len of align,
-        allophone is some int, state is e.g. in [0,1,2].
-    :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
+  @staticmethod
+  def _decode_feat(buf, allow_varying_dim=False):
+    """
+    :param bytes buf: the whole (uncompressed) entry
+    :param bool allow_varying_dim: if the frames have different dims, return a list of features (slow)
+    :return: times (start-time,end-time) in millisecs, float64, shape (T,2), features, float32, shape (T,dim)
+    :rtype: (numpy.ndarray,numpy.ndarray|list[numpy.ndarray])
+    """
+    type_len, = unpack("I", buf[:4])
+    typ = buf[4:4 + type_len].decode("ascii")
+    assert typ == "vector-f32"
+    pos = 4 + type_len
+    count, = unpack("I", buf[pos:pos + 4])
+    pos += 4
+    if count == 0:
+      return numpy.zeros((0, 2), dtype="float64"), numpy.zeros((0, 0), dtype="float32")
+    dim, = unpack("I", buf[pos:pos + 4])
+    # Each frame is: u32 size, size x f32, 2 x f64. Not aligned, so this is a packed struct.
+    frame_dtype = numpy.dtype([("size", "u4"), ("data", "f4", (dim,)), ("time", "f8", (2,))])
+    if len(buf) - pos == count * frame_dtype.itemsize:
+      frames = numpy.frombuffer(buf, dtype=frame_dtype, count=count, offset=pos)
+      if (frames["size"] == dim).all():
+        return frames["time"].copy(), frames["data"].copy()
+    assert allow_varying_dim, "Sprint cache: feature entry with varying dimension, cannot return a matrix"
+    times = numpy.zeros((count, 2), dtype="float64")
+    data = [None] * count  # type: typing.List[typing.Optional[numpy.ndarray]]
+    for i in range(count):
+      size, = unpack("I", buf[pos:pos + 4])
+      pos += 4
+      data[i] = numpy.frombuffer(buf, dtype="f4", count=size, offset=pos).copy()  # size x f32
+      pos += 4 * size
+      times[i] = numpy.frombuffer(buf, dtype="f8", count=2, offset=pos)  # 2 x f64
+      pos += 16
+    return times, data
+
+  def _decode_align(self, buf):
+    """
+    :param bytes buf: the whole (uncompressed) entry
+    :return: int32, shape (T,3), each frame is (time, allophone, state)
+    :rtype: numpy.ndarray
     """
+    type_len, = unpack("I", buf[:4])
+    typ = buf[4:4 + type_len].decode("ascii")
+    assert typ == "flow-alignment"
+    pos = 4 + type_len + 4  # flag ?
+    typ = buf[pos:pos + 8].decode("ascii")
+    pos += 8
+    if typ not in ["ALIGNRLE", "AALPHRLE"]:
+      raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
+    # In case of AALPHRLE, after the alignment, we include the alphabet of the used labels.
+    # We ignore this at the moment.
+    size, = unpack("I", buf[pos:pos + 4])
+    pos += 4
+    if size >= (1 << 31):
+      raise NotImplementedError("No support for weighted alignments yet.")
+    # RLE scheme. We loop over the runs (not the frames), and each run is handled via Numpy.
+    mixes = []  # type: typing.List[numpy.ndarray]
+    times = []  # type: typing.List[numpy.ndarray]
+    time = 0
+    num_frames = 0
+    while num_frames < size:
+      n, = unpack("b", buf[pos:pos + 1])
+      pos += 1
+      if n > 0:
+        mixes.append(numpy.frombuffer(buf, dtype="i4", count=n, offset=pos))
+        pos += 4 * n
+      elif n < 0:
+        n = -n
+        mix, = unpack("i", buf[pos:pos + 4])
+        pos += 4
+        mixes.append(numpy.full((n,), mix, dtype="i4"))
+      else:
+        time, = unpack("i", buf[pos:pos + 4])
+        pos += 4
+        continue
+      times.append(numpy.arange(time, time + n, dtype="i4"))
+      time += n
+      num_frames += n
+    res = numpy.zeros((num_frames, 3), dtype="int32")
+    if num_frames:
+      res[:, 0] = numpy.concatenate(times)
+      res[:, 1], res[:, 2] = self.get_states(numpy.concatenate(mixes))
+    return res
 
-    if typ == "str":
-      return self.read_str(size)
-
-    elif typ == "feat":
-      type_len = self.read_U32()
-      typ = self.read_str(type_len)
-      # print(typ)
-      assert typ == "vector-f32"
-      count = self.read_U32()
-      data = [None] * count  # type: typing.List[typing.Optional[numpy.ndarray]]
-      time_ = [None] * count  # type: typing.List[typing.Optional[numpy.ndarray]]
-      for i in range(count):
-        size = self.read_U32()
-        data[i] = self.read_v("f", size)  # size x f32
-        time_[i] = self.read_v("d", 2)  # 2    x f64
-      return time_, data
+  def read_numpy(self, filename, typ):
+    """
+    Like :func:`read`, but decodes the whole entry at once via Numpy, without any per-frame Python objects.
+    This is much faster for big entries.
 
+    :param str filename: the entry-name in the archive
+    :param str typ: "feat" or "align"
+    :return: depending on typ, "feat" -> (times, features), "align" -> align,
+      where times is float64 of shape (T,2), the (start-time,end-time) in millisecs,
+      features is float32 of shape (T,dim),
+      align is int32 of shape (T,3), each frame is (time, allophone, state).
+      None if the entry is empty.
+    :rtype: (numpy.ndarray,numpy.ndarray)|numpy.ndarray|None
+    """
+    buf = self._read_entry_bytes(filename)
+    if buf is None:
+      return None
+    if typ == "feat":
+      return self._decode_feat(buf)
     elif typ in ["align", "align_raw"]:
-      type_len = self.read_U32()
-      typ = self.read_str(type_len)
-      assert typ == "flow-alignment"
-      self.read_u32()  # flag ?
-      typ = self.read_str(8)
-      if typ in ["ALIGNRLE", "AALPHRLE"]:
-        # In case of AALPHRLE, after the alignment, we include the alphabet of the used labels.
-        # We ignore this at the moment.
-        size = self.read_U32()
-        if size < (1 << 31):
-          # RLE scheme
-          time = 0
-          alignment = []
-          while len(alignment) < size:
-            n = self.read_char()
-            # print(n)
-            if n > 0:
-              while n > 0:
-                mix, state = self.read_u32(), None
-                if typ != "align_raw":
-                  mix, state = self.get_state(mix)
-                # print(mix, state)
-                # print(time, self.allophones[mix])
-                alignment.append((time, mix, state))
-                time += 1
-                n -= 1
-            elif n < 0:
-              mix, state = self.read_u32(), None
-              if typ != "align_raw":
-                mix, state = self.get_state(mix)
-              while n < 0:
-                # print(mix, state)
-                # print(time, self.allophones[mix])
-                alignment.append((time, mix, state))
-                time += 1
-                n += 1
-            else:
-              time = self.read_u32()
-              # print("time", time)
-          return alignment
-        else:
-          raise NotImplementedError("No support for weighted "
-                                    "alignments yet.")
-      else:
-        raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
+      return self._decode_align(buf)
+    else:
+      raise ValueError("invalid typ %r" % typ)
 
   def has_entry(self, filename):
     """
@@ -378,6 +423,35 @@ class FileArchive:
     :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
     """
 
+    if filename not in self.ft:
+      if filename in self._short_seg_names:
+        filename = self._short_seg_names[filename]
+
+    fi = self.ft[filename]
+    if typ == "str":
+      buf = self._read_entry_bytes(filename)
+      if buf is None:
+        return None
+      return buf[:fi.size].decode("ascii")
+    if typ == "feat":
+      buf = self._read_entry_bytes(filename)
+      if buf is None:
+        return None
+      times, data = self._decode_feat(buf, allow_varying_dim=True)
+      return list(times), list(data)
+    if typ in ["align", "align_raw"]:
+      res = self.read_numpy(filename, typ)
+      if res is None:
+        return None
+      return [tuple(frame) for frame in res.tolist()]
+    raise ValueError("invalid typ %r" % typ)
+
+  def _read_entry_bytes(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: the whole uncompressed entry, or None if it is empty
+    :rtype: bytes|None
+    """
     if filename not in self.ft:
       if filename in self._short_seg_names:
         filename = self._short_seg_names[filename]
@@ -391,23 +465,9 @@ class FileArchive:
       return None
 
     if comp > 0:
-      # read compressed bytes into memory as 'bytearray'
-      a = array.array('b')
-      a.fromfile(self.f, comp)
-      # unpack
-      b = zlib.decompress(a.tostring(), 15+32)
-      # substitute self.f by an anonymous memmap file object
-      # restore original file handle after we're done
-      backup_f = self.f
-      self.f = mmap.mmap(-1, len(b))
-      self.f.write(b)
-      self.f.seek(0)
-      try:
-        return self._raw_read(size=fi.size, typ=typ)
-      finally:
-        self.f = backup_f
+      return zlib.decompress(self.f.read(comp), 15+32)
 
-    return self._raw_read(size=fi.size, typ=typ)
+    return self.f.read(size)
 
   def get_state(self, mix):
     """
@@ -427,6 +487,27 @@ class FileArchive:
     assert mix >= 0
     return mix, state
 
+  def get_states(self, mixes):
+    """
+    Vectorized variant of :func:`get_state`.
+
+    :param numpy.ndarray mixes: int, shape (T,)
+    :return: (mixes, states), both int32, shape (T,)
+    :rtype: (numpy.ndarray,numpy.ndarray)
+    """
+    assert self.allophones
+    max_states = 6
+    mixes = mixes.astype("int64")
+    states = numpy.zeros(mixes.shape, dtype="int64")
+    for _ in range(max_states):
+      mask = mixes >= len(self.allophones)
+      if not mask.any():
+        break
+      mixes[mask] -= (1 << 26)
+      states[mask] += 1
+    assert (mixes >= 0).all()
+    return mixes.astype("int32"), numpy.minimum(states, max_states - 1).astype("int32")
+
   def set_allophones(self, f):
     """
     :param str f: allophone filename. line-separated. will ignore lines starting with "#"
@@ -499,15 +580,21 @@ class FileArchiveBundle:
   File archive bundle.
   """
 
-  def __init__(self, filename=None):
+  def __init__(self, filename=None, num_threads=8, index_cache=False):
     """
     :param str|None filename: .bundle file
+    :param int num_threads: the archives of a bundle are opened in parallel with that many threads
+    :param bool|str index_cache: if set, stores the merged file info tables of all archives of a bundle
+      in an index cache (see :class:`returnn.datasets.seq_meta_cache.SeqMetaCache`), such that later runs
+      don't need to read them again. If str, the cache directory
     """
     # filename -> FileArchive
     self.archives = {}  # type: typing.Dict[str,FileArchive]
     # archive content file -> FileArchive
     self.files = {}  # type: typing.Dict[str,FileArchive]
     self._short_seg_names = {}
+    self.num_threads = num_threads
+    self.index_cache = index_cache
     if filename is not None:
       self.add_bundle(filename=filename)
 
@@ -515,8 +602,72 @@ class FileArchiveBundle:
     """
     :param str filename: bundle
     """
+    archive_filenames = []  # type: typing.List[str]
     for line in open(filename).read().splitlines():
-      self.add_archive(filename=line)
+      if line not in self.archives and line not in archive_filenames:
+        archive_filenames.append(line)
+    if not archive_filenames:
+      return
+    index_cache = None
+    if self.index_cache:
+      from returnn.datasets.seq_meta_cache import SeqMetaCache
+      index_cache = SeqMetaCache(
+        source_files=[filename] + archive_filenames, kind=self.__class__.__name__,
+        cache_dir=self.index_cache if isinstance(self.index_cache, str) else None)
+    index = index_cache.load() if index_cache else None
+    if index is not None:
+      archives = self._archives_from_index(archive_filenames, index)
+    else:
+      archives = self._open_archives(archive_filenames)
+      if index_cache:
+        index_cache.save(self._make_index(archives))
+    for archive_filename, a in zip(archive_filenames, archives):
+      self._add_archive_instance(archive_filename, a)
+
+  def _open_archives(self, filenames):
+    """
+    :param list[str] filenames:
+    :rtype: list[FileArchive]
+    """
+    if self.num_threads <= 1 or len(filenames) <= 1:
+      return [FileArchive(fn, must_exists=True) for fn in filenames]
+    # This is mostly I/O bound, so threads are fine.
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(self.num_threads, len(filenames)))
+    try:
+      return pool.map(lambda fn: FileArchive(fn, must_exists=True), filenames)
+    finally:
+      pool.terminate()
+
+  @staticmethod
+  def _make_index(archives):
+    """
+    :param list[FileArchive] archives:
+    :return: merged file info tables, for the index cache
+    :rtype: dict[str,numpy.ndarray|list[str]]
+    """
+    file_infos = [(archive_idx, fi) for archive_idx, a in enumerate(archives) for fi in a.ft.values()]
+    return {
+      "name": [fi.name for _, fi in file_infos],
+      "archive": numpy.array([archive_idx for archive_idx, _ in file_infos], dtype="int32"),
+      "pos": numpy.array([fi.pos for _, fi in file_infos], dtype="int64"),
+      "size": numpy.array([fi.size for _, fi in file_infos], dtype="int64"),
+      "compressed": numpy.array([fi.compressed for _, fi in file_infos], dtype="int64"),
+      "index": numpy.array([fi.index for _, fi in file_infos], dtype="int64")}
+
+  @staticmethod
+  def _archives_from_index(filenames, index):
+    """
+    :param list[str] filenames:
+    :param dict[str,numpy.ndarray|returnn.datasets.seq_meta_cache.StringList] index: via :func:`_make_index`
+    :rtype: list[FileArchive]
+    """
+    file_infos = [[] for _ in filenames]  # type: typing.List[typing.List[FileInfo]]
+    for name, archive_idx, pos, size, comp, i in zip(
+          index["name"], index["archive"].tolist(), index["pos"].tolist(), index["size"].tolist(),
+          index["compressed"].tolist(), index["index"].tolist()):
+      file_infos[archive_idx].append(FileInfo(name, pos, size, comp, i))
+    return [FileArchive(fn, file_infos=infos) for fn, infos in zip(filenames, file_infos)]
 
   def add_archive(self, filename):
     """
@@ -524,7 +675,14 @@ class FileArchiveBundle:
     """
     if filename in self.archives:
       return
-    self.archives[filename] = a = FileArchive(filename, must_exists=True)
+    self._add_archive_instance(filename, FileArchive(filename, must_exists=True))
+
+  def _add_archive_instance(self, filename, a):
+    """
+    :param str filename: single archive
+    :param FileArchive a:
+    """
+    self.archives[filename] = a
     for f in a.ft.keys():
       self.files[f] = a
     # noinspection PyProtectedMember
@@ -572,6 +730,18 @@ class FileArchiveBundle:
         filename = self._short_seg_names[filename]
     return self.files[filename].read(filename, typ)
 
+  def read_numpy(self, filename, typ):
+    """
+    :param str filename: the entry-name in the archive
+    :param str typ: "feat" or "align"
+    :return: see :func:`FileArchive.read_numpy`
+    :rtype: (numpy.ndarray,numpy.ndarray)|numpy.ndarray|None
+    """
+    if filename not in self.files:
+      if filename in self._short_seg_names:
+        filename = self._short_seg_names[filename]
+    return self.files[filename].read_numpy(filename, typ)
+
   def set_allophones(self, filename):
     """
     :param str filename: allophone filename
@@ -580,15 +750,16 @@ class FileArchiveBundle:
       a.set_allophones(filename)
 
 
-def open_file_archive(archive_filename, must_exists=True):
+def open_file_archive(archive_filename, must_exists=True, **kwargs):
   """
   :param str archive_filename:
   :param bool must_exists:
+  :param kwargs: passed to :class:`FileArchiveBundle`, e.g. num_threads or index_cache
   :rtype: FileArchiveBundle|FileArchive
   """
   if archive_filename.endswith(".bundle"):
     assert must_exists
-    return FileArchiveBundle(archive_filename)
+    return FileArchiveBundle(archive_filename, **kwargs)
   else:
     return FileArchive(archive_filename, must_exists=must_exists)
 
@@ -22,6 +22,10 @@ from returnn.util.task_system import Pickler, Unpickler, numpy_set_unused
 from returnn.util.basic import eval_shell_str, make_hashable, BackendEngine
 from returnn.log import log
 
+if typing.TYPE_CHECKING:
+  # noinspection PyUnresolvedReferences
+  from returnn.util.fsa import FastBwFsaCache, FastBaumWelchBatchFsa
+
 
 class SprintSubprocessInstance:
   """
@@ -380,6 +384,12 @@ class SprintInstancePool:
     assert isinstance(sprint_opts, dict)
     sprint_opts = sprint_opts.copy()
     self.max_num_instances = int(sprint_opts.pop("numInstances", 1))
+    # The automata only depend on the segment (e.g. HMM with a fixed lexicon), so we can cache them.
+    self.automata_cache = None  # type: typing.Optional[FastBwFsaCache]
+    automata_cache_size = int(sprint_opts.pop("automataCacheSize", 0))
+    if automata_cache_size > 0:
+      from returnn.util.fsa import FastBwFsaCache
+      self.automata_cache = FastBwFsaCache(max_size=automata_cache_size)
     self.sprint_opts = sprint_opts
     self.instances = []  # type: typing.List[SprintSubprocessInstance]
 
@@ -484,26 +494,33 @@ class SprintInstancePool:
       start_end_states are of shape (2, batch), each (start,stop) state idx, batch = len(tags), of dtype uint32.
     :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
     """
-    all_num_states = [None] * len(tags)  # type: typing.List[typing.Optional[int]]
-    all_num_edges = [None] * len(tags)  # type: typing.List[typing.Optional[int]]
-    all_edges = [None] * len(tags)  # type: typing.List[typing.Optional[numpy.ndarray]]
-    all_weights = [None] * len(tags)  # type: typing.List[typing.Optional[numpy.ndarray]]
-    for bb in range(0, len(tags), self.max_num_instances):
+    from returnn.util.fsa import FastBaumWelchBatchFsa, fast_bw_fsa_concat
+    segment_names = []  # type: typing.List[str]
+    for b in range(len(tags)):
+      if isinstance(tags[0], str):
+        segment_name = tags[b]
+      else:
+        segment_name = tags[b].view('S%d' % tags.shape[1])[0]
+      assert isinstance(segment_name, str)
+      segment_names.append(segment_name)
+    fsas = {}  # type: typing.Dict[str,FastBaumWelchBatchFsa]
+    if self.automata_cache:
+      for segment_name in segment_names:
+        fsa = self.automata_cache.cache.get(segment_name)
+        if fsa is not None:
+          fsas[segment_name] = fsa
+    missing = sorted(set(segment_names).difference(fsas.keys()))
+    for bb in range(0, len(missing), self.max_num_instances):
       for i in range(self.max_num_instances):
         b = bb + i
-        if b >= len(tags):
+        if b >= len(missing):
           break
         instance = self._get_instance(i)
-        if isinstance(tags[0], str):
-          segment_name = tags[b]
-        else:
-          segment_name = tags[b].view('S%d' % tags.shape[1])[0]
-        assert isinstance(segment_name, str)
         # noinspection PyProtectedMember
-        instance._send(("export_allophone_state_fsa_by_segment_name", segment_name))
+        instance._send(("export_allophone_state_fsa_by_segment_name", missing[b]))
       for i in range(self.max_num_instances):
         b = bb + i
-        if b >= len(tags):
+        if b >= len(missing):
           break
         instance = self._get_instance(i)
         # noinspection PyProtectedMember
@@ -511,26 +528,17 @@ class SprintInstancePool:
         if r[0] != 'ok':
           raise RuntimeError(r[1])
         num_states, num_edges, edges, weights = r[1:]
-        all_num_states[b] = num_states
-        all_num_edges[b] = num_edges
-        all_edges[b] = edges.reshape((3, num_edges))  # (from, to, emission-idx) for each edge, uint32
-        all_weights[b] = weights  # for each edge, float32
-    state_offset = 0
-    for idx in range(len(all_edges)):
-      num_edges = all_num_edges[idx]
-      all_edges[idx][0:2, :] += state_offset
-      state_offset += all_num_states[idx]
-      # add sequence_idx. becomes (from, to, emission-idx, seq-idx) for each edge
-      all_edges[idx] = numpy.vstack((all_edges[idx], numpy.ones((1, num_edges), dtype='uint32') * idx))
-
-    start_end_states = numpy.empty((2, len(all_num_states)), dtype='uint32')
-    state_offset = 0
-    for idx, num_states in enumerate(all_num_states):
-      start_end_states[0, idx] = state_offset
-      start_end_states[1, idx] = state_offset + num_states - 1
-      state_offset += num_states
-
-    return numpy.hstack(all_edges), numpy.hstack(all_weights), start_end_states
+        edges = edges.reshape((3, num_edges))  # (from, to, emission-idx) for each edge, uint32
+        # add sequence_idx. becomes (from, to, emission-idx, seq-idx) for each edge
+        edges = numpy.vstack((edges, numpy.zeros((1, num_edges), dtype=edges.dtype)))
+        fsa = FastBaumWelchBatchFsa(
+          edges=edges, weights=weights,  # for each edge, float32
+          start_end_states=numpy.array([[0], [num_states - 1]], dtype='uint32'), num_states=num_states)
+        fsas[missing[b]] = fsa
+        if self.automata_cache:
+          self.automata_cache.cache[missing[b]] = fsa
+    fsa = fast_bw_fsa_concat([fsas[segment_name] for segment_name in segment_names])
+    return fsa.edges, fsa.weights, fsa.start_end_states
 
   def get_free_instance(self):
     """
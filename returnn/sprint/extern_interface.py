@@ -10,6 +10,7 @@ from __future__ import print_function
 import sys
 import os
 import typing
+import numpy
 from returnn.util import better_exchook
 import returnn.util.task_system as task_system
 from returnn.util.task_system import Pickler
@@ -137,7 +138,9 @@ def _init_global_sprint_dataset(input_dim, output_dim, config):
   num_segments = len(segmentOrderList) if segmentOrderList is not None else None
   sprintDataset = ExternSprintDatasetSource(
     c2p_fd=int(config["c2p_fd"]), p2c_fd=int(config["p2c_fd"]),
-    input_dim=input_dim, output_dim=output_dim, num_segments=num_segments)
+    input_dim=input_dim, output_dim=output_dim, num_segments=num_segments,
+    shm_ring_buffer_id=int(config["shm_ring_buffer_id"]) if "shm_ring_buffer_id" in config else None,
+    shm_ring_buffer_size=int(config["shm_ring_buffer_size"]) if "shm_ring_buffer_size" in config else None)
 
 
 # Name need to stay like this, for compatibility.
@@ -310,7 +313,8 @@ class ExternSprintDatasetSource:
   and is waiting for our data.
   """
 
-  def __init__(self, c2p_fd, p2c_fd, input_dim, output_dim, num_segments):
+  def __init__(self, c2p_fd, p2c_fd, input_dim, output_dim, num_segments,
+               shm_ring_buffer_id=None, shm_ring_buffer_size=None):
     """
     :param int c2p_fd: child-to-parent file descriptor
     :param int p2c_fd: parent-to-child file descriptor
@@ -318,9 +322,15 @@ class ExternSprintDatasetSource:
     :type output_dim: int
     :type num_segments: int | None
     :param num_segments: can be None if not known in advance
+    :param int|None shm_ring_buffer_id: shmid of the :class:`SharedMemRingBuffer` created by the parent.
+      If given, the arrays are transferred via this buffer, and only small headers via the pipe.
+    :param int|None shm_ring_buffer_size: capacity of the ring buffer
     """
     self.pipe_c2p = os.fdopen(c2p_fd, "wb")
     self.pipe_p2c = os.fdopen(p2c_fd, "rb")
+    self.shm_ring_buffer = None  # type: typing.Optional[task_system.SharedMemRingBuffer]
+    if shm_ring_buffer_id is not None:
+      self.shm_ring_buffer = task_system.SharedMemRingBuffer(size=shm_ring_buffer_size, shmid=shm_ring_buffer_id)
     self._send("init", (input_dim, output_dim, num_segments))
 
   def _send(self, data_type, args=None):
@@ -344,6 +354,14 @@ class ExternSprintDatasetSource:
     :param numpy.ndarray features: 2D array, (feature,time)
     :param dict[str,numpy.ndarray] targets: each target is either 1D (time->idx) or 2D (time,class)
     """
+    if self.shm_ring_buffer:
+      array_target_keys = sorted([key for (key, value) in targets.items() if isinstance(value, numpy.ndarray)])
+      arrays = [features] + [targets[key] for key in array_target_keys]
+      if self.shm_ring_buffer.can_write(arrays):
+        refs, end_pos = self.shm_ring_buffer.write_arrays(arrays)
+        other_targets = {key: value for (key, value) in targets.items() if key not in array_target_keys}
+        self._send("data-shm", (segment_name, array_target_keys, refs, end_pos, other_targets))
+        return
     self._send("data", (segment_name, features, targets))
 
   def close(self):
@@ -353,5 +371,7 @@ class ExternSprintDatasetSource:
     self._send("exit")
     self.pipe_c2p.close()
     self.pipe_p2c.close()
+    if self.shm_ring_buffer:
+      self.shm_ring_buffer.remove()
 
 # End Sprint PythonControl interface. }
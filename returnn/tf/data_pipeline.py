@@ -82,7 +82,21 @@ Also the chunk shuffling is more difficult to implement and would be slower comp
 Implementation via new tf.dataset API
 -------------------------------------
 
-This is planned, but not yet started.
+This is implemented in :class:`DatasetDataProvider`, and enabled via ``dataset_pipeline`` in the config.
+The network then directly gets its input from the dataset iterator, instead of placeholders.
+
+``dataset_pipeline = True`` uses :func:`DatasetDataProvider._dataset_pipeline_default`,
+which iterates over the sequences of the dataset and uses ``padded_batch`` with ``max_seqs``.
+You can also provide your own function, which gets an :class:`InputContext`.
+
+``dataset_pipeline = "batches"`` wraps the :class:`BatchSetGenerator` of the epoch
+(see :func:`InputContext.get_returnn_batches_dataset`),
+i.e. the batches are exactly the same as with :class:`FeedDictDataProvider`,
+so ``batch_size``, ``max_seqs``, ``chunking`` etc. work as before.
+The batch assembly (``shapes_for_batches``, padding) runs in the background and is prefetched to the device,
+so it overlaps with ``session.run``.
+The number of prefetched batches can be set via ``dataset_pipeline_prefetch``,
+and the number of batch assembly worker threads via ``dataset_pipeline_num_workers``.
 
 
 Some use case
@@ -114,6 +128,7 @@ It depends on whether the full network is recurrent or not.
 from __future__ import print_function
 
 import sys
+import time
 import typing
 try:
   # noinspection PyCompatibility
@@ -128,9 +143,127 @@ import tensorflow as tf
 
 from returnn.datasets.basic import Dataset, BatchSetGenerator
 from returnn.tf.network import ExternData
+from returnn.tf.util.basic import Data
 import returnn.tf.compat as tf_compat
 import returnn.tf.horovod as tf_horovod
 from returnn.log import log
+from returnn.util.task_system import AsyncTask
+
+
+def is_batch_idx_in_slice(batch_idx, batch_slice):
+  """
+  :param int batch_idx:
+  :param slice|None batch_slice: e.g. ``slice(shard_index, None, num_shards)``. None means all batches
+  :return: whether the batch with this index is selected by the batch slice
+  :rtype: bool
+  """
+  if batch_slice is None:
+    return True
+  assert (batch_slice.start or 0) >= 0
+  start = batch_slice.start or 0
+  assert (batch_slice.step or 1) >= 1
+  step = batch_slice.step or 1
+  if batch_idx < start:
+    return False
+  if batch_slice.stop is not None and batch_idx >= batch_slice.stop:
+    return False
+  if step > 1 and (batch_idx - start) % step != 0:
+    return False
+  return True
+
+
+def collect_batch_raw_data(dataset, batch, extern_data, data_keys):
+  """
+  First stage of building the data for one batch:
+  Loads the seqs of the batch and collects the (unpadded) data of each seq slice.
+  The dataset is accessed in the order of the calls, and under the dataset lock,
+  thus this must be called in the order of the batches.
+  The returned arrays are not copied, i.e. we assume that the dataset does not modify them afterwards.
+
+  :param Dataset dataset:
+  :param returnn.engine.batch.Batch batch:
+  :param ExternData extern_data:
+  :param list[str] data_keys:
+  :return: list of (seq, data-key -> seq data, seq tag), in the order of batch.seqs
+  :rtype: list[(returnn.engine.batch.BatchSeqCopyPart,dict[str,numpy.ndarray],str)]
+  """
+  from returnn.engine.batch import Batch
+  from returnn.util.basic import slice_pad_zeros
+  assert isinstance(batch, Batch)
+  raw_seqs = []
+  with dataset.lock:
+    dataset.load_seqs(batch.start_seq, batch.end_seq)
+    for seq in batch.seqs:
+      length = seq.frame_length
+      seq_data = {}
+      for k in data_keys:
+        # Some special cases first, such as "seq_idx" and "seq_tag".
+        # See also :func:`TFNetwork.get_extern_data`.
+        if k in ["seq_idx", "seq_tag"]:
+          continue  # handled in assemble_batch_data. will always be added
+        if k in extern_data.extra_added_keys:
+          continue
+        if extern_data.data[k].have_time_axis():
+          if length.get(k) in [0, None]:
+            continue
+        v = dataset.get_data(seq.seq_idx, k)
+        if extern_data.data[k].have_time_axis():
+          v = slice_pad_zeros(v, begin=seq.seq_start_frame[k], end=seq.seq_end_frame[k])
+          if v.shape[0] != length[k]:
+            raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
+              v.shape[0], length[k], seq.seq_start_frame, seq.seq_end_frame, seq.seq_idx,
+              dataset.get_seq_length(seq.seq_idx)))
+        seq_data[k] = v
+      raw_seqs.append((seq, seq_data, dataset.get_tag(seq.seq_idx)))
+  return raw_seqs
+
+
+def assemble_batch_data(batch, raw_seqs, extern_data, data_keys, enforce_min_len1=False):
+  """
+  Second stage of building the data for one batch:
+  Allocates the zero-padded batch arrays and copies the seq data into it.
+  This does not access the dataset, thus it can run in parallel for multiple batches.
+
+  :param returnn.engine.batch.Batch batch:
+  :param list[(returnn.engine.batch.BatchSeqCopyPart,dict[str,numpy.ndarray],str)] raw_seqs:
+    from :func:`collect_batch_raw_data`
+  :param ExternData extern_data:
+  :param list[str] data_keys:
+  :param bool enforce_min_len1:
+  :return: batch-data-value-dict. also contains "seq_idx", "seq_tag" and "<key>_seq_lens"
+  :rtype: dict[str,numpy.ndarray|list[str]|list[int]]
+  """
+  from returnn.datasets.basic import shapes_for_batches
+  # In Returnn with Theano, we usually have the shape (time,batch,feature).
+  # In TensorFlow, the default is (batch,time,feature).
+  # This is also what we use here, i.e. batch_dim_first=True.
+  # This must match the Data specification in TFNetwork.ExternData.init_from_config().
+  shapes = shapes_for_batches(
+    [batch], data_keys=data_keys, extern_data=extern_data, enforce_min_len1=enforce_min_len1)
+  data = {k: numpy.zeros(shape=shapes[k], dtype=extern_data.data[k].dtype)
+          for k in data_keys if extern_data.data[k].dtype != "string"}
+  # Numpy cannot handle "string" dtype. Just make it a list[str], which is what TF can handle.
+  data.update({k: [""] * batch.num_slices
+               for k in data_keys if extern_data.data[k].dtype == "string"})
+  data.update({"seq_idx": [-1] * batch.num_slices, "seq_tag": [""] * batch.num_slices})
+  seq_lens = {k: numpy.zeros(shape=(shapes[k][0],), dtype=extern_data.data[k].size_dtype)
+              for k in data_keys if extern_data.data[k].have_time_axis()}
+  for seq, seq_data, seq_tag in raw_seqs:
+    o = seq.batch_frame_offset
+    q = seq.batch_slice
+    # input-data, input-index will also be set in this loop. That is data-key "data".
+    for k, v in seq_data.items():
+      if extern_data.data[k].have_time_axis():
+        ls = v.shape[0]
+        data[k][q, o[k]:o[k] + ls] = v
+        seq_lens[k][q] = max(seq_lens[k][q], o[k] + ls)
+      else:  # no time-axis
+        data[k][q] = v
+    data["seq_idx"][q] = seq.seq_idx
+    data["seq_tag"][q] = seq_tag
+  for k in seq_lens.keys():
+    data["%s_seq_lens" % k] = seq_lens[k]
+  return data
 
 
 class DataProviderBase(object):
@@ -210,15 +343,140 @@ class DataProviderBase(object):
     raise NotImplementedError
 
 
+class FeedDictDataProviderWorkers(object):
+  """
+  Worker processes which build the batch data for :class:`FeedDictDataProvider`.
+  Each worker has its own (forked) copy of the dataset and loads only the seqs of the batches it gets,
+  i.e. every seq is loaded exactly once, and the main process does not load any seq data.
+  This requires a random-access dataset where the seq lengths are known without loading the data,
+  see :func:`check_dataset`.
+  The workers are forked once and are kept over the epochs.
+  At the beginning of each epoch, they get the seq order of the dataset of the main process.
+  """
+
+  def __init__(self, dataset, extern_data, data_keys, num_workers, enforce_min_len1=False):
+    """
+    :param Dataset dataset:
+    :param ExternData extern_data:
+    :param list[str]|set[str] data_keys:
+    :param int num_workers:
+    :param bool enforce_min_len1:
+    """
+    assert num_workers > 0
+    self.check_dataset(dataset)
+    self.dataset = dataset
+    self.extern_data = extern_data
+    self.data_keys = sorted(data_keys)
+    self.enforce_min_len1 = enforce_min_len1
+    self.workers = [
+      AsyncTask(func=self._worker_proc_main, name="DataProvider worker %i" % i)
+      for i in range(num_workers)]  # type: typing.List[AsyncTask]
+
+  @classmethod
+  def check_dataset(cls, dataset):
+    """
+    :param Dataset dataset:
+    :raises AssertionError: if the dataset does not support random access in the workers
+    """
+    from returnn.datasets.cached import CachedDataset
+    assert isinstance(dataset, CachedDataset), (
+      "%s: data provider workers need a random-access dataset (e.g. HDFDataset), but got %r. "
+      "For sequential datasets, every worker would need to load all seqs." % (cls.__name__, dataset))
+    assert dataset.cache_byte_size_limit_at_start == 0, (
+      "%s: data provider workers need dataset %r without cache (cache_byte_size=0)." % (cls.__name__, dataset))
+
+  def is_compatible(self, dataset, data_keys, enforce_min_len1=False):
+    """
+    :param Dataset dataset:
+    :param list[str]|set[str] data_keys:
+    :param bool enforce_min_len1:
+    :return: whether these workers can be used for these options
+    :rtype: bool
+    """
+    return (
+      dataset is self.dataset and sorted(data_keys) == self.data_keys and enforce_min_len1 == self.enforce_min_len1)
+
+  def init_epoch(self):
+    """
+    Sends the current epoch and seq order of the dataset (of the main process) to the workers.
+    """
+    seq_order = list(self.dataset.get_current_seq_order())
+    for worker in self.workers:
+      worker.put(("init_seq_order", self.dataset.epoch, seq_order))
+
+  def stop(self):
+    """
+    Stops the worker processes.
+    """
+    for worker in self.workers:
+      try:
+        worker.put(None)
+      except Exception as exc:
+        print("DataProvider: error while stopping worker %s: %r" % (worker.name, exc), file=log.v4)
+      worker.join(timeout=10)
+      if worker.is_alive():
+        worker.terminate()
+    self.workers = []
+
+  def _worker_proc_main(self, task):
+    """
+    Main function of a worker process (forked).
+    Gets ("init_seq_order", epoch, seq_order), or ("batch", :class:`Batch`) and sends back the batch data,
+    or None to quit.
+
+    :param AsyncTask task:
+    """
+    from returnn.util import task_system
+    # Our Pickler will use shared memory for the big arrays.
+    task_system.SharedMemNumpyConfig["enabled"] = True
+    try:
+      while True:
+        msg = task.get()
+        if msg is None:
+          break
+        if msg[0] == "init_seq_order":
+          _, epoch, seq_order = msg
+          self.dataset.init_seq_order(epoch=epoch, seq_order=seq_order)
+          continue
+        assert msg[0] == "batch"
+        batch = msg[1]
+        try:
+          start_time = time.time()
+          raw_seqs = collect_batch_raw_data(
+            dataset=self.dataset, batch=batch, extern_data=self.extern_data, data_keys=self.data_keys)
+          data = assemble_batch_data(
+            batch=batch, raw_seqs=raw_seqs, extern_data=self.extern_data, data_keys=self.data_keys,
+            enforce_min_len1=self.enforce_min_len1)
+          data["batch_build_time"] = time.time() - start_time
+        except Exception as exc:
+          sys.excepthook(*sys.exc_info())
+          task.put(("error", "%s: %r" % (task.name, exc)))
+          break
+        task.put(("data", data))
+    finally:
+      # The process will exit without atexit handlers, so cleanup the shared memory explicitly.
+      # The segments stay valid as long as the main process still has them attached.
+      for shared_array in list(task_system.SharedNumpyArray.ServerInstances):
+        shared_array.mem.remove()
+
+
 class FeedDictDataProvider(DataProviderBase):
   """
   This class will fill all the placeholders used for training or forwarding or evaluation etc.
   of a :class:`returnn.tf.network.TFNetwork`.
   It will run a background thread which reads the data from a dataset and puts it into a queue.
+
+  Optionally, the batch data can be built by multiple worker processes (:class:`FeedDictDataProviderWorkers`),
+  each with its own (forked) copy of the dataset.
+  The background thread then still iterates through the :class:`BatchSetGenerator`,
+  but sends the batches round-robin to the workers and collects the results in the same order,
+  i.e. the order of the batches is deterministic and the same as without workers.
+  The workers send big arrays via shared memory (:class:`returnn.util.task_system.SharedNumpyArray`).
+  This is only supported for random-access datasets (e.g. HDF), see :func:`FeedDictDataProviderWorkers.check_dataset`.
   """
 
   def __init__(self, tf_session, dataset, batches, enforce_min_len1=False, capacity=10, tf_queue=None,
-               batch_slice=None, **kwargs):
+               batch_slice=None, num_workers=0, workers=None, **kwargs):
     """
     :param tf.compat.v1.Session|tf.compat.v1.InteractiveSession tf_session:
     :param Dataset dataset:
@@ -229,6 +487,9 @@ class FeedDictDataProvider(DataProviderBase):
     :param int capacity:
     :param TFDataQueues|None tf_queue:
     :param slice|None batch_slice: select a subset of the batches
+    :param int num_workers: number of worker processes to build the batch data. 0 means in the thread itself.
+      If ``workers`` is not given, the worker processes are created here, and stopped in :func:`stop_threads`.
+    :param FeedDictDataProviderWorkers|None workers: existing workers (e.g. kept over epochs by the engine)
     """
     super(FeedDictDataProvider, self).__init__(**kwargs)
     self.tf_session = tf_session
@@ -245,6 +506,16 @@ class FeedDictDataProvider(DataProviderBase):
     self.thread_finished = False
     self.cur_batch_idx = 0
     self.reached_end = False
+    self.workers = workers
+    self.own_workers = False
+    if num_workers and not workers:
+      self.workers = FeedDictDataProviderWorkers(
+        dataset=dataset, extern_data=self.extern_data, data_keys=self.data_keys, num_workers=num_workers,
+        enforce_min_len1=enforce_min_len1)
+      self.own_workers = True
+    if self.workers:
+      assert self.workers.is_compatible(
+        dataset=dataset, data_keys=self.data_keys, enforce_min_len1=enforce_min_len1)
 
   def start_threads(self, session):
     """
@@ -252,6 +523,8 @@ class FeedDictDataProvider(DataProviderBase):
 
     :param tf.compat.v1.Session session:
     """
+    if self.workers:
+      self.workers.init_epoch()
     thread = Thread(target=self._thread_main, name="DataProvider thread")
     thread.daemon = True  # Thread will close when parent quits.
     thread.start()
@@ -266,8 +539,26 @@ class FeedDictDataProvider(DataProviderBase):
       self._flush_all_data()
       self.thread.join()
       self.thread = None
+    if self.workers and self.own_workers:
+      self.workers.stop()
+      self.workers = None
     self.dataset.finish_epoch()
 
+  def _peek_next_batch(self, consider_batch_slice):
+    """
+    This assumes that we have more data, i.e. self.batches.has_more().
+
+    :param bool consider_batch_slice:
+    :returns: the next batch, or None if it is not selected by the batch slice
+    :rtype: returnn.engine.batch.Batch|None
+    """
+    cur_batch_idx = self.cur_batch_idx
+    batch, = self.batches.peek_next_n(1)
+    self.cur_batch_idx += 1
+    if consider_batch_slice and not is_batch_idx_in_slice(cur_batch_idx, self.batch_slice):
+      return None
+    return batch
+
   def get_next_batch(self, consider_batch_slice):
     """
     This assumes that we have more data, i.e. self.batches.has_more().
@@ -277,70 +568,24 @@ class FeedDictDataProvider(DataProviderBase):
     :rtype: dict[str,numpy.ndarray]|None
     """
     # See EngineUtil.assign_dev_data() for reference.
-    cur_batch_idx = self.cur_batch_idx
-    batch, = self.batches.peek_next_n(1)
-    self.cur_batch_idx += 1
-    if consider_batch_slice and self.batch_slice is not None:
-      assert (self.batch_slice.start or 0) >= 0
-      start = self.batch_slice.start or 0
-      assert (self.batch_slice.step or 1) >= 1
-      step = self.batch_slice.step or 1
-      if cur_batch_idx < start:
-        return None
-      if self.batch_slice.stop is not None and cur_batch_idx >= self.batch_slice.stop:
-        return None
-      if step > 1 and (cur_batch_idx - start) % step != 0:
-        return None
-    from returnn.datasets.basic import Batch, shapes_for_batches
-    assert isinstance(batch, Batch)
-    # In Returnn with Theano, we usually have the shape (time,batch,feature).
-    # In TensorFlow, the default is (batch,time,feature).
-    # This is also what we use here, i.e. batch_dim_first=True.
-    # This must match the Data specification in TFNetwork.ExternData.init_from_config().
-    shapes = shapes_for_batches(
-      [batch], data_keys=self.data_keys, extern_data=self.extern_data, enforce_min_len1=self.enforce_min_len1)
-    data = {k: numpy.zeros(shape=shapes[k], dtype=self.extern_data.data[k].dtype)
-            for k in self.data_keys if self.extern_data.data[k].dtype != "string"}
-    # Numpy cannot handle "string" dtype. Just make it a list[str], which is what TF can handle.
-    data.update({k: [""] * batch.num_slices
-                 for k in self.data_keys if self.extern_data.data[k].dtype == "string"})
-    data.update({"seq_idx": [-1] * batch.num_slices, "seq_tag": [""] * batch.num_slices})
-    seq_lens = {k: numpy.zeros(shape=(shapes[k][0],), dtype=self.extern_data.data[k].size_dtype)
-                for k in self.data_keys if self.extern_data.data[k].have_time_axis()}
-    self.dataset.load_seqs(batch.start_seq, batch.end_seq)
-    from returnn.util.basic import slice_pad_zeros
-    with self.dataset.lock:
-      for seq in batch.seqs:
-        o = seq.batch_frame_offset
-        q = seq.batch_slice
-        length = seq.frame_length
-        # input-data, input-index will also be set in this loop. That is data-key "data".
-        for k in self.data_keys:
-          # Some special cases first, such as "seq_idx" and "seq_tag".
-          # See also :func:`TFNetwork.get_extern_data`.
-          if k in ["seq_idx", "seq_tag"]:
-            continue  # handled below. will always be added
-          if k in self.extern_data.extra_added_keys:
-            continue
-          if self.extern_data.data[k].have_time_axis():
-            if length.get(k) in [0, None]:
-              continue
-          v = self.dataset.get_data(seq.seq_idx, k)
-          if self.extern_data.data[k].have_time_axis():
-            v = slice_pad_zeros(v, begin=seq.seq_start_frame[k], end=seq.seq_end_frame[k])
-            ls = v.shape[0]
-            if ls != length[k]:
-              raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
-                ls, length[k], seq.seq_start_frame, seq.seq_end_frame, seq.seq_idx,
-                self.dataset.get_seq_length(seq.seq_idx)))
-            data[k][q, o[k]:o[k] + ls] = v
-            seq_lens[k][q] = max(seq_lens[k][q], o[k] + ls)
-          else:  # no time-axis
-            data[k][q] = v
-        data["seq_idx"][q] = seq.seq_idx
-        data["seq_tag"][q] = self.dataset.get_tag(seq.seq_idx)
-    for k in seq_lens.keys():
-      data["%s_seq_lens" % k] = seq_lens[k]
+    batch = self._peek_next_batch(consider_batch_slice=consider_batch_slice)
+    if batch is None:
+      return None
+    return self._get_batch_data(batch)
+
+  def _get_batch_data(self, batch):
+    """
+    :param returnn.engine.batch.Batch batch:
+    :returns: batch-data-value-dict. also contains "batch_build_time", see :class:`returnn.tf.engine.StepTimeStats`
+    :rtype: dict[str,numpy.ndarray|float]
+    """
+    start_time = time.time()
+    raw_seqs = collect_batch_raw_data(
+      dataset=self.dataset, batch=batch, extern_data=self.extern_data, data_keys=self.data_keys)
+    data = assemble_batch_data(
+      batch=batch, raw_seqs=raw_seqs, extern_data=self.extern_data, data_keys=self.data_keys,
+      enforce_min_len1=self.enforce_min_len1)
+    data["batch_build_time"] = time.time() - start_time
     return data
 
   def _thread_main(self):
@@ -348,16 +593,14 @@ class FeedDictDataProvider(DataProviderBase):
       from returnn.util import better_exchook
       better_exchook.install()
 
-      while self.batches.has_more() and not self.coord.should_stop():
-        enqueue_args = self.get_next_batch(consider_batch_slice=True)
-        if enqueue_args is not None:
-          if self.queue:
-            self.queue.put(enqueue_args)
-          else:
-            self.tf_queue.enqueue(tf_session=self.tf_session, data=enqueue_args)
-        with self.state_change_cond:
-          self.state_change_cond.notifyAll()
-        self.batches.advance(1)
+      if self.workers:
+        self._thread_main_workers()
+      else:
+        while self.batches.has_more() and not self.coord.should_stop():
+          enqueue_args = self.get_next_batch(consider_batch_slice=True)
+          if enqueue_args is not None:
+            self._enqueue(enqueue_args)
+          self.batches.advance(1)
 
       self.reached_end = not self.batches.has_more()
 
@@ -370,6 +613,48 @@ class FeedDictDataProvider(DataProviderBase):
         self.thread_finished = True
         self.state_change_cond.notifyAll()
 
+  def _thread_main_workers(self):
+    """
+    Like the loop in :func:`_thread_main`, but the batch data is built by the worker processes.
+    Batch i goes to worker i % num_workers, and the results are collected in the same order.
+    """
+    from collections import deque
+    workers = self.workers.workers
+    pending = deque()  # type: typing.Deque[AsyncTask]  # worker for each batch in flight, in order
+    num_sent = 0
+    while not self.coord.should_stop():
+      # Keep each worker busy with up to two batches, such that it does not need to wait for us.
+      while self.batches.has_more() and len(pending) < 2 * len(workers):
+        batch = self._peek_next_batch(consider_batch_slice=True)
+        if batch is not None:
+          worker = workers[num_sent % len(workers)]
+          worker.put(("batch", batch))
+          pending.append(worker)
+          num_sent += 1
+        self.batches.advance(1)
+      if not pending:
+        break
+      worker = pending.popleft()
+      msg_type, value = worker.get()
+      if msg_type == "error":
+        raise Exception("DataProvider worker error: %s" % value)
+      assert msg_type == "data"
+      self._enqueue(value)
+    # When we were stopped early, the workers are kept for the next epoch, so consume their pending results.
+    while pending:
+      pending.popleft().get()
+
+  def _enqueue(self, enqueue_args):
+    """
+    :param dict[str,numpy.ndarray] enqueue_args: batch data
+    """
+    if self.queue:
+      self.queue.put(enqueue_args)
+    else:
+      self.tf_queue.enqueue(tf_session=self.tf_session, data=enqueue_args)
+    with self.state_change_cond:
+      self.state_change_cond.notifyAll()
+
   def have_more_data(self, session):
     """
     :param tf.compat.v1.Session|None session:
@@ -440,7 +725,10 @@ class FeedDictDataProvider(DataProviderBase):
           raise Exception(
             "dataset currently does not support variable shape in other dimensions than the first. "
             "dim=%i, placeholder=%r" % (dim, len_placeholder))
-    return d, {"seq_idx": output["seq_idx"], "seq_tag": output["seq_tag"]}
+    meta = {"seq_idx": output["seq_idx"], "seq_tag": output["seq_tag"]}
+    if "batch_build_time" in output:
+      meta["batch_build_time"] = output["batch_build_time"]
+    return d, meta
 
   def get_dataset_name(self):
     """
@@ -497,8 +785,11 @@ class InputContext(object):
       self.horovod_enabled = True
       self.horovod_rank = tf_horovod.get_ctx().rank()  # rank 0 is the chief
       self.horovod_size = tf_horovod.get_ctx().size()
-      self.num_dataset_consumers = self.horovod_size
-      raise NotImplementedError  # TODO...
+      if not parent.use_batches:
+        self.num_dataset_consumers = self.horovod_size
+        raise NotImplementedError  # TODO...
+      # With the batches pipeline, every rank is its own producer and consumer,
+      # and gets its share of the batches via the batch slice (see :func:`DatasetDataProvider.set_current_dataset`).
 
     self.distributed_tf_enabled = False
     if config.is_true("distributed_tf"):
@@ -563,6 +854,100 @@ class InputContext(object):
       output_types=output_types,
       output_shapes=output_shapes)
 
+  def get_returnn_batches_dataset(self, num_workers=None):
+    """
+    Like :func:`get_returnn_dataset`, but this wraps the :class:`BatchSetGenerator` of the current epoch,
+    i.e. the batching (``batch_size``, ``max_seqs``, chunking, etc.) is exactly as with :class:`FeedDictDataProvider`,
+    and the elements of the resulting dataset are already padded batches.
+
+    The dataset access (:func:`collect_batch_raw_data`) is done sequentially in the order of the batches.
+    The padding (:func:`assemble_batch_data`) can be done by multiple worker threads in parallel.
+    The order of the batches is kept.
+
+    :param int|None num_workers: number of threads for the batch assembly. default via config
+    :return: dataset with batched elements
+    :rtype: tensorflow.data.Dataset
+    """
+    import os
+    from collections import deque
+    if num_workers is None:
+      num_workers = self.config.int("dataset_pipeline_num_workers", 1)
+    assert num_workers >= 1
+    data_keys = self.parent.data_keys
+
+    def convert_batch_data(batch_data):
+      """
+      :param dict[str,numpy.ndarray|list[str]|list[int]] batch_data: from :func:`assemble_batch_data`
+      :rtype: dict[str,numpy.ndarray]
+      """
+      res_ = {}  # type: typing.Dict[str,numpy.ndarray]
+      for key_ in data_keys:
+        data_ = self.extern_data.data[key_]
+        if data_.dtype == "string":
+          res_[key_] = numpy.array([s.encode("utf8") for s in batch_data[key_]], dtype=object)
+        else:
+          res_[key_] = numpy.asarray(batch_data[key_], dtype=data_.dtype)
+        for axis_wo_b_, dim_ in enumerate(data_.shape):
+          if dim_ is None:  # dynamic length
+            assert axis_wo_b_ == 0, "only dynamic time axis supported, got %r" % data_
+            res_["size:%s:%i" % (key_, axis_wo_b_)] = batch_data["%s_seq_lens" % key_]
+      return res_
+
+    def generator():
+      """
+      :rtype: dict[str,numpy.ndarray]
+      """
+      assert self.parent.current_dataset_name, "current dataset name not set"
+      returnn_dataset = self.parent.current_dataset
+      batches = self.parent.current_batches
+      batch_slice = self.parent.current_batch_slice
+      assert returnn_dataset and batches, "RETURNN dataset/batches not set in this proc (pid %i)" % os.getpid()
+      pool = None
+      if num_workers > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(processes=num_workers)
+      pending = deque()
+      batch_idx = 0
+      try:
+        while batches.has_more():
+          batch, = batches.peek_next_n(1)
+          batches.advance(1)
+          batch_idx += 1
+          if not is_batch_idx_in_slice(batch_idx - 1, batch_slice):
+            continue
+          raw_seqs = collect_batch_raw_data(
+            dataset=returnn_dataset, batch=batch, extern_data=self.extern_data, data_keys=data_keys)
+          kwargs = dict(batch=batch, raw_seqs=raw_seqs, extern_data=self.extern_data, data_keys=data_keys)
+          if not pool:
+            yield convert_batch_data(assemble_batch_data(**kwargs))
+            continue
+          pending.append(pool.apply_async(assemble_batch_data, kwds=kwargs))
+          while len(pending) >= num_workers:
+            yield convert_batch_data(pending.popleft().get())
+        while pending:
+          yield convert_batch_data(pending.popleft().get())
+      finally:
+        if pool:
+          pool.terminate()
+      returnn_dataset.finish_epoch()
+
+    output_types = {}  # type: typing.Dict[str,tf.DType]
+    output_shapes = {}  # type: typing.Dict[str,tf.TensorShape]
+    for key in data_keys:
+      data = self.extern_data.data[key]
+      output_types[key] = tf.as_dtype(data.dtype)
+      output_shapes[key] = tf.TensorShape(data.batch_shape)
+      for axis_wo_b, dim in enumerate(data.shape):
+        if dim is None:  # dynamic length -- need size info for it
+          size_key = "size:%s:%i" % (key, axis_wo_b)
+          output_types[size_key] = tf.as_dtype(data.size_dtype)
+          output_shapes[size_key] = tf.TensorShape([None])  # [Batch]
+
+    return tf.data.Dataset.from_generator(
+      generator=generator,
+      output_types=output_types,
+      output_shapes=output_shapes)
+
   def get_default_max_seqs(self):
     """
     :return: batch size in number of seqs, used e.g. for padded_batch
@@ -588,7 +973,7 @@ class InputContext(object):
     :param tensorflow.data.Dataset dataset:
     :rtype: tensorflow.data.Dataset
     """
-    if self.horovod_enabled:
+    if self.horovod_enabled and not self.parent.use_batches:
       raise NotImplementedError  # TODO
     if self.distributed_tf_enabled:
       raise NotImplementedError  # TODO
@@ -616,7 +1001,9 @@ class InputContext(object):
     :rtype: tensorflow.data.Dataset
     """
     from tensorflow.python.data.experimental import prefetch_to_device
-    return prefetch_to_device(self.get_consumer_device())(dataset)
+    # Number of elements (e.g. batches) to prefetch. None means automatic.
+    buffer_size = self.config.int("dataset_pipeline_prefetch", 0) or None
+    return prefetch_to_device(self.get_consumer_device(), buffer_size=buffer_size)(dataset)
 
   def get_dataset_name(self):
     """
@@ -650,6 +1037,18 @@ class DatasetDataProvider(DataProviderBase):
     :param Config.Config config:
     """
     super(DatasetDataProvider, self).__init__(extern_data=extern_data)
+    dataset_pipeline_func = config.typed_value("dataset_pipeline")
+    self.use_batches = dataset_pipeline_func == "batches"
+    if self.use_batches:
+      dataset_pipeline_func = self._dataset_pipeline_batches
+      # The batches come with the seq info. See also :func:`TFNetwork.get_extern_data`.
+      if "seq_idx" not in extern_data.data:
+        extern_data.data["seq_idx"] = Data(
+          name="seq_idx", shape=(), dtype="int32", sparse=False, auto_create_placeholders=False)
+      if "seq_tag" not in extern_data.data:
+        extern_data.data["seq_tag"] = Data(
+          name="seq_tag", shape=(), dtype="string", auto_create_placeholders=False)
+      self.data_keys = sorted(extern_data.data.keys())
     output_types = {}  # type: typing.Dict[str,tf.DType]
     output_shapes = {}  # type: typing.Dict[str,tf.TensorShape]
     for key, data in extern_data.data.items():
@@ -674,7 +1073,6 @@ class DatasetDataProvider(DataProviderBase):
           data.size_placeholder[axis_wo_b] = self.iterator_next_element[size_key]
           assert isinstance(data.size_placeholder[axis_wo_b], tf.Tensor), "next: %r" % (self.iterator_next_element,)
 
-    dataset_pipeline_func = config.typed_value("dataset_pipeline")
     if dataset_pipeline_func in [None, True, 1]:  # allow None here, if this class is used explicitly
       dataset_pipeline_func = self._dataset_pipeline_default
     assert callable(dataset_pipeline_func), "dataset_pipeline in config is invalid"
@@ -708,13 +1106,26 @@ class DatasetDataProvider(DataProviderBase):
     self.current_dataset_reached_end = False
     self.current_dataset_complete_frac = 0.
     self.current_dataset_name = None  # type: typing.Optional[str]
+    self.current_dataset = None  # type: typing.Optional[Dataset]
+    self.current_batches = None  # type: typing.Optional[BatchSetGenerator]
+    self.current_batch_slice = None  # type: typing.Optional[slice]
 
-  def set_current_dataset(self, dataset_name):
+  def set_current_dataset(self, dataset_name, dataset=None, batches=None, batch_slice=None):
     """
     :param str dataset_name:
+    :param Dataset|None dataset: if given, overwrites the dataset for this dataset name
+    :param BatchSetGenerator|None batches: needed for :func:`InputContext.get_returnn_batches_dataset`
+    :param slice|None batch_slice: select a subset of the batches. only for dataset_pipeline 'batches'
     """
     assert dataset_name in self.contexts
+    if self.use_batches:
+      assert batches, "dataset_pipeline 'batches' needs the BatchSetGenerator"
+    else:
+      assert batch_slice is None, "batch_slice is only supported with dataset_pipeline 'batches'"
     self.current_dataset_name = dataset_name
+    self.current_dataset = dataset or self.datasets[dataset_name]
+    self.current_batches = batches
+    self.current_batch_slice = batch_slice
     self.current_dataset_complete_frac = 0.
     self.current_dataset_reached_end = False
 
@@ -798,6 +1209,8 @@ class DatasetDataProvider(DataProviderBase):
     #  we would need some IPC to the original RETURNN dataset if it lives in another process...
     #  we could also feed complete_frac as part of the data itself...
     # self.current_dataset_complete_frac can be set if the dataset lives in the same process
+    if self.current_batches:
+      return self.current_batches.completed_frac()
     return self.current_dataset_complete_frac
 
   # noinspection PyMethodMayBeStatic
@@ -811,3 +1224,17 @@ class DatasetDataProvider(DataProviderBase):
     dataset = context.map_producer_to_consumer(dataset)
     dataset = context.prefetch_to_consumer_device(dataset)
     return dataset
+
+  # noinspection PyMethodMayBeStatic
+  def _dataset_pipeline_batches(self, context):
+    """
+    Used for ``dataset_pipeline = "batches"``.
+    The batches are the same as with :class:`FeedDictDataProvider`.
+
+    :param InputContext context:
+    :rtype: tensorflow.data.Dataset
+    """
+    dataset = context.get_returnn_batches_dataset()
+    dataset = context.map_producer_to_consumer(dataset)
+    dataset = context.prefetch_to_consumer_device(dataset)
+    return dataset
@@ -16,6 +16,7 @@ import os
 import sys
 import time
 import typing
+from threading import Thread
 try:
   # noinspection PyCompatibility
   from Queue import Queue
@@ -37,9 +38,9 @@ from returnn.tf.network import TFNetwork, ExternData, help_on_tf_exception
 from returnn.tf.util.data import Data
 from returnn.tf.layers.base import LayerBase
 from returnn.tf.updater import Updater
-from returnn.tf.data_pipeline import FeedDictDataProvider, DatasetDataProvider
+from returnn.tf.data_pipeline import FeedDictDataProvider, FeedDictDataProviderWorkers, DatasetDataProvider
 import returnn.tf.horovod as tf_horovod
-from returnn.util.basic import hms, NumbersDict, BackendEngine
+from returnn.util.basic import hms, human_bytes_size, NumbersDict, BackendEngine
 from pprint import pprint
 
 
@@ -49,6 +50,199 @@ class CancelTrainingException(Exception):
   """
 
 
+class StepTimeStats(object):
+  """
+  Collects the wall time of each step of :class:`Runner`, split into phases,
+  such that we can see where the time goes when an epoch is slow.
+  The phases are:
+
+    - data_wait: the main thread waits for the next batch (data provider queue), or builds it itself
+    - batch_build: loading the seqs from the dataset and assembling the padded batch
+      (in the data provider thread or worker, i.e. this usually overlaps with the other phases)
+    - session_run: the TF session.run call
+    - param_sync: Horovod communication (signals and param averaging), if used
+    - logging: collecting the eval info, extra fetches, printing the progress
+    - step: total wall time of the step in the main thread
+  """
+
+  Phases = ("data_wait", "batch_build", "session_run", "param_sync", "logging", "step")
+
+  def __init__(self):
+    self.times = {phase: [] for phase in self.Phases}  # type: typing.Dict[str,typing.List[float]]
+
+  def add_step(self, **phase_times):
+    """
+    :param float phase_times: phase -> time in seconds
+    """
+    for phase, t in phase_times.items():
+      self.times[phase].append(t)
+
+  def get_summary(self):
+    """
+    :return: phase -> {"p50", "p95", "max", "total"}, in seconds, for phases with collected times
+    :rtype: dict[str,dict[str,float]]
+    """
+    res = {}
+    for phase in self.Phases:
+      if not self.times[phase]:
+        continue
+      values = numpy.array(self.times[phase])
+      p50, p95 = numpy.percentile(values, [50, 95])
+      res[phase] = {"p50": float(p50), "p95": float(p95), "max": float(values.max()), "total": float(values.sum())}
+    return res
+
+  def print_summary(self, report_prefix, file):
+    """
+    :param str report_prefix:
+    :param io.TextIOBase|log.Stream file:
+    """
+    summary = self.get_summary()
+    print("%s, step time p50/p95/max in sec: %s" % (report_prefix, ", ".join([
+      "%s %.3f/%.3f/%.3f" % (phase, v["p50"], v["p95"], v["max"]) for phase, v in summary.items()])), file=file)
+
+  def write_tf_summary(self, writer, step):
+    """
+    :param tf.compat.v1.summary.FileWriter writer:
+    :param int step: global train step
+    """
+    values = []
+    for phase, v in self.get_summary().items():
+      for key in ["p50", "p95", "max"]:
+        values.append(tf_compat.v1.Summary.Value(tag="step_time/%s/%s" % (phase, key), simple_value=v[key]))
+    writer.add_summary(tf_compat.v1.Summary(value=values), step)
+
+  def write_jsonl(self, filename, **info):
+    """
+    Appends one JSON line with the summary and the given info.
+    This can be collected across multiple jobs, e.g. to track throughput regressions.
+
+    :param str filename:
+    :param info: e.g. dataset name, epoch. must be JSON serializable
+    """
+    import json
+    import socket
+    entry = {"time": time.time(), "host": socket.gethostname(), "pid": os.getpid()}
+    entry.update(info)
+    entry["step_times"] = self.get_summary()
+    with open(filename, "a") as f:
+      f.write("%s\n" % json.dumps(entry, sort_keys=True))
+
+
+class SearchOutputWriter(object):
+  """
+  Writes the search output (:func:`Engine.search`) incrementally, in bounded memory,
+  while the seqs arrive in an arbitrary order (e.g. sorted by length).
+  Every finished batch is appended to a journal file (``<output_file>.unsorted``, one JSON line per seq),
+  and only in :func:`finalize`, the final output file is written in corpus order,
+  where we only keep the file offsets of the journal entries in memory.
+  If the search got interrupted, it can resume from the last finished batch in the journal.
+  """
+
+  def __init__(self, filename, file_format="txt", resume=False):
+    """
+    :param str filename: final output file
+    :param str file_format: "txt" or "py"
+    :param bool resume: if the journal file exists, continue it. otherwise, an existing journal is an error
+    """
+    assert file_format in {"txt", "py"}
+    assert not os.path.exists(filename), "search output file %r exists" % filename
+    self.filename = filename
+    self.file_format = file_format
+    self.journal_filename = "%s.unsorted" % filename
+    self.num_batches_done = 0
+    self._done_corpus_seq_idx = set()  # type: typing.Set[int]
+    self._batch_lines = []  # type: typing.List[str]
+    if os.path.exists(self.journal_filename):
+      assert resume, (
+        "search output journal %r exists. Set search_output_file_resume = True to resume, or delete it." % (
+          self.journal_filename,))
+      self._load_journal()
+      print("Resume search from %r: %i seqs in %i batches done." % (
+        self.journal_filename, len(self._done_corpus_seq_idx), self.num_batches_done), file=log.v2)
+    self._journal_file = open(self.journal_filename, "a")
+
+  def _load_journal(self):
+    """
+    Reads the journal, and drops everything after the last finished batch (e.g. a partially written batch).
+    """
+    import json
+    valid_len = 0
+    done = set()
+    with open(self.journal_filename, "r") as f:
+      while True:
+        line = f.readline()
+        if not line.endswith("\n"):  # EOF, or incomplete last line
+          break
+        entry = json.loads(line)
+        if isinstance(entry, dict):  # batch end marker
+          self.num_batches_done = entry["batch"]
+          self._done_corpus_seq_idx.update(done)
+          done.clear()
+          valid_len = f.tell()
+        else:
+          done.add(entry[0])
+    with open(self.journal_filename, "r+") as f:
+      f.truncate(valid_len)
+
+  def write_seq(self, corpus_seq_idx, seq_tag, out_data):
+    """
+    :param int corpus_seq_idx:
+    :param str seq_tag:
+    :param str|list[(float,str)]|dict[str] out_data:
+    """
+    import json
+    assert corpus_seq_idx not in self._done_corpus_seq_idx, "seq %i %r written twice" % (corpus_seq_idx, seq_tag)
+    self._done_corpus_seq_idx.add(corpus_seq_idx)
+    if self.file_format == "txt":
+      text = "%s\n" % (out_data,)
+    else:
+      from returnn.util.basic import better_repr
+      text = "%r: %s,\n" % (seq_tag, better_repr(out_data))
+    self._batch_lines.append("%s\n" % json.dumps([int(corpus_seq_idx), text]))
+
+  def finish_batch(self):
+    """
+    Appends the seqs of the current batch to the journal, together with the batch end marker.
+    """
+    import json
+    self.num_batches_done += 1
+    self._batch_lines.append("%s\n" % json.dumps({"batch": self.num_batches_done}))
+    self._journal_file.write("".join(self._batch_lines))
+    self._journal_file.flush()
+    self._batch_lines = []
+
+  def finalize(self):
+    """
+    Writes the final output file in corpus order, and removes the journal.
+    """
+    import json
+    assert not self._batch_lines, "finish_batch() not called"
+    self._journal_file.close()
+    num_seqs = len(self._done_corpus_seq_idx)
+    assert num_seqs > 0 and max(self._done_corpus_seq_idx) == num_seqs - 1, "missing seqs in search output"
+    offsets = numpy.zeros((num_seqs,), dtype="int64")
+    with open(self.journal_filename, "r") as f:
+      while True:
+        offset = f.tell()
+        line = f.readline()
+        if not line:
+          break
+        entry = json.loads(line)
+        if not isinstance(entry, dict):
+          offsets[entry[0]] = offset
+      tmp_filename = "%s.tmp" % self.filename
+      with open(tmp_filename, "w") as out:
+        if self.file_format == "py":
+          out.write("{\n")
+        for corpus_seq_idx in range(num_seqs):
+          f.seek(offsets[corpus_seq_idx])
+          out.write(json.loads(f.readline())[1])
+        if self.file_format == "py":
+          out.write("}\n")
+    os.rename(tmp_filename, self.filename)
+    os.remove(self.journal_filename)
+
+
 class Runner(object):
   """
   This encapsulates the logic around TF ``session.run``, i.e. iterating over the dataset.
@@ -58,7 +252,7 @@ class Runner(object):
   def __init__(self, engine,
                dataset_name=None, dataset=None, batches=None,
                train=False, eval=True, train_flag=None,
-               extra_fetches=None, extra_fetches_callback=None):
+               extra_fetches=None, extra_fetches_callback=None, extra_feed_dict=None):
     """
     :param Engine engine:
     :param str|None dataset_name: "train", "dev" or so
@@ -73,6 +267,7 @@ class Runner(object):
       where each item corresponds to the batch-seq.
       It might also be useful to add `network.get_extern_data("seq_idx")` and `network.get_extern_data("seq_tag")`.
     :param (**dict[str,numpy.ndarray|str|list[numpy.ndarray|str])->None extra_fetches_callback: called if extra_fetches
+    :param dict[tf.Tensor,numpy.ndarray|float|int]|None extra_feed_dict: additional feeds per step
     """
     from returnn.tf.data_pipeline import DataProviderBase
     engine.network.extern_data.check_matched_dataset(
@@ -87,6 +282,7 @@ class Runner(object):
     self._train_flag = train_flag
     self._should_train = train
     self._should_eval = eval
+    self.extra_feed_dict = extra_feed_dict or {}
     self.store_metadata_mod_step = engine.config.int("store_metadata_mod_step", 0)
     self.reset_updater_vars_mod_step = engine.config.int("reset_updater_vars_mod_step", 0)
     self.finalized = False
@@ -109,6 +305,8 @@ class Runner(object):
       assert extra_fetches_callback
     self.extra_fetches_callback = extra_fetches_callback
     self._step_start_time = None  # type: typing.Optional[float]
+    self.step_time_stats = StepTimeStats()
+    self._step_time_stats_file = engine.config.value("step_time_stats_file", None)
     self._horovod_last_param_sync_time = time.time()  # we assume it is synced right now
     self._horovod_stopped_runner = False
     self._horovod_finish_all = False
@@ -619,6 +817,7 @@ class Runner(object):
       if writer:
         writer.add_graph(sess.graph)
       hvd_stop = hvd_error = False
+      step_loop_start_time = time.time()
       while self.data_provider.have_more_data(session=sess):
         self._step_start_time = time.time()
         hvd_stop, hvd_error = self._horovod_signal_have_more_data(local_step=step)
@@ -627,11 +826,15 @@ class Runner(object):
         if hvd_stop:
           # Some other peer does not have data anymore, but no error occurred.
           break
+        get_feed_dict_start_time = time.time()
         feed_dict, meta_step_info = self.data_provider.get_feed_dict()
+        time_data_wait = (self._step_start_time - step_loop_start_time) + (time.time() - get_feed_dict_start_time)
+        time_param_sync = get_feed_dict_start_time - self._step_start_time
         if isinstance(self.engine.network.train_flag, tf.Tensor):
           feed_dict[self.engine.network.train_flag] = self._train_flag
         if isinstance(self.engine.network.epoch_step, tf.Tensor):
           feed_dict[self.engine.network.epoch_step] = step
+        feed_dict.update(self.extra_feed_dict)
         start_time = time.time()
         if self._should_train and self.reset_updater_vars_mod_step and step % self.reset_updater_vars_mod_step == 0:
           print("Reset updater vars in step %i." % step, file=log.v5)
@@ -666,7 +869,8 @@ class Runner(object):
               feed_dict=feed_dict,
               options=run_options,
               run_metadata=run_metadata)  # type: typing.Dict[str,typing.Union[numpy.ndarray,str]]
-            elapsed_time_tf += time.time() - session_run_start_time
+            time_session_run = time.time() - session_run_start_time
+            elapsed_time_tf += time_session_run
             writer.add_summary(fetches_results["summary"], step + step_offset)
             writer.add_run_metadata(run_metadata, 'step_{:04d}'.format(step + step_offset))
             tl = timeline.Timeline(run_metadata.step_stats)
@@ -677,7 +881,8 @@ class Runner(object):
             session_run_start_time = time.time()
             fetches_results = sess.run(
               fetches_dict, feed_dict=feed_dict)  # type: typing.Dict[str,typing.Union[numpy.ndarray,str]]
-            elapsed_time_tf += time.time() - session_run_start_time
+            time_session_run = time.time() - session_run_start_time
+            elapsed_time_tf += time_session_run
             if writer and "summary" in fetches_results:
               writer.add_summary(fetches_results["summary"], step + step_offset)
         except tf.errors.OpError as exc:
@@ -691,11 +896,24 @@ class Runner(object):
           # Extra info will be printed below.
           raise
 
+        logging_start_time = time.time()
         eval_info = self._collect_eval_info(fetches_results=fetches_results)
         self._maybe_handle_extra_fetches(fetches_results)
+        param_sync_start_time = time.time()
         elapsed_time_tf += self._horovod_sync_params(local_step=step)
+        param_sync_end_time = time.time()
+        time_param_sync += param_sync_end_time - param_sync_start_time
         duration = time.time() - start_time
         self._print_process(report_prefix=report_prefix, step=step, step_duration=duration, eval_info=eval_info)
+        step_end_time = time.time()
+        step_times = dict(
+          data_wait=time_data_wait, session_run=time_session_run, param_sync=time_param_sync,
+          logging=(param_sync_start_time - logging_start_time) + (step_end_time - param_sync_end_time),
+          step=step_end_time - step_loop_start_time)
+        if meta_step_info and "batch_build_time" in meta_step_info:
+          step_times["batch_build"] = meta_step_info["batch_build_time"]
+        self.step_time_stats.add_step(**step_times)
+        step_loop_start_time = step_end_time
 
         if self.engine.config.bool("stop_on_nonfinite_train_score", True):
           score_values = self._results_accumulated.values()
@@ -730,6 +948,16 @@ class Runner(object):
       elapsed_tf_percentage = (elapsed_time_tf / elapsed) if (elapsed > 0) else 0.0
       print("%s, finished after %i steps, %s elapsed (%.1f%% computing time)" % (
         report_prefix, step, hms(elapsed), (elapsed_tf_percentage * 100.)), file=log.v3)
+      if step > 0:
+        self.step_time_stats.print_summary(report_prefix=report_prefix, file=log.v3)
+        if writer:
+          self.step_time_stats.write_tf_summary(writer=writer, step=step + step_offset)
+        if self._step_time_stats_file:
+          self.step_time_stats.write_jsonl(
+            self._step_time_stats_file,
+            dataset=self.dataset_name, epoch=self.engine.epoch, train=self._should_train,
+            num_steps=step, elapsed=elapsed, steps_per_sec=step / elapsed if elapsed > 0 else None,
+            num_frames={key: int(value) for (key, value) in self.num_frames_accumulated.items()})
 
     except KeyboardInterrupt as exc:
       print("KeyboardInterrupt in step %r." % step)
@@ -786,6 +1014,8 @@ class Engine(EngineBase):
     self.devices_config = self._get_devices_config()
     self._check_devices()
     self.tf_session = None  # type: typing.Optional[tf.compat.v1.Session]
+    self._save_model_thread = None  # type: typing.Optional[Thread]  # see save_model_async
+    self._save_model_exception = None  # type: typing.Optional[BaseException]
     self.network = None  # type: typing.Optional[TFNetwork]
     self.updater = None  # type: typing.Optional[Updater]
     self.learning_rate_control = None  # type: typing.Optional[LearningRateControl]
@@ -793,6 +1023,7 @@ class Engine(EngineBase):
     self._merge_all_summaries = None
     self.dataset_batches = {}  # type: typing.Dict[str,BatchSetGenerator]
     self.dataset_provider = None  # type: typing.Optional[DatasetDataProvider]
+    self._data_provider_workers = {}  # type: typing.Dict[Dataset,FeedDictDataProviderWorkers]
     self.train_data = None  # type: typing.Optional[Dataset]
     self.eval_datasets = {}  # type: typing.Dict[str,Dataset]
     self.start_epoch = None  # type: typing.Optional[int]
@@ -808,6 +1039,7 @@ class Engine(EngineBase):
     """
     Finalizes the TF session, network, graph.
     """
+    self._stop_data_provider_workers()
     self._close_tf_session()
     self._reset_graph(error_occurred=error_occurred)
 
@@ -854,6 +1086,7 @@ class Engine(EngineBase):
         print("Note: There is a GPU available but you have set device=cpu.", file=log.v2)
 
   def _close_tf_session(self):
+    self._wait_for_save_model()
     if self.tf_session:
       self.tf_session.close()
     self.tf_session = None
@@ -947,20 +1180,62 @@ class Engine(EngineBase):
     if epoch:
       assert not filename
       filename = self.get_epoch_model_filename(epoch=epoch)
+    self._wait_for_save_model()
     print("Load model %s" % (filename,), file=log.v4)
     self.network.load_params_from_file(filename, session=self.tf_session)
 
   def save_model(self, filename=None):
     """
+    With config ``save_model_async``, the param values are only copied into host memory here,
+    and the checkpoint is written in a background thread, while e.g. the next epoch starts already.
+    A pending save is always finished before the next save, load, or when the session is closed.
+
     :param str filename: full filename for model
     """
     if not self._do_save():
       return
     if not filename:
       filename = self.get_epoch_model_filename()
+    self._wait_for_save_model()
+    if self.config.bool("save_model_async", False):
+      snapshot = self.network.get_params_snapshot(session=self.tf_session)
+      if snapshot:
+        print("Save model under %s (async, %s)" % (filename, human_bytes_size(snapshot.get_num_bytes())), file=log.v4)
+        self._save_model_thread = Thread(
+          target=self._save_model_thread_main, args=(snapshot, filename), name="save_model %s" % filename)
+        # Not a daemon thread, such that we wait for it at exit.
+        self._save_model_thread.start()
+        return
+      print("save_model_async not supported for this network, save synchronously.", file=log.v3)
     print("Save model under %s" % (filename,), file=log.v4)
     self.network.save_params_to_file(filename, session=self.tf_session)
 
+  def _save_model_thread_main(self, snapshot, filename):
+    """
+    :param returnn.tf.network.TFNetworkParamsSnapshot snapshot:
+    :param str filename:
+    """
+    try:
+      start_time = time.time()
+      snapshot.save_to_file(filename)
+      print("Saved model %s, took %.3f secs in background." % (filename, time.time() - start_time), file=log.v5)
+    except BaseException as exc:
+      self._save_model_exception = exc
+      sys.excepthook(*sys.exc_info())
+
+  def _wait_for_save_model(self):
+    """
+    Waits for a pending save (via save_model_async), and reraises its exception, if there was any.
+    """
+    if self._save_model_thread:
+      if self._save_model_thread.is_alive():
+        print("Wait for pending model save...", file=log.v5)
+      self._save_model_thread.join()
+      self._save_model_thread = None
+    if self._save_model_exception:
+      exc, self._save_model_exception = self._save_model_exception, None
+      raise exc
+
   @staticmethod
   def delete_model(filename):
     """
@@ -1032,6 +1307,12 @@ class Engine(EngineBase):
       self.max_seq_length = NumbersDict(self.max_seq_length)
     assert isinstance(self.max_seq_length, (int, float, NumbersDict))
     self.max_pad_size = config.typed_value("max_pad_size", None)
+    self.batch_bucket_boundaries = config.typed_value("batch_bucket_boundaries", None)
+    self.batch_bucket_batch_sizes = config.typed_value("batch_bucket_batch_sizes", None)
+    if self.batch_bucket_boundaries is not None and train_data:
+      assert train_data.can_load_seqs_in_any_order(), (
+        "batch_bucket_boundaries needs a train dataset which can load the seqs in any order (e.g. HDFDataset), "
+        "but got %r" % train_data)
     # And also initialize the network. That depends on some vars here such as pretrain.
     self.init_network_from_config(config)
 
@@ -1267,20 +1548,38 @@ class Engine(EngineBase):
     use_dataset_pipeline = False
     if self.config.is_true("dataset_pipeline"):
       use_dataset_pipeline = True
-    extern_data = ExternData()
-    extern_data.init_from_config(config=self.config, auto_create_placeholders=not use_dataset_pipeline)
-    if use_dataset_pipeline:
-      datasets = self.eval_datasets.copy()
-      if self.train_data:
-        datasets["train"] = self.train_data
-      self.dataset_provider = DatasetDataProvider(extern_data=extern_data, datasets=datasets, config=self.config)
-    self.network, self.updater = self.create_network(
-      config=self.config,
-      extern_data=extern_data,
-      rnd_seed=net_random_seed,
-      train_flag=train_flag, eval_flag=self.use_eval_flag, search_flag=self.use_search_flag,
-      initial_learning_rate=getattr(self, "initial_learning_rate", None),
-      net_dict=net_desc)
+    graph_cache, graph_cache_key = None, None
+    if (self.config.value("graph_cache_dir", None) and train_flag is False and not self.use_search_flag
+            and not use_dataset_pipeline and not self.config.is_true("use_horovod")
+            and not self.config.is_true("reinit_network_each_epoch")):
+      from returnn.tf.graph_cache import GraphCache
+      graph_cache = GraphCache(cache_dir=self.config.value("graph_cache_dir", None))
+      extern_data = ExternData()
+      extern_data.init_from_config(config=self.config, auto_create_placeholders=False)
+      graph_cache_key = graph_cache.get_key(
+        config=self.config, net_dict=net_desc,
+        train_flag=train_flag, eval_flag=self.use_eval_flag, search_flag=self.use_search_flag,
+        rnd_seed=net_random_seed, extern_data=extern_data)
+    if graph_cache and graph_cache.has(graph_cache_key):
+      # The cached graph contains the extern data placeholders, so we must not create them here.
+      self.network, self.updater = graph_cache.load(graph_cache_key, config=self.config, net_dict=net_desc), None
+    else:
+      extern_data = ExternData()
+      extern_data.init_from_config(config=self.config, auto_create_placeholders=not use_dataset_pipeline)
+      if use_dataset_pipeline:
+        datasets = self.eval_datasets.copy()
+        if self.train_data:
+          datasets["train"] = self.train_data
+        self.dataset_provider = DatasetDataProvider(extern_data=extern_data, datasets=datasets, config=self.config)
+      self.network, self.updater = self.create_network(
+        config=self.config,
+        extern_data=extern_data,
+        rnd_seed=net_random_seed,
+        train_flag=train_flag, eval_flag=self.use_eval_flag, search_flag=self.use_search_flag,
+        initial_learning_rate=getattr(self, "initial_learning_rate", None),
+        net_dict=net_desc)
+      if graph_cache:
+        graph_cache.save(graph_cache_key, network=self.network)
     self.network.initialize_params(session=self.tf_session)
     if self.config.is_true("use_horovod"):
       # Note: Might not be needed as it should be deterministic. But just to be sure...
@@ -1518,6 +1817,8 @@ class Engine(EngineBase):
         max_seqs=self.max_seqs,
         max_seq_length=self.max_seq_length,
         max_pad_size=self.max_pad_size,
+        bucket_boundaries=self.batch_bucket_boundaries,
+        bucket_batch_sizes=self.batch_bucket_batch_sizes,
         seq_drop=self.seq_drop,
         shuffle_batches=self.shuffle_batches,
         used_data_keys=self.network.get_used_data_keys())
@@ -1971,23 +2272,46 @@ class Engine(EngineBase):
     :param bool|None feed_dict:
     :rtype: FeedDictDataProvider|DatasetDataProvider
     """
+    batch_slice = None
+    if tf_horovod.get_ctx() and tf_horovod.get_ctx().is_dataset_distribution_shard():
+      batch_slice = tf_horovod.get_ctx().get_dataset_shard_batch_slice()
     if self.dataset_provider and feed_dict is not True and dataset_name:
-      self.dataset_provider.set_current_dataset(dataset_name=dataset_name)
+      self.dataset_provider.set_current_dataset(
+        dataset_name=dataset_name, dataset=dataset, batches=batches, batch_slice=batch_slice)
       return self.dataset_provider
     else:
       if self.dataset_provider and feed_dict is not False:
         print("WARNING: dataset_provider is set (via dataset_pipeline) but not used", file=log.v2)
-      batch_slice = None
-      if tf_horovod.get_ctx() and tf_horovod.get_ctx().is_dataset_distribution_shard():
-        batch_slice = tf_horovod.get_ctx().get_dataset_shard_batch_slice()
+      data_keys = self.network.get_used_data_keys()
+      enforce_min_len1 = self.config.is_true("enforce_min_len1", False)
+      num_workers = self.config.int("data_provider_num_workers", 0)
+      workers = None
+      if num_workers:
+        workers = self._data_provider_workers.get(dataset)
+        if workers and not workers.is_compatible(
+              dataset=dataset, data_keys=data_keys, enforce_min_len1=enforce_min_len1):
+          workers.stop()
+          workers = None
+        if not workers:
+          # Created once and kept over the epochs, such that we do not fork each epoch.
+          workers = FeedDictDataProviderWorkers(
+            dataset=dataset, extern_data=self.network.extern_data, data_keys=data_keys,
+            num_workers=num_workers, enforce_min_len1=enforce_min_len1)
+          self._data_provider_workers[dataset] = workers
       data_provider = FeedDictDataProvider(
         tf_session=self.tf_session, extern_data=self.network.extern_data,
-        data_keys=self.network.get_used_data_keys(),
+        data_keys=data_keys,
         dataset=dataset, batches=batches,
         batch_slice=batch_slice,
-        enforce_min_len1=self.config.is_true("enforce_min_len1", False))
+        workers=workers,
+        enforce_min_len1=enforce_min_len1)
       return data_provider
 
+  def _stop_data_provider_workers(self):
+    for workers in self._data_provider_workers.values():
+      workers.stop()
+    self._data_provider_workers.clear()
+
   def get_specific_feed_dict(self, dataset, seq_idx):
     """
     :param Dataset.Dataset dataset:
@@ -2096,7 +2420,10 @@ class Engine(EngineBase):
     else:
       assert not os.path.exists(output_file)
     print("Forward output:", output, file=log.v3)
-    writer = SimpleHDFWriter(filename=output_file, dim=output.dim, ndim=output.ndim, labels=labels)
+    writer = SimpleHDFWriter(
+      filename=output_file, dim=output.dim, ndim=output.ndim, labels=labels,
+      buffer_max_bytes=self.config.int("forward_hdf_buffer_max_bytes", 64 * 1024 * 1024),
+      background_write=self.config.bool("forward_hdf_background_write", True))
 
     def extra_fetches_cb(inputs, seq_tag, **kwargs):
       """
@@ -2119,11 +2446,20 @@ class Engine(EngineBase):
     }
     for i, seq_len in output.size_placeholder.items():
       extra_fetches["seq_len_%i" % i] = seq_len
+    batch_slice = None
+    num_shards = self.config.int("forward_num_shards", 1)
+    if num_shards > 1:
+      # E.g. via tools/forward-sharded.py. Every shard process forwards every num_shards-th batch.
+      shard_index = self.config.int("forward_shard_index", 0)
+      assert 0 <= shard_index < num_shards
+      print("Forward shard %i of %i." % (shard_index, num_shards), file=log.v2)
+      batch_slice = slice(shard_index, None, num_shards)
     batches = data.generate_batches(
       recurrent_net=self.network.recurrent,
       batch_size=batch_size,
       max_seqs=self.max_seqs,
-      used_data_keys=self.network.get_used_data_keys())
+      used_data_keys=self.network.get_used_data_keys(),
+      batch_slice=batch_slice)
     forwarder = Runner(
       engine=self, dataset=data, batches=batches,
       train=False, eval=False,
@@ -2206,29 +2542,73 @@ class Engine(EngineBase):
       if self.network:
         print("Reinit network with search flag.", file=log.v3)
       self.init_network_from_config(self.config)
+    search_batch_compaction = self.config.float("search_batch_compaction", 0.0)
+    search_seq_finished = None  # type: typing.Optional[tf.Tensor]  # (batch,), bool
+    if search_batch_compaction:
+      from returnn.tf.util.basic import CollectionKeys
+      seq_finished_list = tf_compat.v1.get_collection(CollectionKeys.SEARCH_SEQ_FINISHED)
+      if seq_finished_list:
+        print(
+          "Search batch compaction: stop the search of a batch when at most %.1f%% of its seqs are unfinished,"
+          " and search these again in new batches." % (search_batch_compaction * 100), file=log.v3)
+        search_seq_finished = tf.reduce_all(tf.stack(seq_finished_list, axis=0), axis=0)
+        assert not self.config.bool("search_output_file_resume", False), (
+          "search_output_file_resume is not supported with search_batch_compaction")
+        if do_eval:
+          print("Search batch compaction: disable eval, as the loss would include unfinished seqs.", file=log.v2)
+          do_eval = False
+      else:
+        print("Search batch compaction: no search with dynamic length in the network, disabled.", file=log.v3)
+        search_batch_compaction = 0.0
     if do_eval:
       # It's constructed lazily and it will set used_data_keys, so make sure that we have it now.
       self.network.maybe_construct_objective()
+    # (seq_idx, seq_tag) -> corpus seq idx, i.e. the index in the written output file
+    get_corpus_seq_idx = None  # type: typing.Optional[typing.Callable[[int,str],int]]
     if output_file:
+      # We want to sort it, for optimal batch packing.
+      # Sort it in reverse to make sure that we have enough memory right at the beginning.
       if dataset.have_corpus_seq_idx():
-        # We can sort it. Sort it in reverse to make sure that we have enough memory right at the beginning.
         print("Dataset have_corpus_seq_idx == True, i.e. it will be sorted for optimal performance.", file=log.v3)
         dataset.seq_ordering = "sorted_reverse"
+        get_corpus_seq_idx = lambda seq_idx_, seq_tag_: dataset.get_corpus_seq_idx(seq_idx_)  # noqa
       else:
-        print("Dataset have_corpus_seq_idx == False, i.e. it will not be sorted for optimal performance.", file=log.v3)
-        dataset.seq_ordering = "default"  # enforce order as-is, so that the order in the written file corresponds
+        tag_to_corpus_seq_idx = self._get_search_tag_to_corpus_seq_idx(dataset)
+        if tag_to_corpus_seq_idx is not None:
+          print(
+            "Dataset have_corpus_seq_idx == False, but we have unique seq tags for all seqs,"
+            " i.e. it will be sorted for optimal performance.", file=log.v3)
+          dataset.seq_ordering = "sorted_reverse"
+          get_corpus_seq_idx = lambda seq_idx_, seq_tag_: tag_to_corpus_seq_idx[seq_tag_]  # noqa
+        else:
+          print(
+            "Dataset have_corpus_seq_idx == False, i.e. it will not be sorted for optimal performance.", file=log.v3)
+          dataset.seq_ordering = "default"  # enforce order as-is, so that the order in the written file corresponds
+          get_corpus_seq_idx = lambda seq_idx_, seq_tag_: seq_idx_  # noqa
 
     max_seq_length = self.config.typed_value('max_seq_length', None) or self.config.float('max_seq_length', 0)
     assert not max_seq_length, (
       "Set max_seq_length = 0 for search (i.e. no maximal length). We want to keep all source sentences.")
 
+    output_writer = None  # type: typing.Optional[SearchOutputWriter]
+    if output_file:
+      assert output_file_format in {"txt", "py"}
+      if isinstance(output_layer_names, list):
+        assert output_file_format == "py", "Text format not supported in the case of multiple output layers."
+      print("Will write outputs to: %s" % output_file, file=log.v2)
+      output_writer = SearchOutputWriter(
+        filename=output_file, file_format=output_file_format,
+        resume=self.config.bool("search_output_file_resume", False))
+
     dataset.init_seq_order(epoch=self.epoch)
     batches = dataset.generate_batches(
       recurrent_net=self.network.recurrent,
       batch_size=self.config.int('batch_size', 1),
       max_seqs=self.config.int('max_seqs', -1),
       max_seq_length=max_seq_length,
-      used_data_keys=self.network.get_used_data_keys())
+      used_data_keys=self.network.get_used_data_keys(),
+      # The batches are deterministic, so we can skip those which are already written.
+      batch_slice=slice(output_writer.num_batches_done, None) if output_writer else None)
 
     output_is_dict = isinstance(output_layer_names, list)
     if not output_is_dict:
@@ -2254,22 +2634,16 @@ class Engine(EngineBase):
       out_beam_sizes.append(out_beam.beam_size if out_beam else None)
       target_keys.append(output_layer.target or self.network.extern_data.default_target)
 
-    out_cache = None
-    seq_idx_to_tag = {}
-    if output_file:
-      assert output_file_format in {"txt", "py"}
-      if output_is_dict:
-        assert output_file_format == "py", "Text format not supported in the case of multiple output layers."
+    if output_writer:
       assert all(dataset.can_serialize_data(target_key) for target_key in target_keys)
-      assert not os.path.exists(output_file)
-      print("Will write outputs to: %s" % output_file, file=log.v2)
-      output_file = open(output_file, "w")
-      # corpus-seq-idx -> str|list[(float,str)]|dict[str -> str|list[(float,str)]],
-      # depending on output_is_dict and whether output is after decision
-      out_cache = {}
     if not log.verbose[4]:
       print("Set log_verbosity to level 4 or higher to see seq info on stdout.", file=log.v2)
 
+    # With search_batch_compaction, unfinished seqs are searched again in further passes.
+    # seq_infos: for the seqs of the current pass, the (seq_idx, seq_tag) in the dataset. None in the first pass.
+    # unfinished: list of (seq_idx, seq_tag, data) for the next pass.
+    search_pass = {"seq_infos": None, "unfinished": []}
+
     def extra_fetches_callback(seq_idx, seq_tag, **kwargs):
       """
       :param list[int] seq_idx: of length batch (without beam)
@@ -2279,7 +2653,12 @@ class Engine(EngineBase):
         list[numpy.ndarray] output_<layer name>
         list[numpy.ndarray] beam_scores_<layer name>
         list[numpy.ndarray] target_<target key>
+      With search_batch_compaction, also:
+        numpy.ndarray seq_finished
+        list[numpy.ndarray] data_<data key>
       """
+      if search_pass["seq_infos"] is not None:
+        seq_idx, seq_tag = [list(x) for x in zip(*[search_pass["seq_infos"][i] for i in seq_idx])]
 
       outputs, beam_scores, targets = [], [], []
       # noinspection PyShadowingNames
@@ -2305,13 +2684,15 @@ class Engine(EngineBase):
           outputs[target_idx] = bytearray(outputs[target_idx]).decode("utf8")
 
       for batch_idx in range(len(seq_idx)):
-        corpus_seq_idx = None
-        if out_cache is not None:
-          corpus_seq_idx = dataset.get_corpus_seq_idx(seq_idx[batch_idx])
-          assert corpus_seq_idx not in out_cache
-          seq_idx_to_tag[corpus_seq_idx] = seq_tag[batch_idx]
-          if output_is_dict:
-            out_cache[corpus_seq_idx] = {}
+        if search_seq_finished is not None and not kwargs["seq_finished"][batch_idx]:
+          search_pass["unfinished"].append((
+            seq_idx[batch_idx], seq_tag[batch_idx],
+            {key: kwargs["data_" + key][batch_idx] for key in compaction_data_keys}))
+          continue
+
+        # str|list[(float,str)]|dict[str -> str|list[(float,str)]],
+        # depending on output_is_dict and whether output is after decision
+        out_seq_data = {} if output_is_dict else None
 
         # noinspection PyShadowingNames
         for target_idx in range(num_targets):
@@ -2340,7 +2721,7 @@ class Engine(EngineBase):
                   dataset.serialize_data(key=target_keys[target_idx], data=outputs[target_idx][out_idx + beam_idx]),
                   file=log.v4)
 
-            if out_cache is not None:
+            if output_writer:
               if out_beam_sizes[target_idx] is None:
                   out_data = dataset.serialize_data(key=target_keys[target_idx], data=outputs[target_idx][out_idx])
               else:
@@ -2351,11 +2732,18 @@ class Engine(EngineBase):
                     for beam_idx in range(out_beam_sizes[target_idx])]
 
               if output_is_dict:
-                assert output_layer_names[target_idx] not in out_cache[corpus_seq_idx]
-                out_cache[corpus_seq_idx][output_layer_names[target_idx]] = out_data
+                assert output_layer_names[target_idx] not in out_seq_data
+                out_seq_data[output_layer_names[target_idx]] = out_data
               else:
-                assert corpus_seq_idx not in out_cache
-                out_cache[corpus_seq_idx] = out_data
+                out_seq_data = out_data
+
+        if output_writer:
+          output_writer.write_seq(
+            corpus_seq_idx=get_corpus_seq_idx(seq_idx[batch_idx], seq_tag[batch_idx]), seq_tag=seq_tag[batch_idx],
+            out_data=out_seq_data)
+
+      if output_writer:
+        output_writer.finish_batch()
 
     train = self._maybe_prepare_train_in_eval(targets_via_search=True)
 
@@ -2371,32 +2759,98 @@ class Engine(EngineBase):
       extra_fetches["target_" + target_keys[target_idx]] = self.network.get_extern_data(
         target_keys[target_idx], mark_data_key_as_used=True)
 
-    runner = Runner(
-      engine=self, dataset=dataset, batches=batches, train=train, eval=do_eval,
-      extra_fetches=extra_fetches,
-      extra_fetches_callback=extra_fetches_callback)
-    runner.run(report_prefix=self.get_epoch_str() + " search")
-    if not runner.finalized:
-      print("Error happened (%s). Exit now." % runner.run_exception)
-      sys.exit(1)
+    extra_feed_dict = {}
+    compaction_data_keys = []  # type: typing.List[str]
+    if search_seq_finished is not None:
+      from returnn.tf.util.basic import global_tensor
+      extra_feed_dict[global_tensor(None, name="search_batch_compaction_threshold")] = search_batch_compaction
+      extra_fetches["seq_finished"] = search_seq_finished
+      # We keep the input data of the unfinished seqs, to search them again.
+      compaction_data_keys = sorted(self.network.get_used_data_keys().difference({"seq_idx", "seq_tag"}))
+      for key in compaction_data_keys:
+        extra_fetches["data_" + key] = self.network.get_extern_data(key, mark_data_key_as_used=True)
+
+    num_steps = 0
+    search_pass_idx = 0
+    search_dataset = dataset
+    while True:
+      runner = Runner(
+        engine=self, dataset=search_dataset, batches=batches, train=train, eval=do_eval,
+        extra_fetches=extra_fetches,
+        extra_fetches_callback=extra_fetches_callback,
+        extra_feed_dict=extra_feed_dict)
+      runner.run(report_prefix=self.get_epoch_str() + " search" + (
+        " (compaction pass %i)" % search_pass_idx if search_pass_idx else ""))
+      if not runner.finalized:
+        print("Error happened (%s). Exit now." % runner.run_exception)
+        sys.exit(1)
+      num_steps += runner.num_steps
+      if not search_pass["unfinished"]:
+        break
+      search_pass_idx += 1
+      print("Search batch compaction: pass %i with %i unfinished seqs." % (
+        search_pass_idx, len(search_pass["unfinished"])), file=log.v3)
+      search_dataset = self._get_search_compaction_dataset(
+        seqs=search_pass["unfinished"], data_keys=compaction_data_keys, target_list=dataset.get_target_list())
+      search_pass["seq_infos"] = [(seq_idx, seq_tag) for (seq_idx, seq_tag, _) in search_pass["unfinished"]]
+      search_pass["unfinished"] = []
+      batches = search_dataset.generate_batches(
+        recurrent_net=self.network.recurrent,
+        batch_size=self.config.int('batch_size', 1),
+        max_seqs=self.config.int('max_seqs', -1),
+        used_data_keys=self.network.get_used_data_keys())
     print("Search done. Num steps %i, Final: score %s error %s" % (
-      runner.num_steps, self.format_score(runner.score), self.format_score(runner.error)), file=log.v1)
-    if output_file:
-      assert out_cache
-      assert 0 in out_cache
-      assert len(out_cache) - 1 in out_cache
-      if output_file_format == "txt":
-        for i in range(len(out_cache)):
-          output_file.write("%s\n" % out_cache[i])
-      elif output_file_format == "py":
-        from returnn.util.basic import better_repr
-        output_file.write("{\n")
-        for i in range(len(out_cache)):
-          output_file.write("%r: %s,\n" % (seq_idx_to_tag[i], better_repr(out_cache[i])))
-        output_file.write("}\n")
-      else:
-        raise Exception("invalid output_file_format %r" % output_file_format)
-      output_file.close()
+      num_steps, self.format_score(runner.score), self.format_score(runner.error)), file=log.v1)
+    if output_writer:
+      output_writer.finalize()
+
+  def _get_search_compaction_dataset(self, seqs, data_keys, target_list):
+    """
+    For search_batch_compaction, see :func:`search`.
+
+    :param list[(int,str,dict[str,numpy.ndarray])] seqs: unfinished seqs (seq_idx, seq_tag, data)
+    :param list[str] data_keys:
+    :param list[str] target_list:
+    :return: dataset with the data of the seqs, in the same order, which is sorted by length (longest first)
+    :rtype: returnn.datasets.generating.StaticDataset
+    """
+    from returnn.datasets.generating import StaticDataset
+    default_input = self.network.extern_data.default_input
+    if default_input in data_keys and self.network.extern_data.data[default_input].have_time_axis():
+      # Sort it like in the first pass (sorted_reverse), for optimal batch packing.
+      seqs.sort(key=lambda seq: -len(seq[2][default_input]))
+    output_dim = {
+      key: (self.network.extern_data.data[key].dim, self.network.extern_data.data[key].ndim) for key in data_keys}
+    dataset = StaticDataset(
+      data=[data for (_, _, data) in seqs], target_list=[key for key in target_list if key in data_keys],
+      output_dim=output_dim)
+    dataset.init_seq_order(epoch=1)
+    return dataset
+
+  @staticmethod
+  def _get_search_tag_to_corpus_seq_idx(dataset):
+    """
+    For datasets without :func:`Dataset.have_corpus_seq_idx`,
+    we can still sort the seqs when we know all the seq tags in the original corpus order.
+
+    :param Dataset dataset:
+    :return: seq tag -> corpus seq idx, or None if not possible
+    :rtype: dict[str,int]|None
+    """
+    if type(dataset).get_all_tags is Dataset.get_all_tags:
+      # The default implementation depends on the current seq order, and is thus not usable for this.
+      return None
+    if dataset.partition_epoch not in (None, 1):
+      return None
+    try:
+      all_tags = dataset.get_all_tags()
+    except NotImplementedError:
+      return None
+    tag_to_corpus_seq_idx = {tag: i for (i, tag) in enumerate(all_tags)}
+    if len(tag_to_corpus_seq_idx) != len(all_tags):
+      print("Dataset seq tags are not unique.", file=log.v3)
+      return None
+    return tag_to_corpus_seq_idx
 
   def search_single(self, dataset, seq_idx, output_layer_name=None):
     """
@@ -2559,18 +3013,32 @@ class Engine(EngineBase):
       numpy.savetxt(f, log_average_posterior, delimiter=' ')
     print("Saved prior in %r in +log space." % output_file, file=log.v1)
 
-  def web_server(self, port):
+  def web_server(self, port, max_batch_size=None, max_batch_wait_time=None):
     """
     Starts a web-server with a simple API to forward data through the network
     (or search if the flag is set).
+    Concurrent requests are collected by a :class:`DynamicBatcher`
+    and processed together in a single ``session.run`` call.
+    ``GET /stats`` returns the queue latency and batch size statistics as JSON.
 
     :param int port: for the http server
+    :param int|None max_batch_size: max number of requests per batch. config "web_server_max_batch_size"
+    :param float|None max_batch_wait_time: in seconds, how long the first request of a batch waits for others.
+      config "web_server_max_batch_wait_time"
     :return:
     """
     assert sys.version_info[0] >= 3, "only Python 3 supported"
     # noinspection PyCompatibility
     from http.server import HTTPServer, BaseHTTPRequestHandler
+    # noinspection PyCompatibility
+    from socketserver import ThreadingMixIn
     from returnn.datasets.generating import StaticDataset, Vocabulary, BytePairEncoding, ExtractAudioFeatures
+    from returnn.util.basic import DynamicBatcher
+
+    if max_batch_size is None:
+      max_batch_size = self.config.int("web_server_max_batch_size", 16)
+    if max_batch_wait_time is None:
+      max_batch_wait_time = self.config.float("web_server_max_batch_wait_time", 0.01)
 
     if not self.use_search_flag or not self.network or self.use_dynamic_train_flag:
       self.use_search_flag = True
@@ -2620,6 +3088,44 @@ class Engine(EngineBase):
       print("Given output %r has beam size %i." % (output_layer, out_beam_size), file=log.v1)
       output_layer_beam_scores_t = output_layer.get_search_choices().beam_scores
 
+    def process_batch(features_list):
+      """
+      :param list[numpy.ndarray] features_list: input features per request
+      :return: per request: list of (score or None, output txt), i.e. len is the beam size (or 1)
+      :rtype: list[list[(float|None,str)]]
+      """
+      dataset = StaticDataset(
+        data=[
+          {input_data.name: features, output_data.name: numpy.array([], dtype="int32")}  # empty targets...
+          for features in features_list],
+        output_dim=num_outputs)
+      dataset.init_seq_order(epoch=1)
+      start_time = time.time()
+      output_d = engine.run_single(dataset=dataset, seq_idx=-1, output_dict={
+        "output": output_t,
+        "seq_lens": output_seq_lens_t,
+        "beam_scores": output_layer_beam_scores_t})
+      print("Took %.3f secs for decoding a batch of %i seqs." % (time.time() - start_time, len(features_list)),
+            file=log.v4)
+      output = output_d["output"]
+      seq_lens = output_d["seq_lens"]
+      beam_scores = output_d["beam_scores"]
+      beam = out_beam_size or 1
+      assert len(output) == len(seq_lens) == len(features_list) * beam  # beam is merged into batch dim
+      if out_beam_size:
+        assert beam_scores.shape == (len(features_list), out_beam_size)  # (batch, beam)
+      results = []
+      for b in range(len(features_list)):
+        results.append([
+          (beam_scores[b][i] if out_beam_size else None,
+           output_vocab.get_seq_labels(output[b * beam + i][:seq_lens[b * beam + i]]))
+          for i in range(beam)])
+      return results
+
+    batcher = DynamicBatcher(
+      process_batch=process_batch, max_batch_size=max_batch_size, max_wait_time=max_batch_wait_time,
+      name="web_server batcher")
+
     class Handler(BaseHTTPRequestHandler):
       """
       Handle POST requests.
@@ -2635,6 +3141,20 @@ class Engine(EngineBase):
           sys.excepthook(*sys.exc_info())
           raise
 
+      # noinspection PyPep8Naming
+      def do_GET(self):
+        """
+        Handle GET request. Only /stats.
+        """
+        import json
+        if self.path.rstrip("/") != "/stats":
+          self.send_error(404)
+          return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(("%s\n" % json.dumps(batcher.get_stats(), sort_keys=True)).encode("utf8"))
+
       def _do_post(self):
         import cgi
         form = cgi.FieldStorage(
@@ -2664,49 +3184,44 @@ class Engine(EngineBase):
           seq = input_vocab.get_seq(sentence)
           print("Input seq:", input_vocab.get_seq_labels(seq), file=log.v4)
           features = numpy.array(seq, dtype="int32")
-        targets = numpy.array([], dtype="int32")  # empty...
-        dataset = StaticDataset(
-          data=[{input_data.name: features, output_data.name: targets}], output_dim=num_outputs)
-        dataset.init_seq_order(epoch=1)
 
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
         start_time = time.time()
-        output_d = engine.run_single(dataset=dataset, seq_idx=0, output_dict={
-          "output": output_t,
-          "seq_lens": output_seq_lens_t,
-          "beam_scores": output_layer_beam_scores_t})
+        hyps = batcher.submit(features)
         delta_time = time.time() - start_time
-        print("Took %.3f secs for decoding." % delta_time, file=log.v4)
+        print("Took %.3f secs for decoding, incl. waiting in the queue." % delta_time, file=log.v4)
         if audio_len:
           print("Real-time-factor: %.3f" % (delta_time / audio_len), file=log.v4)
-        output = output_d["output"]
-        seq_lens = output_d["seq_lens"]
-        beam_scores = output_d["beam_scores"]
-        assert len(output) == len(seq_lens) == (out_beam_size or 1)
-        if out_beam_size:
-          assert beam_scores.shape == (1, out_beam_size)  # (batch, beam)
-
-        first_best_txt = output_vocab.get_seq_labels(output[0][:seq_lens[0]])
-        print("Best output: %s" % first_best_txt, file=log.v4)
+        if batcher.num_batches % 100 == 0:
+          print("Web server stats: %s" % batcher.get_stats_str(), file=log.v3)
+        print("Best output: %s" % hyps[0][1], file=log.v4)
 
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain')
+        self.end_headers()
         if out_beam_size:
           self.wfile.write(b"[\n")
-          for i in range(out_beam_size):
-            txt = output_vocab.get_seq_labels(output[i][:seq_lens[i]])
-            score = beam_scores[0][i]
+          for score, txt in hyps:
             self.wfile.write(("(%r, %r)\n" % (score, txt)).encode("utf8"))
           self.wfile.write(b"]\n")
 
         else:
-          self.wfile.write(("%r\n" % first_best_txt).encode("utf8"))
+          self.wfile.write(("%r\n" % hyps[0][1]).encode("utf8"))
 
-    print("Simple search web server, listening on port %i." % port, file=log.v2)
+    class Server(ThreadingMixIn, HTTPServer):
+      """
+      One thread per request, such that the requests can be batched.
+      """
+      daemon_threads = True
+
+    print("Simple search web server, listening on port %i, %r." % (port, batcher), file=log.v2)
     server_address = ('', port)
     # noinspection PyAttributeOutsideInit
-    self.httpd = HTTPServer(server_address, Handler)
-    self.httpd.serve_forever()
+    self.httpd = Server(server_address, Handler)
+    try:
+      self.httpd.serve_forever()
+    finally:
+      batcher.stop()
+      print("Web server stats: %s" % batcher.get_stats_str(), file=log.v3)
 
 
 def get_global_engine():
@@ -0,0 +1,559 @@
+"""
+Cache for the constructed TF graph of a network, to skip the (potentially slow) network construction
+(:func:`TFNetwork.construct_from_dict`, e.g. the template construction of the :class:`RecLayer`)
+for runs with identical settings.
+
+The cache entry consists of the exported MetaGraph (like ``tools/compile_tf_graph.py`` does it)
+and the Python-side meta information which the engine needs to run the graph
+(extern data, layer outputs, fetches incl. losses), see :class:`GraphCache`.
+When the graph is imported from the cache, we get a :class:`CachedGraphNetwork` instead of a :class:`TFNetwork`,
+which only provides the subset of the :class:`TFNetwork` interface which is needed for the forwarding
+(:func:`Engine.forward_single`, :func:`Engine.forward_to_hdf`).
+I.e. this is only used when the network is constructed with a static train flag and without search
+(see :func:`Engine._init_network`), not for training, evaluation (dynamic train flag) or search,
+where we need the layer instances.
+
+Graphs which depend on Python-side state are not cached, as this state would be missing in another process:
+``PyFunc`` ops (e.g. via :func:`py_print`), params with a custom init (:func:`set_custom_post_init`),
+layers with ``custom_param_importer``, and graph reset callbacks.
+Native ops (:class:`OpCodeCompiler`) are supported: the op libraries are stored in the cache entry
+and loaded before the graph is imported.
+"""
+
+from __future__ import print_function
+
+import os
+import typing
+import tensorflow as tf
+
+import returnn.tf.compat as tf_compat
+from returnn.log import log
+from returnn.tf.network import ExternData, TFNetwork
+from returnn.tf.util.data import Data
+
+
+class GraphCache(object):
+  """
+  Stores the graph of a :class:`TFNetwork` in ``cache_dir``, keyed by :func:`get_key`.
+  For each key, there are the files ``<key>.meta`` (MetaGraph) and ``<key>.info`` (pickled meta information).
+  """
+
+  Version = 2
+
+  # Config options which are used in the network construction (and not part of the net dict).
+  RelevantConfigKeys = (
+    "device", "use_horovod", "flat_net_construction",
+    "debug_print_layer_output_template", "debug_print_layer_output_shape",
+    "debug_add_check_numerics_on_output", "debug_add_check_numerics_ops",
+    "debug_unnormalized_loss_summaries", "debug_objective_loss_summaries", "calculate_exp_loss",
+    "tf_log_memory_usage", "param_variational_noise",
+    "optimize_move_layers_out", "debug_rec_layer", "search_batch_compaction")
+
+  # PyFunc ops refer to a Python callback by a key in the registry of the current process.
+  PyFuncOpTypes = {"PyFunc", "PyFuncStateless", "EagerPyFunc"}
+
+  def __init__(self, cache_dir):
+    """
+    :param str cache_dir:
+    """
+    self.cache_dir = cache_dir
+
+  @classmethod
+  def get_key(cls, config, net_dict, train_flag, eval_flag, search_flag, rnd_seed, extern_data):
+    """
+    :param returnn.config.Config config: see :data:`RelevantConfigKeys`
+    :param dict[str,dict[str]] net_dict:
+    :param bool|tf.Tensor train_flag:
+    :param bool eval_flag:
+    :param bool search_flag:
+    :param int rnd_seed:
+    :param ExternData extern_data:
+    :return: hash of everything which influences the graph construction.
+      Note that functions in the net dict (e.g. in an "eval" layer) have their memory address in the repr,
+      i.e. there will be no cache hit in that case.
+    :rtype: str
+    """
+    import hashlib
+    from returnn.util.basic import describe_returnn_version, describe_tensorflow_version
+    parts = [
+      "version %i" % cls.Version,
+      "returnn %s" % describe_returnn_version(),
+      "tf %s" % describe_tensorflow_version(),
+      "config %r" % [(key, cls._get_config_value(config, key)) for key in cls.RelevantConfigKeys],
+      "flags train %r eval %r search %r" % (train_flag, eval_flag, search_flag),
+      "rnd_seed %i" % rnd_seed,
+      "extern_data %r" % sorted([(key, _get_data_kwargs(data)) for (key, data) in extern_data.data.items()]),
+      "default_target %r" % extern_data.default_target,
+      "net %r" % (net_dict,)]
+    return hashlib.sha256("\n".join(parts).encode("utf8")).hexdigest()
+
+  @staticmethod
+  def _get_config_value(config, key):
+    """
+    :param returnn.config.Config config:
+    :param str key:
+    :return: the value, either typed (e.g. Python config) or the string (e.g. text config or command line override)
+    """
+    if config.is_typed(key):
+      return config.typed_value(key)
+    return config.value(key, None)
+
+  def _get_filename_prefix(self, key):
+    """
+    :param str key:
+    :rtype: str
+    """
+    return "%s/%s" % (self.cache_dir, key)
+
+  def has(self, key):
+    """
+    :param str key:
+    :return: whether there is a usable cache entry. also checks that the native op libraries still exist
+    :rtype: bool
+    """
+    prefix = self._get_filename_prefix(key)
+    if not os.path.exists(prefix + ".meta") or not os.path.exists(prefix + ".info"):
+      return False
+    for filename in self._load_info(key)["op_libraries"]:
+      if not os.path.exists(filename):
+        print("Graph cache: op library %s does not exist anymore, ignore cache entry." % filename, file=log.v3)
+        return False
+    return True
+
+  def _load_info(self, key):
+    """
+    :param str key:
+    :return: info, see :func:`save`
+    :rtype: dict[str]
+    """
+    import pickle
+    with open(self._get_filename_prefix(key) + ".info", "rb") as f:
+      return pickle.load(f)
+
+  @classmethod
+  def _get_not_cacheable_reason(cls, network):
+    """
+    :param returnn.tf.network.TFNetwork network:
+    :return: reason why the graph cannot be cached, or None if it can be cached
+    :rtype: str|None
+    """
+    from returnn.tf.network import have_custom_post_init
+    if network.get_graph_reset_callbacks():
+      return "network has graph reset callbacks"
+    if any([have_custom_post_init(param) for param in network.get_saveable_params_list()]):
+      return "network has params with custom init"
+    if any([layer.custom_param_importer for layer in network._get_all_layers()]):
+      return "network has layers with custom_param_importer"
+    graph_def = tf_compat.v1.get_default_graph().as_graph_def()
+    op_types = {node.op for node in graph_def.node}
+    for func in graph_def.library.function:
+      op_types.update([node.op for node in func.node_def])
+    if op_types.intersection(cls.PyFuncOpTypes):
+      return "graph has PyFunc ops (%s)" % ", ".join(sorted(op_types.intersection(cls.PyFuncOpTypes)))
+    return None
+
+  def save(self, key, network):
+    """
+    Exports the graph of the network, which must be in the default graph.
+    Networks which depend on Python-side state are skipped, see :func:`_get_not_cacheable_reason`.
+
+    :param str key:
+    :param returnn.tf.network.TFNetwork network:
+    :return: whether it was stored
+    :rtype: bool
+    """
+    import pickle
+    from returnn.tf.util.basic import CollectionKeys, OpCodeCompiler
+    reason = self._get_not_cacheable_reason(network)
+    if reason:
+      print("Graph cache: %s, cannot cache it." % reason, file=log.v3)
+      return False
+    if not os.path.exists(self.cache_dir):
+      os.makedirs(self.cache_dir, exist_ok=True)
+    prefix = self._get_filename_prefix(key)
+    # These are usually created lazily, e.g. for the extra fetches in forward_to_hdf.
+    network.get_extern_data("seq_idx", mark_data_key_as_used=False)
+    network.get_extern_data("seq_tag", mark_data_key_as_used=False)
+    config = network.get_config()
+    fetches = network.get_fetches_dict(config=config, should_train=False, with_size=True)
+    # The sizes of the extern data are added in CachedGraphNetwork.get_fetches_dict, depending on the used data keys.
+    fetches = {
+      name: value for (name, value) in fetches.items()
+      if not name.startswith("size:") or name.startswith("size:layer:")}
+    info = {
+      "extern_data": {
+        key_: _get_data_info(data) for (key_, data) in network.extern_data.data.items()},
+      "default_input": network.extern_data.default_input,
+      "default_target": network.extern_data.default_target,
+      "extra_added_keys": sorted(network.extern_data.extra_added_keys),
+      "used_data_keys": sorted(network.used_data_keys),
+      "layers": {
+        name: (_get_data_info(layer.output), layer.target) for (name, layer) in network.layers.items()
+        if layer.output.placeholder is not None},
+      "recurrent": network.recurrent,
+      "default_output_layer_name": network.get_default_output_layer_name(),
+      "fetches": {
+        name: _get_tensor_names(value) for (name, value) in fetches.items()},
+      "params": [param.name for param in network.get_params_list()],
+      "global_train_step": network.global_train_step.name,
+      "eval_flag": network.eval_flag,
+      # All loaded native op libraries. Loading some library which is not needed does not harm.
+      "op_libraries": list(OpCodeCompiler.loaded_op_libraries),
+    }
+    saver = tf_compat.v1.train.Saver(var_list=network.get_saveable_params_list(), max_to_keep=2 ** 31 - 1)
+    graph = tf_compat.v1.get_default_graph()
+    collection_list = [
+      key_ for key_ in graph.get_all_collection_keys()
+      if key_ not in {CollectionKeys.RETURNN_LAYERS, CollectionKeys.RETURNN_NET_STACK}]
+    # Write to temp files first, and rename at the end, such that parallel runs do not see partial files.
+    tmp_suffix = ".tmp.%i" % os.getpid()
+    saver.export_meta_graph(filename=prefix + ".meta" + tmp_suffix, collection_list=collection_list)
+    with open(prefix + ".info" + tmp_suffix, "wb") as f:
+      pickle.dump(info, f)
+    os.rename(prefix + ".meta" + tmp_suffix, prefix + ".meta")
+    os.rename(prefix + ".info" + tmp_suffix, prefix + ".info")
+    print("Stored graph in cache: %s" % prefix, file=log.v3)
+    return True
+
+  def load(self, key, config, net_dict):
+    """
+    Imports the graph into the default graph.
+
+    :param str key:
+    :param returnn.config.Config config:
+    :param dict[str,dict[str]] net_dict: the net dict which was used for the key
+    :rtype: CachedGraphNetwork
+    """
+    prefix = self._get_filename_prefix(key)
+    print("Load graph from cache: %s" % prefix, file=log.v3)
+    info = self._load_info(key)
+    for filename in info["op_libraries"]:
+      # The ops must be registered before the import.
+      tf.load_op_library(filename)
+    saver = tf_compat.v1.train.import_meta_graph(prefix + ".meta")
+    return CachedGraphNetwork(config=config, info=info, saver=saver, net_dict=net_dict)
+
+
+def _get_data_kwargs(data):
+  """
+  :param Data data:
+  :return: kwargs for :class:`Data`, without the vocab (not relevant for the graph) and beam (no search)
+  :rtype: dict[str]
+  """
+  kwargs = data.get_kwargs()
+  kwargs.pop("vocab", None)
+  kwargs.pop("beam", None)
+  return kwargs
+
+
+def _get_data_info(data):
+  """
+  :param Data data:
+  :return: info to recreate the data, see :func:`_create_data_from_info`
+  :rtype: dict[str]
+  """
+  return {
+    "kwargs": _get_data_kwargs(data),
+    "placeholder": data.placeholder.name if data.placeholder is not None else None,
+    "size_placeholder": {axis: v.name for (axis, v) in (data.size_placeholder or {}).items()}}
+
+
+def _create_data_from_info(info):
+  """
+  :param dict[str] info: from :func:`_get_data_info`
+  :rtype: Data
+  """
+  graph = tf_compat.v1.get_default_graph()
+  data = Data(**info["kwargs"])
+  if info["placeholder"]:
+    data.placeholder = graph.get_tensor_by_name(info["placeholder"])
+  data.size_placeholder = {
+    axis: graph.get_tensor_by_name(name) for (axis, name) in info["size_placeholder"].items()}
+  return data
+
+
+def _get_tensor_names(value):
+  """
+  :param tf.Tensor|tf.Operation|list[tf.Tensor|tf.Operation] value:
+  :return: names, in the same structure
+  :rtype: str|list[str]
+  """
+  if isinstance(value, (list, tuple)):
+    return [_get_tensor_names(v) for v in value]
+  return value.name
+
+
+def _get_tensors_by_names(names):
+  """
+  :param str|list[str] names: from :func:`_get_tensor_names`
+  :rtype: tf.Tensor|tf.Operation|list[tf.Tensor|tf.Operation]
+  """
+  if isinstance(names, list):
+    return [_get_tensors_by_names(name) for name in names]
+  return tf_compat.v1.get_default_graph().as_graph_element(names)
+
+
+class _CachedLayer(object):
+  """
+  Like :class:`LayerBase`, but only the output.
+  """
+
+  def __init__(self, name, output, target):
+    """
+    :param str name:
+    :param Data output:
+    :param str|None target:
+    """
+    self.name = name
+    self.output = output
+    self.target = target
+    self.stats = {}
+    self.custom_param_importer = None  # networks with custom_param_importer are not cached
+
+  def __repr__(self):
+    return "<%s %r out_type=%s>" % (self.__class__.__name__, self.name, self.output.get_description(with_name=False))
+
+
+class CachedGraphNetwork(object):
+  """
+  Provides the subset of the :class:`TFNetwork` interface which the engine uses for forwarding and evaluation,
+  for a graph which was imported from the :class:`GraphCache`.
+  """
+
+  def __init__(self, config, info, saver, net_dict):
+    """
+    :param returnn.config.Config config:
+    :param dict[str] info: from :func:`GraphCache.save`
+    :param tf.compat.v1.train.Saver saver: from the imported MetaGraph
+    :param dict[str,dict[str]] net_dict:
+    """
+    self.name = "root"
+    self._config = config
+    self.saver = saver
+    self.train_flag = False
+    self.eval_flag = info["eval_flag"]
+    self.search_flag = False
+    self.recurrent = info["recurrent"]
+    self.epoch_step = None
+    self.layers_desc = net_dict
+    self.extern_data = ExternData(default_input=info["default_input"], default_target=info["default_target"])
+    for key, data_info in info["extern_data"].items():
+      self.extern_data.data[key] = _create_data_from_info(data_info)
+    self.extern_data.extra_added_keys = set(info["extra_added_keys"])
+    self.used_data_keys = set(info["used_data_keys"])
+    self.layers = {
+      name: _CachedLayer(name=name, output=_create_data_from_info(layer_info), target=target)
+      for (name, (layer_info, target)) in info["layers"].items()}  # type: typing.Dict[str,_CachedLayer]
+    self._default_output_layer_name = info["default_output_layer_name"]
+    self._fetches = {name: _get_tensors_by_names(names) for (name, names) in info["fetches"].items()}
+    # The global train step is not in the global variables collection, see TFNetwork.__init__.
+    variables = {
+      var.name: var
+      for var in tf_compat.v1.global_variables() + tf_compat.v1.get_collection(tf_compat.v1.GraphKeys.GLOBAL_STEP)}
+    self._params = [variables[name] for name in info["params"]]  # type: typing.List[tf.Variable]
+    self.global_train_step = variables[info["global_train_step"]]  # type: tf.Variable
+
+  def __repr__(self):
+    return "<%s from graph cache>" % self.__class__.__name__
+
+  def get_config(self):
+    """
+    :rtype: returnn.config.Config
+    """
+    return self._config
+
+  def get_absolute_name_scope_prefix(self):
+    """
+    :rtype: str
+    """
+    return ""
+
+  def get_extern_data(self, key, mark_data_key_as_used=True):
+    """
+    :param str key:
+    :param bool mark_data_key_as_used:
+    :rtype: Data
+    """
+    if mark_data_key_as_used:
+      self.used_data_keys.add(key)
+    return self.extern_data.get_data(key)
+
+  def get_used_data_keys(self, exclude_extra_added=True):
+    """
+    :param bool exclude_extra_added:
+    :rtype: set[str]
+    """
+    used_data_keys = self.used_data_keys
+    if exclude_extra_added:
+      used_data_keys = used_data_keys.difference(self.extern_data.extra_added_keys)
+    return used_data_keys
+
+  def get_seq_tags(self, mark_data_key_as_used=True):
+    """
+    :param bool mark_data_key_as_used:
+    :rtype: tf.Tensor
+    """
+    return self.get_extern_data("seq_tag", mark_data_key_as_used=mark_data_key_as_used).placeholder
+
+  def get_default_target(self):
+    """
+    :rtype: str
+    """
+    return self.extern_data.default_target
+
+  def get_layer(self, layer_name):
+    """
+    :param str layer_name:
+    :rtype: _CachedLayer
+    """
+    if layer_name not in self.layers:
+      raise KeyError("layer %r not found in cached graph, available: %s" % (layer_name, ", ".join(self.layers)))
+    return self.layers[layer_name]
+
+  def get_default_output_layer_name(self):
+    """
+    :rtype: str|None
+    """
+    return self._default_output_layer_name
+
+  def _get_all_layers(self):
+    """
+    :rtype: list[_CachedLayer]
+    """
+    return list(self.layers.values())
+
+  def get_default_output_layer(self, must_exist=True):
+    """
+    :param bool must_exist:
+    :rtype: _CachedLayer|None
+    """
+    if not self._default_output_layer_name:
+      assert not must_exist, "default output layer does not exist"
+      return None
+    return self.layers[self._default_output_layer_name]
+
+  def maybe_construct_objective(self):
+    """
+    The losses are already part of the cached graph.
+    """
+
+  def get_fetches_dict(self, config=None, should_train=None, should_eval=None, with_summary=False, with_size=False,
+                       horovod_collected_reduce_inputs=None):
+    """
+    :param returnn.config.Config|None config:
+    :param bool|None should_train: must be False
+    :param bool|None should_eval: must match the eval flag of the cached graph, if True
+    :param bool with_summary: ignored, no summaries
+    :param bool with_size:
+    :param dict[str,(tf.Tensor,tf.Tensor)]|None horovod_collected_reduce_inputs: not used, no Horovod
+    :return: values and actions which should be calculated and executed by the TF session for each step
+    :rtype: dict[str,tf.Tensor|tf.Operation]
+    """
+    assert not should_train, "%s: training is not supported" % self
+    if should_eval is None:
+      should_eval = self.eval_flag
+    if should_eval:
+      assert self.eval_flag, "%s: graph was cached without eval flag" % self
+    d = {}
+    if with_size:
+      for key in self.used_data_keys:
+        data = self.extern_data.get_data(key)
+        for dim, v in data.size_placeholder.items():
+          d["size:%s:%i" % (key, dim)] = v
+    for name, value in self._fetches.items():
+      if name.startswith("size:") and not with_size:
+        continue
+      if not should_eval and (name == "loss" or name.split(":")[0] in {"cost", "error", "loss_norm_factor"}):
+        continue
+      d[name] = value
+    return d
+
+  def get_params_list(self):
+    """
+    :rtype: list[tf.Variable]
+    """
+    return list(self._params)
+
+  def get_saveable_params_list(self):
+    """
+    :rtype: list[tf.Variable]
+    """
+    return self.get_params_list() + self.get_auxiliary_params()
+
+  def get_trainable_params(self):
+    """
+    :rtype: list[tf.Variable]
+    """
+    return [param for param in self._params if param.trainable]
+
+  def get_auxiliary_params(self):
+    """
+    :rtype: list[tf.Variable]
+    """
+    return [self.global_train_step]
+
+  def initialize_params(self, session):
+    """
+    :param tf.compat.v1.Session session:
+    """
+    TFNetwork.initialize_params(self, session=session)
+
+  def load_params_from_file(self, filename, session):
+    """
+    Same logic as :func:`TFNetwork.load_params_from_file`,
+    e.g. params which were pre-loaded (``preload_from_files``) are kept.
+
+    :param str filename:
+    :param tf.compat.v1.Session session:
+    """
+    TFNetwork.load_params_from_file(self, filename=filename, session=session)
+
+  def get_params_serialized(self, session):
+    """
+    Used by :func:`Engine.init_new_network`, i.e. when the network changes (e.g. pretraining),
+    which is not supported for a cached graph (there is no mapping to the layer params).
+
+    :param tf.compat.v1.Session session:
+    :rtype: returnn.tf.network.TFNetworkParamsSerialized
+    """
+    raise NotImplementedError(
+      "%s: cannot reinit the network from a cached graph. Disable graph_cache_dir for this case." % self)
+
+  def get_global_train_step(self, session):
+    """
+    :param tf.compat.v1.Session session:
+    :rtype: int
+    """
+    return self.global_train_step.eval(session=session)
+
+  def get_graph_reset_callbacks(self):
+    """
+    :return: nothing, networks with graph reset callbacks are not cached
+    :rtype: list[()->None]
+    """
+    return []
+
+  def call_graph_reset_callbacks(self):
+    """
+    Nothing to do, see :func:`get_graph_reset_callbacks`.
+    """
+
+  def set_run_opts(self, epoch, dataset_name):
+    """
+    :param int epoch:
+    :param str|None dataset_name:
+    """
+
+  def set_run_finished(self, error_occurred=False):
+    """
+    :param bool error_occurred:
+    """
+
+  def print_network_info(self, name="Network"):
+    """
+    :param str name:
+    """
+    print("%s layer topology (from graph cache):" % name, file=log.v2)
+    print("  extern data:", self.extern_data.get_data_description(), file=log.v2)
+    print("  layers:", ", ".join(sorted(self.layers.keys())), file=log.v2)
+    print("net params #:", sum([int(param.get_shape().num_elements()) for param in self._params]), file=log.v2)
@@ -2303,18 +2303,7 @@ class _SubnetworkRecCell(object):
       """
       with tf.name_scope("loop_cond"):
         from returnn.tf.util.basic import opt_logical_and
-        res = True
-        # noinspection PyProtectedMember
-        if max_seq_len is not None:
-          res = opt_logical_and(res, tf.less(i, max_seq_len, name="i_less_max_seq_len"))
-        # Only consider the user 'max_seq_len' option if we don't know the real max_seq_len.
-        # This is the old behavior. Maybe this might change at some point.
-        elif isinstance(rec_layer._max_seq_len, (int, tf.Tensor)):
-          # noinspection PyProtectedMember
-          res = opt_logical_and(res, tf.less(i, rec_layer._max_seq_len, name="i_less_max_seq_len"))
-        else:
-          # noinspection PyProtectedMember
-          assert rec_layer._max_seq_len is None, "%r: unsupported max_seq_len %r" % (rec_layer, rec_layer._max_seq_len)
+        res = i_less_max_seq_len(i)
         # Check not considering seq_len_info because the dynamics of the network can also lead
         # to an infinite loop, so enforce that some maximum is specified.
         assert res is not True, "%r: specify max_seq_len" % rec_layer
@@ -2322,8 +2311,46 @@ class _SubnetworkRecCell(object):
           end_flag, _ = seq_len_info
           any_not_ended = tf.reduce_any(tf.logical_not(end_flag), name="any_not_ended")
           res = opt_logical_and(res, any_not_ended)
+          if search_batch_compaction:
+            with tf.name_scope("search_batch_compaction"):
+              seq_not_ended = tf.reduce_any(tf.reshape(tf.logical_not(end_flag), [batch_dim, -1]), axis=1)  # (batch,)
+              frac_not_ended = tf.reduce_mean(tf.cast(seq_not_ended, tf.float32))
+              res = opt_logical_and(res, tf.greater(frac_not_ended, search_batch_compaction_threshold))
         return res
 
+    # noinspection PyShadowingNames
+    def i_less_max_seq_len(i):
+      """
+      :param tf.Tensor i: loop counter, scalar
+      :return: whether we are below the max seq len, or True if there is no max seq len
+      :rtype: tf.Tensor|bool
+      """
+      # noinspection PyProtectedMember
+      if max_seq_len is not None:
+        return tf.less(i, max_seq_len, name="i_less_max_seq_len")
+      # Only consider the user 'max_seq_len' option if we don't know the real max_seq_len.
+      # This is the old behavior. Maybe this might change at some point.
+      # noinspection PyProtectedMember
+      if isinstance(rec_layer._max_seq_len, (int, tf.Tensor)):
+        # noinspection PyProtectedMember
+        return tf.less(i, rec_layer._max_seq_len, name="i_less_max_seq_len")
+      # noinspection PyProtectedMember
+      assert rec_layer._max_seq_len is None, "%r: unsupported max_seq_len %r" % (rec_layer, rec_layer._max_seq_len)
+      return True
+
+    # Stop the search loop early when only few seqs of the batch have not ended yet.
+    # The unfinished seqs are searched again by the engine in a new batch. See Engine.search.
+    search_batch_compaction = (
+      not have_known_seq_len and self.parent_net.search_flag
+      and rec_layer.network.get_config().float("search_batch_compaction", 0.0) > 0)
+    search_batch_compaction_threshold = None
+    if search_batch_compaction:
+      from returnn.tf.util.basic import global_tensor
+      # By default 0, i.e. disabled. The engine feeds it.
+      search_batch_compaction_threshold = global_tensor(
+        lambda: tf_compat.v1.placeholder_with_default(0.0, (), name="search_batch_compaction_threshold"),
+        name="search_batch_compaction_threshold")
+
     from returnn.tf.util.basic import constant_with_shape
     init_loop_vars = (
       tf.constant(0, name="initial_i"),
@@ -2361,7 +2388,15 @@ class _SubnetworkRecCell(object):
           if time_dim_tag:
             time_dim_tag.set_tag_on_size_tensor(seq_len)
       else:
-        _, final_net_vars, final_acc_tas, (_, seq_len) = final_loop_vars
+        final_i, final_net_vars, final_acc_tas, (final_end_flag, seq_len) = final_loop_vars
+        if search_batch_compaction:
+          from returnn.tf.util.basic import CollectionKeys
+          with tf.name_scope("search_batch_compaction"):
+            # A seq is finished if all its hyps have ended, or if we reached the max seq len.
+            seq_finished = tf.logical_or(
+              tf.reduce_all(tf.reshape(final_end_flag, [batch_dim, -1]), axis=1),
+              tf.logical_not(i_less_max_seq_len(final_i)), name="seq_finished")  # (batch,)
+          tf_compat.v1.add_to_collection(CollectionKeys.SEARCH_SEQ_FINISHED, seq_finished)
         time_dim_tag = DimensionTag(
           description="rec-time:%s" % rec_layer.get_absolute_name(), kind=DimensionTag.Types.Time)
         time_dim_tag.set_tag_on_size_tensor(seq_len)
@@ -5709,7 +5744,7 @@ class SelfAttentionLayer(_ConcatInputLayer):
                key_shift=None,
                forward_weights_init="glorot_uniform", attention_dropout=0.0,
                attention_left_only=False, initial_state=None, restrict_state_to_last_seq=False,
-               state_var_lengths=None, **kwargs):
+               state_var_lengths=None, split_kv_state=False, **kwargs):
     """
     :param int num_heads:
     :param int total_key_dim: i.e. key_dim == total_key_dim // num_heads
@@ -5724,6 +5759,11 @@ class SelfAttentionLayer(_ConcatInputLayer):
     :param None|tf.Tensor|()->tf.Tensor state_var_lengths:
       if passed, a Tensor containing the number of keys in the state_var for
       each batch-entry, used for decoding in RASR.
+    :param bool split_kv_state: only relevant inside a RecLayer loop.
+      Keep the keys and the values of the previous frames as separate states ("k_left", "v_left"),
+      such that the new frame is only concatenated to them,
+      instead of concatenating and splitting the combined state ("kv_left") in every frame.
+      E.g. for a Transformer decoder in search. Not supported with initial_state.
     """
     super(SelfAttentionLayer, self).__init__(**kwargs)
     self._restrict_state_to_last_seq = restrict_state_to_last_seq
@@ -5741,11 +5781,19 @@ class SelfAttentionLayer(_ConcatInputLayer):
       mat = self.add_param(tf_compat.v1.get_variable(
         name="QKV", shape=(n_in, mat_n_out), dtype=tf.float32, initializer=fwd_weights_initializer),
         axes_split_info=[[n_in], [total_key_dim, total_key_dim, total_value_dim]])
+      prev_k_left, prev_v_left = None, None
       if self._rec_previous_layer:
         assert self.input_data.time_dim_axis is None
         assert attention_left_only
-        # (batch,heads,time,kv-dim//heads)
-        prev_kv_left = self._rec_previous_layer.rec_vars_outputs["kv_left"]
+        if split_kv_state:
+          assert not restrict_state_to_last_seq and state_var_lengths is None
+          prev_kv_left = None
+          # (batch,heads,time,k-dim//heads), (batch,heads,time,v-dim//heads)
+          prev_k_left = self._rec_previous_layer.rec_vars_outputs["k_left"]
+          prev_v_left = self._rec_previous_layer.rec_vars_outputs["v_left"]
+        else:
+          # (batch,heads,time,kv-dim//heads)
+          prev_kv_left = self._rec_previous_layer.rec_vars_outputs["kv_left"]
       else:
         assert self.input_data.time_dim_axis is not None
         batch_dim = self.input_data.get_batch_dim()
@@ -5785,6 +5833,13 @@ class SelfAttentionLayer(_ConcatInputLayer):
     q *= (total_key_dim // num_heads) ** -0.5
     orig_k = k
     orig_q = q
+    if prev_k_left is not None:
+      k = tf.concat([prev_k_left, k], axis=2)  # (batch,heads,time,k-dim//heads)
+      k.set_shape((None, num_heads, None, total_key_dim // num_heads))
+      v = tf.concat([prev_v_left, v], axis=2)  # (batch,heads,time,v-dim//heads)
+      v.set_shape((None, num_heads, None, total_value_dim // num_heads))
+      self.rec_vars_outputs["k_left"] = k
+      self.rec_vars_outputs["v_left"] = v
     if prev_kv_left is not None:
       # Memory for kv.
       kv = tf.concat([k, v], axis=-1)  # (batch,heads,1|time,kv-dim//heads)
@@ -5919,7 +5974,7 @@ class SelfAttentionLayer(_ConcatInputLayer):
   # noinspection PyMethodOverriding
   @classmethod
   def get_rec_initial_extra_outputs(cls, batch_dim, rec_layer, num_heads, total_key_dim, n_out, name,
-                                    initial_state=None, sources=(), **kwargs):
+                                    initial_state=None, sources=(), split_kv_state=False, **kwargs):
     """
     :param tf.Tensor batch_dim:
     :param RecLayer|LayerBase rec_layer:
@@ -5929,10 +5984,16 @@ class SelfAttentionLayer(_ConcatInputLayer):
     :param str name:
     :param str|float|int|None initial_state:
     :param list[LayerBase] sources:
+    :param bool split_kv_state:
     :rtype: dict[str, tf.Tensor]
     """
     data = get_concat_sources_data_template(sources)
     data = data.copy_as_batch_major()
+    if split_kv_state and data.time_dim_axis is None:
+      assert initial_state is None, "%s: split_kv_state with initial_state not supported" % name
+      return {
+        "k_left": tf.zeros((batch_dim, num_heads, 0, total_key_dim // num_heads), name="initial_k_left"),
+        "v_left": tf.zeros((batch_dim, num_heads, 0, n_out // num_heads), name="initial_v_left")}
     if data.time_dim_axis is None or initial_state is not None:
       kv_dim = total_key_dim + n_out
       # Assume inside RecLayer, or initial_state set explicitly.
@@ -5947,12 +6008,14 @@ class SelfAttentionLayer(_ConcatInputLayer):
     return {}
 
   @classmethod
-  def get_rec_initial_extra_outputs_shape_invariants(cls, num_heads, total_key_dim, n_out, sources, **kwargs):
+  def get_rec_initial_extra_outputs_shape_invariants(cls, num_heads, total_key_dim, n_out, sources,
+                                                     split_kv_state=False, **kwargs):
     """
     :param int num_heads:
     :param int total_key_dim:
     :param int n_out:
     :param list[LayerBase] sources:
+    :param bool split_kv_state:
     :rtype: dict[str, tf.TensorShape]
     """
     data = get_concat_sources_data_template(sources)
@@ -5960,6 +6023,10 @@ class SelfAttentionLayer(_ConcatInputLayer):
     if data.time_dim_axis is None:
       # Assume inside RecLayer. See get_rec_initial_extra_outputs.
       total_value_dim = n_out
+      if split_kv_state:
+        return {
+          "k_left": tf.TensorShape((None, num_heads, None, total_key_dim // num_heads)),
+          "v_left": tf.TensorShape((None, num_heads, None, total_value_dim // num_heads))}
       return {"kv_left": tf.TensorShape((None, num_heads, None, (total_key_dim + total_value_dim) // num_heads))}
     return {}
 
@@ -6089,12 +6156,17 @@ class KenLmStateLayer(_ConcatInputLayer):
   returns score (+log space, natural base e) of sequence,
   using KenLM (http://kheafield.com/code/kenlm/) (see :mod:`TFKenLM`).
   EOS (</s>) token must be used explicitly.
+
+  With ``incremental=True``, instead of the string so far (which is rescored from scratch in every step),
+  we keep the KenLM state per hypothesis (see :func:`TFKenLM.ken_lm_state_advance`),
+  i.e. the cost per step does not depend on the length of the prefix.
+  The scores are the same.
   """
   layer_class = "kenlm"
   recurrent = True
 
   def __init__(self, lm_file, vocab_file=None, vocab_unknown_label="UNK", bpe_merge_symbol=None,
-               input_step_offset=0, dense_output=False,
+               input_step_offset=0, dense_output=False, incremental=False, candidates=None,
                debug=False,
                **kwargs):
     """
@@ -6104,6 +6176,9 @@ class KenLmStateLayer(_ConcatInputLayer):
     :param str|None bpe_merge_symbol: e.g. "@@" if you want to apply BPE merging
     :param int input_step_offset: if provided, will consider the input only from this step onwards
     :param bool dense_output: whether we output the score for all possible succeeding tokens
+    :param bool incremental: keep the KenLM state instead of the string so far
+    :param LayerBase|None candidates: (batch,K) label indices (e.g. top-k of the AM).
+      with incremental, we output the score only for these succeeding tokens (like dense_output, but sparse)
     :param bool debug: prints debug info
     """
     if callable(lm_file):
@@ -6114,6 +6189,9 @@ class KenLmStateLayer(_ConcatInputLayer):
     # Note: We later could extend it and have the state-behavior just as the :class:`CumsumLayer`.
     assert self._rec_previous_layer and self.input_data.time_dim_axis is None, (
       "%s: currently expected to run inside rec layer" % self)
+    assert not candidates or (incremental and not dense_output), (
+      "%s: candidates only with incremental and without dense_output" % self)
+    self.candidates = candidates
     # Create KenLM handle. Use var scope to explicitly have it outside the loop.
     with self.var_creation_scope():
       self.lm_handle = tf_ken_lm.ken_lm_load(filename=lm_file)
@@ -6146,12 +6224,45 @@ class KenLmStateLayer(_ConcatInputLayer):
       new_input = tf.where(
         tf.greater_equal(prev_step, input_step_offset),
         new_input, tf.zeros_like(new_input))
-    # See :class:`CumsumLayer` for comparison.
-    prev_strings = self._rec_previous_layer.rec_vars_outputs["state"]
-    next_strings = prev_strings + new_input
-    self.rec_vars_outputs["state"] = next_strings
     prev_scores = self._rec_previous_layer.rec_vars_outputs["scores"]
-    if dense_output:
+    if incremental:
+      # Only the new input is scored. The KenLM states are (batch-major) rec vars,
+      # thus they get reordered in the beam search, like all other rec vars.
+      next_strings = new_input  # for debug
+      lm_state, lm_partial, lm_boundary_scores, new_abs_scores = tf_ken_lm.ken_lm_state_advance(
+        handle=self.lm_handle,
+        bpe_merge_symbol=bpe_merge_symbol or "",
+        states=self._rec_previous_layer.rec_vars_outputs["lm_state"],
+        partials=self._rec_previous_layer.rec_vars_outputs["lm_partial"],
+        boundary_scores=self._rec_previous_layer.rec_vars_outputs["lm_boundary_scores"],
+        tokens=new_input)
+      self.rec_vars_outputs["lm_state"] = lm_state
+      self.rec_vars_outputs["lm_partial"] = lm_partial
+      self.rec_vars_outputs["lm_boundary_scores"] = lm_boundary_scores
+    else:
+      # See :class:`CumsumLayer` for comparison.
+      prev_strings = self._rec_previous_layer.rec_vars_outputs["state"]
+      next_strings = prev_strings + new_input
+      self.rec_vars_outputs["state"] = next_strings
+    if incremental and (dense_output or candidates):
+      assert self.tf_vocab is not None, "%s: provide vocab_file" % self
+      if candidates:
+        candidates_data = candidates.output.copy_as_batch_major()
+        assert candidates_data.batch_ndim == self.input_data.batch_ndim + 1, (
+          "%s: expect candidates %s of shape (batch,K)" % (self, candidates))
+        label_indices = tf.cast(candidates_data.placeholder, tf.int32)
+      else:
+        label_indices = tf.range(self.vocab.num_labels)
+      new_abs_scores, new_abs_scores_labels = tf_ken_lm.ken_lm_state_score_labels(
+        handle=self.lm_handle,
+        bpe_merge_symbol=bpe_merge_symbol or "",
+        states=lm_state, partials=lm_partial, boundary_scores=lm_boundary_scores,
+        labels=self.tf_vocab,
+        label_indices=label_indices)
+      new_rel_scores = new_abs_scores_labels - tf.expand_dims(new_abs_scores, axis=-1)
+    elif incremental:
+      new_rel_scores = new_abs_scores - prev_scores
+    elif dense_output:
       assert self.tf_vocab is not None, "%s: provide vocab_file" % self
       new_abs_scores, new_abs_scores_dense = tf_ken_lm.ken_lm_abs_score_bpe_strings_dense(
         handle=self.lm_handle,
@@ -6184,9 +6295,29 @@ class KenLmStateLayer(_ConcatInputLayer):
     self.rec_vars_outputs["scores"] = new_abs_scores
     self.output.placeholder = new_rel_scores
 
+  def get_dep_layers(self):
+    """
+    :rtype: list[LayerBase]
+    """
+    deps = super(KenLmStateLayer, self).get_dep_layers()
+    if self.candidates:
+      deps.append(self.candidates)
+    return deps
+
+  @classmethod
+  def transform_config_dict(cls, d, network, get_layer):
+    """
+    :param dict[str] d:
+    :param returnn.tf.network.TFNetwork network:
+    :param get_layer:
+    """
+    super(KenLmStateLayer, cls).transform_config_dict(d, network=network, get_layer=get_layer)
+    if d.get("candidates", None):
+      d["candidates"] = get_layer(d["candidates"])
+
   @classmethod
   def get_out_data_from_opts(cls, name, sources,
-                             vocab_file=None, vocab_unknown_label="UNK", dense_output=False,
+                             vocab_file=None, vocab_unknown_label="UNK", dense_output=False, candidates=None,
                              **kwargs):
     """
     :param str name:
@@ -6194,6 +6325,7 @@ class KenLmStateLayer(_ConcatInputLayer):
     :param str|None vocab_file:
     :param str vocab_unknown_label:
     :param bool dense_output:
+    :param LayerBase|None candidates:
     :rtype: Data
     """
     data = get_concat_sources_data_template(sources)
@@ -6208,22 +6340,35 @@ class KenLmStateLayer(_ConcatInputLayer):
       vocab = Vocabulary(vocab_file=vocab_file, unknown_label=vocab_unknown_label)
       data.dim = vocab.num_labels
       data.shape = data.shape + (vocab.num_labels,)
+    elif candidates:
+      num_candidates = candidates.output.copy_as_batch_major().shape[-1]
+      data.dim = num_candidates
+      data.shape = data.shape + (num_candidates,)
+      data.beam = SearchBeam.get_combined_beam(data.beam, candidates.output.beam)
     else:
       data.dim = None
     return data
 
   @classmethod
-  def get_rec_initial_extra_outputs(cls, batch_dim, rec_layer, sources=(), **kwargs):
+  def get_rec_initial_extra_outputs(cls, batch_dim, rec_layer, sources=(), incremental=False, **kwargs):
     """
     :param tf.Tensor batch_dim:
     :param RecLayer|LayerBase rec_layer:
     :param list[LayerBase] sources:
+    :param bool incremental:
     :rtype: dict[str,tf.Tensor]
     """
     data = get_concat_sources_data_template(sources)
     # Assume inside RecLayer.
     assert all(data.shape)
     batch_shape = data.get_batch_shape(batch_dim=batch_dim)
+    if incremental:
+      return {
+        "lm_state": tf.zeros(batch_shape, dtype=tf.string),  # empty is the sentence begin
+        "lm_partial": tf.zeros(batch_shape, dtype=tf.string),
+        "lm_boundary_scores": tf.zeros(batch_shape, dtype=tf.float32),
+        "step": tf.constant(0, dtype=tf.int32),
+        "scores": tf.zeros(batch_shape, dtype=tf.float32)}
     return {
       "state": tf.zeros(batch_shape, dtype=tf.string),
       "step": tf.constant(0, dtype=tf.int32),
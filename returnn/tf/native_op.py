@@ -640,6 +640,79 @@ def make_op(cls, **kwargs):
   return maker.make_op()
 
 
+def get_native_op_names():
+  """
+  :return: names of all native ops in :mod:`returnn.native_op`, e.g. "NativeLstm2"
+  :rtype: list[str]
+  """
+  return [
+    name for (name, obj) in sorted(vars(native_op).items())
+    if isinstance(obj, type) and issubclass(obj, native_op.NativeOpGenBase) and obj is not native_op.NativeOpGenBase
+    and obj.c_fw_code is not None]
+
+
+def _precompile_native_op(op_name, cache_base_dir, op_maker_kwargs):
+  """
+  Runs in a worker process of :func:`precompile_native_ops`.
+
+  :param str op_name:
+  :param str|None cache_base_dir:
+  :param dict[str] op_maker_kwargs:
+  :return: op_name, so filenames, error
+  :rtype: (str, list[str]|None, str|None)
+  """
+  tf_util.NativeCodeCompiler.CacheBaseDir = cache_base_dir
+  tf_util.NativeCodeCompiler.CollectedCompilers = []
+  try:
+    make_op(getattr(native_op, op_name), **op_maker_kwargs)
+  except Exception as exc:
+    return op_name, None, "%s: %s" % (type(exc).__name__, exc)
+  # noinspection PyProtectedMember
+  return op_name, [compiler._so_filename for compiler in tf_util.NativeCodeCompiler.CollectedCompilers], None
+
+
+def precompile_native_ops(op_names=None, num_workers=None, op_maker_kwargs=None):
+  """
+  Compiles the native ops in parallel worker processes.
+  Normally, each op is compiled on-the-fly when it is used the first time (:func:`make_op`),
+  one after another, which can take minutes on a fresh node.
+  After this, :func:`make_op` finds the compiled op in the cache (:class:`NativeCodeCompiler`) and only loads it.
+
+  :param list[str]|None op_names: e.g. ["NativeLstm2", "FastBaumWelchOp"]. all ops by default
+  :param int|None num_workers: by default the number of available CPUs
+  :param dict[str]|None op_maker_kwargs: passed to :class:`OpMaker`
+  :return: op name -> so filenames (incl. the gradient op). ops which failed to compile are left out
+  :rtype: dict[str,list[str]]
+  """
+  import multiprocessing
+  from returnn.util.basic import get_number_available_cpus
+  if op_names is None:
+    op_names = get_native_op_names()
+  if not op_names:
+    return {}
+  if not num_workers:
+    num_workers = get_number_available_cpus() or 1
+  num_workers = min(num_workers, len(op_names))
+  print("Precompile native ops %s with %i workers, cache base dir %s." % (
+    ", ".join(op_names), num_workers, tf_util.NativeCodeCompiler.CacheBaseDir or "<temp dir>"))
+  # Use spawn instead of fork, as we cannot safely fork when TF is already initialized.
+  pool = multiprocessing.get_context("spawn").Pool(processes=num_workers)
+  try:
+    results = pool.starmap(
+      _precompile_native_op,
+      [(op_name, tf_util.NativeCodeCompiler.CacheBaseDir, op_maker_kwargs or {}) for op_name in op_names])
+  finally:
+    pool.close()
+    pool.join()
+  res = {}
+  for op_name, so_filenames, error in results:
+    if error:
+      print("Precompile native op %s failed: %s" % (op_name, error))
+      continue
+    res[op_name] = so_filenames
+  return res
+
+
 def make_lstm_op(**kwargs):
   """
   See :class:`NativeLstmCell` for usage.
@@ -353,6 +353,8 @@ class TFNetwork(object):
           collections=[tf_compat.v1.GraphKeys.GLOBAL_STEP], trainable=False)
     self.epoch_step = None
     self.saver = None  # type: typing.Optional[tf.compat.v1.train.Saver]
+    self._save_from_values = None  # type: typing.Optional[typing.Tuple[tf.Operation,tf.Tensor,typing.Dict[tf.Tensor,tf.Tensor]]]  # nopep8
+    self._meta_graph_cache = None  # type: typing.Optional[typing.Tuple[int,bytes]]  # graph version, serialized
     self.extra_vars_to_save = []  # type: typing.List[tf.Variable]
     self.recurrent = False
     self._assigner_cache = {}  # type: typing.Dict[tf.Variable,VariableAssigner]
@@ -1393,6 +1395,7 @@ class TFNetwork(object):
     Warning: Don't repeat that too often as it will always create new ops in the computation graph.
     """
     self.saver = None
+    self._save_from_values = None
 
   def _create_saver(self):
     # Saver for storing checkpoints of the model.
@@ -1414,22 +1417,71 @@ class TFNetwork(object):
     maybe_make_dirs(os.path.dirname(filename))
     if not self.saver:
       self._create_saver()
-    # We add some extra logic to try again for DiskQuota and other errors.
-    # This could save us multiple hours of computation.
-    try_again_wait_time = 10
-    while True:
-      try:
-        self.saver.save(sess=session, save_path=filename)
-        break
-      except IOError as e:
-        import errno
-        import time
-        if e.errno in [errno.EBUSY, errno.EDQUOT, errno.EIO, errno.ENOSPC]:
-          print("Exception while saving:", e, file=log.v3)
-          print("Trying again in %s secs." % try_again_wait_time, file=log.v3)
-          time.sleep(try_again_wait_time)
-          continue
-        raise
+    _try_again_on_disk_errors(lambda: self.saver.save(sess=session, save_path=filename))
+
+  def _get_save_from_values(self):
+    """
+    Similar to the save op of the saver, but the values are fed, i.e. they can come from host memory.
+
+    :return: (save op, filename placeholder, variable tensor -> value placeholder),
+      or None if some saveable object is not a plain variable (e.g. partitioned)
+    :rtype: (tf.Operation,tf.Tensor,dict[tf.Tensor|tf.Variable,tf.Tensor])|None
+    """
+    if self._save_from_values:
+      return self._save_from_values
+    from tensorflow.python.training.saving import saveable_object_util
+    from tensorflow.python.ops import gen_io_ops
+    # Same checkpoint names as the saver uses. The values are the variables or their (read) tensors.
+    names_to_saveables = saveable_object_util.op_list_to_dict(self.get_saveable_params_list())
+    if not all([isinstance(v, (tf.Variable, tf.Tensor)) for v in names_to_saveables.values()]):
+      return None
+    names = sorted(names_to_saveables.keys())
+    with tf.name_scope("save_from_values"), tf.device("/cpu:0"):
+      filename = tf_compat.v1.placeholder(tf.string, shape=(), name="filename")
+      values = {
+        names_to_saveables[name]: tf_compat.v1.placeholder(
+          names_to_saveables[name].dtype.base_dtype, shape=names_to_saveables[name].shape,
+          name="value_%i" % i)
+        for (i, name) in enumerate(names)}
+      save_op = gen_io_ops.save_v2(
+        prefix=filename, tensor_names=names, shape_and_slices=[""] * len(names),
+        tensors=[values[names_to_saveables[name]] for name in names])
+    if not self.saver:
+      self._create_saver()  # also create it now, such that it is part of the meta graph
+    self._save_from_values = (save_op, filename, values)
+    return self._save_from_values
+
+  def _get_meta_graph_serialized(self):
+    """
+    :return: the serialized meta graph, as the saver would write it
+    :rtype: bytes
+    """
+    graph = tf_compat.v1.get_default_graph()
+    if self._meta_graph_cache and self._meta_graph_cache[0] == graph.version:
+      return self._meta_graph_cache[1]
+    meta_graph_def = self.saver.export_meta_graph()
+    self._meta_graph_cache = (graph.version, meta_graph_def.SerializeToString())
+    return self._meta_graph_cache[1]
+
+  def get_params_snapshot(self, session):
+    """
+    Copies the current values of all saveable params into host memory,
+    such that they can be saved via :func:`TFNetworkParamsSnapshot.save_to_file` later,
+    e.g. in a background thread, while the training already continues and modifies the params.
+
+    :param tf.compat.v1.Session session:
+    :return: snapshot, or None if this is not supported for the saveable params of this network
+    :rtype: TFNetworkParamsSnapshot|None
+    """
+    save_from_values = self._get_save_from_values()
+    if not save_from_values:
+      return None
+    save_op, filename, values = save_from_values
+    variables = list(values.keys())
+    feed_dict = dict(zip([values[v] for v in variables], session.run(variables)))
+    return TFNetworkParamsSnapshot(
+      session=session, save_op=save_op, filename_placeholder=filename, feed_dict=feed_dict,
+      meta_graph_serialized=self._get_meta_graph_serialized())
 
   def load_params_from_file(self, filename, session):
     """
@@ -2069,6 +2121,78 @@ class TFNetworkParamsSerialized(object):
     self.global_train_step = global_train_step
 
 
+class TFNetworkParamsSnapshot(object):
+  """
+  Holds the values of all saveable params in host memory, via :func:`TFNetwork.get_params_snapshot`.
+  """
+
+  def __init__(self, session, save_op, filename_placeholder, feed_dict, meta_graph_serialized):
+    """
+    :param tf.compat.v1.Session session:
+    :param tf.Operation save_op: writes the checkpoint, values fed via feed_dict
+    :param tf.Tensor filename_placeholder:
+    :param dict[tf.Tensor,numpy.ndarray] feed_dict:
+    :param bytes meta_graph_serialized:
+    """
+    self.session = session
+    self.save_op = save_op
+    self.filename_placeholder = filename_placeholder
+    self.feed_dict = feed_dict
+    self.meta_graph_serialized = meta_graph_serialized
+
+  def get_num_bytes(self):
+    """
+    :rtype: int
+    """
+    return sum([value.nbytes for value in self.feed_dict.values()])
+
+  def save_to_file(self, filename):
+    """
+    Writes the checkpoint files, in the same format as :func:`TFNetwork.save_params_to_file`.
+    This can be called from another thread.
+    The meta file is written last, as its existence marks the model as existing
+    (see :func:`returnn.util.basic.get_model_filename_postfix`).
+
+    :param str filename:
+    """
+    import os
+    filename = os.path.abspath(filename)  # TF needs absolute path
+    from returnn.util.basic import maybe_make_dirs
+    maybe_make_dirs(os.path.dirname(filename))
+    feed_dict = self.feed_dict.copy()
+    feed_dict[self.filename_placeholder] = filename
+    _try_again_on_disk_errors(lambda: self.session.run(self.save_op, feed_dict=feed_dict))
+    tmp_meta_filename = "%s.meta.tmp" % filename
+    with open(tmp_meta_filename, "wb") as f:
+      f.write(self.meta_graph_serialized)
+    os.rename(tmp_meta_filename, "%s.meta" % filename)
+    tf_compat.v1.train.update_checkpoint_state(
+      save_dir=os.path.dirname(filename), model_checkpoint_path=filename)
+
+
+def _try_again_on_disk_errors(func):
+  """
+  We add some extra logic to try again for DiskQuota and other errors.
+  This could save us multiple hours of computation.
+
+  :param ()->None func:
+  """
+  try_again_wait_time = 10
+  while True:
+    try:
+      func()
+      break
+    except IOError as e:
+      import errno
+      import time
+      if e.errno in [errno.EBUSY, errno.EDQUOT, errno.EIO, errno.ENOSPC]:
+        print("Exception while saving:", e, file=log.v3)
+        print("Trying again in %s secs." % try_again_wait_time, file=log.v3)
+        time.sleep(try_again_wait_time)
+        continue
+      raise
+
+
 class LossHolder:
   """
   This object just keeps a reference to the loss/error value,
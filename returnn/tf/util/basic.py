@@ -26,6 +26,7 @@ class CollectionKeys:
   RETURNN_LAYERS = "_RETURNN_layers"  # LayerBase instances
   RETURNN_NET_STACK = "_RETURNN_network_stack"  # TFNetwork instance stack
   STATE_VARS = "_RETURNN_state_vars"  # tf.Variable, like e.g. tf.compat.v1.GraphKeys.LOCAL_VARIABLES
+  SEARCH_SEQ_FINISHED = "_RETURNN_search_seq_finished"  # tf.Tensor (batch,) bool, see search_batch_compaction
 
 
 def tf_version_tuple():
@@ -2452,6 +2453,9 @@ class OpCodeCompiler(NativeCodeCompiler):
 
   CacheDirName = "returnn_tf_cache/ops"
 
+  # All op libraries which were loaded in this process, e.g. such that we can store them with a graph.
+  loaded_op_libraries = []  # type: typing.List[str]
+
   def __init__(self, use_cuda_if_available=True, cuda_auto_min_compute_capability=True,
                include_paths=(), ld_flags=(), c_macro_defines=None, **kwargs):
     self._cuda_env = use_cuda_if_available and CudaEnv.get_instance()
@@ -2531,6 +2535,8 @@ class OpCodeCompiler(NativeCodeCompiler):
       return self._tf_mod
     self._maybe_compile()
     self._tf_mod = tf.load_op_library(self._so_filename)
+    if self._so_filename not in self.loaded_op_libraries:
+      self.loaded_op_libraries.append(self._so_filename)
     return self._tf_mod
 
 
@@ -104,6 +104,58 @@ REGISTER_OP("KenLmAbsScoreBpeStringsDense")
   " dense output, for all possible succeeding labels.");
 
 
+REGISTER_OP("KenLmStateAdvance")
+.Input("handle: resource")
+.Input("bpe_merge_symbol: string")
+.Input("states: string")
+.Input("partials: string")
+.Input("boundary_scores: float32")
+.Input("tokens: string")
+.Output("new_states: string")
+.Output("new_partials: string")
+.Output("new_boundary_scores: float32")
+.Output("scores: float32")
+.SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+  for(int i = 0; i < 4; ++i)
+    c->set_output(i, c->input(2));
+  return Status::OK();
+})
+.Doc("KenLmStateAdvance: advances the (serialized) KenLM states by the given tokens (white-space delimited)."
+  " the empty state is the sentence begin."
+  " optionally BPE-merges: subwords ending with bpe_merge_symbol are collected in partials,"
+  " and only complete words advance the KenLM state."
+  " boundary_scores is the score of the complete words so far, in +log10 space (like KenLM)."
+  " scores is the abs score, including the partial word, in +log space (natural log, not base 10).");
+
+
+REGISTER_OP("KenLmStateScoreLabels")
+.Input("handle: resource")
+.Input("bpe_merge_symbol: string")
+.Input("states: string")
+.Input("partials: string")
+.Input("boundary_scores: float32")
+.Input("labels: string")
+.Input("label_indices: int32")
+.Output("scores: float32")
+.Output("label_scores: float32")
+.SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+  c->set_output(0, c->input(2));
+  if(c->RankKnown(c->input(6)) && c->Rank(c->input(6)) == 1) {
+    ::tensorflow::shape_inference::ShapeHandle out_shape;
+    TF_RETURN_IF_ERROR(c->Concatenate(c->input(2), c->input(6), &out_shape));
+    c->set_output(1, out_shape);
+  }
+  else
+    c->set_output(1, c->input(6));
+  return Status::OK();
+})
+.Doc("KenLmStateScoreLabels: for the states from KenLmStateAdvance, scores the given succeeding labels."
+  " label_indices is either of shape [K], shared for all states, or of shape states.shape + [K]."
+  " returns in +log space (natural log, not base 10)."
+  " scores is the abs score of the current state, like in KenLmAbsScoreBpeStringsDense,"
+  " label_scores are the abs scores of the succeeding labels.");
+
+
 // https://github.com/kpu/kenlm/blob/master/lm/model.hh
 // https://github.com/kpu/kenlm/blob/master/lm/virtual_interface.hh
 // https://github.com/kpu/kenlm/blob/master/python/kenlm.pyx
@@ -167,6 +219,74 @@ struct KenLmModel : public ResourceBase {
     return total_score * logf(10.);
   }
 
+  // For the state-based ops (KenLmStateAdvance, KenLmStateScoreLabels).
+  // The KenLM state is serialized as raw bytes. The empty string is the sentence begin.
+  Status get_state(const ::tstring& s, lm::ngram::State* state) {
+    if(s.empty()) {
+      model_.BeginSentenceWrite(state);
+      return Status::OK();
+    }
+    if(s.size() != sizeof(lm::ngram::State))
+      return errors::InvalidArgument(
+        "KenLM state: expected ", sizeof(lm::ngram::State), " bytes but got ", s.size(), " bytes");
+    memcpy(state, s.data(), sizeof(lm::ngram::State));
+    return Status::OK();
+  }
+
+  static string state_to_string(const lm::ngram::State& state) {
+    return string(reinterpret_cast<const char*>(&state), sizeof(lm::ngram::State));
+  }
+
+  // Returns the score in +log10 space.
+  float word_score(const lm::ngram::State& state, const string& word, lm::ngram::State* out_state) {
+    return model_.FullScore(state, model_.BaseVocabulary().Index(word), *out_state).prob;
+  }
+
+  // Same semantics as abs_score after the BPE merging (see KenLmAbsScoreBpeStringsOp),
+  // but incremental, i.e. only the new tokens are scored.
+  // Subwords (ending with bpe_merge_symbol) are collected in partial.
+  // A partial word is scored as if it is complete but does not advance the state.
+  // boundary_score is in +log10 space. Returns the abs score in (natural) +log space.
+  float advance(
+        lm::ngram::State* state, string* partial, float* boundary_score,
+        const string& tokens, const string& bpe_merge_symbol) {
+    mutex_lock l(mu_);
+    lm::ngram::State out_state;
+    for(const string& token : tensorflow::str_util::Split(tokens, ' ')) {
+      if(token.empty()) continue;
+      if(!bpe_merge_symbol.empty() && tensorflow::str_util::EndsWith(token, bpe_merge_symbol)) {
+        partial->append(token, 0, token.size() - bpe_merge_symbol.size());
+        continue;
+      }
+      *boundary_score += word_score(*state, *partial + token, &out_state);
+      *state = out_state;
+      partial->clear();
+    }
+    float total_score = *boundary_score;
+    if(!partial->empty())
+      total_score += word_score(*state, *partial, &out_state);
+    return total_score * logf(10.);
+  }
+
+  // Same semantics as abs_score_dense, but incremental, and only for the given label indices
+  // (or all labels if label_indices is nullptr).
+  float score_labels(
+        const lm::ngram::State& state, const string& partial, float boundary_score, const string& bpe_merge_symbol,
+        const TTypes<::tstring>::ConstFlat labels, const int32* label_indices, int num_labels,
+        float* out_label_scores) {
+    mutex_lock l(mu_);
+    lm::ngram::State out_state;
+    for(int i = 0; i < num_labels; ++i) {
+      const ::tstring& label = labels(label_indices ? label_indices[i] : i);
+      float score = word_score(state, partial + string(label.data(), label.size()), &out_state);
+      out_label_scores[i] = (boundary_score + score) * logf(10.);
+    }
+    float total_score = boundary_score;
+    if(!partial.empty())
+      total_score += word_score(state, partial + bpe_merge_symbol, &out_state);
+    return total_score * logf(10.);
+  }
+
   string DebugString()
 #if (TF_MAJOR_VERSION == 1 && TF_MINOR_VERSION >= 14) || (TF_MAJOR_VERSION > 1)
 const
@@ -340,6 +460,141 @@ class KenLmAbsScoreBpeStringsDenseOp : public OpKernel {
 
 REGISTER_KERNEL_BUILDER(Name("KenLmAbsScoreBpeStringsDense").Device(DEVICE_CPU), KenLmAbsScoreBpeStringsDenseOp);
 
+
+class KenLmStateAdvanceOp : public OpKernel {
+ public:
+  using OpKernel::OpKernel;
+
+  void Compute(OpKernelContext* context) override {
+    KenLmModel* lm;
+    {
+      const Tensor* handle;
+      OP_REQUIRES_OK(context, context->input("handle", &handle));
+      OP_REQUIRES_OK(context, GetResourceFromContext(context, "handle", &lm));
+    }
+    core::ScopedUnref unref(lm);
+
+    OP_REQUIRES(context, context->input(1).NumElements() == 1,
+      errors::InvalidArgument(
+        "bpe_merge_symbol must be a single element but got shape ",
+        context->input(1).shape().DebugString()));
+    const ::tstring& bpe_merge_symbol_ = context->input(1).flat<::tstring>()(0);
+    const string bpe_merge_symbol(bpe_merge_symbol_.data(), bpe_merge_symbol_.size());
+
+    const Tensor& states_tensor = context->input(2);
+    for(int j = 3; j < 6; ++j)
+      OP_REQUIRES(context, context->input(j).shape().IsSameSize(states_tensor.shape()),
+        errors::InvalidArgument(
+          "input ", j, " shape ", context->input(j).shape().DebugString(),
+          " does not match states shape ", states_tensor.shape().DebugString()));
+    auto states_flat = states_tensor.flat<::tstring>();
+    auto partials_flat = context->input(3).flat<::tstring>();
+    auto boundary_scores_flat = context->input(4).flat<float>();
+    auto tokens_flat = context->input(5).flat<::tstring>();
+
+    Tensor* output_tensors[4];
+    for(int j = 0; j < 4; ++j)
+      OP_REQUIRES_OK(context, context->allocate_output(j, states_tensor.shape(), &output_tensors[j]));
+    auto new_states_flat = output_tensors[0]->flat<::tstring>();
+    auto new_partials_flat = output_tensors[1]->flat<::tstring>();
+    auto new_boundary_scores_flat = output_tensors[2]->flat<float>();
+    auto scores_flat = output_tensors[3]->flat<float>();
+
+    for(int i = 0; i < states_flat.size(); ++i) {
+      lm::ngram::State state;
+      OP_REQUIRES_OK(context, lm->get_state(states_flat(i), &state));
+      string partial(partials_flat(i).data(), partials_flat(i).size());
+      float boundary_score = boundary_scores_flat(i);
+      scores_flat(i) = lm->advance(
+        &state, &partial, &boundary_score, string(tokens_flat(i).data(), tokens_flat(i).size()), bpe_merge_symbol);
+      new_states_flat(i) = KenLmModel::state_to_string(state);
+      new_partials_flat(i) = partial;
+      new_boundary_scores_flat(i) = boundary_score;
+    }
+  }
+};
+
+REGISTER_KERNEL_BUILDER(Name("KenLmStateAdvance").Device(DEVICE_CPU), KenLmStateAdvanceOp);
+
+
+class KenLmStateScoreLabelsOp : public OpKernel {
+ public:
+  using OpKernel::OpKernel;
+
+  void Compute(OpKernelContext* context) override {
+    KenLmModel* lm;
+    {
+      const Tensor* handle;
+      OP_REQUIRES_OK(context, context->input("handle", &handle));
+      OP_REQUIRES_OK(context, GetResourceFromContext(context, "handle", &lm));
+    }
+    core::ScopedUnref unref(lm);
+
+    OP_REQUIRES(context, context->input(1).NumElements() == 1,
+      errors::InvalidArgument(
+        "bpe_merge_symbol must be a single element but got shape ",
+        context->input(1).shape().DebugString()));
+    const ::tstring& bpe_merge_symbol_ = context->input(1).flat<::tstring>()(0);
+    const string bpe_merge_symbol(bpe_merge_symbol_.data(), bpe_merge_symbol_.size());
+
+    const Tensor& states_tensor = context->input(2);
+    for(int j = 3; j < 5; ++j)
+      OP_REQUIRES(context, context->input(j).shape().IsSameSize(states_tensor.shape()),
+        errors::InvalidArgument(
+          "input ", j, " shape ", context->input(j).shape().DebugString(),
+          " does not match states shape ", states_tensor.shape().DebugString()));
+    auto states_flat = states_tensor.flat<::tstring>();
+    auto partials_flat = context->input(3).flat<::tstring>();
+    auto boundary_scores_flat = context->input(4).flat<float>();
+    auto labels_flat = context->input(5).flat<::tstring>();
+
+    // The label indices are either shared for all states, or given per state.
+    const Tensor& indices_tensor = context->input(6);
+    auto indices_flat = indices_tensor.flat<int32>();
+    bool shared_indices = indices_tensor.dims() == 1;
+    TensorShape label_scores_shape(states_tensor.shape());
+    if(shared_indices)
+      label_scores_shape.AppendShape(indices_tensor.shape());
+    else {
+      OP_REQUIRES(context, indices_tensor.dims() == states_tensor.dims() + 1,
+        errors::InvalidArgument(
+          "label_indices shape ", indices_tensor.shape().DebugString(),
+          " must be [K] or states shape ", states_tensor.shape().DebugString(), " + [K]"));
+      for(int d = 0; d < states_tensor.dims(); ++d)
+        OP_REQUIRES(context, indices_tensor.dim_size(d) == states_tensor.dim_size(d),
+          errors::InvalidArgument(
+            "label_indices shape ", indices_tensor.shape().DebugString(),
+            " must be [K] or states shape ", states_tensor.shape().DebugString(), " + [K]"));
+      label_scores_shape = indices_tensor.shape();
+    }
+    int num_labels = indices_tensor.dim_size(indices_tensor.dims() - 1);
+    for(int i = 0; i < indices_flat.size(); ++i)
+      OP_REQUIRES(context, indices_flat(i) >= 0 && indices_flat(i) < labels_flat.size(),
+        errors::InvalidArgument(
+          "label index ", indices_flat(i), " out of range, num labels ", labels_flat.size()));
+
+    Tensor* output_tensor = NULL;
+    OP_REQUIRES_OK(context, context->allocate_output(0, states_tensor.shape(), &output_tensor));
+    auto output_flat = output_tensor->flat<float>();
+
+    Tensor* output_labels_tensor = NULL;
+    OP_REQUIRES_OK(context, context->allocate_output(1, label_scores_shape, &output_labels_tensor));
+    auto output_labels_flat = output_labels_tensor->flat<float>();
+
+    for(int i = 0; i < states_flat.size(); ++i) {
+      lm::ngram::State state;
+      OP_REQUIRES_OK(context, lm->get_state(states_flat(i), &state));
+      string partial(partials_flat(i).data(), partials_flat(i).size());
+      output_flat(i) = lm->score_labels(
+        state, partial, boundary_scores_flat(i), bpe_merge_symbol,
+        labels_flat, indices_flat.data() + (shared_indices ? 0 : i * num_labels), num_labels,
+        output_labels_flat.data() + i * num_labels);
+    }
+  }
+};
+
+REGISTER_KERNEL_BUILDER(Name("KenLmStateScoreLabels").Device(DEVICE_CPU), KenLmStateScoreLabelsOp);
+
 """
 
 _kenlm_src_code_workarounds = """
@@ -401,7 +656,7 @@ def get_tf_mod(verbose=False):
   src_code += _src_code
 
   compiler = OpCodeCompiler(
-    base_name="KenLM", code_version=1, code=src_code,
+    base_name="KenLM", code_version=2, code=src_code,
     include_paths=(kenlm_dir, kenlm_dir + "/util/double-conversion"),
     c_macro_defines={"NDEBUG": 1, "KENLM_MAX_ORDER": 6, "HAVE_ZLIB": 1},
     ld_flags=["-l%s" % lib for lib in libs],
@@ -457,6 +712,49 @@ def ken_lm_abs_score_bpe_strings_dense(handle, bpe_merge_symbol, strings, labels
     handle=handle, bpe_merge_symbol=bpe_merge_symbol, strings=strings, labels=labels)
 
 
+def ken_lm_state_advance(handle, bpe_merge_symbol, states, partials, boundary_scores, tokens):
+  """
+  Incremental variant of :func:`ken_lm_abs_score_bpe_strings`:
+  Instead of the whole string so far, we keep the (serialized) KenLM state,
+  and only score the new tokens.
+
+  :param tf.Tensor handle: TF resource handle returned by :func:`ken_lm_load`
+  :param str bpe_merge_symbol: e.g. "@@"
+  :param tf.Tensor states: string. serialized KenLM states. initially empty (sentence begin)
+  :param tf.Tensor partials: string, same shape as `states`. partial word (BPE merged), initially empty
+  :param tf.Tensor boundary_scores: float32, same shape as `states`. in +log10 space. initially zero
+  :param tf.Tensor tokens: string, same shape as `states`. white-space delimited words or subwords. can be empty
+  :return: (new_states, new_partials, new_boundary_scores, scores), all same shape as `states`,
+    where `scores` is the abs score (+log space, like :func:`ken_lm_abs_score_bpe_strings`)
+  :rtype: (tf.Tensor, tf.Tensor, tf.Tensor, tf.Tensor)
+  """
+  return get_tf_mod().ken_lm_state_advance(
+    handle=handle, bpe_merge_symbol=bpe_merge_symbol,
+    states=states, partials=partials, boundary_scores=boundary_scores, tokens=tokens)
+
+
+def ken_lm_state_score_labels(handle, bpe_merge_symbol, states, partials, boundary_scores, labels, label_indices):
+  """
+  Incremental variant of :func:`ken_lm_abs_score_bpe_strings_dense`,
+  for the states from :func:`ken_lm_state_advance`.
+
+  :param tf.Tensor handle: TF resource handle returned by :func:`ken_lm_load`
+  :param str bpe_merge_symbol: e.g. "@@"
+  :param tf.Tensor states: string. see :func:`ken_lm_state_advance`
+  :param tf.Tensor partials: string, same shape as `states`
+  :param tf.Tensor boundary_scores: float32, same shape as `states`
+  :param tf.Tensor|tf.Variable labels: string, (num_labels,)
+  :param tf.Tensor label_indices: int32, either (K,), e.g. tf.range(num_labels) for all labels,
+    or states.shape + (K,), e.g. the top-k candidates
+  :return: (scores, label_scores), where `scores` is of the same shape as `states`,
+    and `label_scores` is of shape states.shape + (K,). both abs scores in +log space
+  :rtype: (tf.Tensor, tf.Tensor)
+  """
+  return get_tf_mod().ken_lm_state_score_labels(
+    handle=handle, bpe_merge_symbol=bpe_merge_symbol,
+    states=states, partials=partials, boundary_scores=boundary_scores, labels=labels, label_indices=label_indices)
+
+
 if __name__ == "__main__":
   from returnn.util import better_exchook
   better_exchook.install()
@@ -9,6 +9,7 @@ from __future__ import division
 
 import subprocess
 from subprocess import CalledProcessError
+import operator
 
 import h5py
 from collections import deque
@@ -1551,12 +1552,31 @@ def load_json(filename=None, content=None):
   return json_content
 
 
+class _ClassOnlyMethod(classmethod):
+  """
+  Like classmethod, but when accessed via an instance, you get ``_max_error`` of the class instead.
+  Used for :func:`NumbersDict.max`.
+  """
+
+  def __get__(self, instance, owner=None):
+    if instance is not None:
+      # noinspection PyProtectedMember
+      return instance._max_error
+    return super(_ClassOnlyMethod, self).__get__(instance, owner)
+
+
 class NumbersDict:
   """
   It's mostly like dict[str,float|int] & some optional broadcast default value.
   It implements the standard math bin ops in a straight-forward way.
+
+  This is used a lot in the batch generation (for every seq and chunk),
+  so the bin ops are implemented directly on the underlying dicts,
+  and there are in-place variants (e.g. ``+=``) which avoid allocating a new object.
   """
 
+  __slots__ = ("dict", "value")
+
   def __init__(self, auto_convert=None, numbers_dict=None, broadcast_value=None):
     """
     :param dict|NumbersDict|T auto_convert: first argument, so that we can automatically convert/copy
@@ -1580,7 +1600,6 @@ class NumbersDict:
 
     self.dict = numbers_dict
     self.value = broadcast_value
-    self.max = self.__max_error
 
   def copy(self):
     """
@@ -1722,62 +1741,93 @@ class NumbersDict:
     :param NumbersDict|None result:
     :rtype: NumbersDict
     """
-    if not isinstance(self, NumbersDict):
+    # A scalar is treated like NumbersDict.constant_like(scalar, numbers_dict=the_other_one),
+    # i.e. it only has a broadcast value if the other one has one.
+    if isinstance(self, NumbersDict):
+      self_dict, self_value = self.dict, self.value
       if isinstance(other, NumbersDict):
-        self = NumbersDict.constant_like(self, numbers_dict=other)
+        other_dict, other_value = other.dict, other.value
+        res_value_defined = self_value is not None or other_value is not None
+      else:
+        other_dict, other_value = {}, other
+        res_value_defined = self_value is not None
+    elif isinstance(other, NumbersDict):
+      self_dict, self_value = {}, self
+      other_dict, other_value = other.dict, other.value
+      res_value_defined = other_value is not None
+    else:
+      self_dict, self_value = {}, self
+      other_dict, other_value = {}, other
+      res_value_defined = self_value is not None
+    res_dict = {}
+    for k, a in self_dict.items():
+      b = other_dict.get(k, other_value)
+      if a is None:
+        res_dict[k] = None if b is None else op(zero, b)
+      else:
+        res_dict[k] = op(a, zero if b is None else b)
+    for k, b in other_dict.items():
+      if k in self_dict:
+        continue
+      a = self_value
+      if a is None:
+        res_dict[k] = None if b is None else op(zero, b)
       else:
-        self = NumbersDict(self)
-    if not isinstance(other, NumbersDict):
-      other = NumbersDict.constant_like(other, numbers_dict=self)
+        res_dict[k] = op(a, zero if b is None else b)
+    if res_value_defined:
+      res_value = op(zero if self_value is None else self_value, zero if other_value is None else other_value)
+    else:
+      res_value = None
     if result is None:
       result = NumbersDict()
-    assert isinstance(result, NumbersDict)
-    for k in self.keys_set | other.keys_set:
-      result[k] = cls.bin_op_scalar_optional(self.get(k, None), other.get(k, None), zero=zero, op=op)
-    result.value = cls.bin_op_scalar_optional(self.value, other.value, zero=zero, op=op)
+      result.dict = res_dict
+    else:
+      assert isinstance(result, NumbersDict)
+      result.dict.update(res_dict)
+    result.value = res_value
     return result
 
   def __add__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a + b, zero=0)
+    return self.bin_op(self, other, op=operator.add, zero=0)
 
   __radd__ = __add__
 
   def __iadd__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a + b, zero=0, result=self)
+    return self.bin_op(self, other, op=operator.add, zero=0, result=self)
 
   def __sub__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a - b, zero=0)
+    return self.bin_op(self, other, op=operator.sub, zero=0)
 
   def __rsub__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: b - a, zero=0)
+    return self.bin_op(other, self, op=operator.sub, zero=0)
 
   def __isub__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a - b, zero=0, result=self)
+    return self.bin_op(self, other, op=operator.sub, zero=0, result=self)
 
   def __mul__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a * b, zero=1)
+    return self.bin_op(self, other, op=operator.mul, zero=1)
 
   __rmul__ = __mul__
 
   def __imul__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a * b, zero=1, result=self)
+    return self.bin_op(self, other, op=operator.mul, zero=1, result=self)
 
   def __div__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a / b, zero=1)
+    return self.bin_op(self, other, op=operator.truediv, zero=1)
 
   __rdiv__ = __div__
   __truediv__ = __div__
 
   def __idiv__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a / b, zero=1, result=self)
+    return self.bin_op(self, other, op=operator.truediv, zero=1, result=self)
 
   __itruediv__ = __idiv__
 
   def __floordiv__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a // b, zero=1)
+    return self.bin_op(self, other, op=operator.floordiv, zero=1)
 
   def __ifloordiv__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a // b, zero=1, result=self)
+    return self.bin_op(self, other, op=operator.floordiv, zero=1, result=self)
 
   def __neg__(self):
     return self.unary_op(op=lambda a: -a)
@@ -1875,7 +1925,7 @@ class NumbersDict:
       return args[0]
     return min(*args)
 
-  @classmethod
+  @_ClassOnlyMethod
   def max(cls, items):
     """
     Element-wise maximum for item in items.
@@ -1904,8 +1954,8 @@ class NumbersDict:
     return cls.min([items[0], cls.min(items[1:])])
 
   @staticmethod
-  def __max_error():
-    # Will replace self.max for each instance. To be sure that we don't confuse it with self.max_value.
+  def _max_error():
+    # This is self.max for each instance. To be sure that we don't confuse it with self.max_value.
     raise Exception("Use max_value instead.")
 
   def max_value(self):
@@ -2037,6 +2087,216 @@ class FrozenDict(dict):
     return hash(tuple(sorted(self.items())))
 
 
+class LRUCache(object):
+  """
+  Dict-like cache with a bounded number of entries.
+  If it is full, the least recently used entry is removed.
+  It is thread-safe, e.g. for the request handler threads of :func:`returnn.tf.engine.Engine.web_server`.
+  """
+
+  def __init__(self, max_size):
+    """
+    :param int|None max_size: None means unbounded
+    """
+    from collections import OrderedDict
+    self.max_size = max_size
+    self._dict = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __repr__(self):
+    return "%s(max_size=%r, len=%i)" % (self.__class__.__name__, self.max_size, len(self._dict))
+
+  def __len__(self):
+    return len(self._dict)
+
+  def __contains__(self, key):
+    return key in self._dict
+
+  def get(self, key, default=None):
+    """
+    :param key:
+    :param default:
+    :return: value, or default if not in the cache. marks the entry as recently used
+    """
+    with self._lock:
+      try:
+        value = self._dict.pop(key)
+      except KeyError:
+        return default
+      self._dict[key] = value  # move to the end
+      return value
+
+  def __getitem__(self, key):
+    with self._lock:
+      value = self._dict.pop(key)
+      self._dict[key] = value  # move to the end
+      return value
+
+  def __setitem__(self, key, value):
+    with self._lock:
+      self._dict.pop(key, None)
+      self._dict[key] = value
+      if self.max_size is not None:
+        while len(self._dict) > self.max_size:
+          self._dict.popitem(last=False)
+
+  def clear(self):
+    """
+    Removes all entries.
+    """
+    with self._lock:
+      self._dict.clear()
+
+
+class DynamicBatcher(object):
+  """
+  Collects single requests from multiple threads, and processes them in batches in a background thread.
+  A batch is processed as soon as there are ``max_batch_size`` pending requests,
+  or when the oldest pending request waited for ``max_wait_time`` seconds.
+  This is e.g. used by :func:`returnn.tf.engine.Engine.web_server`,
+  such that concurrent requests share one ``session.run`` call.
+  """
+
+  class _Request(object):
+    """
+    Single pending request.
+    """
+    def __init__(self, item):
+      self.item = item
+      self.enqueue_time = time.time()
+      self.done = threading.Event()
+      self.result = None
+      self.exception = None  # type: typing.Optional[BaseException]
+
+  def __init__(self, process_batch, max_batch_size=16, max_wait_time=0.01, num_recent_stats=1000,
+               name="DynamicBatcher"):
+    """
+    :param ((list[T])->list[R]) process_batch: gets a list of items, returns a list of results (same len and order)
+    :param int max_batch_size:
+    :param float max_wait_time: in seconds, max time the oldest request waits until its batch is processed
+    :param int num_recent_stats: for :func:`get_stats`, the statistics are over the last N requests/batches
+    :param str name: for the thread name
+    """
+    assert max_batch_size >= 1
+    self.process_batch = process_batch
+    self.max_batch_size = max_batch_size
+    self.max_wait_time = max_wait_time
+    self.num_requests = 0
+    self.num_batches = 0
+    self.recent_queue_latencies = deque(maxlen=num_recent_stats)  # type: typing.Deque[float]
+    self.recent_batch_sizes = deque(maxlen=num_recent_stats)  # type: typing.Deque[int]
+    self.recent_batch_process_times = deque(maxlen=num_recent_stats)  # type: typing.Deque[float]
+    self._queue = deque()  # type: typing.Deque[DynamicBatcher._Request]
+    self._cond = threading.Condition()
+    self._quit = False
+    self._thread = threading.Thread(target=self._thread_main, name=name)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __repr__(self):
+    return "%s(max_batch_size=%i, max_wait_time=%r)" % (
+      self.__class__.__name__, self.max_batch_size, self.max_wait_time)
+
+  def submit(self, item):
+    """
+    Blocks until the batch containing this item was processed.
+
+    :param T item:
+    :return: the corresponding result from ``process_batch``
+    :rtype: R
+    """
+    request = self._Request(item)
+    with self._cond:
+      assert not self._quit, "%r was stopped" % self
+      self._queue.append(request)
+      self._cond.notify_all()
+    request.done.wait()
+    if request.exception is not None:
+      raise request.exception
+    return request.result
+
+  def stop(self):
+    """
+    Stops the background thread, after all pending requests are processed.
+    """
+    with self._cond:
+      self._quit = True
+      self._cond.notify_all()
+    self._thread.join()
+
+  def _get_next_batch(self):
+    """
+    :return: pending requests, or None if we should quit
+    :rtype: list[DynamicBatcher._Request]|None
+    """
+    with self._cond:
+      while True:
+        if self._queue:
+          if self._quit or len(self._queue) >= self.max_batch_size:
+            break
+          timeout = self._queue[0].enqueue_time + self.max_wait_time - time.time()
+          if timeout <= 0:
+            break
+          self._cond.wait(timeout)
+        else:
+          if self._quit:
+            return None
+          self._cond.wait()
+      return [self._queue.popleft() for _ in range(min(self.max_batch_size, len(self._queue)))]
+
+  def _thread_main(self):
+    while True:
+      batch = self._get_next_batch()
+      if batch is None:
+        return
+      start_time = time.time()
+      try:
+        results = self.process_batch([request.item for request in batch])
+        assert len(results) == len(batch), "process_batch returned %i results for %i items" % (
+          len(results), len(batch))
+        for request, result in zip(batch, results):
+          request.result = result
+      except Exception as exc:
+        sys.excepthook(*sys.exc_info())
+        for request in batch:
+          request.exception = exc
+      end_time = time.time()
+      self.num_requests += len(batch)
+      self.num_batches += 1
+      self.recent_queue_latencies.extend([start_time - request.enqueue_time for request in batch])
+      self.recent_batch_sizes.append(len(batch))
+      self.recent_batch_process_times.append(end_time - start_time)
+      for request in batch:
+        request.done.set()
+
+  def get_stats(self):
+    """
+    :return: statistics over the recent requests and batches, times in seconds
+    :rtype: dict[str,int|float]
+    """
+    res = {"num_requests": self.num_requests, "num_batches": self.num_batches, "num_pending": len(self._queue)}
+    if self.recent_batch_sizes:
+      latencies = np.array(self.recent_queue_latencies)
+      p50, p95 = np.percentile(latencies, [50, 95])
+      res.update({
+        "queue_latency_p50": float(p50), "queue_latency_p95": float(p95), "queue_latency_max": float(latencies.max()),
+        "batch_size_mean": float(np.mean(self.recent_batch_sizes)), "batch_size_max": max(self.recent_batch_sizes),
+        "batch_process_time_mean": float(np.mean(self.recent_batch_process_times))})
+    return res
+
+  def get_stats_str(self):
+    """
+    :rtype: str
+    """
+    stats = self.get_stats()
+    s = "%i requests in %i batches" % (stats["num_requests"], stats["num_batches"])
+    if "batch_size_mean" in stats:
+      s += ", batch size mean %.1f max %i, queue latency p50/p95/max %.3f/%.3f/%.3f secs" % (
+        stats["batch_size_mean"], stats["batch_size_max"],
+        stats["queue_latency_p50"], stats["queue_latency_p95"], stats["queue_latency_max"])
+    return s
+
+
 def make_hashable(obj):
   """
   Theano needs hashable objects in some cases, e.g. the properties of Ops.
@@ -3158,6 +3418,9 @@ class NativeCodeCompiler(object):
   """
 
   CacheDirName = "returnn_native"
+  # If set, used as the base dir instead of get_temp_dir(), e.g. a dir shared by all nodes of a cluster.
+  # The build of a specific op version is in its own sub dir (via the hash), and is protected by a LockFile.
+  CacheBaseDir = None  # type: typing.Optional[str]
   CollectedCompilers = None  # type: typing.Optional[typing.List[NativeCodeCompiler]]
 
   def __init__(self, base_name, code_version, code,
@@ -3185,7 +3448,7 @@ class NativeCodeCompiler(object):
     if self.CollectedCompilers is not None:
       self.CollectedCompilers.append(self)
     self.verbose = verbose
-    self.cache_dir = "%s/%s" % (get_temp_dir(), self.CacheDirName)
+    self.cache_dir = "%s/%s" % (self.CacheBaseDir or get_temp_dir(), self.CacheDirName)
     self._include_paths = list(include_paths)
     self.base_name = base_name
     self.code_version = code_version
@@ -3357,6 +3620,11 @@ class NativeCodeCompiler(object):
       if os.path.exists(self._mod_path):
         self._cleanup_old_path(self._mod_path, reason="need recompile")
     with lock:
+      # Another process (e.g. on another node, with a shared cache dir) might have compiled it meanwhile.
+      if not self._need_recompile():
+        if self.verbose:
+          print("%s: Compiled meanwhile by another process: %s" % (self.__class__.__name__, self._so_filename))
+        return
       self._maybe_compile_inner()
 
   def _get_compiler_bin(self):
@@ -3405,7 +3673,10 @@ class NativeCodeCompiler(object):
     common_opts += ["-D_GLIBCXX_USE_CXX11_ABI=%i" % (1 if self.use_cxx11_abi else 0)]
     common_opts += ["-D%s=%s" % item for item in sorted(self.c_macro_defines.items())]
     common_opts += ["-g"]
-    opts = common_opts + [self._c_filename, "-o", self._so_filename]
+    # Write to a temp file first, and rename at the end.
+    # Other processes can check for the so-file and load it without the lock, so it must never be incomplete.
+    tmp_so_filename = "%s.tmp%i.so" % (self._so_filename[:-len(".so")], os.getpid())
+    opts = common_opts + [self._c_filename, "-o", tmp_so_filename]
     opts += list(map(self._transform_ld_flag, self.ld_flags))
     cmd_bin = self._get_compiler_bin()
     cmd_args = [cmd_bin] + opts
@@ -3426,13 +3697,14 @@ class NativeCodeCompiler(object):
         print("Your GCC version might be too new. This is a problem with some nvcc versions.")
         print()
       raise CalledProcessError(returncode=proc.returncode, cmd=cmd_args)
-    assert os.path.exists(self._so_filename)
+    assert os.path.exists(tmp_so_filename)
     with open("%s/compile.log" % self._mod_path, "wb") as f:
       if self.verbose:
         print("%s: write compile log to: %s" % (self.__class__.__name__, f.name))
       f.write(("+ %s\n" % " ".join(cmd_args)).encode("utf8"))
       f.write(stdout)
     self._save_info()
+    os.rename(tmp_so_filename, self._so_filename)
     assert not self._need_recompile()
 
   def load_lib_ctypes(self):
@@ -996,11 +996,12 @@ class FastBaumWelchBatchFsa:
   FSA(s) in representation format for :class:`FastBaumWelchOp`.
   """
 
-  def __init__(self, edges, weights, start_end_states):
+  def __init__(self, edges, weights, start_end_states, num_states=None):
     """
     :param numpy.ndarray edges: (4,num_edges), edges of the graph (from,to,emission_idx,sequence_idx)
     :param numpy.ndarray weights: (num_edges,), weights of the edges
     :param numpy.ndarray start_end_states: (2, batch), (start,end) state idx in automaton.
+    :param int|None num_states: total number of states. by default the max state idx + 1
     """
     assert edges.ndim == 2
     self.num_edges = edges.shape[1]
@@ -1012,6 +1013,70 @@ class FastBaumWelchBatchFsa:
     self.edges = edges
     self.weights = weights
     self.start_end_states = start_end_states
+    if num_states is None:
+      num_states = int(max(edges[:2].max(initial=-1), start_end_states.max(initial=-1))) + 1
+    self.num_states = num_states
+
+
+def fast_bw_fsa_concat(fsas):
+  """
+  Concatenates the FSAs along the batch dim, i.e. the states and seq idx of each FSA get an offset.
+  This is vectorized, i.e. there is no Python loop over the edges.
+
+  :param list[FastBaumWelchBatchFsa] fsas:
+  :rtype: FastBaumWelchBatchFsa
+  """
+  assert fsas
+  num_states = numpy.array([fsa.num_states for fsa in fsas])
+  num_edges = numpy.array([fsa.num_edges for fsa in fsas])
+  num_batch = numpy.array([fsa.num_batch for fsa in fsas])
+  state_offsets = numpy.concatenate([[0], numpy.cumsum(num_states)[:-1]])
+  batch_offsets = numpy.concatenate([[0], numpy.cumsum(num_batch)[:-1]])
+  edges = numpy.concatenate([fsa.edges for fsa in fsas], axis=1)  # (4,num_edges)
+  edges = edges + numpy.stack([
+    numpy.repeat(state_offsets, num_edges), numpy.repeat(state_offsets, num_edges),
+    numpy.zeros((edges.shape[1],), dtype=state_offsets.dtype), numpy.repeat(batch_offsets, num_edges)
+  ]).astype(edges.dtype)
+  start_end_states = numpy.concatenate([fsa.start_end_states for fsa in fsas], axis=1)  # (2,batch)
+  start_end_states = start_end_states + numpy.repeat(state_offsets, num_batch)[None, :].astype(start_end_states.dtype)
+  return FastBaumWelchBatchFsa(
+    edges=edges, weights=numpy.concatenate([fsa.weights for fsa in fsas]),
+    start_end_states=start_end_states, num_states=int(num_states.sum()))
+
+
+class FastBwFsaCache:
+  """
+  Caches the FSAs of single seqs, e.g. by seq tag, for cases where the topology of a seq is static,
+  e.g. HMM with a fixed lexicon, or :func:`fast_bw_fsa_staircase` for a given seq len.
+  The FSA for the batch is then only a (vectorized) concatenation of the cached FSAs.
+  """
+
+  def __init__(self, max_size=1000):
+    """
+    :param int|None max_size: max number of cached FSAs, the least recently used are removed
+    """
+    from returnn.util.basic import LRUCache
+    from threading import Lock
+    self.cache = LRUCache(max_size=max_size)
+    self.lock = Lock()  # e.g. multiple TF py_func calls in parallel
+
+  def get_batch_fsa(self, keys, create_fsa_func):
+    """
+    :param list[T] keys: for each seq in the batch, e.g. the seq tag. must be hashable
+    :param ((T)->FastBaumWelchBatchFsa) create_fsa_func: FSA for a single seq (batch dim 1), if not cached
+    :rtype: FastBaumWelchBatchFsa
+    """
+    fsas = []
+    for key in keys:
+      with self.lock:
+        fsa = self.cache.get(key)
+      if fsa is None:
+        fsa = create_fsa_func(key)
+        assert fsa.num_batch == 1
+        with self.lock:
+          self.cache[key] = fsa
+      fsas.append(fsa)
+    return fast_bw_fsa_concat(fsas)
 
 
 class FastBwFsaShared:
@@ -1058,15 +1123,15 @@ class FastBwFsaShared:
     :rtype: numpy.ndarray
     """
     num_edges = len(self.edges)
-    res = numpy.zeros((4, num_edges * n_batch), dtype="int32")
-    for batch_idx in range(n_batch):
-      for edge_idx, edge in enumerate(self.edges):
-        res[:, batch_idx * num_edges + edge_idx] = (
-          edge.source_state_idx + batch_idx * self.num_states,
-          edge.target_state_idx + batch_idx * self.num_states,
-          edge.label,
-          batch_idx)
-    return res
+    edges = numpy.array(
+      [(edge.source_state_idx, edge.target_state_idx, edge.label) for edge in self.edges],
+      dtype="int32").reshape((num_edges, 3)).transpose()  # (3,num_edges)
+    batch_idxs = numpy.arange(n_batch, dtype="int32")
+    res = numpy.zeros((4, n_batch, num_edges), dtype="int32")
+    res[0:2] = edges[0:2, None, :] + batch_idxs[None, :, None] * self.num_states
+    res[2] = edges[2][None, :]
+    res[3] = batch_idxs[:, None]
+    return res.reshape((4, n_batch * num_edges))
 
   def get_weights(self, n_batch):
     """
@@ -1074,12 +1139,8 @@ class FastBwFsaShared:
     :return weights: (num_edges,), weights of the edges
     :rtype: numpy.ndarray
     """
-    num_edges = len(self.edges)
-    res = numpy.zeros((num_edges * n_batch,), dtype="float32")
-    for batch_idx in range(n_batch):
-      for edge_idx, edge in enumerate(self.edges):
-        res[batch_idx * num_edges + edge_idx] = edge.weight
-    return res
+    weights = numpy.array([edge.weight for edge in self.edges], dtype="float32")
+    return numpy.tile(weights, n_batch)
 
   def get_start_end_states(self, n_batch):
     """
@@ -1089,12 +1150,8 @@ class FastBwFsaShared:
     """
     start_state_idx = 0
     end_state_idx = self.num_states - 1
-    res = numpy.zeros((2, n_batch), dtype="int32")
-    for batch_idx in range(n_batch):
-      res[:, batch_idx] = (
-        start_state_idx + batch_idx * self.num_states,
-        end_state_idx + batch_idx * self.num_states)
-    return res
+    offsets = numpy.arange(n_batch, dtype="int32") * self.num_states
+    return numpy.stack([start_state_idx + offsets, end_state_idx + offsets])
 
   def get_fast_bw_fsa(self, n_batch):
     """
@@ -1104,7 +1161,8 @@ class FastBwFsaShared:
     return FastBaumWelchBatchFsa(
       edges=self.get_edges(n_batch),
       weights=self.get_weights(n_batch),
-      start_end_states=self.get_start_end_states(n_batch))
+      start_end_states=self.get_start_end_states(n_batch),
+      num_states=self.num_states * n_batch)
 
 
 def get_ctc_fsa_fast_bw(targets, seq_lens, blank_idx):
@@ -1116,9 +1174,6 @@ def get_ctc_fsa_fast_bw(targets, seq_lens, blank_idx):
   """
   n_batch, n_time = targets.shape
   assert seq_lens.shape == (n_batch,)
-  edges = []  # type: typing.List[typing.Tuple[int,int,int,int]]  # list of (from,to,emission_idx,sequence_idx)
-  start_end_states = []  # type: typing.List[typing.Tuple[int,int]]  # list of (start,end), same len as batch
-  state_idx = 0
   # Note: We don't use weights on the edges, i.e. they are all set to zero.
   # I.e. we want that all strings for some given length T have the same probability.
   # In a probabilistic interpretation, this means that for some given length T,
@@ -1132,58 +1187,60 @@ def get_ctc_fsa_fast_bw(targets, seq_lens, blank_idx):
   # we need to add some extra handling (see below).
   # It would be a bit simpler if we would have multiple final states,
   # but the current interface does not allow this.
-  for batch_idx in range(n_batch):
-    initial_state_idx = state_idx
-    edges.append((state_idx, state_idx, blank_idx, batch_idx))  # initial blank loop
-    assert seq_lens[batch_idx] <= n_time
-    for i in range(seq_lens[batch_idx]):
-      label_idx = targets[batch_idx, i]
-      is_final_label = i == seq_lens[batch_idx] - 1
-      next_is_final_label = i == seq_lens[batch_idx] - 2
-      next_label_idx = None if is_final_label else targets[batch_idx, i + 1]
-      edges.append((state_idx, state_idx + 1, label_idx, batch_idx))  # label
-      if is_final_label:
-        # Case 1a: no blank at the end, exactly 1 label.
-        # Skip directly to final state (state_idx + 3).
-        edges.append((state_idx, state_idx + 3, label_idx, batch_idx))  # label
-      state_idx += 1
-      edges.append((state_idx, state_idx, label_idx, batch_idx))  # label loop
-      edges.append((state_idx, state_idx + 1, blank_idx, batch_idx))  # blank
-      if not is_final_label and label_idx != next_label_idx:
-        # Skip over blank is allowed in this case.
-        edges.append((state_idx, state_idx + 2, next_label_idx, batch_idx))  # next label
-        if next_is_final_label:
-          # We miss now the case of having: exactly one label, no blank.
-          # Skip directly to the final state (state_idx + 4).
-          edges.append((state_idx, state_idx + 4, next_label_idx, batch_idx))  # next label
-      if is_final_label:
-        # Case 1b: no blank at the end, 2 or more labels.
-        # Skip directly to final state (state_idx + 2).
-        edges.append((state_idx, state_idx + 2, label_idx, batch_idx))  # label
-        # Case 2: exactly one blank at the end, 1 or more labels.
-        # Skip directly to final state (state_idx + 2).
-        edges.append((state_idx, state_idx + 2, blank_idx, batch_idx))  # blank
-      state_idx += 1
-      edges.append((state_idx, state_idx, blank_idx, batch_idx))  # blank loop
-      if is_final_label:
-        # Case 3: 2 or more blank at the end, 1 or more labels.
-        # Go to final state (state_idx + 1).
-        edges.append((state_idx, state_idx + 1, blank_idx, batch_idx))  # blank
-        state_idx += 1  # this is the final state now
-    final_state_idx = state_idx
-    start_end_states.append((initial_state_idx, final_state_idx))
-    state_idx += 1
-  edges_np = numpy.array(edges).transpose()  # (4,n_edges)
-  start_end_states_np = numpy.array(start_end_states).transpose()  # (2,batch)
+  # We construct all edges of the whole batch at once, without a Python loop.
+  # For every label position i, there is a fixed list of possible edges (slots, see below),
+  # relative to the state s = initial_state + 2 * i, and each edge is only valid in certain cases.
+  # Flattening (batch,time,slot) with the mask keeps the edges ordered per seq, as one would add them in a loop.
+  # The number of states per seq is 2 * seq_len + 2 (or 1 for an empty seq).
+  seq_lens = numpy.asarray(seq_lens)
+  assert (seq_lens <= n_time).all()
+  num_states = numpy.where(seq_lens > 0, 2 * seq_lens + 2, 1)  # (batch,)
+  initial_states = (numpy.cumsum(num_states) - num_states).astype("int64")  # (batch,)
+  n_time_ = max(n_time, 1)  # we need at least one position for the initial blank loop
+  pos = numpy.arange(n_time_)[None, :]  # (1,time)
+  seq_lens_ = seq_lens[:, None]  # (batch,1)
+  targets_ = numpy.zeros((n_batch, n_time_ + 1), dtype="int64")
+  targets_[:, :n_time] = targets
+  label = targets_[:, :-1]  # (batch,time)
+  next_label = targets_[:, 1:]  # (batch,time)
+  s0 = initial_states[:, None] + 2 * pos  # (batch,time)
+  s1 = s0 + 1
+  is_label = pos < seq_lens_
+  is_final = pos == seq_lens_ - 1
+  is_skip = (pos < seq_lens_ - 1) & numpy.not_equal(label, next_label)
+  blank = numpy.full_like(label, blank_idx)
+  slots = [  # (valid,from,to,emission_idx)
+    (pos == 0, s0, s0, blank),  # initial blank loop
+    (is_label, s0, s0 + 1, label),  # label
+    (is_final, s0, s0 + 3, label),  # Case 1a: no blank at the end, exactly 1 label.
+    (is_label, s1, s1, label),  # label loop
+    (is_label, s1, s1 + 1, blank),  # blank
+    (is_skip, s1, s1 + 2, next_label),  # skip over blank is allowed if the next label is different
+    (is_skip & (pos == seq_lens_ - 2), s1, s1 + 4, next_label),  # next label, and it is final (exactly one label)
+    (is_final, s1, s1 + 2, label),  # Case 1b: no blank at the end, 2 or more labels.
+    (is_final, s1, s1 + 2, blank),  # Case 2: exactly one blank at the end, 1 or more labels.
+    (is_label, s1 + 1, s1 + 1, blank),  # blank loop
+    (is_final, s1 + 1, s1 + 2, blank),  # Case 3: 2 or more blank at the end, 1 or more labels.
+  ]
+  batch_idxs = numpy.broadcast_to(numpy.arange(n_batch)[:, None], (n_batch, n_time_))
+  valid = numpy.stack([numpy.broadcast_to(slot[0], (n_batch, n_time_)) for slot in slots], axis=-1)  # (B,T,slot)
+  edges_np = numpy.stack([
+    numpy.stack([slot[1] for slot in slots], axis=-1)[valid],
+    numpy.stack([slot[2] for slot in slots], axis=-1)[valid],
+    numpy.stack([slot[3] for slot in slots], axis=-1)[valid],
+    numpy.stack([batch_idxs] * len(slots), axis=-1)[valid]])  # (4,n_edges)
+  start_end_states_np = numpy.stack([initial_states, initial_states + num_states - 1])  # (2,batch)
   return FastBaumWelchBatchFsa(
-    edges=edges_np, weights=numpy.zeros((len(edges),), dtype="float32"),
-    start_end_states=start_end_states_np)
+    edges=edges_np, weights=numpy.zeros((edges_np.shape[1],), dtype="float32"),
+    start_end_states=start_end_states_np, num_states=int(num_states.sum()))
 
 
 def fast_bw_fsa_staircase(seq_lens, with_loop=False, max_skip=None, start_max_skip=None, end_max_skip=None):
   """
   Builds up a staircase FSA, returns a FastBaumWelchBatchFsa.
   The emissions are indices [0, ..., seq_len - 1].
+  The FSA of a single seq only depends on its seq len and the options,
+  so it is cached (:class:`FastBwFsaCache`).
 
   :param list[int]|numpy.ndarray seq_lens:
   :param bool with_loop:
@@ -1199,61 +1256,72 @@ def fast_bw_fsa_staircase(seq_lens, with_loop=False, max_skip=None, start_max_sk
     start_max_skip = [start_max_skip] * n_batch
   if not isinstance(end_max_skip, list):
     end_max_skip = [end_max_skip] * n_batch
+  keys = [
+    (int(seq_lens[batch]), bool(with_loop), max_skip[batch], start_max_skip[batch], end_max_skip[batch])
+    for batch in range(n_batch)]
+  return _fast_bw_fsa_staircase_cache.get_batch_fsa(
+    keys=keys, create_fsa_func=lambda key: _fast_bw_fsa_staircase_single(*key))
+
+
+_fast_bw_fsa_staircase_cache = FastBwFsaCache()
+
+
+def _fast_bw_fsa_staircase_single(seq_len, with_loop, max_skip, start_max_skip, end_max_skip):
+  """
+  :param int seq_len:
+  :param bool with_loop:
+  :param int|None max_skip:
+  :param int|None start_max_skip:
+  :param int|None end_max_skip:
+  :return: FSA for a single seq, batch dim 1
+  :rtype: FastBaumWelchBatchFsa
+  """
+  assert seq_len > 0
   # numpy.ndarray edges: (4,num_edges), edges of the graph (from,to,emission_idx,sequence_idx)
   # numpy.ndarray weights: (num_edges,), weights of the edges
   # numpy.ndarray start_end_states: (2, batch), (start,end) state idx in automaton.
-  state_idx = 0
   edges = []
-  start_end_states = []
-  for batch in range(n_batch):
-    seq_len = seq_lens[batch]
-    assert seq_len > 0
-    start_state_idx = state_idx
-    # Conventions:
-    # * create seq_len + 1 states
-    # * state 't': all outgoing edges have emission 't'
-    # * state t=0 is initial/first; state t=seq_len is final.
-    # * need extra handling for first:
-    #   - all outgoing edges can have emissions up to the skip-len
-    for i in range(seq_len):
-      cur_state_idx = state_idx
-      cur_max_skip = None
-      if not cur_max_skip and i == 0:
-        cur_max_skip = start_max_skip[batch]
-      if not cur_max_skip and end_max_skip[batch] and i + end_max_skip[batch] >= seq_len:
-        cur_max_skip = end_max_skip[batch]
-      if not cur_max_skip:
-        cur_max_skip = max_skip[batch]
-      j_max = seq_len
-      if cur_max_skip:
-        j_max = min(j_max, i + cur_max_skip)
-      if with_loop:
+  # Conventions:
+  # * create seq_len + 1 states
+  # * state 't': all outgoing edges have emission 't'
+  # * state t=0 is initial/first; state t=seq_len is final.
+  # * need extra handling for first:
+  #   - all outgoing edges can have emissions up to the skip-len
+  for i in range(seq_len):
+    cur_state_idx = i
+    cur_max_skip = None
+    if not cur_max_skip and i == 0:
+      cur_max_skip = start_max_skip
+    if not cur_max_skip and end_max_skip and i + end_max_skip >= seq_len:
+      cur_max_skip = end_max_skip
+    if not cur_max_skip:
+      cur_max_skip = max_skip
+    j_max = seq_len
+    if cur_max_skip:
+      j_max = min(j_max, i + cur_max_skip)
+    if with_loop:
+      emission_idx = i
+      target_state_idx = cur_state_idx
+      edges += [(cur_state_idx, target_state_idx, emission_idx, 0)]
+    for j in range(i + 1, j_max + 1):
+      target_state_idx = cur_state_idx + j - i
+      if i > 0:
         emission_idx = i
-        target_state_idx = cur_state_idx
-        edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-      for j in range(i + 1, j_max + 1):
-        target_state_idx = cur_state_idx + j - i
-        if i > 0:
-          emission_idx = i
-          edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-        else:  # see comment above. extra rule for first state
-          for t in range(i, j):
-            if with_loop and i == t and j < seq_len:
-              continue
-            emission_idx = t
-            edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-          if with_loop and j < seq_len:
-            emission_idx = j
-            edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-      state_idx += 1
-    end_state_idx = state_idx
-    start_end_states += [(start_state_idx, end_state_idx)]
-    state_idx += 1
-  weights = [0.0] * len(edges)
+        edges += [(cur_state_idx, target_state_idx, emission_idx, 0)]
+      else:  # see comment above. extra rule for first state
+        for t in range(i, j):
+          if with_loop and i == t and j < seq_len:
+            continue
+          emission_idx = t
+          edges += [(cur_state_idx, target_state_idx, emission_idx, 0)]
+        if with_loop and j < seq_len:
+          emission_idx = j
+          edges += [(cur_state_idx, target_state_idx, emission_idx, 0)]
   return FastBaumWelchBatchFsa(
-    edges=numpy.array(edges).transpose(),
-    weights=numpy.array(weights),
-    start_end_states=numpy.array(start_end_states).transpose())
+    edges=numpy.array(edges).reshape((len(edges), 4)).transpose(),
+    weights=numpy.zeros((len(edges),)),
+    start_end_states=numpy.array([[0], [seq_len]]),
+    num_states=seq_len + 1)
 
 
 def main():
@@ -474,6 +474,130 @@ class SharedNumpyArray:
     return "<%s is_server=%r state=%r>" % (self.__class__.__name__, self.is_server, self.__getstate__())
 
 
+class SharedMemRingBuffer:
+  """
+  Ring buffer in a single :class:`SharedMem` segment, to transfer numpy arrays from one writer process
+  to one reader process without pickling, e.g. used by :class:`ExternSprintDataset`.
+  The writer copies the arrays into the buffer and sends only small headers (see :func:`write_arrays`)
+  over some other channel (e.g. a pipe) to the reader, which copies the arrays out (see :func:`read_arrays`),
+  and then releases the memory, such that the writer can reuse it.
+  The writer waits if the buffer is full.
+
+  The first bytes of the segment are used for the shared state:
+  the sanity check flag, and the read position of the reader (total bytes, monotonic).
+  The write position is only known by the writer.
+  """
+
+  HeaderBytes = 64
+  Alignment = 64
+
+  def __init__(self, size=None, shmid=None):
+    """
+    :param int|None size: capacity in bytes, needed for a new buffer (the reader creates it)
+    :param int|None shmid: attach to an existing buffer (the writer, e.g. in the child process)
+    """
+    if shmid is None:
+      assert size and size > 0
+      size = (size + self.Alignment - 1) // self.Alignment * self.Alignment
+      self.mem = SharedMem(size=self.HeaderBytes + size)
+      self._get_sanity_check_flag_ref().value = 42
+      self._get_read_pos_ref().value = 0
+    else:
+      self.mem = SharedMem(size=self.HeaderBytes + size, shmid=shmid)
+      assert self._get_sanity_check_flag_ref().value == 42
+    self.capacity = self.mem.size - self.HeaderBytes
+    import ctypes
+    self._buffer = numpy.frombuffer(
+      (ctypes.c_uint8 * self.capacity).from_address(self.mem.ptr + self.HeaderBytes), dtype="uint8")
+    self._write_pos = self._get_read_pos_ref().value
+
+  def _get_sanity_check_flag_ref(self):
+    assert self.mem.ptr > 0
+    import ctypes
+    return ctypes.cast(ctypes.c_void_p(self.mem.ptr), ctypes.POINTER(ctypes.c_uint64)).contents
+
+  def _get_read_pos_ref(self):
+    assert self.mem.ptr > 0
+    import ctypes
+    return ctypes.cast(ctypes.c_void_p(self.mem.ptr + 8), ctypes.POINTER(ctypes.c_uint64)).contents
+
+  def get_shmid(self):
+    """
+    :return: pass this to the writer process, such that it can attach to the buffer
+    :rtype: int
+    """
+    return self.mem.shmid
+
+  def can_write(self, arrays):
+    """
+    :param list[numpy.ndarray] arrays:
+    :return: whether the arrays fit into the buffer at all. otherwise, use some other way to transfer them
+    :rtype: bool
+    """
+    # In the worst case, we need to wrap around for every array.
+    return sum([self._aligned(a.nbytes) for a in arrays]) * 2 <= self.capacity
+
+  def _aligned(self, num_bytes):
+    """
+    :param int num_bytes:
+    :rtype: int
+    """
+    return max((num_bytes + self.Alignment - 1) // self.Alignment * self.Alignment, self.Alignment)
+
+  def write_arrays(self, arrays, wait_sleep_time=0.001):
+    """
+    Writer side. Blocks until there is enough free space in the buffer.
+
+    :param list[numpy.ndarray] arrays:
+    :param float wait_sleep_time: poll interval while the buffer is full
+    :return: refs (offset, shape, dtype str) for each array, and the end position, to pass to :func:`read_arrays`
+    :rtype: (list[(int,tuple[int],str)], int)
+    """
+    assert self.can_write(arrays)
+    refs = []
+    for array in arrays:
+      array = numpy.ascontiguousarray(array)
+      num_bytes = self._aligned(array.nbytes)
+      offset = self._write_pos % self.capacity
+      if offset + num_bytes > self.capacity:  # does not fit at the end, wrap around
+        self._write_pos += self.capacity - offset
+        offset = 0
+      while self._write_pos + num_bytes - self._get_read_pos_ref().value > self.capacity:
+        time.sleep(wait_sleep_time)  # wait for the reader
+      self._buffer[offset:offset + array.nbytes] = array.reshape(-1).view("uint8")
+      refs.append((offset, array.shape, array.dtype.str))
+      self._write_pos += num_bytes
+    return refs, self._write_pos
+
+  def read_arrays(self, refs, end_pos):
+    """
+    Reader side. Copies the arrays out of the buffer, and releases the memory.
+    The arrays must be read in the same order as they were written.
+
+    :param list[(int,tuple[int],str)] refs: from :func:`write_arrays`
+    :param int end_pos: from :func:`write_arrays`
+    :return: copies of the arrays
+    :rtype: list[numpy.ndarray]
+    """
+    arrays = []
+    for offset, shape, dtype_str in refs:
+      dtype = numpy.dtype(dtype_str)
+      num_bytes = int(numpy.prod(shape, dtype="int64")) * dtype.itemsize
+      arrays.append(self._buffer[offset:offset + num_bytes].view(dtype).reshape(shape).copy())
+    self._get_read_pos_ref().value = end_pos
+    return arrays
+
+  def remove(self):
+    """
+    Detaches (and removes, if we created it) the shared memory.
+    """
+    self._buffer = None
+    self.mem.remove()
+
+  def __repr__(self):
+    return "<%s shmid=%r capacity=%r>" % (self.__class__.__name__, self.mem.shmid, self.capacity)
+
+
 def attrChain(base, *attribs, **kwargs):
   default = kwargs.get("default", None)
   obj = base
@@ -6,7 +6,8 @@ from __future__ import print_function
 import sys
 import _setup_test_env  # noqa
 import unittest
-from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
+from nose.tools import assert_equal, assert_not_equal, assert_is_instance, assert_in, assert_not_in
+from nose.tools import assert_true, assert_false
 from returnn.datasets.generating import GeneratingDataset, DummyDataset, DummyDatasetMultipleSequenceLength
 from returnn.engine.batch import Batch
 from returnn.datasets.basic import DatasetSeq
@@ -284,6 +285,38 @@ def test_batches_context_window():
   assert_equal(b2.seqs[0].batch_frame_offset, 0)
 
 
+def test_generate_batches_bucketed():
+  from returnn.datasets.generating import StaticDataset
+  seq_lens = [3, 30, 4, 31, 5, 32, 2, 29, 6]
+  dataset = StaticDataset(data=[{"data": np.zeros((n,), dtype="int32")} for n in seq_lens], output_dim={"data": [3, 1]})
+
+  def get_batches(**kwargs):
+    dataset.init_seq_order(epoch=1)
+    batch_gen = dataset.generate_batches(recurrent_net=True, batch_size=100, max_seqs=2, **kwargs)
+    batches = []
+    while batch_gen.has_more():
+      batch, = batch_gen.peek_next_n(1)
+      batches.append(batch)
+      batch_gen.advance(1)
+    return batches
+
+  batches = get_batches()
+  padding_ratio = dataset.get_batches_padding_ratio(batches)["data"]
+  assert_true(padding_ratio > 0.4)
+  bucket_batches = get_batches(bucket_boundaries=[10], bucket_batch_sizes=[100, 60])
+  assert_equal(
+    sorted([seq.seq_idx for batch in bucket_batches for seq in batch.seqs]), list(range(len(seq_lens))))
+  for batch in bucket_batches:
+    assert_true(batch.num_slices <= 2)
+    assert_true(batch.get_all_slices_num_frames()["data"] <= 100)
+    lens = [seq.frame_length["data"] for seq in batch.seqs]
+    assert_true(max(lens) <= 10 or min(lens) > 10)
+  assert_true(dataset.get_batches_padding_ratio(bucket_batches)["data"] < padding_ratio / 4)
+  assert_equal(
+    [[seq.seq_idx for seq in batch.seqs] for batch in get_batches(bucket_boundaries=[10])],
+    [[seq.seq_idx for seq in batch.seqs] for batch in get_batches(bucket_boundaries=[10])])
+
+
 def test_task12ax_window():
   from returnn.datasets.generating import Task12AXDataset
   window = 3
@@ -324,6 +357,139 @@ def test_task12ax_window():
   assert_equal(list(data2a[-1, 2]), [0] * input_dim)  # zero-padded right
 
 
+def test_get_seq_order_for_epoch_version1():
+  # This must stay the same as in earlier RETURNN versions, to keep the seq order reproducible.
+  from returnn.datasets.basic import Dataset
+  expected = {
+    ("sorted", 1): [0, 5, 10, 15, 3, 8, 13, 18, 1, 6],
+    ("sorted_reverse", 1): [2, 7, 12, 17, 4, 9, 14, 19, 1, 6],
+    ("sort_bin_shuffle:3", 3): [15, 0, 10, 5, 8, 13, 3, 18, 6, 16],
+    ("sort_bin_shuffle_x2:.4", 1): [8, 18, 3, 13, 0, 15, 10, 5, 12, 17],
+    ("laplace:.5", 3): [8, 6, 19, 7, 17, 9, 13, 3, 15, 0],
+    ("random", 3): [7, 6, 17, 8, 19, 15, 13, 0, 3, 9],
+    ("random:2", 3): [3, 7, 0, 16, 19, 9, 11, 12, 1, 18],
+    ("default_every_n:4", 1): [0, 5, 10, 15, 1, 6, 11, 16, 2, 7],
+  }
+  seq_lens = [(i * 7) % 5 + 1 for i in range(20)]
+  for (seq_ordering, epoch), expected_seq_order in sorted(expected.items()):
+    dataset = Dataset(seq_ordering=seq_ordering, partition_epoch=2)
+    seq_order = dataset.get_seq_order_for_epoch(epoch=epoch, num_seqs=20, get_seq_len=seq_lens.__getitem__)
+    print(seq_ordering, epoch, seq_order)
+    assert_equal(seq_order, expected_seq_order)
+    seq_order = dataset.get_seq_order_for_epoch(epoch=epoch, num_seqs=20, seq_lens=np.array(seq_lens))
+    assert_equal(seq_order, expected_seq_order)
+
+
+def test_get_seq_order_for_epoch_version2():
+  from returnn.datasets.basic import Dataset
+  num_seqs = 1000
+  seq_lens = np.random.RandomState(42).randint(1, 100, size=(num_seqs,))
+  for seq_ordering in ["random", "sort_bin_shuffle:.10", "sort_bin_shuffle_x2:.10", "laplace:.10"]:
+    dataset = Dataset(seq_ordering=seq_ordering, seq_order_version=2)
+    seq_order1 = dataset.get_seq_order_for_epoch(epoch=1, num_seqs=num_seqs, seq_lens=seq_lens)
+    assert_equal(sorted(seq_order1), list(range(num_seqs)))
+    seq_order1b = dataset.get_seq_order_for_epoch(epoch=1, num_seqs=num_seqs, seq_lens=seq_lens)
+    assert_equal(seq_order1, seq_order1b)  # deterministic
+    seq_order2 = dataset.get_seq_order_for_epoch(epoch=2, num_seqs=num_seqs, seq_lens=seq_lens)
+    assert_equal(sorted(seq_order2), list(range(num_seqs)))
+    assert_not_equal(seq_order1, seq_order2)
+    if seq_ordering.startswith("laplace"):
+      first_bin_lens = seq_lens[seq_order1[:10]]
+      assert_equal(list(first_bin_lens), sorted(first_bin_lens))
+
+
+def test_get_seq_order_for_epoch_unique_tags_filter():
+  from returnn.datasets.basic import Dataset
+  import tempfile
+  all_tags = ["a", "b", "a", "c", "d", "b", "e"]
+  filter_file = tempfile.NamedTemporaryFile(mode="w", suffix=".txt")
+  filter_file.write("a\nb\ne\n")
+  filter_file.flush()
+
+  class _TagsDataset(Dataset):
+    def get_all_tags(self):
+      return all_tags
+
+    def get_total_num_seqs(self):
+      return len(all_tags)
+
+  dataset = _TagsDataset(seq_ordering="reverse", unique_seq_tags=True)
+  assert_equal(dataset.get_seq_order_for_epoch(epoch=1, num_seqs=len(all_tags)), [6, 5, 4, 3, 2])
+  dataset = _TagsDataset(seq_ordering="default", seq_list_filter_file=filter_file.name)
+  assert_equal(dataset.get_seq_order_for_epoch(epoch=1, num_seqs=len(all_tags)), [0, 1, 2, 5, 6])
+
+
+def test_LmDataset_seq_meta_cache():
+  from returnn.datasets.lm import LmDataset
+  import os
+  import tempfile
+  import shutil
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    corpus_file = "%s/corpus.txt" % tmp_dir
+    with open(corpus_file, "w") as f:
+      f.write("helloworld\nab\nc\u00e4\u00f6\u00fc\nxyzxyzxyz\n")
+    symbols_file = "%s/symbols.txt" % tmp_dir
+    with open(symbols_file, "w") as f:
+      for i, symbol in enumerate(sorted(set("helowrdabc\u00e4\u00f6\u00fcxyz")) + ["[END]"]):
+        f.write("%s %i\n" % (symbol, i))
+    opts = dict(
+      corpus_file=corpus_file, orth_symbols_map_file=symbols_file, word_based=False, seq_ordering="sorted")
+    dataset_ref = LmDataset(**opts)
+    dataset_ref.init_seq_order(epoch=1)
+    dataset_ref.load_seqs(0, 4)
+    seq_order = dataset_ref.seq_order
+    for _ in range(2):  # first writes the cache, second reads it
+      dataset = LmDataset(seq_meta_cache=True, **opts)
+      assert os.path.isdir(corpus_file + ".returnn-seq-meta")
+      assert_equal(list(dataset.orths), dataset_ref.orths)
+      dataset.init_seq_order(epoch=1)
+      assert_equal(dataset.seq_order, seq_order)
+      dataset.load_seqs(0, 4)
+      for i in range(4):
+        assert_equal(dataset.get_data(i, "data").tolist(), dataset_ref.get_data(i, "data").tolist())
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_CachedDataset2_readahead():
+  from returnn.datasets.cached2 import CachedDataset2
+  import threading
+
+  class _SlowDataset(CachedDataset2):
+    def __init__(self, **kwargs):
+      super(_SlowDataset, self).__init__(**kwargs)
+      self.num_inputs = 2
+      self.num_outputs = {"data": [2, 2]}
+      self.collect_threads = {}  # seq_idx -> thread name
+
+    def init_seq_order(self, epoch=None, seq_list=None, seq_order=None):
+      super(_SlowDataset, self).init_seq_order(epoch=epoch)
+      self._num_seqs = 10
+      return True
+
+    def _collect_single_seq(self, seq_idx):
+      self.collect_threads[seq_idx] = threading.current_thread().name
+      return DatasetSeq(seq_idx=seq_idx, features=np.full((seq_idx + 1, 2), seq_idx, dtype="float32"))
+
+  dataset = _SlowDataset(readahead=3, readahead_num_threads=2)
+  for epoch in [1, 2]:
+    dataset.collect_threads.clear()
+    dataset.init_seq_order(epoch=epoch)
+    for seq_idx in range(10):
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      assert_equal(dataset.get_data(seq_idx, "data").tolist(), [[seq_idx] * 2] * (seq_idx + 1))
+      assert_true(len(dataset._readahead_results) <= 3)
+    assert_equal(sorted(dataset.collect_threads.keys()), list(range(10)))
+    # Seq 0 is loaded directly, all further seqs in the readahead threads.
+    assert_equal(dataset.collect_threads[0], threading.current_thread().name)
+    assert_not_in(threading.current_thread().name, [dataset.collect_threads[i] for i in range(1, 10)])
+    assert_false(dataset.is_less_than_num_seqs(10))
+    assert_true(dataset._readahead_pool is not None)
+    dataset.finish_epoch()
+    assert_true(dataset._readahead_pool is None)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -346,6 +346,46 @@ def test_fast_bw_fsa_staircase():
   check_fast_bw_fsa_staircase(3, 3, with_loop=True)
 
 
+def test_get_ctc_fsa_fast_bw():
+  # Single label "a" (idx 0) with blank idx 1.
+  fsa = fsa_util.get_ctc_fsa_fast_bw(targets=numpy.array([[0], [0]]), seq_lens=numpy.array([1, 0]), blank_idx=1)
+  assert fsa.num_batch == 2
+  assert fsa.num_states == 4 + 1
+  assert fsa.start_end_states.tolist() == [[0, 4], [3, 4]]
+  edges = sorted(map(tuple, fsa.edges.transpose().tolist()))
+  assert edges == [
+    (0, 0, 1, 0), (0, 1, 0, 0), (0, 3, 0, 0),  # initial blank loop, label, label to final
+    (1, 1, 0, 0), (1, 2, 1, 0), (1, 3, 0, 0), (1, 3, 1, 0),  # label loop, blank, label loop to final, blank to final
+    (2, 2, 1, 0), (2, 3, 1, 0),  # blank loop, blank to final
+    (4, 4, 1, 1)]  # empty seq, only blank loop
+
+
+def test_fast_bw_fsa_concat_and_cache():
+  fsa0 = fsa_util.fast_bw_fsa_staircase([3], with_loop=True)
+  fsa1 = fsa_util.fast_bw_fsa_staircase([2], with_loop=True)
+  fsa = fsa_util.fast_bw_fsa_staircase([3, 2], with_loop=True)
+  assert fsa.num_states == fsa0.num_states + fsa1.num_states
+  assert fsa.edges.tolist() == fsa_util.fast_bw_fsa_concat([fsa0, fsa1]).edges.tolist()
+  assert fsa.start_end_states.tolist() == [[0, 4], [3, 6]]
+  assert fsa.edges[:, :fsa0.num_edges].tolist() == fsa0.edges.tolist()
+  assert (fsa.edges[:2, fsa0.num_edges:] == fsa1.edges[:2] + fsa0.num_states).all()
+  assert (fsa.edges[3, fsa0.num_edges:] == 1).all()
+
+  created = []
+
+  def create_fsa(key):
+    created.append(key)
+    return fsa_util.fast_bw_fsa_staircase([key])
+
+  cache = fsa_util.FastBwFsaCache(max_size=2)
+  fsa = cache.get_batch_fsa([3, 2, 3], create_fsa_func=create_fsa)
+  assert fsa.num_batch == 3
+  assert created == [3, 2]
+  cache.get_batch_fsa([4, 3], create_fsa_func=create_fsa)  # removes 2
+  cache.get_batch_fsa([2], create_fsa_func=create_fsa)
+  assert created == [3, 2, 4, 2]
+
+
 if __name__ == "__main__":
   from returnn.util import better_exchook
   better_exchook.install()
@@ -4,7 +4,8 @@ from __future__ import print_function
 
 import _setup_test_env  # noqa
 import unittest
-from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
+from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false, \
+  assert_is_none
 from returnn.datasets.generating import *
 from returnn.datasets.basic import DatasetSeq
 from returnn.util.basic import PY3, unicode
@@ -140,6 +141,64 @@ def test_BytePairEncoding_unicode():
     u"råt råt iz ďër iz ďër ám à@@ n iz ďër ë låk ë k@@ o@@ d áv d@@ r@@ e@@ s w@@ ër yù w@@ ê@@ k dù ďë à@@ s@@ k")
 
 
+def test_BytePairEncoding_get_seqs_cache():
+  opts = dict(
+    bpe_file="%s/bpe-unicode-demo.codes" % my_dir,
+    vocab_file="%s/bpe-unicode-demo.vocab" % my_dir,
+    unknown_label="<unk>")
+  bpe_ref = BytePairEncoding(encode_cache_size=None, **opts)
+  bpe = BytePairEncoding(encode_cache_size=3, **opts)
+  sentences = [
+    u"råt råt iz ďër iz ďër ám àn iz ďër",
+    u"ë låk ë kod áv dres wër yù wêk dù ďë àsk",
+    u"kod kod dres àsk"]
+  seqs = [bpe_ref.get_seq(sentence) for sentence in sentences]
+  assert_equal([bpe.get_seq(sentence) for sentence in sentences], seqs)
+  assert_equal(len(bpe._bpe_encode_cache), 3)
+  assert_equal(bpe.get_seqs(sentences), seqs)
+  assert_equal(len(bpe._bpe_encode_cache), 3)
+
+
+def test_OggZipDataset_feature_cache():
+  import tempfile
+  import shutil
+  import zipfile
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    zip_fn = "%s/corpus.zip" % tmp_dir
+    rnd = numpy.random.RandomState(42)
+    audio = {"seq-%i.raw" % i: rnd.uniform(-1, 1, size=(10 + i, 1)).astype("float32") for i in range(3)}
+    with zipfile.ZipFile(zip_fn, "w") as zip_file:
+      zip_file.writestr("corpus.txt", repr([
+        {"text": "hello", "duration": float(len(a)), "file": fn} for fn, a in sorted(audio.items())]))
+      for fn, a in audio.items():
+        zip_file.writestr("corpus/%s" % fn, a.tobytes())
+    num_extract_calls = [0]
+
+    def get_audio_features_from_raw_bytes(raw_bytes, seq_name=None):
+      num_extract_calls[0] += 1
+      return numpy.frombuffer(raw_bytes.getvalue(), dtype="float32").reshape((-1, 1)).copy()
+
+    for epoch in [1, 2]:
+      dataset = OggZipDataset(
+        path=zip_fn, audio={"features": "raw"}, targets=None, feature_cache="%s/cache" % tmp_dir)
+      dataset.feature_extractor.get_audio_features_from_raw_bytes = get_audio_features_from_raw_bytes
+      dataset.init_seq_order(epoch=epoch)
+      dataset.load_seqs(0, 3)
+      for seq_idx in range(3):
+        assert_equal(
+          dataset.get_data(seq_idx, "data").tolist(), audio[dataset.get_tag(seq_idx)].tolist())
+      assert_equal(num_extract_calls[0], 3)  # second epoch only uses the cache
+
+    dataset = OggZipDataset(
+      path=zip_fn, audio={"features": "raw", "random_permute": True}, targets=None,
+      feature_cache="%s/cache" % tmp_dir)
+    assert_is_none(dataset.feature_extractor.get_cache_key())
+    assert_is_none(dataset._feature_cache_dir)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
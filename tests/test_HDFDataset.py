@@ -249,6 +249,100 @@ def test_HDFDataset_partition_epoch():
       assert_equal(hdf_reader.data[key][seq_idx].tolist(), orig_reader.data[key][seq_idx].tolist())
 
 
+def test_HDFDataset_seq_order_seq_lens():
+  num_seqs = 11
+  hdf_fn = generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  hdf = HDFDataset([hdf_fn, hdf_fn], seq_ordering="sorted")
+  seq_lens = hdf._get_all_seq_lengths_by_real_idx()
+  assert_equal(seq_lens.shape, (2 * num_seqs,))
+  assert_equal(seq_lens.tolist(), [int(hdf._get_seq_length_by_real_idx(i)[0]) for i in range(2 * num_seqs)])
+  hdf.init_seq_order(epoch=1)
+  assert_equal([hdf.get_estimated_seq_length(i) for i in range(2 * num_seqs)], sorted(seq_lens.tolist()))
+
+
+def test_HDFDataset_seq_meta_cache():
+  import tempfile
+  import shutil
+  num_seqs = 11
+  hdf_fn = generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  cache_dir = tempfile.mkdtemp()
+  try:
+    hdf_ref = HDFDataset([hdf_fn], seq_ordering="sorted")
+    hdf_ref.init_seq_order(epoch=1)
+    for _ in range(2):  # first writes the cache, second reads it
+      hdf = HDFDataset([hdf_fn], seq_ordering="sorted", seq_meta_cache=cache_dir)
+      assert_equal(len(os.listdir(cache_dir)), 1)
+      hdf.init_seq_order(epoch=1)
+      assert_equal(hdf.get_all_tags(), hdf_ref.get_all_tags())
+      assert_equal(
+        [hdf.get_tag(i) for i in range(num_seqs)],
+        [hdf_ref.get_tag(i) for i in range(num_seqs)])
+      assert_equal(
+        [hdf.get_estimated_seq_length(i) for i in range(num_seqs)],
+        [hdf_ref.get_estimated_seq_length(i) for i in range(num_seqs)])
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+def test_HDFDataset_seq_meta_cache_no_seq_tags():
+  import tempfile
+  import shutil
+  import h5py
+  num_seqs = 11
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    hdf_fn = "%s/no_seq_tags.hdf" % tmp_dir
+    shutil.copy(generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs}), hdf_fn)
+    with h5py.File(hdf_fn, "a") as f:
+      del f["seqTags"]
+    cache_dir = "%s/cache" % tmp_dir
+    hdf_ref = HDFDataset([hdf_fn], seq_ordering="sorted")
+    hdf_ref.init_seq_order(epoch=1)
+    for _ in range(2):  # first writes the cache, second reads it
+      hdf = HDFDataset([hdf_fn], seq_ordering="sorted", seq_meta_cache=cache_dir)
+      assert_equal(len(os.listdir(cache_dir)), 1)
+      hdf.init_seq_order(epoch=1)
+      assert_equal(
+        [hdf.get_estimated_seq_length(i) for i in range(num_seqs)],
+        [hdf_ref.get_estimated_seq_length(i) for i in range(num_seqs)])
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_HDFDataset_use_memmap():
+  num_seqs = 11
+  hdf_fn = generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  hdf_ref = HDFDataset([hdf_fn], partition_epoch=2)
+  hdf = HDFDataset([hdf_fn], partition_epoch=2, use_memmap=True)
+  assert_equal(set(hdf._file_memmaps[0].keys()), {"data", "classes"})
+  for epoch in [1, 2]:
+    hdf_ref.init_seq_order(epoch=epoch)
+    hdf.init_seq_order(epoch=epoch)
+    hdf_ref.load_seqs(0, hdf_ref.num_seqs)
+    hdf.load_seqs(0, hdf.num_seqs)
+    for seq_idx in range(hdf.num_seqs):
+      for key in ["data", "classes"]:
+        data = hdf.get_data(seq_idx, key)
+        assert isinstance(data, numpy.memmap)
+        assert_equal(data.dtype, hdf_ref.get_data(seq_idx, key).dtype)
+        assert_equal(data.tolist(), hdf_ref.get_data(seq_idx, key).tolist())
+
+
+def test_HDFDataset_use_memmap_chunked():
+  # SimpleHDFWriter uses resizable (chunked) datasets, thus we will fall back to h5py.
+  fn = get_test_tmp_file(suffix=".hdf")
+  os.remove(fn)  # SimpleHDFWriter expects that the file does not exist
+  writer = SimpleHDFWriter(filename=fn, dim=3, labels=None)
+  writer.insert_batch(
+    inputs=numpy.random.normal(size=(2, 5, 3)).astype("float32"), seq_len=[5, 4], seq_tag=["seq-0", "seq-1"])
+  writer.close()
+  hdf = HDFDataset([fn], use_memmap=True)
+  assert_equal(hdf._file_memmaps[0], {})
+  hdf.init_seq_order(epoch=1)
+  hdf.load_seqs(0, 2)
+  assert_equal(hdf.get_data(1, "data").shape, (4, 3))
+
+
 def test_SimpleHDFWriter():
   fn = get_test_tmp_file(suffix=".hdf")
   os.remove(fn)  # SimpleHDFWriter expects that the file does not exist
@@ -433,6 +527,43 @@ def test_SimpleHDFWriter_extend_existing_file():
     assert reader.seq_lens[i]["data"] == seq_len
 
 
+def test_SimpleHDFWriter_buffered_extra():
+  rnd = numpy.random.RandomState(42)
+  n_dim = 3
+  seq_lens = [[5, 2, 4], [3], [7, 1]]
+  batches = [
+    (rnd.normal(size=(len(lens), max(lens), n_dim)).astype("float32"), rnd.randint(0, 10, size=(len(lens), 2)))
+    for lens in seq_lens]
+  fns = []
+  for buffer_max_bytes, background_write in [(0, False), (100, True), (10 ** 9, True)]:
+    fn = get_test_tmp_file(suffix=".hdf")
+    os.remove(fn)  # SimpleHDFWriter expects that the file does not exist
+    writer = SimpleHDFWriter(
+      filename=fn, dim=n_dim, labels=None, buffer_max_bytes=buffer_max_bytes, background_write=background_write)
+    offset = 0
+    for lens, (inputs, classes) in zip(seq_lens, batches):
+      writer.insert_batch(
+        inputs=inputs, seq_len=lens, seq_tag=["seq-%i" % (offset + i) for i in range(len(lens))],
+        extra={"classes": classes})
+      offset += len(lens)
+    writer.close()
+    fns.append(fn)
+
+  for fn in fns:
+    dataset = HDFDataset(files=[fn])
+    reader = DatasetTestReader(dataset=dataset)
+    reader.read_all()
+    assert_equal(reader.seq_tags, ["seq-%i" % i for i in range(6)])
+    i = 0
+    for lens, (inputs, classes) in zip(seq_lens, batches):
+      for b, seq_len in enumerate(lens):
+        assert_equal(reader.seq_lens[i]["data"], seq_len)
+        assert_equal(reader.seq_lens[i]["classes"], 2)
+        numpy.testing.assert_array_equal(reader.data["data"][i], inputs[b, :seq_len])
+        assert_equal(reader.data["classes"][i].tolist(), classes[b].tolist())
+        i += 1
+
+
 @unittest.skip("unfinished...")
 def test_SimpleHDFWriter_swmr():
   fn = get_test_tmp_file(suffix=".hdf")
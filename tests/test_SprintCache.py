@@ -0,0 +1,170 @@
+
+from __future__ import print_function
+
+import _setup_test_env  # noqa
+import os
+import sys
+import zlib
+import tempfile
+import unittest
+from struct import pack
+import numpy
+from nose.tools import assert_equal, assert_is_instance
+from returnn.sprint.cache import FileArchive, FileArchiveBundle
+from returnn.util import better_exchook
+
+
+def _write_archive(entries):
+  """
+  :param dict[str,(bytes,bool)] entries: name -> (content, compress)
+  :return: filename
+  :rtype: str
+  """
+  fd, filename = tempfile.mkstemp(suffix=".cache")
+  table = []
+  with os.fdopen(fd, "wb") as f:
+    f.write(FileArchive.SprintCacheHeader.encode("ascii"))
+    f.write(pack("b", 1))
+    for name, (content, compress) in entries.items():
+      pos = f.tell()
+      stored = zlib.compress(content) if compress else content
+      f.write(pack("III", len(content), len(stored) if compress else 0, 0))
+      f.write(stored)
+      table.append((name, pos, len(content), len(stored) if compress else 0))
+    table_pos = f.tell()
+    f.write(pack("i", len(table)))
+    for name, pos, size, comp in table:
+      f.write(pack("i", len(name)) + name.encode("ascii") + pack("qii", pos, size, comp))
+    f.write(pack("q", table_pos))
+  return filename
+
+
+def _feat_entry(times, feats):
+  """
+  :param numpy.ndarray times: (T,2)
+  :param list[numpy.ndarray] feats:
+  :rtype: bytes
+  """
+  typ = b"vector-f32"
+  res = pack("I", len(typ)) + typ + pack("I", len(feats))
+  for t, f in zip(times, feats):
+    res += pack("I", len(f)) + f.astype("float32").tobytes() + numpy.array(t, dtype="float64").tobytes()
+  return res
+
+
+def _align_entry(runs, num_frames):
+  """
+  :param list[(int,list[int])] runs: RLE runs (n, values), see FileArchive._decode_align
+  :param int num_frames:
+  :rtype: bytes
+  """
+  typ = b"flow-alignment"
+  res = pack("I", len(typ)) + typ + pack("i", 0) + b"ALIGNRLE" + pack("I", num_frames)
+  for n, values in runs:
+    res += pack("b", n) + b"".join(pack("i", v) for v in values)
+  return res
+
+
+def test_FileArchive_feat():
+  rnd = numpy.random.RandomState(42)
+  times = numpy.array([[10. * i, 10. * i + 25.] for i in range(7)])
+  feats = [rnd.normal(size=(5,)).astype("float32") for _ in range(7)]
+  fn = _write_archive({"seq-0": (_feat_entry(times, feats), False), "seq-1": (_feat_entry(times, feats), True)})
+  try:
+    archive = FileArchive(fn)
+    for name in ["seq-0", "seq-1"]:
+      times_, feats_ = archive.read_numpy(name, "feat")
+      assert_equal(feats_.dtype, numpy.float32)
+      assert_equal(feats_.shape, (7, 5))
+      assert_equal(times_.tolist(), times.tolist())
+      assert_equal(feats_.tolist(), numpy.array(feats).tolist())
+      times_, feats_ = archive.read(name, "feat")
+      assert_is_instance(feats_, list)
+      assert_equal([t.tolist() for t in times_], times.tolist())
+      assert_equal([f.tolist() for f in feats_], [f.tolist() for f in feats])
+  finally:
+    os.remove(fn)
+
+
+def test_FileArchive_feat_varying_dim():
+  times = numpy.array([[0., 10.], [10., 20.]])
+  feats = [numpy.array([1., 2.]), numpy.array([3., 4., 5.])]
+  fn = _write_archive({"seq-0": (_feat_entry(times, feats), False)})
+  try:
+    archive = FileArchive(fn)
+    times_, feats_ = archive.read("seq-0", "feat")
+    assert_equal([f.tolist() for f in feats_], [f.tolist() for f in feats])
+  finally:
+    os.remove(fn)
+
+
+def test_FileArchive_align():
+  # 3 allophones. mix >= 3 means state > 0, i.e. mix = allo + state * 2 ** 26.
+  runs = [(2, [0, 1]), (-3, [2 + (1 << 26)]), (0, [10]), (1, [1 + 2 * (1 << 26)]), (-2, [0])]
+  expected = [
+    (0, 0, 0), (1, 1, 0), (2, 2, 1), (3, 2, 1), (4, 2, 1),
+    (10, 1, 2), (11, 0, 0), (12, 0, 0)]
+  fn = _write_archive({"seq-0": (_align_entry(runs, len(expected)), False)})
+  allo_fn = fn + ".allophones"
+  with open(allo_fn, "w") as f:
+    f.write("# comment\na\nb\nc\n")
+  try:
+    bundle = FileArchiveBundle()
+    bundle.add_archive(fn)
+    bundle.set_allophones(allo_fn)
+    align = bundle.read_numpy("seq-0", "align")
+    assert_equal(align.dtype, numpy.int32)
+    assert_equal(align.tolist(), [list(frame) for frame in expected])
+    assert_equal(bundle.read("seq-0", "align"), expected)
+  finally:
+    os.remove(fn)
+    os.remove(allo_fn)
+
+
+def test_FileArchiveBundle_index_cache():
+  import shutil
+  tmp_dir = tempfile.mkdtemp()
+  archive_fns = []
+  try:
+    times = numpy.array([[0., 10.], [10., 20.]])
+    for i in range(5):
+      feats = [numpy.array([i, j], dtype="float32") for j in range(2)]
+      archive_fns.append(_write_archive({"seq-%i-%i" % (i, j): (_feat_entry(times, feats), False) for j in range(3)}))
+    bundle_fn = "%s/feats.bundle" % tmp_dir
+    with open(bundle_fn, "w") as f:
+      f.write("".join("%s\n" % fn for fn in archive_fns))
+    for _ in range(2):  # first writes the index cache, second reads it
+      bundle = FileArchiveBundle(bundle_fn, num_threads=3, index_cache="%s/cache" % tmp_dir)
+      assert_equal(len(os.listdir("%s/cache" % tmp_dir)), 1)
+      assert_equal(sorted(bundle.archives.keys()), sorted(archive_fns))
+      assert_equal(len(bundle.file_list()), 5 * 3)
+      for i in range(5):
+        times_, feats_ = bundle.read_numpy("seq-%i-2" % i, "feat")
+        assert_equal(feats_.tolist(), [[i, 0], [i, 1]])
+  finally:
+    shutil.rmtree(tmp_dir)
+    for fn in archive_fns:
+      os.remove(fn)
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
@@ -154,6 +154,47 @@ def test_window():
     dataset2._exit_handler()
 
 
+def test_shared_mem_ring_buffer():
+  input_dim = 2
+  output_dim = 3
+  num_seqs = 20
+  dataset_kwargs = dict(
+    sprintTrainerExecPath=[sys.executable, sprintExecPath],
+    sprintConfigStr=" ".join([
+      "--*.feature-dimension=%i" % input_dim,
+      "--*.trainer-output-dimension=%i" % output_dim,
+      "--*.crnn-dataset=DummyDataset(input_dim=%i,output_dim=%i,num_seqs=%i,seq_len=10)" % (
+        input_dim, output_dim, num_seqs)]))
+  dataset1 = ExternSprintDataset(**dataset_kwargs)
+  # Small buffer, such that the child needs to wrap around and to wait for us.
+  dataset2 = ExternSprintDataset(shared_mem_ring_buffer_size=1024, **dataset_kwargs)
+  try:
+    for epoch in [1, 2]:
+      dataset1.init_seq_order(epoch=epoch)
+      dataset2.init_seq_order(epoch=epoch)
+      seq_idx = 0
+      while dataset1.is_less_than_num_seqs(seq_idx):
+        assert dataset2.is_less_than_num_seqs(seq_idx)
+        dataset1.load_seqs(seq_idx, seq_idx + 1)
+        dataset2.load_seqs(seq_idx, seq_idx + 1)
+        assert_equal(dataset1.get_tag(seq_idx), dataset2.get_tag(seq_idx))
+        for key in dataset1.get_data_keys():
+          data1 = dataset1.get_data(seq_idx, key)
+          data2 = dataset2.get_data(seq_idx, key)
+          assert_equal(data1.dtype, data2.dtype)
+          assert_equal(data1.tolist(), data2.tolist())
+        seq_idx += 1
+      assert_equal(seq_idx, num_seqs)
+      assert not dataset2.is_less_than_num_seqs(seq_idx)
+    assert dataset2.shared_mem_ring_buffer
+    # All seqs went through the shared memory, none through the pickle fallback.
+    assert_equal(dataset2.shared_mem_ring_buffer_num_seqs, 2 * num_seqs)
+    assert_equal(dataset1.shared_mem_ring_buffer_num_seqs, 0)
+  finally:
+    dataset1._exit_handler()
+    dataset2._exit_handler()
+
+
 def test_py2_client():
   # like test_read_all
   config = Config()
@@ -132,6 +132,86 @@ def test_FeedDictDataProvider():
   assert_equal(classes.tolist(), [[1, 2, 0, 1, 2]])
 
 
+def test_FeedDictDataProvider_workers():
+  from returnn.datasets.hdf import HDFDataset
+  from returnn.tf.data_pipeline import FeedDictDataProvider, FeedDictDataProviderWorkers
+  from test_HDFDataset import generate_hdf_from_other
+  num_seqs = 11
+  hdf_fn = generate_hdf_from_other(
+    {"class": "DummyDataset", "input_dim": 2, "output_dim": 3, "num_seqs": num_seqs, "seq_len": 7})
+  dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0, seq_ordering="random")
+
+  extern_data = ExternData()
+  extern_data.init_from_dataset(dataset)
+
+  def get_all_batches(epoch, num_workers=0, workers=None):
+    """
+    :param int epoch:
+    :param int num_workers:
+    :param FeedDictDataProviderWorkers|None workers:
+    :rtype: list[dict[str,numpy.ndarray]]
+    """
+    dataset.init_seq_order(epoch=epoch)
+    batches = dataset.generate_batches(recurrent_net=True, batch_size=20, max_seqs=3)
+    data_provider = FeedDictDataProvider(
+      tf_session=session, extern_data=extern_data,
+      data_keys=["data", "classes"],
+      dataset=dataset, batches=batches, num_workers=num_workers, workers=workers)
+    data_provider.start_threads(session=session)
+    res = []
+    while data_provider.have_more_data(session=session):
+      feed_dict, meta = data_provider.get_feed_dict()
+      res.append({
+        "data": numpy.array(feed_dict[extern_data.data["data"].placeholder]),
+        "classes": numpy.array(feed_dict[extern_data.data["classes"].placeholder]),
+        "seq_idx": list(meta["seq_idx"])})
+    assert data_provider.have_reached_end()
+    data_provider.stop_threads()
+    return res
+
+  def check_batches(ref_batches, worker_batches):
+    """
+    :param list[dict[str,numpy.ndarray]] ref_batches:
+    :param list[dict[str,numpy.ndarray]] worker_batches:
+    """
+    assert_equal(len(ref_batches), len(worker_batches))
+    assert_equal(sum([b["seq_idx"] for b in worker_batches], []), list(range(num_seqs)))
+    for ref_batch, worker_batch in zip(ref_batches, worker_batches):
+      assert_equal(ref_batch["seq_idx"], worker_batch["seq_idx"])
+      numpy.testing.assert_array_equal(ref_batch["data"], worker_batch["data"])
+      numpy.testing.assert_array_equal(ref_batch["classes"], worker_batch["classes"])
+
+  check_batches(get_all_batches(epoch=1), get_all_batches(epoch=1, num_workers=2))
+  # Workers kept over epochs, like in the engine. They must follow the seq order of each epoch.
+  workers = FeedDictDataProviderWorkers(
+    dataset=dataset, extern_data=extern_data, data_keys=["data", "classes"], num_workers=2)
+  try:
+    for epoch in [1, 2]:
+      check_batches(get_all_batches(epoch=epoch), get_all_batches(epoch=epoch, workers=workers))
+  finally:
+    workers.stop()
+
+
+def test_FeedDictDataProvider_workers_sequential_dataset():
+  from returnn.datasets.generating import DummyDataset
+  from returnn.tf.data_pipeline import FeedDictDataProvider
+  dataset = DummyDataset(input_dim=2, output_dim=3, num_seqs=11, seq_len=7)
+  extern_data = ExternData()
+  extern_data.init_from_dataset(dataset)
+  dataset.init_seq_order(epoch=1)
+  batches = dataset.generate_batches(recurrent_net=True, batch_size=20, max_seqs=3)
+  try:
+    FeedDictDataProvider(
+      tf_session=session, extern_data=extern_data,
+      data_keys=["data", "classes"],
+      dataset=dataset, batches=batches, num_workers=2)
+  except AssertionError as exc:
+    print("Expected exception: %s" % exc)
+    assert "random-access" in str(exc)
+  else:
+    assert False, "expected AssertionError"
+
+
 def test_DatasetDataProvider():
   from returnn.datasets.generating import DummyDataset
   seq_len = 5
@@ -199,6 +279,100 @@ def test_DatasetDataProvider():
     data_provider.stop_threads()
 
 
+def test_DatasetDataProvider_batches():
+  from returnn.datasets.generating import DummyDataset
+  seq_len = 5
+  n_data_dim = 2
+  n_classes_dim = 3
+  num_seqs = 5
+  dataset = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=num_seqs, seq_len=seq_len)
+  dataset.init_seq_order(epoch=1)
+
+  n_batch = 2
+  config = Config({
+    "dataset_pipeline": "batches",
+    "dataset_pipeline_num_workers": 2,
+  })
+
+  with make_scope() as session:
+    extern_data = ExternData()
+    extern_data.init_from_dataset(dataset, auto_create_placeholders=False)
+
+    from returnn.tf.data_pipeline import DatasetDataProvider
+    data_provider = DatasetDataProvider(
+      extern_data=extern_data, config=config, datasets={"train": dataset})
+    assert data_provider.use_batches
+    assert "seq_idx" in extern_data.data and "seq_tag" in extern_data.data
+
+    batches = dataset.generate_batches(recurrent_net=True, batch_size=seq_len * n_batch, max_seqs=n_batch)
+    data_provider.set_current_dataset(dataset_name="train", dataset=dataset, batches=batches)
+    data_provider.start_threads(session=session)
+
+    seq_idx_list = []
+    step = 0
+    while True:
+      try:
+        data, data_size, classes, seq_idx, seq_tag = session.run([
+          extern_data.data["data"].placeholder,
+          extern_data.data["data"].get_sequence_lengths(),
+          extern_data.data["classes"].placeholder,
+          extern_data.data["seq_idx"].placeholder,
+          extern_data.data["seq_tag"].placeholder])
+      except tf.errors.OutOfRangeError as exc:
+        print("Got out-of-range (as expected):", exc.message)
+        break
+      print("step %i, seq_idx %r, seq_tag %r" % (step, seq_idx, seq_tag))
+      assert_equal(data.shape, (len(seq_idx), seq_len, n_data_dim))
+      assert_equal(classes.shape, (len(seq_idx), seq_len))
+      assert_equal(list(data_size), [seq_len] * len(seq_idx))
+      if step == 0:
+        numpy.testing.assert_almost_equal(list(data[0, 0]), [-0.5, -0.4])
+        assert_equal(classes[0].tolist(), [1, 2, 0, 1, 2])
+      assert_equal([tag.decode("utf8") for tag in seq_tag], ["seq-%i" % i for i in seq_idx])
+      seq_idx_list.extend(seq_idx.tolist())
+      step += 1
+      if step > 10 * num_seqs:
+        break  # should not get here...
+
+    print("Finished after %i steps." % step)
+    assert step == (num_seqs - 1) // n_batch + 1
+    assert_equal(seq_idx_list, list(range(num_seqs)))
+    assert_equal(data_provider.get_complete_frac(), 1.)
+
+    data_provider.stop_threads()
+
+
+def test_DatasetDataProvider_batches_slice():
+  from returnn.datasets.generating import DummyDataset
+  from returnn.tf.data_pipeline import DatasetDataProvider
+  seq_len = 5
+  num_seqs = 5
+  n_batch = 2
+  dataset = DummyDataset(input_dim=2, output_dim=3, num_seqs=num_seqs, seq_len=seq_len)
+  dataset.init_seq_order(epoch=1)
+  config = Config({"dataset_pipeline": "batches"})
+
+  with make_scope() as session:
+    extern_data = ExternData()
+    extern_data.init_from_dataset(dataset, auto_create_placeholders=False)
+    data_provider = DatasetDataProvider(extern_data=extern_data, config=config, datasets={"train": dataset})
+
+    # Batches [0, 1], [2, 3], [4], where we select the 1st and 3rd, like horovod rank 0 of 2.
+    batches = dataset.generate_batches(recurrent_net=True, batch_size=seq_len * n_batch, max_seqs=n_batch)
+    data_provider.set_current_dataset(
+      dataset_name="train", dataset=dataset, batches=batches, batch_slice=slice(0, None, 2))
+    data_provider.start_threads(session=session)
+    seq_idx_list = []
+    while True:
+      try:
+        seq_idx = session.run(extern_data.data["seq_idx"].placeholder)
+      except tf.errors.OutOfRangeError:
+        break
+      seq_idx_list.append(seq_idx.tolist())
+    assert_equal(seq_idx_list, [[0, 1], [4]])
+    data_provider.stop_threads()
+
+
 def test_engine_train():
   from returnn.datasets.generating import DummyDataset
   seq_len = 5
@@ -226,6 +400,124 @@ def test_engine_train():
   engine.finalize()
 
 
+def test_engine_train_batch_bucket_boundaries():
+  from returnn.datasets.generating import DummyDataset
+  from returnn.datasets.hdf import HDFDataset
+  from test_HDFDataset import generate_hdf_from_other
+  dataset_opts = {"class": "DummyDataset", "input_dim": 2, "output_dim": 3, "num_seqs": 11, "seq_len": 5}
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "num_outputs": 3,
+    "num_inputs": 2,
+    "network": {
+      "rnn": {"class": "rec", "unit": "standardlstm", "n_out": 3},  # make it recurrent
+      "output": {"class": "softmax", "loss": "ce", "from": "rnn"}},
+    "batch_size": 15,
+    "batch_bucket_boundaries": [4],
+    "start_epoch": 1,
+    "num_epochs": 2
+  })
+  _cleanup_old_models(config)
+
+  # DummyDataset is sequential (CachedDataset2), it cannot load the seqs in the bucketed order.
+  sequential_data = DummyDataset(
+    input_dim=dataset_opts["input_dim"], output_dim=dataset_opts["output_dim"],
+    num_seqs=dataset_opts["num_seqs"], seq_len=dataset_opts["seq_len"])
+  engine = Engine(config=config)
+  try:
+    engine.init_train_from_config(config=config, train_data=sequential_data)
+  except AssertionError as exc:
+    print("Expected exception: %s" % exc)
+    assert "batch_bucket_boundaries" in str(exc)
+  else:
+    assert False, "expected AssertionError"
+  engine.finalize()
+
+  train_data = HDFDataset(files=[generate_hdf_from_other(dataset_opts)])
+  train_data.initialize()
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=train_data)
+  engine.train()
+  engine.finalize()
+
+
+def test_engine_train_step_time_stats():
+  from returnn.datasets.generating import DummyDataset
+  import json
+  seq_len = 5
+  n_data_dim = 2
+  n_classes_dim = 3
+  train_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=4, seq_len=seq_len)
+  train_data.init_seq_order(epoch=1)
+  stats_fn = "%s/step_time_stats.jsonl" % _get_tmp_dir()
+  if os.path.exists(stats_fn):
+    os.remove(stats_fn)
+
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {"output": {"class": "softmax", "loss": "ce"}},
+    "batch_size": 10,
+    "max_seqs": 2,
+    "start_epoch": 1,
+    "num_epochs": 1,
+    "step_time_stats_file": stats_fn,
+  })
+  _cleanup_old_models(config)
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=train_data, dev_data=None, eval_data=None)
+  engine.train()
+  engine.finalize()
+
+  with open(stats_fn) as f:
+    lines = [json.loads(line) for line in f.read().splitlines()]
+  assert_equal(len(lines), 1)
+  info = lines[0]
+  assert_equal(info["train"], True)
+  assert_equal(info["num_steps"], 2)
+  for phase in ["data_wait", "batch_build", "session_run", "step"]:
+    assert phase in info["step_times"], "missing %r in %r" % (phase, info)
+    assert 0 <= info["step_times"][phase]["p50"] <= info["step_times"][phase]["max"]
+  os.remove(stats_fn)
+
+
+def test_engine_train_save_model_async():
+  from returnn.datasets.generating import DummyDataset
+  seq_len = 5
+  n_data_dim = 2
+  n_classes_dim = 3
+  train_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=4, seq_len=seq_len)
+  train_data.init_seq_order(epoch=1)
+
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {"output": {"class": "softmax", "loss": "ce"}},
+    "start_epoch": 1,
+    "num_epochs": 2,
+    "save_model_async": True,
+  })
+  _cleanup_old_models(config)
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=train_data, dev_data=None, eval_data=None)
+  engine.train()
+  params = engine.network.get_params_list()
+  param_values = {param.op.name: value for (param, value) in zip(params, engine.tf_session.run(params))}
+  model_filename = engine.get_epoch_model_filename(epoch=2)
+  engine.finalize()  # waits for the pending save
+
+  for epoch in [1, 2]:
+    assert os.path.exists(engine.get_epoch_model_filename(epoch=epoch) + ".meta")
+  reader = tf_compat.v1.train.NewCheckpointReader(model_filename)
+  for name, value in param_values.items():
+    numpy.testing.assert_array_equal(reader.get_tensor(name), value)
+
+
 def test_engine_train_newbob():
   from returnn.datasets.generating import DummyDataset
   seq_len = 5
@@ -283,6 +575,38 @@ def test_engine_train_new_dataset_pipeline():
   engine.finalize()
 
 
+def test_engine_train_dataset_pipeline_batches():
+  from returnn.datasets.generating import DummyDataset
+  seq_len = 5
+  n_data_dim = 2
+  n_classes_dim = 3
+  train_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=5, seq_len=seq_len)
+  train_data.init_seq_order(epoch=1)
+  cv_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=3, seq_len=seq_len)
+  cv_data.init_seq_order(epoch=1)
+
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {"output": {"class": "softmax", "loss": "ce"}},
+    "start_epoch": 1,
+    "num_epochs": 2,
+    "batch_size": 10,
+    "max_seqs": 2,
+    "dataset_pipeline": "batches",
+    "dataset_pipeline_prefetch": 2,
+    "dataset_pipeline_num_workers": 2,
+  })
+  _cleanup_old_models(config)
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=train_data, dev_data=cv_data, eval_data=None)
+  assert engine.dataset_provider and engine.dataset_provider.use_batches
+  engine.train()
+  engine.finalize()
+
+
 def test_engine_train_uneven_batches():
   rnd = numpy.random.RandomState(42)
   from returnn.datasets.generating import StaticDataset
@@ -638,6 +962,113 @@ def test_engine_forward_single():
   engine.finalize()
 
 
+def test_engine_forward_to_hdf_graph_cache():
+  from returnn.tf.graph_cache import CachedGraphNetwork
+  from returnn.datasets.generating import DummyDataset
+  from subprocess import check_output, STDOUT
+  import sys
+  import h5py
+  returnn_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  n_data_dim = 2
+  n_classes_dim = 3
+  tmp_dir = _get_tmp_dir()
+  dataset_dict = {"class": "DummyDataset", "input_dim": n_data_dim, "output_dim": n_classes_dim, "num_seqs": 2,
+                  "seq_len": 5}
+  config_dict = {
+    "model": "%s/model" % tmp_dir,
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {
+      "lstm": {"class": "rec", "unit": "standardlstm", "n_out": 4},
+      "output": {"class": "softmax", "loss": "ce", "from": "lstm"}},
+    "graph_cache_dir": "%s/graph-cache" % tmp_dir,
+    "num_epochs": 1,
+  }
+  config = Config()
+  config.update(config_dict)
+  dataset = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=2, seq_len=5)
+  dataset.init_seq_order(epoch=1)
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=dataset)
+  engine.train()
+  engine.finalize()
+
+  # The graph cache is only useful across processes, thus test it like that.
+  config_dict.update({"task": "forward", "load_epoch": 1, "eval": dataset_dict, "log_verbosity": 4})
+  config_filename = "%s/forward.config" % tmp_dir
+  with open(config_filename, "w") as f:
+    f.write("#!rnn.py\n")
+    for key, value in sorted(config_dict.items()):
+      f.write("%s = %r\n" % (key, value))
+  outputs = []
+  for i in range(2):
+    output_file = "%s/forward%i.hdf" % (tmp_dir, i)
+    out = check_output(
+      [sys.executable, "%s/rnn.py" % returnn_dir, config_filename, "++output_file", output_file],
+      stderr=STDOUT).decode("utf8")
+    print(out)
+    if i == 0:
+      assert "Stored graph in cache" in out
+    else:
+      assert "Load graph from cache" in out
+    with h5py.File(output_file, "r") as f:
+      outputs.append(f["inputs"][...])
+  assert_equal(outputs[0].shape, (2 * 5, n_classes_dim))
+  numpy.testing.assert_array_equal(outputs[0], outputs[1])
+
+  # Also in this process, and check that the engine would not reinit the network.
+  config = Config()
+  config.update(config_dict)
+  engine = Engine(config=config)
+  engine.init_network_from_config(config=config)
+  assert isinstance(engine.network, CachedGraphNetwork)
+  assert not engine.need_init_new_network(config_dict["network"])
+  dataset.init_seq_order(epoch=1)
+  output = engine.forward_single(dataset=dataset, seq_idx=0)
+  engine.finalize()
+  numpy.testing.assert_almost_equal(output, outputs[0][:5], decimal=5)
+
+
+def test_graph_cache_no_py_func():
+  from returnn.tf.graph_cache import GraphCache
+  from returnn.tf.network import TFNetwork
+  with make_scope():
+    config = Config({"extern_data": {"data": {"dim": 3}}})
+    net = TFNetwork(config=config, train_flag=False)
+    net.construct_from_dict({"output": {"class": "linear", "activation": None, "n_out": 2, "from": "data"}})
+    cache = GraphCache(cache_dir=_get_tmp_dir())
+    key = cache.get_key(
+      config=config, net_dict={}, train_flag=False, eval_flag=False, search_flag=False, rnd_seed=0,
+      extern_data=net.extern_data)
+    tf_compat.v1.py_func(lambda x: x, [net.get_default_output_layer().output.placeholder], tf.float32)
+    assert not cache.save(key, network=net)
+    assert not cache.has(key)
+
+
+def test_graph_cache_key_config_override():
+  from returnn.tf.graph_cache import GraphCache
+  config = Config({"extern_data": {"data": {"dim": 3}}})
+  extern_data = ExternData()
+  extern_data.init_from_config(config=config, auto_create_placeholders=False)
+
+  def get_key():
+    """
+    :rtype: str
+    """
+    return GraphCache.get_key(
+      config=config, net_dict={}, train_flag=False, eval_flag=False, search_flag=False, rnd_seed=0,
+      extern_data=extern_data)
+
+  key_default = get_key()
+  config.add_line("device", "gpu")  # like a text config or a "++device gpu" command line override
+  key_gpu = get_key()
+  config.add_line("device", "cpu")
+  key_cpu = get_key()
+  assert_equal(len({key_default, key_gpu, key_cpu}), 3)
+  config.add_line("debug_add_check_numerics_ops", "True")
+  assert key_cpu != get_key()
+
+
 def test_engine_forward_to_hdf():
   from returnn.datasets.generating import DummyDataset
   import tempfile
@@ -688,6 +1119,58 @@ def test_engine_forward_to_hdf():
   os.remove(output_file)
 
 
+def test_engine_forward_to_hdf_sharded():
+  from returnn.datasets.generating import DummyDataset
+  from returnn.datasets.hdf import HDFDataset, merge_hdf_files
+  import tempfile
+  n_data_dim = 2
+  n_classes_dim = 3
+  num_seqs = 20
+  dataset = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=num_seqs, seq_len=5)
+  dataset.init_seq_order(epoch=1)
+
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {"output": {"class": "softmax", "loss": "ce"}},
+  })
+  _cleanup_old_models(config)
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=dataset, dev_data=None, eval_data=None)
+
+  output_file = tempfile.mktemp(suffix=".hdf", prefix="nose-tf-forward")
+  engine.forward_to_hdf(data=dataset, output_file=output_file, batch_size=5)
+  num_shards = 3
+  shard_files = []
+  for shard_index in range(num_shards):
+    config.set("forward_num_shards", num_shards)
+    config.set("forward_shard_index", shard_index)
+    shard_files.append(tempfile.mktemp(suffix=".hdf", prefix="nose-tf-forward-shard%i" % shard_index))
+    dataset.init_seq_order(epoch=1)  # like a new process
+    engine.forward_to_hdf(data=dataset, output_file=shard_files[-1], batch_size=5)
+  engine.finalize()
+  shard_num_seqs = [HDFDataset(files=[fn]).num_seqs for fn in shard_files]
+  assert_equal(sum(shard_num_seqs), num_seqs)
+  assert all([0 < n < num_seqs for n in shard_num_seqs])
+
+  merged_file = tempfile.mktemp(suffix=".hdf", prefix="nose-tf-forward-merged")
+  merge_hdf_files(shard_files, merged_file)
+  datasets = {}
+  for name, fn in [("single", output_file), ("merged", merged_file)]:
+    ds = HDFDataset(files=[fn])
+    ds.init_seq_order(epoch=1)
+    ds.load_seqs(0, num_seqs)
+    datasets[name] = {ds.get_tag(i): ds.get_data(i, "data") for i in range(num_seqs)}
+  assert_equal(sorted(datasets["single"].keys()), sorted(datasets["merged"].keys()))
+  for tag, data in datasets["single"].items():
+    numpy.testing.assert_allclose(data, datasets["merged"][tag], rtol=1e-5)
+
+  for fn in [output_file, merged_file] + shard_files:
+    os.remove(fn)
+
+
 def test_engine_rec_subnet_count():
   from returnn.datasets.generating import DummyDataset
   seq_len = 5
@@ -871,6 +1354,166 @@ def test_engine_search():
   check_engine_search()
 
 
+def check_engine_search_output_file_sorted(use_meta_dataset=False):
+  """
+  :param bool use_meta_dataset: MetaDataset does not have corpus seq idx, thus the seq tags are used for the order
+  """
+  from returnn.datasets.hdf import SimpleHDFWriter, HDFDataset
+  from returnn.datasets.meta import MetaDataset
+  n_data_dim = 2
+  n_classes_dim = 7
+  num_seqs = 7
+  hdf_fn = _get_tmp_file(suffix=".hdf")
+  os.remove(hdf_fn)  # SimpleHDFWriter expects that it does not exist
+  writer = SimpleHDFWriter(filename=hdf_fn, dim=n_data_dim, extra_type={"classes": (n_classes_dim, 1, "int32")})
+  rnd = numpy.random.RandomState(42)
+  seq_tags = ["seq-%i" % i for i in range(num_seqs)]
+  for seq_idx in range(num_seqs):
+    seq_len = rnd.randint(1, 10)
+    writer.insert_batch(
+      inputs=rnd.normal(size=(1, seq_len, n_data_dim)).astype("float32"), seq_len=[seq_len],
+      seq_tag=[seq_tags[seq_idx]], extra={"classes": rnd.randint(1, n_classes_dim, size=(1, seq_len))})
+  writer.close()
+  if use_meta_dataset:
+    dataset = MetaDataset(
+      datasets={"hdf": {"class": "HDFDataset", "files": [hdf_fn]}},
+      data_map={"data": ("hdf", "data"), "classes": ("hdf", "classes")})
+    assert not dataset.have_corpus_seq_idx()
+  else:
+    dataset = HDFDataset(files=[hdf_fn])
+  dataset.labels["classes"] = ["c%i" % i for i in range(n_classes_dim)]
+
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "batch_size": 20,
+    "max_seqs": 2,
+    "num_outputs": {"data": [n_data_dim, 2], "classes": [n_classes_dim, 1]},
+    "network": {
+      "output": {
+        "class": "rec", "from": [], "max_seq_len": 10, "target": "classes",
+        "unit": {
+          "prob": {"class": "softmax", "from": ["prev:output"], "loss": "ce", "target": "classes"},
+          "output": {"class": "choice", "beam_size": 3, "from": ["prob"], "target": "classes", "initial_output": 0},
+          "end": {"class": "compare", "from": ["output"], "value": 0}
+        }
+      },
+      "decision": {"class": "decide", "from": ["output"], "loss": "edit_distance"}
+    }
+  })
+  _cleanup_old_models(config)
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=dataset)
+  output_file = _get_tmp_file(suffix=".py")
+  os.remove(output_file)
+  engine.search(dataset=dataset, output_file=output_file, output_file_format="py")
+  assert_equal(dataset.seq_ordering, "sorted_reverse")
+  assert not os.path.exists(output_file + ".unsorted")
+  res = eval(open(output_file).read())
+  assert_equal(list(res.keys()), seq_tags)  # corpus order
+  for seq_tag, hyps in res.items():
+    assert_equal(len(hyps), 3)
+  engine.finalize()
+
+
+def test_engine_search_output_file_sorted():
+  check_engine_search_output_file_sorted()
+
+
+def test_engine_search_output_file_sorted_by_seq_tags():
+  check_engine_search_output_file_sorted(use_meta_dataset=True)
+
+
+def test_engine_search_batch_compaction():
+  from returnn.datasets.generating import StaticDataset
+  n_data_dim = 2
+  n_classes_dim = 7
+  rnd = numpy.random.RandomState(42)
+  seqs = []
+  for _ in range(9):
+    seq_len = rnd.randint(1, 10)
+    seqs.append({
+      "data": rnd.normal(size=(seq_len, n_data_dim)).astype("float32"),
+      "classes": rnd.randint(1, n_classes_dim, size=(seq_len,)).astype("int32")})
+  dataset = StaticDataset(data=seqs, output_dim={"data": [n_data_dim, 2], "classes": [n_classes_dim, 1]})
+  dataset.labels["classes"] = ["c%i" % i for i in range(n_classes_dim)]
+
+  def search(search_batch_compaction):
+    """
+    :param float search_batch_compaction:
+    :return: search output, number of compaction passes
+    :rtype: (dict[str,list[(float,str)]], int)
+    """
+    config = Config()
+    config.update({
+      "model": "%s/model" % _get_tmp_dir(),
+      "batch_size": 50,
+      "max_seqs": 4,
+      "num_outputs": {"data": [n_data_dim, 2], "classes": [n_classes_dim, 1]},
+      "search_batch_compaction": search_batch_compaction,
+      "network": {
+        "encoder": {"class": "reduce", "mode": "mean", "axis": "T", "from": "data"},
+        "output": {
+          "class": "rec", "from": [], "max_seq_len": 10, "target": "classes",
+          "unit": {
+            "prev_emb": {"class": "linear", "activation": None, "from": "prev:output", "n_out": 5},
+            "prob": {"class": "softmax", "from": ["prev_emb", "base:encoder"], "target": "classes"},
+            "output": {"class": "choice", "beam_size": 3, "from": ["prob"], "target": "classes", "initial_output": 0},
+            "end": {"class": "compare", "from": ["output"], "value": 5}
+          }
+        },
+        "decision": {"class": "decide", "from": ["output"], "target": "classes"}
+      }
+    })
+    _cleanup_old_models(config)
+    engine = Engine(config=config)
+    engine.init_train_from_config(config=config, train_data=dataset)
+    num_passes = [0]
+    get_search_compaction_dataset = engine._get_search_compaction_dataset
+
+    def wrapped_get_search_compaction_dataset(**kwargs):
+      num_passes[0] += 1
+      return get_search_compaction_dataset(**kwargs)
+
+    engine._get_search_compaction_dataset = wrapped_get_search_compaction_dataset
+    output_file = _get_tmp_file(suffix=".py")
+    os.remove(output_file)
+    engine.search(dataset=dataset, output_file=output_file, output_file_format="py")
+    engine.finalize()
+    return eval(open(output_file).read()), num_passes[0]
+
+  res_ref, num_passes_ref = search(search_batch_compaction=0.)
+  assert_equal(num_passes_ref, 0)
+  res, num_passes = search(search_batch_compaction=0.5)
+  assert num_passes > 0
+  assert_equal(list(res.keys()), list(res_ref.keys()))
+  for seq_tag in res_ref.keys():
+    # The final length normalization of the scores depends on the batch (see ChoiceLayer), thus only compare the hyps.
+    assert_equal([hyp for (_, hyp) in res[seq_tag]], [hyp for (_, hyp) in res_ref[seq_tag]])
+
+
+def test_SearchOutputWriter_resume():
+  output_file = _get_tmp_file(suffix=".txt")
+  os.remove(output_file)
+  writer = SearchOutputWriter(filename=output_file, file_format="txt")
+  writer.write_seq(corpus_seq_idx=3, seq_tag="seq-3", out_data="d")
+  writer.write_seq(corpus_seq_idx=1, seq_tag="seq-1", out_data="b")
+  writer.finish_batch()
+  writer.write_seq(corpus_seq_idx=0, seq_tag="seq-0", out_data="a")
+  writer._journal_file.write(writer._batch_lines[0][:5])  # simulate an interrupted write
+  writer._journal_file.close()
+
+  writer = SearchOutputWriter(filename=output_file, file_format="txt", resume=True)
+  assert_equal(writer.num_batches_done, 1)
+  assert_equal(writer._done_corpus_seq_idx, {1, 3})
+  writer.write_seq(corpus_seq_idx=0, seq_tag="seq-0", out_data="a")
+  writer.write_seq(corpus_seq_idx=2, seq_tag="seq-2", out_data="c")
+  writer.finish_batch()
+  writer.finalize()
+  assert_equal(open(output_file).read(), "a\nb\nc\nd\n")
+  assert not os.path.exists(output_file + ".unsorted")
+
+
 def check_engine_search_attention(extra_rec_kwargs=None):
   """
   :param dict[str] extra_rec_kwargs:
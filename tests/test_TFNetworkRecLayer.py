@@ -3431,6 +3431,12 @@ def test_reclayer_optimize_out_selfatt_left():
     "class": "self_attention", "attention_left_only": True, "num_heads": 2, "total_key_dim": 6, "n_out": 18})
 
 
+def test_reclayer_optimize_out_selfatt_left_split_kv_state():
+  check_reclayer_optimize_out({
+    "class": "self_attention", "attention_left_only": True, "num_heads": 2, "total_key_dim": 6, "n_out": 18,
+    "split_kv_state": True})
+
+
 def test_reclayer_optimize_out_dot():
   # Used for multi-head dot-attention.
   AttNumHeads = 4
@@ -4227,6 +4233,90 @@ def test_KenLmStateLayer_dense():
       print("Scores are as expected.")
 
 
+def test_KenLmStateLayer_incremental():
+  import returnn.tf.util.ken_lm as tf_ken_lm
+  if not tf_ken_lm.kenlm_checked_out():
+    raise unittest.SkipTest("KenLM not checked out")
+  tf_ken_lm.get_tf_mod(verbose=True)
+  test_lm_file = tf_ken_lm.kenlm_dir + "/lm/test.arpa"
+  assert os.path.exists(test_lm_file)
+  from returnn.datasets.generating import Vocabulary
+  from returnn.tf.layers.base import InternalLayer
+  import tempfile
+  with make_scope() as session:
+    with tempfile.NamedTemporaryFile(mode="w", prefix="vocab") as tmp_bpe_vocab_file:
+      labels = "</s> <unk> be@@ yond imm@@ edi@@ ate conc@@ erns".split()
+      bpe_vocab_dict = Vocabulary.create_vocab_dict_from_labels(labels)
+      tmp_bpe_vocab_file.write(repr(bpe_vocab_dict))
+      tmp_bpe_vocab_file.flush()
+
+      net = TFNetwork(extern_data=ExternData())
+      net.extern_data.register_data(Data(
+        name="data", shape=(), time_dim_axis=None, dim=len(labels), sparse=True,
+        auto_create_placeholders=True))
+      net.extern_data.register_data(Data(
+        name="candidates", shape=(3,), time_dim_axis=None, dtype="int32", auto_create_placeholders=True))
+      data_layer = net.construct_layer(name="data", net_dict={})
+      candidates_layer = net.construct_layer(name="data:candidates", net_dict={})
+      batch_dim = 1
+      layers = {}
+      rec_states = {}
+
+      def make_layer(name, **kwargs):
+        """
+        :param str name:
+        :rtype: KenLmStateLayer
+        """
+        layer_opts = dict(
+          name=name, network=net, sources=[data_layer],
+          lm_file=test_lm_file,
+          vocab_file=tmp_bpe_vocab_file.name, vocab_unknown_label="<unk>",
+          bpe_merge_symbol="@@",
+          input_step_offset=1)
+        layer_opts.update(kwargs)
+        layer_out = KenLmStateLayer.get_out_data_from_opts(**layer_opts)
+        rec_states[name] = session.run(
+          KenLmStateLayer.get_rec_initial_extra_outputs(batch_dim=batch_dim, rec_layer=None, **layer_opts))
+        prev_layer = InternalLayer(name="prev:%s" % name, network=net, output=layer_out.copy())
+        prev_layer.rec_vars_outputs = {
+          k: tf_compat.v1.placeholder(name="prev_%s_%s" % (name, k), shape=v.shape, dtype=v.dtype)
+          for (k, v) in rec_states[name].items()}
+        with reuse_name_scope(KenLmStateLayer.cls_get_tf_scope_name(name)):
+          layer = KenLmStateLayer(output=layer_out, rec_previous_layer=prev_layer, **layer_opts)
+        net.layers[name] = layer
+        layers[name] = layer
+        return layer
+
+      make_layer("ref_sparse")
+      make_layer("ref_dense", dense_output=True)
+      make_layer("sparse", incremental=True)
+      make_layer("dense", incremental=True, dense_output=True)
+      make_layer("candidates", incremental=True, candidates=candidates_layer)
+      assert "state" not in rec_states["dense"] and "lm_state" in rec_states["dense"]
+      assert layers["candidates"].output.shape == (3,)
+      net.initialize_params(session=session)
+
+      input_word_ids = [labels.index(w) for w in "be@@ yond imm@@ edi@@ ate conc@@ erns </s>".split()]
+      rnd = numpy.random.RandomState(42)
+      for i in range(len(input_word_ids)):
+        word_id = input_word_ids[i - 1] if i > 0 else 0
+        candidates = rnd.randint(0, len(labels), size=(batch_dim, 3))
+        feed_dict = {
+          net.extern_data.data["data"].placeholder: [word_id],
+          net.extern_data.data["candidates"].placeholder: candidates}
+        for name, layer in layers.items():
+          feed_dict.update({
+            layer._rec_previous_layer.rec_vars_outputs[k]: v for (k, v) in rec_states[name].items()})
+        res, rec_states = session.run(
+          ({name: layer.output.placeholder for (name, layer) in layers.items()},
+           {name: layer.rec_vars_outputs for (name, layer) in layers.items()}),
+          feed_dict=feed_dict)
+        print("input %i, word %r, scores:" % (i, labels[word_id]), res)
+        assert_almost_equal(res["sparse"], res["ref_sparse"], decimal=5)
+        assert_almost_equal(res["dense"], res["ref_dense"], decimal=5)
+        assert_almost_equal(res["candidates"], numpy.take_along_axis(res["ref_dense"], candidates, axis=1), decimal=5)
+
+
 @unittest.skipIf(not is_gpu_available(), "no gpu on this system")
 def test_BlocksparseLSTM_load_params_from_native_lstm():
   from returnn.tf.native_op import have_blocksparse_requirements, init_blocksparse
@@ -5296,7 +5386,12 @@ def test_extra_scatter_nd_search_train():
     print(out)  # random...
 
 
-def test_trafo_search_lm():
+def check_trafo_search_lm(split_kv_state=False):
+  """
+  :param bool split_kv_state: for the self-attention layer
+  :return: output seqs, output seq lens
+  :rtype: (numpy.ndarray, numpy.ndarray)
+  """
   rnd = numpy.random.RandomState(42)
   beam_size = 5
   ff_dim = 7
@@ -5378,7 +5473,8 @@ def test_trafo_search_lm():
                                'from': ['dec_0_self_att_laynorm'],
                                'n_out': v_dim,
                                'num_heads': num_heads,
-                               'total_key_dim': qk_dim},
+                               'total_key_dim': qk_dim,
+                               'split_kv_state': split_kv_state},
         'dec_0_self_att_lin': {'activation': None,
                                'class': 'linear',
                                'from': ['dec_0_self_att_att'],
@@ -5456,6 +5552,18 @@ def test_trafo_search_lm():
     for i in range(n_batch):
       assert out_seq_lens[i] == input_seq_lens[i] * 3 // 2  # we constructed the 'end' layer that way
       assert all(out_seqs[i, :input_seq_lens[i]] == input_seqs[i, :input_seq_lens[i]])
+  return out_seqs, out_seq_lens
+
+
+def test_trafo_search_lm():
+  check_trafo_search_lm()
+
+
+def test_trafo_search_lm_split_kv_state():
+  out_seqs, out_seq_lens = check_trafo_search_lm(split_kv_state=True)
+  ref_out_seqs, ref_out_seq_lens = check_trafo_search_lm(split_kv_state=False)
+  assert_equal(out_seq_lens.tolist(), ref_out_seq_lens.tolist())
+  assert_equal(out_seqs.tolist(), ref_out_seqs.tolist())
 
 
 def test_PositionalEncodingLayer_offset_no_rec():
@@ -128,6 +128,71 @@ def test_NumbersDict_int_floordiv():
   assert_equal(b.dict["classes"], 1)
 
 
+def test_NumbersDict_inplace_add():
+  a = NumbersDict({"data": 3, "classes": 2})
+  a_ = a
+  a += NumbersDict({"data": 1, "speaker": 5})
+  assert_is(a, a_)
+  assert_equal(a.dict, {"data": 4, "classes": 2, "speaker": 5})
+  assert_is(a.value, None)
+  a += 1
+  assert_is(a, a_)
+  assert_equal(a.dict, {"data": 5, "classes": 3, "speaker": 6})
+  assert_is(a.value, None)
+  assert_equal((1 - a).dict, {"data": -4, "classes": -2, "speaker": -5})
+
+
+def test_NumbersDict_max_on_instance():
+  a = NumbersDict({"data": 3, "classes": 2})
+  assert_equal(NumbersDict.max([a, NumbersDict(5)]), NumbersDict(numbers_dict={"data": 5, "classes": 5}))
+  assert_raises(Exception, a.max)  # should use max_value
+
+
+def test_LRUCache():
+  from returnn.util.basic import LRUCache
+  cache = LRUCache(max_size=2)
+  cache["a"] = 1
+  cache["b"] = 2
+  assert_equal(cache["a"], 1)  # now "b" is the least recently used
+  cache["c"] = 3
+  assert_equal(len(cache), 2)
+  assert "b" not in cache
+  assert_equal(cache.get("b"), None)
+  assert_equal(cache.get("a"), 1)
+  cache["d"] = 4
+  assert "c" not in cache
+  assert_equal((cache.get("a"), cache.get("d")), (1, 4))
+
+
+def test_LRUCache_threads():
+  from returnn.util.basic import LRUCache
+  from threading import Thread
+  cache = LRUCache(max_size=10)
+  errors = []
+
+  def thread_main(thread_idx):
+    """
+    :param int thread_idx:
+    """
+    try:
+      for i in range(2000):
+        key = (thread_idx * 7 + i) % 20
+        cache[key] = key
+        value = cache.get(key)
+        assert value is None or value == key
+    except Exception as exc:
+      errors.append(exc)
+
+  threads = [Thread(target=thread_main, args=(i,)) for i in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert_equal(errors, [])
+  assert_equal(len(cache), 10)
+  assert_equal(sorted(cache._dict.items()), [(key, key) for key in sorted(cache._dict.keys())])
+
+
 def test_collect_class_init_kwargs():
   class A(object):
     def __init__(self, a):
@@ -180,6 +245,49 @@ def test_NativeCodeCompiler():
   assert_equal(lib.get_magic(), 42)
 
 
+def test_NativeCodeCompiler_shared_cache_dir_concurrent():
+  import tempfile
+  import shutil
+  from threading import Thread
+
+  class Compiler(NativeCodeCompiler):
+    """
+    Counts the compilations.
+    """
+    num_compiles = 0
+
+    def _maybe_compile_inner(self):
+      Compiler.num_compiles += 1
+      super(Compiler, self)._maybe_compile_inner()
+
+  cache_base_dir = tempfile.mkdtemp()
+  old_cache_base_dir = NativeCodeCompiler.CacheBaseDir
+  NativeCodeCompiler.CacheBaseDir = cache_base_dir
+  try:
+    so_filenames = []
+
+    def compile_func():
+      native = Compiler(
+        base_name="test_NativeCodeCompiler_shared", code_version=1, code="""
+        extern "C" int get_magic() { return 13; }
+        """)
+      so_filenames.append(native.get_lib_filename())
+
+    threads = [Thread(target=compile_func) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    assert_equal(len(so_filenames), 4)
+    assert_equal(len(set(so_filenames)), 1)
+    assert so_filenames[0].startswith(cache_base_dir + "/")
+    assert os.path.exists(so_filenames[0])
+    assert_equal(Compiler.num_compiles, 1)
+  finally:
+    NativeCodeCompiler.CacheBaseDir = old_cache_base_dir
+    shutil.rmtree(cache_base_dir)
+
+
 def test_Stats():
   rnd = numpy.random.RandomState(42)
   m = rnd.uniform(-2., 10., (1000, 3))
@@ -283,6 +391,48 @@ def test_CollectionReadCheckCovered():
   assert x and x.truth_value
 
 
+def test_DynamicBatcher():
+  import threading
+  batch_sizes = []
+
+  def process_batch(items):
+    batch_sizes.append(len(items))
+    return [x * 2 for x in items]
+
+  batcher = DynamicBatcher(process_batch=process_batch, max_batch_size=4, max_wait_time=10.)
+  results = {}
+
+  def submit(x):
+    results[x] = batcher.submit(x)
+
+  threads = [threading.Thread(target=submit, args=(i,)) for i in range(8)]
+  for thread_ in threads:
+    thread_.start()
+  for thread_ in threads:
+    thread_.join()
+  batcher.stop()
+  assert_equal(results, {i: i * 2 for i in range(8)})
+  assert_equal(batch_sizes, [4, 4])  # max_wait_time is long, so the batches are full
+  stats = batcher.get_stats()
+  assert_equal(stats["num_requests"], 8)
+  assert_equal(stats["num_batches"], 2)
+  assert_equal(stats["batch_size_max"], 4)
+
+
+def test_DynamicBatcher_max_wait_time_and_exception():
+  def process_batch(items):
+    if "fail" in items:
+      raise ValueError("fail")
+    return items
+
+  batcher = DynamicBatcher(process_batch=process_batch, max_batch_size=100, max_wait_time=0.01)
+  assert_equal(batcher.submit("a"), "a")  # single request, only waits max_wait_time
+  assert_raises(ValueError, lambda: batcher.submit("fail"))
+  assert_equal(batcher.submit("b"), "b")
+  batcher.stop()
+  assert_equal(batcher.num_batches, 3)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
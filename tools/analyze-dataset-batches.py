@@ -52,6 +52,8 @@ def analyze_dataset(options):
   seq_drop = config.float('seq_drop', 0.0)
   max_seq_length = config.typed_value('max_seq_length', None) or config.float('max_seq_length', 0)
   max_pad_size = config.typed_value("max_pad_size", None)
+  bucket_boundaries = config.typed_value("batch_bucket_boundaries", None)
+  bucket_batch_sizes = config.typed_value("batch_bucket_batch_sizes", None)
 
   batches = dataset.generate_batches(
     recurrent_net=recurrent,
@@ -59,6 +61,8 @@ def analyze_dataset(options):
     max_seqs=max_seqs,
     max_seq_length=max_seq_length,
     max_pad_size=max_pad_size,
+    bucket_boundaries=bucket_boundaries,
+    bucket_batch_sizes=bucket_batch_sizes,
     seq_drop=seq_drop,
     used_data_keys=used_data_keys)
 
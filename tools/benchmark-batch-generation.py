@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmark of the batch generation (:func:`Dataset.generate_batches`),
+i.e. the pure Python overhead of the batching logic and :class:`NumbersDict`,
+on a synthetic dataset where the seq lengths are known in advance, without any data loading.
+"""
+
+from __future__ import print_function, division
+
+import sys
+import time
+import argparse
+import numpy
+
+import _setup_returnn_env  # noqa
+from returnn.util.basic import NumbersDict, hms
+from returnn.datasets.basic import Dataset
+
+
+class SyntheticSeqLensDataset(Dataset):
+  """
+  Only provides random seq lengths for the keys "data" and "classes" (frame-wise, i.e. same length), no data.
+  """
+
+  def __init__(self, num_seqs, max_seq_len=1000, **kwargs):
+    """
+    :param int num_seqs:
+    :param int max_seq_len:
+    """
+    super(SyntheticSeqLensDataset, self).__init__(**kwargs)
+    rnd = numpy.random.RandomState(42)
+    self._seq_lens = rnd.randint(1, max_seq_len + 1, size=(num_seqs,)).tolist()
+    self._num_seqs = num_seqs
+    self.num_inputs = 1
+    self.num_outputs = {"data": [1, 2], "classes": [10, 1]}
+
+  def init_seq_order(self, epoch=None, seq_list=None, seq_order=None):
+    """
+    :param int|None epoch:
+    :param list[str]|None seq_list:
+    :param list[int]|None seq_order:
+    :rtype: bool
+    """
+    super(SyntheticSeqLensDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list, seq_order=seq_order)
+    self._num_seqs = len(self._seq_lens)
+    return True
+
+  @property
+  def num_seqs(self):
+    """
+    :rtype: int
+    """
+    return self._num_seqs
+
+  def get_seq_length(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: NumbersDict
+    """
+    return NumbersDict({"data": self._seq_lens[seq_idx], "classes": self._seq_lens[seq_idx]})
+
+
+def benchmark(num_seqs, recurrent_net, batch_size, max_seqs, chunking):
+  """
+  :param int num_seqs:
+  :param bool recurrent_net:
+  :param int batch_size:
+  :param int max_seqs:
+  :param str|None chunking:
+  """
+  dataset = SyntheticSeqLensDataset(num_seqs=num_seqs, chunking=chunking or "0")
+  dataset.init_seq_order(epoch=1)
+  start_time = time.time()
+  batches = dataset.generate_batches(recurrent_net=recurrent_net, batch_size=batch_size, max_seqs=max_seqs)
+  num_batches = 0
+  num_slices = 0
+  while batches.has_more():
+    batch, = batches.peek_next_n(1)
+    num_batches += 1
+    num_slices += batch.num_slices
+    batches.advance(1)
+  elapsed = time.time() - start_time
+  print("%i seqs, recurrent %s, chunking %r: %i batches, %i slices in %s, %.1f batches/sec, %.1f seqs/sec" % (
+    num_seqs, recurrent_net, chunking, num_batches, num_slices, hms(elapsed),
+    num_batches / elapsed, num_seqs / elapsed))
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--num_seqs", type=int, default=1000000)
+  arg_parser.add_argument("--batch_size", type=int, default=20000)
+  arg_parser.add_argument("--max_seqs", type=int, default=200)
+  arg_parser.add_argument("--chunking", default="100:50", help="used for the recurrent case with chunking")
+  args = arg_parser.parse_args()
+  benchmark(
+    num_seqs=args.num_seqs, recurrent_net=True, batch_size=args.batch_size, max_seqs=args.max_seqs, chunking=None)
+  benchmark(
+    num_seqs=args.num_seqs // 10, recurrent_net=True, batch_size=args.batch_size, max_seqs=args.max_seqs,
+    chunking=args.chunking)
+  benchmark(
+    num_seqs=args.num_seqs, recurrent_net=False, batch_size=args.batch_size, max_seqs=args.max_seqs, chunking=None)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the step latency of :class:`SelfAttentionLayer` inside a :class:`RecLayer` in beam search,
+i.e. a Transformer decoder (without encoder attention), with and without the ``split_kv_state`` option,
+for different output lengths.
+"""
+
+from __future__ import print_function, division
+
+import time
+import argparse
+import numpy
+
+import _setup_returnn_env  # noqa
+from returnn.config import Config
+import returnn.tf.compat as tf_compat
+from returnn.tf.network import TFNetwork
+from returnn.tf.util.basic import setup_tf_thread_pools
+
+
+def get_net_dict(out_len, num_layers, dim, num_heads, beam_size, split_kv_state):
+  """
+  :param int out_len:
+  :param int num_layers:
+  :param int dim:
+  :param int num_heads:
+  :param int beam_size:
+  :param bool split_kv_state:
+  :rtype: dict[str]
+  """
+  unit = {
+    "target_embed": {"class": "linear", "activation": None, "with_bias": False, "from": "prev:output", "n_out": dim},
+    "output_prob": {"class": "softmax", "from": "dec_%i" % (num_layers - 1), "target": "classes"},
+    "output": {"class": "choice", "target": "classes", "beam_size": beam_size, "from": "output_prob",
+               "initial_output": 0},
+    # Never ends, i.e. we always do max_seq_len steps.
+    "end": {"class": "compare", "from": "output", "value": -1},
+  }
+  x = "target_embed"
+  for i in range(num_layers):
+    unit.update({
+      "dec_%i_self_att" % i: {
+        "class": "self_attention", "from": x, "attention_left_only": True,
+        "num_heads": num_heads, "total_key_dim": dim, "n_out": dim, "split_kv_state": split_kv_state},
+      "dec_%i_ff" % i: {"class": "linear", "activation": "relu", "from": "dec_%i_self_att" % i, "n_out": dim * 4},
+      "dec_%i" % i: {"class": "linear", "activation": None, "from": "dec_%i_ff" % i, "n_out": dim}})
+    x = "dec_%i" % i
+  return {
+    "output": {"class": "rec", "from": [], "target": "classes", "max_seq_len": out_len, "unit": unit},
+    "decision": {"class": "decide", "from": "output", "target": "classes", "is_output_layer": True}}
+
+
+def benchmark(out_len, split_kv_state, args):
+  """
+  :param int out_len:
+  :param bool split_kv_state:
+  :param args: see main()
+  :return: seconds per step
+  :rtype: float
+  """
+  config = Config({
+    "extern_data": {"data": {"dim": 1}, "classes": {"dim": args.num_classes, "sparse": True}},
+    "debug_print_layer_output_template": False})
+  net_dict = get_net_dict(
+    out_len=out_len, num_layers=args.num_layers, dim=args.dim, num_heads=args.num_heads, beam_size=args.beam_size,
+    split_kv_state=split_kv_state)
+  with tf_compat.v1.Graph().as_default() as graph:
+    with tf_compat.v1.Session(graph=graph) as session:
+      network = TFNetwork(config=config, train_flag=False, search_flag=True)
+      network.construct_from_dict(net_dict)
+      data = network.extern_data.data["data"]
+      out = network.get_layer("decision").output
+      session.run(tf_compat.v1.global_variables_initializer())
+      feed_dict = {
+        data.placeholder: numpy.zeros((args.batch_size, 1, 1), dtype="float32"),
+        data.size_placeholder[0]: numpy.ones((args.batch_size,), dtype="int32")}
+      session.run(out.placeholder, feed_dict=feed_dict)  # warmup
+      start_time = time.time()
+      for _ in range(args.num_runs):
+        out_seqs = session.run(out.placeholder, feed_dict=feed_dict)
+        assert out_seqs.shape == (args.batch_size, out_len)
+      return (time.time() - start_time) / args.num_runs / out_len
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--out_lens", default="50,200,500", help="comma-separated list of output lengths")
+  arg_parser.add_argument("--batch_size", type=int, default=8)
+  arg_parser.add_argument("--beam_size", type=int, default=12)
+  arg_parser.add_argument("--num_layers", type=int, default=6)
+  arg_parser.add_argument("--dim", type=int, default=256)
+  arg_parser.add_argument("--num_heads", type=int, default=4)
+  arg_parser.add_argument("--num_classes", type=int, default=1000)
+  arg_parser.add_argument("--num_runs", type=int, default=3)
+  args = arg_parser.parse_args()
+  setup_tf_thread_pools()
+
+  print("Step latency, %i layers, dim %i, batch %i, beam %i:" % (
+    args.num_layers, args.dim, args.batch_size, args.beam_size))
+  for out_len in [int(x) for x in args.out_lens.split(",")]:
+    times = {split: benchmark(out_len=out_len, split_kv_state=split, args=args) for split in [False, True]}
+    print("out len %i: kv_left %.2fms, split_kv_state %.2fms, speedup %.2fx" % (
+      out_len, times[False] * 1000, times[True] * 1000, times[False] / times[True]))
+
+
+if __name__ == "__main__":
+  main()
@@ -5,6 +5,8 @@ This explicitly compiles some of the native ops, and will tell you the so-filena
 Normally all native ops (e.g. NativeLstm2 etc) are compiled on-the-fly within RETURNN.
 When you export the computation graph (e.g. via ``compile_tf_graph.py``),
 you explicitly must load these native ops.
+Multiple ops are compiled in parallel, which can also be used to warm up the cache
+(e.g. a ``--cache_dir`` shared by the cluster, see the config option ``native_code_cache_dir``).
 """
 
 from __future__ import print_function
@@ -69,7 +71,10 @@ def main(argv):
 
   argparser = argparse.ArgumentParser(description='Compile some op')
   argparser.add_argument('--config', help="filename to config-file")
-  argparser.add_argument('--native_op', help="op name. e.g. 'LstmGenericBase'")
+  argparser.add_argument(
+    '--native_op', help="op name. e.g. 'LstmGenericBase'. multiple ops separated by comma, or 'all'")
+  argparser.add_argument('--num_workers', type=int, help="for multiple ops. default: number of CPUs")
+  argparser.add_argument('--cache_dir', help="base dir for the compiled ops. default: temp dir")
   argparser.add_argument('--blas_lib', default=None,
                          help="specify which blas lib to use (path to .so or file name to search for)")
   argparser.add_argument('--search_for_numpy_blas', dest='search_for_numpy_blas', action='store_true',
@@ -79,16 +84,23 @@ def main(argv):
   argparser.add_argument("--verbosity", default=4, type=int, help="5 for all seqs (default: 4)")
   argparser.add_argument("--output_file", help='if given, will write the list of libs to this file')
   args = argparser.parse_args(argv[1:])
+  if args.cache_dir:
+    NativeCodeCompiler.CacheBaseDir = args.cache_dir
   init(config_filename=args.config, log_verbosity=args.verbosity)
 
   import returnn.native_op as native_op
-  from returnn.tf.native_op import make_op, OpMaker
+  from returnn.tf.native_op import make_op, OpMaker, get_native_op_names, precompile_native_ops
   if args.native_op:
-    print("Loading native op %r" % args.native_op)
-    op_gen = getattr(native_op, args.native_op)
-    assert issubclass(op_gen, native_op.NativeOpGenBase)
-    make_op(op_gen, compiler_opts={"verbose": True},
-            search_for_numpy_blas=args.search_for_numpy_blas, blas_lib=args.blas_lib)
+    op_names = get_native_op_names() if args.native_op == "all" else args.native_op.split(",")
+    op_maker_kwargs = dict(search_for_numpy_blas=args.search_for_numpy_blas, blas_lib=args.blas_lib)
+    if len(op_names) > 1:
+      compiled = precompile_native_ops(op_names=op_names, num_workers=args.num_workers, op_maker_kwargs=op_maker_kwargs)
+      op_names = [op_name for op_name in op_names if op_name in compiled]
+    for op_name in op_names:
+      print("Loading native op %r" % op_name)
+      op_gen = getattr(native_op, op_name)
+      assert issubclass(op_gen, native_op.NativeOpGenBase)
+      make_op(op_gen, compiler_opts={"verbose": True}, **op_maker_kwargs)
 
   libs = []
   if OpMaker.with_cuda and OpMaker.tf_blas_gemm_workaround:
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Forwards a dataset (task "forward", i.e. :func:`Engine.forward_to_hdf`) with multiple RETURNN processes in parallel,
+e.g. to make use of all cores of a CPU-only node.
+Every process forwards every N-th batch (config ``forward_num_shards``, ``forward_shard_index``)
+into its own shard HDF file.
+The shards are then merged into a single HDF file (:func:`merge_hdf_files`),
+or a file list with the shard HDF files is written, which can be used for :class:`HDFDataset` ``files``.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import subprocess
+import argparse
+
+import _setup_returnn_env  # noqa
+from returnn.util.basic import get_number_available_cpus, hms
+from returnn.datasets.hdf import merge_hdf_files
+
+
+returnn_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_shard_filename(output_file, shard_index, num_shards):
+  """
+  :param str output_file:
+  :param int shard_index:
+  :param int num_shards:
+  :rtype: str
+  """
+  base, ext = os.path.splitext(output_file)
+  return "%s.shard%iof%i%s" % (base, shard_index, num_shards, ext or ".hdf")
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("returnn_config")
+  arg_parser.add_argument("--output_file", required=True)
+  arg_parser.add_argument("--num_shards", type=int, help="default: num CPUs // num_threads")
+  arg_parser.add_argument("--num_threads", type=int, help="TF threads per process. default: num CPUs // num_shards")
+  arg_parser.add_argument(
+    "--merge", choices=["single", "list", "none"], default="single",
+    help="single: merge into output_file. list: write output_file with the list of shard files")
+  arg_parser.add_argument("--keep_shards", action="store_true", help="with --merge single")
+  arg_parser.add_argument("--returnn_args", nargs=argparse.REMAINDER, default=[], help="e.g. ++load_epoch 10")
+  args = arg_parser.parse_args()
+
+  num_cpus = get_number_available_cpus() or 1
+  num_shards = args.num_shards
+  num_threads = args.num_threads
+  if not num_shards:
+    num_shards = max(num_cpus // (num_threads or 2), 1)
+  if not num_threads:
+    num_threads = max(num_cpus // num_shards, 1)
+  print("Forward with %i shards, %i threads each (%i CPUs available)." % (num_shards, num_threads, num_cpus))
+  assert not os.path.exists(args.output_file), "output file %r exists" % args.output_file
+
+  start_time = time.time()
+  procs = []
+  for shard_index in range(num_shards):
+    shard_file = get_shard_filename(args.output_file, shard_index=shard_index, num_shards=num_shards)
+    cmd = [
+      sys.executable, "%s/rnn.py" % returnn_dir, args.returnn_config,
+      "++task", "forward",
+      "++forward_num_shards", str(num_shards), "++forward_shard_index", str(shard_index),
+      "++output_file", shard_file,
+      "++log", "%s.log" % shard_file] + args.returnn_args
+    env = os.environ.copy()
+    env["OMP_NUM_THREADS"] = str(num_threads)  # used by setup_tf_thread_pools
+    print("Start shard %i: %s" % (shard_index, " ".join(cmd)))
+    procs.append((shard_file, subprocess.Popen(cmd, env=env)))
+  failed = []
+  for shard_file, proc in procs:
+    if proc.wait() != 0:
+      failed.append(shard_file)
+  if failed:
+    print("Error: %i shards failed, see the logs: %s" % (len(failed), ", ".join(["%s.log" % fn for fn in failed])))
+    sys.exit(1)
+  shard_files = [shard_file for (shard_file, _) in procs]
+  print("All shards finished after %s." % hms(time.time() - start_time))
+
+  if args.merge == "single":
+    print("Merge into %s." % args.output_file)
+    merge_hdf_files(shard_files, args.output_file)
+    if not args.keep_shards:
+      for fn in shard_files:
+        os.remove(fn)
+  elif args.merge == "list":
+    print("Write shard list into %s." % args.output_file)
+    with open(args.output_file, "w") as f:
+      f.write("".join(["%s\n" % os.path.abspath(fn) for fn in shard_files]))
+  print("Done, total time %s." % hms(time.time() - start_time))
+
+
+if __name__ == "__main__":
+  main()